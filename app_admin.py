@@ -10,8 +10,10 @@ import base64
 import re
 import unicodedata
 from difflib import SequenceMatcher
+import numpy as np
 import pandas as pd
 import boto3
+from botocore import xform_name
 from botocore.exceptions import ClientError
 import gspread
 from gspread.exceptions import APIError
@@ -23,12 +25,47 @@ from zoneinfo import ZoneInfo
 import os
 import uuid
 from pathlib import Path
+from docx import Document
 from urllib.parse import urlparse, unquote, quote
-from contextlib import suppress
+from contextlib import contextmanager, suppress
 from streamlit.runtime.scriptrunner import StopException
 import numbers
+import warnings
 import gc
 import sys
+import hashlib
+import threading
+import zipfile
+import copy
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from app_comun import (
+    FRAME_STORE_MAX_BYTES,
+    FRAME_VERSION_ATTR,
+    XLSX_MIME,
+    dataframe_fingerprint,
+    depende_de_hojas,
+    derived_frame_version,
+    finish_rerun_profile,
+    frame_store_stats,
+    get_or_build_export,
+    get_sheet_headers,
+    get_trace_store,
+    invalidar_hojas,
+    load_session_frame,
+    peek_cached_export,
+    profile_block,
+    profile_checkpoint,
+    register_sheet_headers,
+    release_session_frames,
+    render_profile_panel,
+    sheet_values_to_frame,
+    start_rerun_profile,
+    store_session_frame,
+    write_dataframe_xlsx_streaming,
+)
 
 # Reintentos robustos para Google Sheets
 RETRIABLE_CODES = {429, 500, 502, 503, 504}
@@ -261,6 +298,399 @@ def has_structured_material_format(raw_text: str) -> bool:
     return False
 
 
+# ================== Formatos Word (devoluciones) ==================
+PLACEHOLDER_PATTERN = re.compile(r"\{\{([^}]+)\}\}")
+
+
+def _safe_value(v):
+    if v is None:
+        return "Sin registro"
+    s = str(v).strip()
+    return "Sin registro" if s.lower() in ("", "none", "nan", "n/a") else s
+
+
+def _iter_paragraphs_within(container):
+    if container is None:
+        return
+
+    element = getattr(container, "_element", None)
+    if element is not None:
+        from docx.oxml.ns import qn
+        from docx.text.paragraph import Paragraph
+
+        parent = container
+        for para_element in element.iter(qn("w:p")):
+            yield Paragraph(para_element, parent)
+        return
+
+    for paragraph in getattr(container, "paragraphs", []):
+        yield paragraph
+    for table in getattr(container, "tables", []):
+        for row in table.rows:
+            for cell in row.cells:
+                yield from _iter_paragraphs_within(cell)
+
+
+def _replace_span_in_runs(runs, start: int, end: int, replacement: str) -> None:
+    current_pos = 0
+    start_run_idx = None
+    start_offset = 0
+    end_run_idx = None
+    end_offset = 0
+
+    for idx, run in enumerate(runs):
+        text = run.text or ""
+        run_start = current_pos
+        run_end = current_pos + len(text)
+
+        if start_run_idx is None and start < run_end:
+            start_run_idx = idx
+            start_offset = start - run_start
+
+        if start_run_idx is not None and end <= run_end:
+            end_run_idx = idx
+            end_offset = end - run_start
+            break
+
+        current_pos = run_end
+
+    if start_run_idx is None or end_run_idx is None:
+        return
+
+    if start_run_idx == end_run_idx:
+        run = runs[start_run_idx]
+        text = run.text or ""
+        run.text = text[:start_offset] + replacement + text[end_offset:]
+        return
+
+    start_run = runs[start_run_idx]
+    end_run = runs[end_run_idx]
+
+    start_text = start_run.text or ""
+    end_text = end_run.text or ""
+
+    start_run.text = start_text[:start_offset] + replacement
+    end_run.text = end_text[end_offset:]
+
+    for idx in range(start_run_idx + 1, end_run_idx):
+        runs[idx].text = ""
+
+
+DOCX_HEADER_FOOTER_ATTRS = (
+    "header",
+    "first_page_header",
+    "even_page_header",
+    "footer",
+    "first_page_footer",
+    "even_page_footer",
+)
+DEVOLUCION_TEMPLATE_PATH = "plantillas/Formato_Devolución-M.docx"
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+def _iter_docx_parts(doc: Document):
+    """Recorre cuerpo, encabezados y pies con una llave estable por parte."""
+    yield "body", doc
+    for section_idx, section in enumerate(doc.sections):
+        for attr in DOCX_HEADER_FOOTER_ATTRS:
+            part = getattr(section, attr, None)
+            if part is not None:
+                yield f"{section_idx}:{attr}", part
+
+
+def _paragraph_full_text(paragraph) -> str:
+    runs = paragraph.runs
+    return "".join(run.text or "" for run in runs) if runs else (paragraph.text or "")
+
+
+def _placeholder_run_spans(paragraph) -> list[tuple[str, int, int, int, int]]:
+    """Ubica cada placeholder del párrafo como (llave, run inicial, offset, run final, offset).
+
+    En párrafos sin runs los offsets son del texto completo y los runs valen -1.
+    """
+    runs = paragraph.runs
+    if not runs:
+        text = paragraph.text or ""
+        return [(m.group(1), -1, m.start(), -1, m.end()) for m in PLACEHOLDER_PATTERN.finditer(text)]
+
+    starts: list[int] = []
+    ends: list[int] = []
+    cursor = 0
+    for run in runs:
+        starts.append(cursor)
+        cursor += len(run.text or "")
+        ends.append(cursor)
+    text = "".join(run.text or "" for run in runs)
+
+    spans = []
+    for match in PLACEHOLDER_PATTERN.finditer(text):
+        start_run = bisect_right(ends, match.start())
+        end_run = bisect_left(ends, match.end())
+        spans.append(
+            (
+                match.group(1),
+                start_run,
+                match.start() - starts[start_run],
+                end_run,
+                match.end() - starts[end_run],
+            )
+        )
+    return spans
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _load_docx_template_cached(
+    template_path: str, mtime_ns: int
+) -> tuple[Document, dict[str, list[tuple[int, list[tuple[str, int, int, int, int]]]]]]:
+    """Parsea la plantilla una vez y precalcula los runs que ocupa cada placeholder.
+
+    El ``Document`` cacheado no se modifica: cada render trabaja sobre una copia profunda.
+    """
+    _ = mtime_ns
+    doc = Document(template_path)
+    placeholder_spans: dict[str, list[tuple[int, list[tuple[str, int, int, int, int]]]]] = {}
+    for part_key, part in _iter_docx_parts(doc):
+        spans_part = []
+        for idx, paragraph in enumerate(_iter_paragraphs_within(part)):
+            if "{{" not in _paragraph_full_text(paragraph):
+                continue
+            spans = _placeholder_run_spans(paragraph)
+            if spans:
+                spans_part.append((idx, spans))
+        if spans_part:
+            placeholder_spans[part_key] = spans_part
+    return doc, placeholder_spans
+
+
+def _replace_placeholders_in_paragraph(
+    paragraph,
+    spans: list[tuple[str, int, int, int, int]],
+    token_values: dict[str, str],
+    skip_keys: set[str],
+) -> tuple[int, int, list[str]]:
+    """Reemplaza los placeholders precalculados de un párrafo (de derecha a izquierda)."""
+    spans = [span for span in spans if span[0] not in skip_keys]
+    if not spans:
+        return 0, 0, []
+
+    replaced = 0
+    remaining: list[str] = []
+    if spans[0][1] < 0:
+        text = paragraph.text or ""
+        pieces = []
+        cursor = 0
+        for key, _, start, _, end in spans:
+            pieces.append(text[cursor:start])
+            if key in token_values:
+                pieces.append(token_values[key])
+                replaced += 1
+            else:
+                pieces.append(text[start:end])
+                remaining.append(key)
+            cursor = end
+        pieces.append(text[cursor:])
+        if replaced:
+            paragraph.text = "".join(pieces)
+        return len(spans), replaced, remaining
+
+    runs = paragraph.runs
+    for key, start_run, start_offset, end_run, end_offset in reversed(spans):
+        if key not in token_values:
+            remaining.append(key)
+            continue
+        value = token_values[key]
+        if start_run == end_run:
+            text = runs[start_run].text or ""
+            runs[start_run].text = text[:start_offset] + value + text[end_offset:]
+        else:
+            runs[start_run].text = (runs[start_run].text or "")[:start_offset] + value
+            runs[end_run].text = (runs[end_run].text or "")[end_offset:]
+            for idx in range(start_run + 1, end_run):
+                runs[idx].text = ""
+        replaced += 1
+    return len(spans), replaced, remaining
+
+
+def render_docx_template(
+    template_path: str,
+    mapping: dict[str, str],
+    table_placeholders: dict[str, list[dict[str, str]]] | None = None,
+) -> tuple[bytes, dict[str, object]]:
+    """Genera un .docx desde la plantilla cacheada y devuelve (bytes, estadísticas)."""
+    if not os.path.exists(template_path):
+        raise FileNotFoundError(f"No se encontró la plantilla en: {template_path}")
+
+    table_placeholders = table_placeholders or {}
+    template_doc, placeholder_spans = _load_docx_template_cached(
+        template_path, os.stat(template_path).st_mtime_ns
+    )
+    doc = copy.deepcopy(template_doc)
+    token_values = {key: _safe_value(value) for key, value in mapping.items()}
+    skip_keys = set(table_placeholders)
+
+    total_found = 0
+    total_replaced = 0
+    remaining: list[str] = []
+    for part_key, part in _iter_docx_parts(doc):
+        spans_part = placeholder_spans.get(part_key)
+        if not spans_part:
+            continue
+        spans_by_idx = dict(spans_part)
+        for idx, paragraph in enumerate(_iter_paragraphs_within(part)):
+            spans = spans_by_idx.get(idx)
+            if spans is None:
+                continue
+            found, replaced, pending = _replace_placeholders_in_paragraph(
+                paragraph, spans, token_values, skip_keys
+            )
+            total_found += found
+            total_replaced += replaced
+            remaining.extend(pending)
+
+    # Las tablas se insertan al final para no desplazar las posiciones precalculadas.
+    material_tables = 0
+    for placeholder_key, rows in table_placeholders.items():
+        material_tables += _replace_material_placeholder_with_table(doc, placeholder_key, rows)
+
+    out_buffer = BytesIO()
+    doc.save(out_buffer)
+    stats = {
+        "found": total_found,
+        "replaced": total_replaced,
+        "remaining": remaining,
+        "material_tables": material_tables,
+    }
+    return out_buffer.getvalue(), stats
+
+
+def build_devolucion_docx_inputs(
+    row,
+    *,
+    fecha_recepcion: str,
+    guias,
+    seguimiento,
+    nota_credito_url,
+    comentario_admin,
+    material_faltante,
+) -> tuple[dict[str, str], dict[str, list[dict[str, str]]]]:
+    """Arma el mapping de placeholders y las tablas de material para un formato de devolución."""
+    table_placeholders: dict[str, list[dict[str, str]]] = {}
+    raw_material_devuelto = row.get("Material_Devuelto")
+    mapping = {
+        "Cliente": _safe_value(row.get("Cliente")),
+        "Vendedor_Registro": _safe_value(row.get("Vendedor_Registro")),
+        "Folio_Factura": _safe_value(row.get("Folio_Factura")),
+        "Monto_Devuelto": _safe_value(row.get("Monto_Devuelto")),
+        "Fecha_Recepcion_Devolucion": fecha_recepcion,
+        "Numero_Guias_Devolucion": _safe_value(guias),
+        "Area_Responsable": _safe_value(row.get("Area_Responsable")),
+        "Seguimiento": _safe_value(seguimiento),
+        "Nota_Credito_URL": _safe_value(nota_credito_url),
+        "Folio_Factura_Error": _safe_value(row.get("Folio_Factura_Error")),
+        "Motivo_Detallado": _safe_value(row.get("Motivo_Detallado")),
+        "Comentarios_Admin_Devolucion": _safe_value(comentario_admin),
+    }
+    if has_structured_material_format(raw_material_devuelto):
+        table_placeholders["Material_Devuelto"] = sanitize_material_rows_for_table(raw_material_devuelto)
+    else:
+        mapping["Material_Devuelto"] = str(raw_material_devuelto or "").strip() or "n/a"
+
+    if has_structured_material_format(material_faltante):
+        table_placeholders["Material_Faltante"] = sanitize_material_rows_for_table(material_faltante)
+    else:
+        mapping["Material_Faltante"] = str(material_faltante or "").strip() or "No aplica"
+    return mapping, table_placeholders
+
+
+def devolucion_docx_filename(cliente) -> str:
+    cliente_archivo = str(cliente or "").strip() or "Cliente"
+    cliente_archivo = re.sub(r"[^A-Za-z0-9ÁÉÍÓÚáéíóúÑñ _-]", "", cliente_archivo).strip()
+    cliente_archivo = re.sub(r"\s+", "_", cliente_archivo) or "Cliente"
+    return f"Formato_Devolucion_{cliente_archivo}.docx"
+
+
+def _replace_material_placeholder_with_table(
+    doc: Document,
+    placeholder_key: str,
+    material_rows: list[dict[str, str]],
+) -> int:
+    """Reemplaza {{Material_Devuelto}} por una tabla limpia en cada aparición."""
+    from docx.oxml import OxmlElement
+    from docx.oxml.ns import qn
+
+    def _normalize_material_cell(value) -> str:
+        raw = str(value or "").strip()
+        if raw.lower() in {"", "nan", "none", "n/a", "sin registro"}:
+            return "n/a"
+        return raw
+
+    def _set_cell_borders(cell) -> None:
+        tc = cell._tc
+        tc_pr = tc.get_or_add_tcPr()
+        tc_borders = tc_pr.find(qn("w:tcBorders"))
+        if tc_borders is None:
+            tc_borders = OxmlElement("w:tcBorders")
+            tc_pr.append(tc_borders)
+        for border_name in ("top", "left", "bottom", "right"):
+            border = tc_borders.find(qn(f"w:{border_name}"))
+            if border is None:
+                border = OxmlElement(f"w:{border_name}")
+                tc_borders.append(border)
+            border.set(qn("w:val"), "single")
+            border.set(qn("w:sz"), "8")
+            border.set(qn("w:space"), "0")
+            border.set(qn("w:color"), "FFFFFF")
+
+    token = f"{{{{{placeholder_key}}}}}"
+    replacements = 0
+    headers = ["Código", "Descripción", "Cantidad", "Monto IVA"]
+    style_names = {s.name for s in doc.styles if getattr(s, "name", None)}
+
+    for paragraph in list(_iter_paragraphs_within(doc)):
+        runs = list(paragraph.runs)
+        paragraph_text = "".join(run.text or "" for run in runs) if runs else (paragraph.text or "")
+        if token not in paragraph_text:
+            continue
+
+        if runs:
+            while True:
+                current_text = "".join(run.text or "" for run in runs)
+                idx = current_text.find(token)
+                if idx == -1:
+                    break
+                _replace_span_in_runs(runs, idx, idx + len(token), "")
+        else:
+            paragraph.text = paragraph_text.replace(token, "")
+
+        parent = paragraph._parent
+        table = parent.add_table(rows=len(material_rows) + 1, cols=4)
+        if "Table Grid" in style_names:
+            table.style = "Table Grid"
+
+        for col_idx, header in enumerate(headers):
+            header_cell = table.cell(0, col_idx)
+            header_cell.text = ""
+            p = header_cell.paragraphs[0]
+            run = p.add_run(header)
+            run.underline = True
+
+        for row_idx, row_data in enumerate(material_rows, start=1):
+            table.cell(row_idx, 0).text = _normalize_material_cell(row_data.get("Código"))
+            table.cell(row_idx, 1).text = _normalize_material_cell(row_data.get("Descripción"))
+            table.cell(row_idx, 2).text = _normalize_material_cell(row_data.get("Cantidad"))
+            table.cell(row_idx, 3).text = _normalize_material_cell(row_data.get("Monto IVA"))
+
+        for row_cells in table.rows:
+            for cell in row_cells.cells:
+                _set_cell_borders(cell)
+
+        paragraph._p.addnext(table._tbl)
+        replacements += 1
+
+    return replacements
+
+
+
 def normalize_user_field(value: str | None) -> str:
     """Normaliza campos de usuario para mostrarlos solo si traen información."""
     raw = str(value or "").strip()
@@ -347,14 +777,8 @@ def ensure_id_vendedor_column(
     if source.empty:
         return work
 
-    if "ID_Pedido" in source.columns:
-        source["__id_norm"] = source["ID_Pedido"].apply(normalize_id_pedido)
-    else:
-        source["__id_norm"] = ""
-    if "Folio_Factura" in source.columns:
-        source["__folio_norm"] = source["Folio_Factura"].apply(normalize_folio_factura)
-    else:
-        source["__folio_norm"] = ""
+    source["__id_norm"] = pedido_id_keys(source)
+    source["__folio_norm"] = pedido_folio_keys(source)
 
     source = source[(source["__id_norm"] != "") | (source["__folio_norm"] != "")]
     if source.empty:
@@ -364,14 +788,8 @@ def ensure_id_vendedor_column(
     id_map = source.set_index("__id_norm")["id_vendedor"].to_dict()
     folio_map = source.set_index("__folio_norm")["id_vendedor"].to_dict()
 
-    if "ID_Pedido" in work.columns:
-        work["__id_norm"] = work["ID_Pedido"].apply(normalize_id_pedido)
-    else:
-        work["__id_norm"] = ""
-    if "Folio_Factura" in work.columns:
-        work["__folio_norm"] = work["Folio_Factura"].apply(normalize_folio_factura)
-    else:
-        work["__folio_norm"] = ""
+    work["__id_norm"] = pedido_id_keys(work)
+    work["__folio_norm"] = pedido_folio_keys(work)
 
     id_values = work["__id_norm"].map(id_map).fillna("")
     folio_values = work["__folio_norm"].map(folio_map).fillna("")
@@ -472,6 +890,13 @@ def ensure_sheet_column(worksheet, headers: list[str], column_name: str) -> list
     if column_name in headers_list:
         return headers_list
 
+    # Antes de agregar, confirma la fila 1 real: otra sesión o la app de ventas pudo agregarla ya.
+    sheet_name = getattr(worksheet, "title", "")
+    with suppress(Exception):
+        headers_list = register_sheet_headers(sheet_name, worksheet.row_values(1)) or headers_list
+    if column_name in headers_list:
+        return headers_list
+
     desired_index = len(headers_list) + 1
 
     try:
@@ -494,6 +919,7 @@ def ensure_sheet_column(worksheet, headers: list[str], column_name: str) -> list
             ],
         )
         headers_list.append(column_name)
+        register_sheet_headers(sheet_name, headers_list)
     except Exception as err:
         st.warning(
             f"⚠️ No se pudo asegurar la columna '{column_name}' en la hoja: {err}"
@@ -502,20 +928,22 @@ def ensure_sheet_column(worksheet, headers: list[str], column_name: str) -> list
     return headers_list
 
 
-def _filter_cancelled_pedidos(df: pd.DataFrame) -> pd.DataFrame:
-    """Oculta pedidos cancelados marcados en la columna de motivos."""
-    if df is None or df.empty:
-        return df
+def _motivo_cancelado_mask(df: pd.DataFrame) -> pd.Series:
+    """True donde la columna de motivos marca el pedido como ``Cancelado[``."""
+    if MOTIVO_RECHAZO_CANCELACION_COL not in df.columns:
+        return pd.Series(False, index=df.index)
+    return (
+        df[MOTIVO_RECHAZO_CANCELACION_COL]
+        .astype(str)
+        .str.contains("Cancelado[", regex=False, na=False)
+    )
 
-    trabajo = df.copy()
-    if MOTIVO_RECHAZO_CANCELACION_COL in trabajo.columns:
-        mask_cancelados = (
-            trabajo[MOTIVO_RECHAZO_CANCELACION_COL]
-            .astype(str)
-            .str.contains(r"Cancelado\[", na=False)
-        )
-        trabajo = trabajo[~mask_cancelados]
-    return trabajo
+
+def pedido_cancelado_mask(df: pd.DataFrame) -> pd.Series:
+    """Pedidos cancelados; usa la columna precalculada del snapshot cuando existe."""
+    if PEDIDO_CANCELADO_COL in df.columns:
+        return df[PEDIDO_CANCELADO_COL].astype(bool)
+    return _motivo_cancelado_mask(df)
 
 
 def _load_pedidos_admin_fuentes(_nonce: int = 0) -> pd.DataFrame:
@@ -539,11 +967,12 @@ def _load_pedidos_admin_fuentes(_nonce: int = 0) -> pd.DataFrame:
             ~combinados["Tipo_Envio"].isin(["🎓 Cursos y Eventos", "📋 Solicitudes de Guía"])
         ].copy()
 
-    if "ID_Pedido" in combinados.columns:
-        combinados["ID_Pedido"] = combinados["ID_Pedido"].apply(normalize_id_pedido)
+    # Cada hoja ya trae sus claves normalizadas: ID y folio quedan como la clave.
+    if PEDIDO_KEY_ID_COL in combinados.columns:
+        combinados["ID_Pedido"] = combinados[PEDIDO_KEY_ID_COL]
 
-    if "Folio_Factura" in combinados.columns:
-        combinados["Folio_Factura"] = combinados["Folio_Factura"].apply(normalize_folio_factura)
+    if PEDIDO_KEY_FOLIO_COL in combinados.columns:
+        combinados["Folio_Factura"] = combinados[PEDIDO_KEY_FOLIO_COL]
 
     if "ID_Pedido" in combinados.columns:
         combinados = combinados.drop_duplicates(subset=["ID_Pedido"], keep="first")
@@ -572,10 +1001,10 @@ def resolve_pedido_source_context(selected_pedido_data: pd.Series) -> tuple[pd.D
         worksheet = _get_ws_data()
     else:
         source_sheet = "datos_pedidos"
-        df_source = st.session_state.get("df_pedidos", pd.DataFrame())
+        df_source = load_session_frame("df_pedidos", pd.DataFrame())
         worksheet = _get_ws_datos()
 
-    headers = [str(h).strip() for h in worksheet.row_values(1)]
+    headers = get_sheet_headers(source_sheet, worksheet)
     return df_source, worksheet, headers, source_sheet
 
 
@@ -584,22 +1013,12 @@ def resolve_gsheet_row_index(df_source: pd.DataFrame, selected_pedido_data: pd.S
     pedido_id = normalize_id_pedido(selected_pedido_data.get("ID_Pedido", ""))
     folio = normalize_folio_factura(selected_pedido_data.get("Folio_Factura", ""))
 
-    row_candidates = pd.DataFrame()
-    if pedido_id and "ID_Pedido" in df_source.columns:
-        row_candidates = df_source[
-            df_source["ID_Pedido"].apply(normalize_id_pedido) == pedido_id
-        ]
-
-    if row_candidates.empty and folio and "Folio_Factura" in df_source.columns:
-        row_candidates = df_source[
-            df_source["Folio_Factura"].apply(normalize_folio_factura) == folio
-        ]
-
-    if row_candidates.empty:
+    posiciones = find_pedido_positions(df_source, pedido_id, folio)
+    if not posiciones:
         raise ValueError("No se encontró el pedido en la hoja origen.")
 
-    if "__sheet_row" in row_candidates.columns:
-        sheet_row = row_candidates["__sheet_row"].iloc[0]
+    if "__sheet_row" in df_source.columns:
+        sheet_row = df_source["__sheet_row"].iat[posiciones[0]]
         try:
             sheet_row_int = int(sheet_row)
             if sheet_row_int >= 2:
@@ -607,46 +1026,132 @@ def resolve_gsheet_row_index(df_source: pd.DataFrame, selected_pedido_data: pd.S
         except (TypeError, ValueError):
             pass
 
-    return int(row_candidates.index[0]) + 2
+    return int(df_source.index[posiciones[0]]) + 2
+
+
+# Conjunto de pendientes: etiquetas de índice del snapshot base, en orden (dict como conjunto ordenado).
+PENDIENTES_INDEX_KEY = "_pendientes_index"
+
+
+def pendientes_mask(df: pd.DataFrame) -> pd.Series:
+    """Pedidos con comprobante sin confirmar, fuera de Cursos/Solicitudes y no cancelados."""
+    if "Comprobante_Confirmado" not in df.columns:
+        return pd.Series(False, index=df.index)
+    mask = df["Comprobante_Confirmado"].astype(str).str.strip().str.lower() != "sí"
+    if "Tipo_Envio" in df.columns:
+        mask &= ~df["Tipo_Envio"].isin(["🎓 Cursos y Eventos", "📋 Solicitudes de Guía"])
+    return mask & ~pedido_cancelado_mask(df)
+
+
+def _materializar_pendientes(base: pd.DataFrame, etiquetas) -> pd.DataFrame:
+    """Filas pendientes del snapshot base (sin ``display_label``) en una sola selección."""
+    columnas = [col for col in base.columns if col != "display_label"]
+    return base.loc[list(etiquetas), columnas]
 
 
 def refresh_pedidos_pagados_no_confirmados(
     df: pd.DataFrame | None = None,
 ) -> pd.DataFrame:
-    """Recalcula y guarda en sesión los pedidos con comprobante pendiente."""
+    """Recalcula el conjunto de pendientes sobre el snapshot y guarda en sesión el DataFrame resultante."""
 
     if df is None:
-        df = st.session_state.get("df_pedidos")
+        df = load_session_frame("df_pedidos")
 
     if df is None or df.empty:
+        st.session_state.pop(PENDIENTES_INDEX_KEY, None)
+        st.session_state.pop("pedidos_pendientes_base", None)
         pendientes = pd.DataFrame()
     else:
-        trabajo = df.copy()
+        etiquetas = dict.fromkeys(df.index[pendientes_mask(df)])
+        store_session_frame("pedidos_pendientes_base", df)
+        st.session_state[PENDIENTES_INDEX_KEY] = etiquetas
+        pendientes = _materializar_pendientes(df, etiquetas)
 
-        if "Comprobante_Confirmado" in trabajo.columns:
-            mask_no_confirmado = (
-                trabajo["Comprobante_Confirmado"].astype(str).str.strip().str.lower()
-                != "sí"
-            )
-            pendientes = trabajo[mask_no_confirmado].copy()
-        else:
-            pendientes = trabajo.iloc[0:0].copy()
-
-        if "Tipo_Envio" in pendientes.columns:
-            pendientes = pendientes[
-                ~pendientes["Tipo_Envio"].isin(
-                    ["🎓 Cursos y Eventos", "📋 Solicitudes de Guía"]
-                )
-            ].copy()
+    store_session_frame("pedidos_pagados_no_confirmados", pendientes)
+    return pendientes
 
-    if not pendientes.empty:
-        pendientes = _filter_cancelled_pedidos(pendientes)
-        pendientes = pendientes.drop(columns=["display_label"], errors="ignore")
 
-    st.session_state.pedidos_pagados_no_confirmados = pendientes
+def load_pedidos_pagados_no_confirmados() -> pd.DataFrame | None:
+    """Pendientes de la sesión; si el almacén los desalojó se rearman desde el snapshot base y el índice."""
+    pendientes = load_session_frame("pedidos_pagados_no_confirmados")
+    if pendientes is not None:
+        return pendientes
+    base = load_session_frame("pedidos_pendientes_base")
+    etiquetas = st.session_state.get(PENDIENTES_INDEX_KEY)
+    if base is None or etiquetas is None:
+        return None
+    pendientes = _materializar_pendientes(base, etiquetas)
+    store_session_frame("pedidos_pagados_no_confirmados", pendientes)
     return pendientes
 
 
+def _actualizar_pendientes(source_sheet: str, pedidos: list[tuple[pd.Series, int]], valores: dict) -> None:
+    """Agrega o quita del conjunto los pedidos recién escritos sin recalcular todo el snapshot."""
+    base = load_session_frame("pedidos_pendientes_base")
+    etiquetas = st.session_state.get(PENDIENTES_INDEX_KEY)
+    if base is None or base.empty or etiquetas is None:
+        return
+
+    indice = pedido_key_index(base)
+    posiciones: list[int] = []
+    for pedido, _ in pedidos:
+        pedido_id = normalize_id_pedido(pedido.get("ID_Pedido", ""))
+        if pedido_id:
+            posiciones.extend(indice["id"].get(pedido_id, []))
+        else:
+            folio = normalize_folio_factura(pedido.get("Folio_Factura", ""))
+            posiciones.extend(indice["folio"].get(folio, []) if folio else [])
+    posiciones = np.array(sorted(set(posiciones)), dtype=np.intp)
+    if "__source_sheet" in base.columns:
+        posiciones = posiciones[base["__source_sheet"].astype(str).to_numpy()[posiciones] == source_sheet]
+    if not len(posiciones):
+        return
+
+    filas = base.iloc[posiciones].copy()
+    for col, val in valores.items():
+        if col in filas.columns:
+            filas[col] = val
+    if MOTIVO_RECHAZO_CANCELACION_COL in valores and PEDIDO_CANCELADO_COL in filas.columns:
+        filas[PEDIDO_CANCELADO_COL] = _motivo_cancelado_mask(filas)
+
+    # El snapshot base recibe los mismos valores: si el almacén desaloja los pendientes
+    # materializados, se rearman desde aquí ya actualizados.
+    cambios = (source_sheet, posiciones.tolist(), valores)
+    version_base = derived_frame_version(base, *cambios)
+    for col in dict.fromkeys([*valores, PEDIDO_CANCELADO_COL]):
+        if col in base.columns:
+            columna = base[col].to_numpy(copy=True)
+            columna[posiciones] = filas[col].to_numpy()
+            base[col] = columna
+    store_session_frame("pedidos_pendientes_base", base, version=version_base)
+
+    siguen = pendientes_mask(filas)
+    quitar = [etiqueta for etiqueta in filas.index[~siguen] if etiqueta in etiquetas]
+    agregar = [etiqueta for etiqueta in filas.index[siguen] if etiqueta not in etiquetas]
+    actualizar = [etiqueta for etiqueta in filas.index[siguen] if etiqueta in etiquetas]
+    for etiqueta in quitar:
+        del etiquetas[etiqueta]
+    for etiqueta in agregar:
+        etiquetas[etiqueta] = None
+
+    pendientes = load_pedidos_pagados_no_confirmados()
+    if pendientes is None:
+        return
+    version_pendientes = derived_frame_version(pendientes, *cambios)
+    if quitar:
+        pendientes = pendientes.drop(index=quitar, errors="ignore")
+    if actualizar:
+        fila = pendientes.index.isin(actualizar)
+        for col, val in valores.items():
+            if col in pendientes.columns:
+                pendientes[col] = pendientes[col].where(~fila, val)
+    if agregar:
+        columnas = [col for col in filas.columns if col != "display_label"]
+        pendientes = pd.concat([pendientes, filas.loc[agregar, columnas]])
+    if quitar or actualizar or agregar:
+        store_session_frame("pedidos_pagados_no_confirmados", pendientes, version=version_pendientes)
+
+
 def has_text_value(value: object) -> bool:
     """True cuando el valor tiene contenido útil (no vacío / NaN)."""
     text = str(value or "").strip()
@@ -664,12 +1169,87 @@ def is_venta_terceros_pedido(row: pd.Series) -> bool:
     return tipo_venta == "venta terceros"
 
 
+# --- Columnas derivadas vectorizadas (mismas reglas que las funciones por fila) ---
+
+
+def _columna_texto(df: pd.DataFrame, col: str) -> pd.Series:
+    """Columna como texto con nulos en blanco; serie vacía si la columna no existe."""
+    if col not in df.columns:
+        return pd.Series("", index=df.index, dtype=object)
+    serie = df[col]
+    return serie.where(serie.notna(), "").astype(str)
+
+
+def _columna_str(df: pd.DataFrame, col: str, default: str = "") -> pd.Series:
+    """``str(row.get(col, default))`` para toda la columna."""
+    if col not in df.columns:
+        return pd.Series(default, index=df.index, dtype=object)
+    return df[col].astype(str)
+
+
+def has_text_value_series(serie: pd.Series) -> pd.Series:
+    """Versión vectorizada de ``has_text_value``."""
+    texto = serie.where(serie.notna(), "").astype(str).str.strip()
+    return texto.ne("") & ~texto.str.lower().isin(["nan", "none"])
+
+
+def nota_venta_mask(df: pd.DataFrame) -> pd.Series:
+    """Versión vectorizada de ``is_nota_venta_pedido``."""
+    return has_text_value_series(_columna_texto(df, "Motivo_NotaVenta"))
+
+
+def venta_terceros_mask(df: pd.DataFrame) -> pd.Series:
+    """Versión vectorizada de ``is_venta_terceros_pedido``."""
+    return _columna_texto(df, "Tipo_Venta").str.strip().str.lower().eq("venta terceros")
+
+
+def es_devolucion_mask(df: pd.DataFrame) -> pd.Series:
+    """Versión vectorizada de ``is_devolucion_case_row``."""
+    mask = pd.Series(False, index=df.index)
+    for col in ("Tipo_Caso", "Tipo_Envio"):
+        mask |= _columna_texto(df, col).str.lower().str.contains("devoluci", regex=False)
+    return mask
+
+
+def turno_local_display(df: pd.DataFrame) -> pd.Series:
+    """Turno capturado solo para pedidos locales; vacío en cualquier otro caso."""
+    tipo = _columna_str(df, "Tipo_Envio").str.strip()
+    turno = _columna_texto(df, "Turno").str.strip()
+    visible = tipo.isin(TIPOS_ENVIO_LOCAL) & turno.ne("") & ~turno.str.lower().isin(["nan", "none"])
+    return turno.where(visible, "")
+
+
+def etiqueta_pendiente_series(df: pd.DataFrame) -> pd.Series:
+    """``📄 folio - 👤 cliente - estado - tipo`` con la marca de nota de venta."""
+    return (
+        "📄 " + _columna_str(df, "Folio_Factura", "N/A")
+        + " - 👤 " + _columna_str(df, "Cliente", "N/A")
+        + " - " + _columna_str(df, "Estado", "N/A")
+        + " - " + _columna_str(df, "Tipo_Envio", "N/A")
+        + nota_venta_mask(df).map({True: " - 🧾 Nota de venta", False: ""})
+    )
+
+
+def link_dictamen_o_nota(df: pd.DataFrame) -> pd.Series:
+    """Dictamen de garantía si existe; si no, la nota de crédito."""
+    dictamen = _columna_str(df, "Dictamen_Garantia_URL").str.strip()
+    return dictamen.where(dictamen.ne(""), _columna_str(df, "Nota_Credito_URL").str.strip())
+
+
 def is_estado_pago_no_aplica(value: object) -> bool:
     """Detecta estados de pago del tipo 'No Aplica'."""
     estado = str(value or "").strip().lower()
     return estado.startswith("🎟️ no aplica") or estado == "no aplica"
 
 
+def is_estado_pago_confirmable(value: object) -> bool:
+    """Pagado (``✅``) o No Aplica: se puede confirmar sin comprobante en S3; crédito nunca."""
+    estado = str(value or "").strip()
+    if estado == "💳 CREDITO":
+        return False
+    return estado.startswith("✅") or is_estado_pago_no_aplica(estado)
+
+
 def render_venta_terceros_info(row: pd.Series) -> None:
     """Muestra datos de venta terceros si el pedido aplica y tiene valores útiles."""
     if not is_venta_terceros_pedido(row):
@@ -715,7 +1295,7 @@ def force_reload_pedidos_and_refresh_pendientes() -> tuple[pd.DataFrame, list[st
     """Fuerza recarga real de pedidos, refrescando pendientes y sesión."""
     _get_ws_datos.clear()
     _get_ws_data.clear()
-    cargar_pedidos_desde_google_sheet.clear()
+    invalidar_hojas("datos_pedidos", "data_pedidos")
     st.session_state.setdefault("pedidos_reload_nonce", 0)
     st.session_state["pedidos_reload_nonce"] += 1
 
@@ -739,12 +1319,271 @@ def force_reload_pedidos_and_refresh_pendientes() -> tuple[pd.DataFrame, list[st
     if FECHA_CONFIRMADO_COL not in df_pedidos.columns:
         df_pedidos[FECHA_CONFIRMADO_COL] = ""
 
-    st.session_state.df_pedidos = df_pedidos
+    store_session_frame("df_pedidos", df_pedidos)
     st.session_state.headers = headers
     refresh_pedidos_pagados_no_confirmados(pedidos_pendientes)
+    reset_pedidos_write_through_state()
     return df_pedidos, headers
 
 
+# --- Write-through de confirmaciones (parchea la sesión en vez de releer las hojas) ---
+# Columnas que deciden si un pedido sigue pendiente; son lo único que relee la verificación de versión.
+PEDIDOS_VERSION_COLUMNS = ("ID_Pedido", "Comprobante_Confirmado", MOTIVO_RECHAZO_CANCELACION_COL)
+# Aunque la versión coincida, tras confirmar en modo write-through se recarga completo pasado este tiempo.
+PEDIDOS_SNAPSHOT_MAX_AGE_SECONDS = 10 * 60
+
+
+@st.cache_resource
+def get_pedidos_reconcile_executor() -> ThreadPoolExecutor:
+    """Hilos para las verificaciones de versión: lecturas pequeñas fuera del rerun."""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="reconcile-pedidos")
+
+
+def _read_pedidos_version(worksheet, headers: list[str]) -> dict[str, list[str]]:
+    """Lee solo ``PEDIDOS_VERSION_COLUMNS`` en un único ``batch_get``."""
+    columnas = [col for col in PEDIDOS_VERSION_COLUMNS if col in headers]
+    rangos = []
+    for col in columnas:
+        letra = rowcol_to_a1(1, headers.index(col) + 1)[:-1]
+        rangos.append(f"{letra}:{letra}")
+    valores = worksheet.batch_get(rangos) if rangos else []
+    return {
+        col: _trim_version_column([str(fila[0]) if fila else "" for fila in rango])
+        for col, rango in zip(columnas, valores)
+    }
+
+
+def _trim_version_column(valores: list[str]) -> list[str]:
+    # La API omite las filas vacías al final; se recortan igual en ambos lados de la comparación.
+    while valores and valores[-1] == "":
+        valores.pop()
+    return valores
+
+
+def _schedule_pedidos_version_check(source_sheet: str, worksheet, headers: list[str]) -> None:
+    checks = st.session_state.setdefault("_pedidos_version_checks", {})
+    check = checks.get(source_sheet)
+    if check is not None and not check["future"].done():
+        # La verificación en curso pudo leer antes de esta escritura; se reintenta al terminar.
+        return
+    checks[source_sheet] = {
+        "future": get_pedidos_reconcile_executor().submit(_read_pedidos_version, worksheet, list(headers)),
+        "seq": st.session_state.get("_pedidos_write_seq", {}).get(source_sheet, 0),
+        "worksheet": worksheet,
+        "headers": list(headers),
+    }
+
+
+def reset_pedidos_write_through_state() -> None:
+    """Olvida versiones y verificaciones pendientes tras una recarga completa."""
+    for key in ("_pedidos_version_checks", "_pedidos_version_base", "_pedidos_write_seq"):
+        st.session_state.pop(key, None)
+    st.session_state["_pedidos_snapshot_loaded_at"] = time.time()
+
+
+def apply_pedido_write_through(
+    selected_pedido_data: pd.Series,
+    source_sheet: str,
+    gsheet_row_index: int,
+    updates: dict,
+    worksheet,
+    headers: list[str],
+) -> None:
+    """Aplica en memoria las celdas recién escritas y agenda una verificación de versión.
+
+    ``df_pedidos`` se parchea por fila de hoja y ``pedidos_pagados_no_confirmados``
+    quita el pedido si quedó confirmado o cancelado; ninguna hoja se relee completa.
+    """
+    apply_pedidos_write_through(
+        source_sheet, [(selected_pedido_data, gsheet_row_index)], updates, worksheet, headers
+    )
+
+
+def apply_pedidos_write_through(
+    source_sheet: str,
+    pedidos: list[tuple[pd.Series, int]],
+    updates: dict,
+    worksheet,
+    headers: list[str],
+) -> None:
+    """Versión por lote de ``apply_pedido_write_through``: mismas celdas para varios pedidos de una hoja."""
+    valores = {col: ("" if val is None else val) for col, val in updates.items()}
+    filas_hoja = [int(fila) for _, fila in pedidos]
+
+    if source_sheet == "datos_pedidos":
+        df = load_session_frame("df_pedidos")
+        if df is not None and not df.empty:
+            # El loader descarta filas en blanco: el índice no es la fila de hoja.
+            if "__sheet_row" in df.columns:
+                fila = pd.to_numeric(df["__sheet_row"], errors="coerce").isin(filas_hoja).to_numpy()
+            else:
+                fila = df.index.isin([fila - 2 for fila in filas_hoja])
+            if fila.any():
+                for col, val in valores.items():
+                    if col in df.columns:
+                        df[col] = df[col].where(~fila, val)
+                if {"ID_Pedido", "Folio_Factura"} & set(valores):
+                    with_pedido_keys(df)
+                if MOTIVO_RECHAZO_CANCELACION_COL in valores and PEDIDO_CANCELADO_COL in df.columns:
+                    cancelado = "Cancelado[" in str(valores[MOTIVO_RECHAZO_CANCELACION_COL])
+                    df[PEDIDO_CANCELADO_COL] = df[PEDIDO_CANCELADO_COL].where(~fila, cancelado)
+                store_session_frame("df_pedidos", df)
+
+    _actualizar_pendientes(source_sheet, pedidos, valores)
+
+    # Las demás sesiones leerán la hoja actualizada en su próxima carga.
+    invalidar_hojas(source_sheet)
+
+    base = st.session_state.get("_pedidos_version_base", {}).get(source_sheet)
+    if base is not None:
+        for col in PEDIDOS_VERSION_COLUMNS:
+            if col not in valores or col not in base:
+                continue
+            columna = base[col]
+            for gsheet_row_index in filas_hoja:
+                while len(columna) < gsheet_row_index:
+                    columna.append("")
+                columna[gsheet_row_index - 1] = str(valores[col])
+            base[col] = _trim_version_column(columna)
+    seqs = st.session_state.setdefault("_pedidos_write_seq", {})
+    seqs[source_sheet] = seqs.get(source_sheet, 0) + 1
+    _schedule_pedidos_version_check(source_sheet, worksheet, headers)
+
+
+def reconcile_pedidos_snapshot() -> bool:
+    """Revisa las verificaciones terminadas; recarga completa solo si otro usuario cambió las hojas."""
+    checks = st.session_state.get("_pedidos_version_checks") or {}
+    seqs = st.session_state.get("_pedidos_write_seq") or {}
+    bases = st.session_state.setdefault("_pedidos_version_base", {})
+    desfasada = False
+    for hoja, check in list(checks.items()):
+        if not check["future"].done():
+            continue
+        del checks[hoja]
+        try:
+            leido = check["future"].result()
+        except Exception:
+            continue
+        if check["seq"] != seqs.get(hoja, 0):
+            _schedule_pedidos_version_check(hoja, check["worksheet"], check["headers"])
+            continue
+        if hoja not in bases:
+            bases[hoja] = leido
+        elif bases[hoja] != leido:
+            desfasada = True
+
+    loaded_at = float(st.session_state.get("_pedidos_snapshot_loaded_at", 0.0) or 0.0)
+    vencida = bool(seqs) and time.time() - loaded_at > PEDIDOS_SNAPSHOT_MAX_AGE_SECONDS
+    if desfasada or vencida:
+        force_reload_pedidos_and_refresh_pendientes()
+        return True
+    return False
+
+
+def build_pedido_row_index(df_source: pd.DataFrame) -> dict[tuple[str, str], int]:
+    """Índice (``"id"``/``"folio"``, clave normalizada) → fila de hoja, con la prioridad de ``resolve_gsheet_row_index``."""
+    if df_source is None or df_source.empty:
+        return {}
+    filas = pd.Series(df_source.index, index=df_source.index) + 2
+    if "__sheet_row" in df_source.columns:
+        sheet_rows = pd.to_numeric(df_source["__sheet_row"], errors="coerce")
+        filas = sheet_rows.where(sheet_rows >= 2, filas)
+    indice: dict[tuple[str, str], int] = {}
+    claves_por_tipo = pedido_key_index(df_source)
+    filas = filas.tolist()
+    for tipo, claves in claves_por_tipo.items():
+        for clave, posiciones in claves.items():
+            indice[(tipo, clave)] = int(filas[posiciones[0]])
+    return indice
+
+
+def lookup_pedido_row(indice: dict[tuple[str, str], int], pedido: pd.Series) -> int | None:
+    """Fila de hoja del pedido según ``build_pedido_row_index`` (ID primero, luego folio)."""
+    pedido_id = normalize_id_pedido(pedido.get("ID_Pedido", ""))
+    if pedido_id and ("id", pedido_id) in indice:
+        return indice[("id", pedido_id)]
+    folio = normalize_folio_factura(pedido.get("Folio_Factura", ""))
+    if folio:
+        return indice.get(("folio", folio))
+    return None
+
+
+def bulk_confirm_comprobantes(seleccion: pd.DataFrame) -> list[dict]:
+    """Confirma varios comprobantes con un ``batch_update`` por hoja y reporta el resultado de cada pedido."""
+    resultados: list[dict] = []
+    updates = {
+        "Comprobante_Confirmado": "Sí",
+        FECHA_CONFIRMADO_COL: obtener_fecha_confirmado_cdmx(),
+    }
+
+    def _resultado(pedido: pd.Series, hoja: str, fila: int | None, ok: bool, detalle: str) -> dict:
+        return {
+            "Folio_Factura": pedido.get("Folio_Factura", ""),
+            "Cliente": pedido.get("Cliente", ""),
+            "Hoja": hoja,
+            "Fila": fila,
+            "OK": ok,
+            "Detalle": detalle,
+        }
+
+    if "__source_sheet" in seleccion.columns:
+        hojas = seleccion["__source_sheet"].fillna("datos_pedidos").astype(str).replace("", "datos_pedidos")
+    else:
+        hojas = pd.Series("datos_pedidos", index=seleccion.index)
+
+    for hoja, grupo in seleccion.groupby(hojas, sort=False):
+        try:
+            df_source, worksheet, headers, source_sheet = resolve_pedido_source_context(grupo.iloc[0])
+            headers = ensure_sheet_column(worksheet, headers, FECHA_CONFIRMADO_COL)
+        except Exception as e:
+            resultados.extend(
+                _resultado(pedido, hoja, None, False, f"No se pudo abrir la hoja: {e}")
+                for _, pedido in grupo.iterrows()
+            )
+            continue
+
+        indice = build_pedido_row_index(df_source)
+        cell_updates = []
+        confirmables: list[tuple[pd.Series, int]] = []
+        for _, pedido in grupo.iterrows():
+            # Misma regla que el botón individual: sin comprobantes revisados solo pasan pagados/No Aplica.
+            if not is_estado_pago_confirmable(pedido.get("Estado_Pago", "")):
+                resultados.append(_resultado(
+                    pedido, source_sheet, None, False,
+                    f"Estado_Pago '{pedido.get('Estado_Pago', '')}' no se confirma en lote; revísalo individualmente.",
+                ))
+                continue
+            fila = lookup_pedido_row(indice, pedido)
+            if fila is None:
+                resultados.append(_resultado(pedido, source_sheet, None, False, "No se encontró el pedido en la hoja origen."))
+                continue
+            for col, val in updates.items():
+                if col in headers:
+                    cell_updates.append({
+                        "range": rowcol_to_a1(fila, headers.index(col) + 1),
+                        "values": [[val]],
+                    })
+            confirmables.append((pedido, fila))
+
+        if not cell_updates:
+            continue
+        try:
+            safe_batch_update(worksheet, cell_updates)
+        except Exception as e:
+            resultados.extend(
+                _resultado(pedido, source_sheet, fila, False, f"Error al escribir: {e}")
+                for pedido, fila in confirmables
+            )
+            continue
+
+        apply_pedidos_write_through(source_sheet, confirmables, updates, worksheet, headers)
+        resultados.extend(
+            _resultado(pedido, source_sheet, fila, True, "Confirmado")
+            for pedido, fila in confirmables
+        )
+    return resultados
+
+
 if "pedidos_reload_nonce" not in st.session_state:
     st.session_state["pedidos_reload_nonce"] = 0
 
@@ -799,26 +1638,27 @@ def expand_link_adjuntos_columns(df: pd.DataFrame) -> tuple[pd.DataFrame, list[s
     if "Link_Adjuntos" not in df_expanded.columns:
         return df_expanded, []
 
-    def _split_links(valor: str) -> list[str]:
-        bruto = str(valor or "")
-        partes = [p.strip() for p in bruto.replace("\n", ",").split(",") if p and p.strip()]
-        return list(dict.fromkeys(partes))
-
-    enlaces_por_fila = df_expanded["Link_Adjuntos"].fillna("").apply(_split_links)
-    max_enlaces = int(enlaces_por_fila.map(len).max() or 0) if not enlaces_por_fila.empty else 0
-
-    patron_columna_adjuntos = re.compile(r"Link_Adjuntos_\d+")
-
-    columnas_creadas: list[str] = []
-    for idx in range(max_enlaces):
-        nombre_columna = f"Link_Adjuntos_{idx + 1}"
-        columnas_creadas.append(nombre_columna)
-        df_expanded[nombre_columna] = enlaces_por_fila.apply(
-            lambda enlaces, i=idx: enlaces[i] if len(enlaces) > i else ""
-        )
-
-    columnas_creadas = [col for col in columnas_creadas if patron_columna_adjuntos.fullmatch(col)]
+    # Una sola pasada por fila (partir, limpiar y deduplicar) y todas las columnas nuevas
+    # se agregan juntas, sin reconstruir el DataFrame columna por columna.
+    enlaces_por_fila: list[list[str]] = []
+    for bruto in df_expanded["Link_Adjuntos"].fillna("").astype(str).tolist():
+        vistos: dict[str, None] = {}
+        if bruto:
+            for parte in bruto.replace("\n", ",").split(","):
+                parte = parte.strip()
+                if parte:
+                    vistos[parte] = None
+        enlaces_por_fila.append(list(vistos))
+
+    max_enlaces = max(map(len, enlaces_por_fila), default=0)
+    if max_enlaces == 0:
+        return df_expanded, []
 
+    columnas_creadas = [f"Link_Adjuntos_{idx + 1}" for idx in range(max_enlaces)]
+    expandidas = pd.DataFrame(
+        enlaces_por_fila, index=df_expanded.index, columns=columnas_creadas
+    ).fillna("")
+    df_expanded = pd.concat([df_expanded, expandidas], axis=1)
     return df_expanded, columnas_creadas
 
 def safe_open_worksheet(sheet_id: str, worksheet_name: str, retries: int = 3):
@@ -992,7 +1832,7 @@ def reset_pending_confirmation_selection_state() -> None:
 
 
 def release_app_memory() -> None:
-    """Libera memoria de sesión/caché para reducir reinicios por límites de recursos."""
+    """Libera el estado de esta sesión y fuerza que vuelva a leer las hojas (sin vaciar cachés compartidas)."""
     keep_keys = {
         TAB_SESSION_KEY,
         "current_tab",
@@ -1005,6 +1845,7 @@ def release_app_memory() -> None:
     }
     preserve_prefixes = ("auth_",)
 
+    release_session_frames()
     for key in list(st.session_state.keys()):
         if key in keep_keys:
             continue
@@ -1013,25 +1854,48 @@ def release_app_memory() -> None:
         # Limpieza agresiva: elimina DataFrames y llaves temporales para recuperar RAM.
         st.session_state.pop(key, None)
 
-    st.cache_data.clear()
-    st.cache_resource.clear()
+    # Las cachés compartidas (datos, clientes) no se tocan: otras sesiones las siguen usando.
+    # Subir los nonces basta para que esta sesión vuelva a leer las hojas.
+    for nonce_key in ("pedidos_reload_nonce", "tab2_reload_nonce", "tab3_reload_nonce", "tab4_reload_nonce"):
+        st.session_state[nonce_key] = int(st.session_state.get(nonce_key, 0) or 0) + 1
     gc.collect()
 
 
+SESSION_LARGE_VALUE_BYTES = 256 * 1024
+
+
+def _session_value_bytes(value) -> int:
+    if isinstance(value, pd.DataFrame):
+        try:
+            return int(value.memory_usage(deep=True).sum())
+        except Exception:
+            return 0
+    if isinstance(value, (bytes, bytearray, memoryview, str, list, tuple, set, dict)):
+        return sys.getsizeof(value)
+    return 0
+
+
+def release_session_large_values() -> int:
+    """Quita de esta sesión los DataFrames y blobs grandes que no viven en el almacén compartido."""
+    liberados = 0
+    for key in list(st.session_state.keys()):
+        if key in (TAB_SESSION_KEY, "current_tab") or str(key).startswith("auth_"):
+            continue
+        value = st.session_state.get(key)
+        if isinstance(value, pd.DataFrame) or _session_value_bytes(value) >= SESSION_LARGE_VALUE_BYTES:
+            st.session_state.pop(key, None)
+            liberados += 1
+    return liberados
+
+
 def estimate_session_state_df_memory_mb() -> float:
-    """Estima memoria total en MB ocupada por DataFrames y blobs en session_state."""
-    total_bytes = 0
-    for value in st.session_state.values():
-        if isinstance(value, pd.DataFrame):
-            try:
-                total_bytes += int(value.memory_usage(deep=True).sum())
-            except Exception:
-                continue
-        elif isinstance(value, (bytes, bytearray, memoryview, str)):
-            total_bytes += sys.getsizeof(value)
-        elif isinstance(value, (list, tuple, set, dict)):
-            # Estimación ligera (shallow) para colecciones temporales grandes.
-            total_bytes += sys.getsizeof(value)
+    """Estima memoria total en MB ocupada por DataFrames y blobs en session_state.
+
+    Los handles del almacén compartido no cuentan: el contenido se paga una vez
+    para todas las sesiones y lo acota ``FRAME_STORE_MAX_BYTES``.
+    """
+    # Estimación ligera (shallow) para colecciones temporales grandes.
+    total_bytes = sum(_session_value_bytes(value) for value in st.session_state.values())
     return total_bytes / (1024 * 1024)
 
 
@@ -1041,8 +1905,9 @@ def maybe_run_proactive_memory_guard(
     min_interval_sec: int = 90,
 ) -> None:
     """
-    Limpieza preventiva: si los DataFrames en session_state superan el umbral,
-    libera memoria antes de llegar al límite duro de Streamlit Cloud.
+    Limpieza preventiva: si los DataFrames propios de la sesión superan el umbral,
+    los suelta antes de llegar al límite duro de Streamlit Cloud. No toca las
+    cachés globales ni el almacén compartido (ése se acota solo por LRU).
     """
     now = time.time()
     last_guard = float(st.session_state.get("_last_memory_guard_ts", 0.0) or 0.0)
@@ -1055,14 +1920,182 @@ def maybe_run_proactive_memory_guard(
     if current_mb < threshold_mb:
         return
 
-    active_tab = st.session_state.get(TAB_SESSION_KEY, 0)
-    release_app_memory()
-    st.session_state[TAB_SESSION_KEY] = active_tab
-    st.session_state["current_tab"] = str(active_tab)
-    st.warning(
-        "🧹 Se aplicó una limpieza preventiva de memoria para evitar el error de límites de recursos. "
-        "Si estabas llenando un formulario, vuelve a abrirlo."
-    )
+    if release_session_large_values():
+        gc.collect()
+        st.session_state["_session_df_memory_mb"] = round(estimate_session_state_df_memory_mb(), 2)
+        st.warning(
+            "🧹 Se aplicó una limpieza preventiva de memoria para evitar el error de límites de recursos. "
+            "Si estabas llenando un formulario, vuelve a abrirlo."
+        )
+
+
+# --- Motor vectorizado de fechas mixtas ---
+# Seriales de Sheets/Excel plausibles para pedidos: 1970-01-01 .. 2099-12-31.
+FECHA_SERIAL_MIN = 25569
+FECHA_SERIAL_MAX = 73051
+FECHA_SERIAL_TEXTO_PATTERN = r"^\d+\.\d+$"
+FECHA_SOLO_DIGITOS_PATTERN = r"^\d+$"
+FECHA_OFFSET_PATTERN = r"\d{1,2}:\d{2}(?::\d{2}(?:\.\d+)?)?\s*(?:Z|[+-]\d{2}:?\d{2})$"
+FECHAS_ZONA_LOCAL = "America/Mexico_City"
+FECHA_ISO_PATTERN = r"^\d{4}-\d{1,2}-\d{1,2}"
+FECHA_DIA_MES_PATTERN = r"^\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}"
+FECHA_ISO_FORMATOS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d", "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M:%S")
+FECHAS_MEMO_MAX_ENTRIES = 64
+
+
+@st.cache_resource
+def _get_fechas_memo() -> dict:
+    """Memo compartido de columnas de fechas ya parseadas (por contenido de la columna)."""
+    return {"entries": OrderedDict(), "lock": threading.Lock()}
+
+
+def _fechas_a_naive(parsed: pd.Series) -> pd.Series:
+    """Deja todo en hora local de CDMX sin zona, venga o no con offset."""
+    if isinstance(parsed.dtype, pd.DatetimeTZDtype):
+        return parsed.dt.tz_convert(FECHAS_ZONA_LOCAL).dt.tz_localize(None)
+    if parsed.dtype == object:
+        return pd.to_datetime(
+            parsed.map(
+                lambda v: v.tz_convert(FECHAS_ZONA_LOCAL).tz_localize(None)
+                if getattr(v, "tzinfo", None) is not None
+                else v
+            ),
+            errors="coerce",
+        )
+    return parsed
+
+
+def _to_datetime_mixto(texto: pd.Series, *, dayfirst: bool, utc: bool = False) -> pd.Series:
+    # Los offsets mezclados (-06:00 y Z en la misma llamada) provocan un FutureWarning de pandas;
+    # el resultado se normaliza igual en ``_fechas_a_naive``.
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", FutureWarning)
+        try:
+            return pd.to_datetime(texto, errors="coerce", format="mixed", dayfirst=dayfirst, utc=utc)
+        except (TypeError, ValueError):
+            return pd.to_datetime(texto, errors="coerce", dayfirst=dayfirst, utc=utc)
+
+
+def _parse_fechas_por_formatos(texto: pd.Series, formatos: tuple[str, ...], *, dayfirst: bool) -> pd.Series:
+    """Prueba formatos exactos en bloque y deja a ``format='mixed'`` solo lo que sobra."""
+    resultado = pd.Series(pd.NaT, index=texto.index, dtype="datetime64[ns]")
+    pendientes = texto
+    for formato in formatos:
+        if pendientes.empty:
+            break
+        parsed = pd.to_datetime(pendientes, format=formato, errors="coerce")
+        ok = parsed.notna()
+        resultado.loc[ok[ok].index] = parsed[ok]
+        pendientes = pendientes[~ok]
+    if not pendientes.empty:
+        # Con offset se parsea en UTC y se pasa a hora local; sin offset se toma tal cual.
+        con_zona = pendientes.str.contains(FECHA_OFFSET_PATTERN, regex=True)
+        if con_zona.any():
+            parsed = _to_datetime_mixto(pendientes[con_zona], dayfirst=dayfirst, utc=True)
+            resultado.loc[parsed.index] = _fechas_a_naive(parsed)
+        if not con_zona.all():
+            parsed = _to_datetime_mixto(pendientes[~con_zona], dayfirst=dayfirst)
+            resultado.loc[parsed.index] = _fechas_a_naive(parsed)
+    return resultado
+
+
+def _fechas_numericas(series: pd.Series) -> np.ndarray:
+    """Máscara de celdas que llegan como número (no texto) desde la hoja."""
+    if pd.api.types.is_bool_dtype(series):
+        return np.zeros(len(series), dtype=bool)
+    if pd.api.types.is_numeric_dtype(series):
+        return np.ones(len(series), dtype=bool)
+    return series.map(
+        lambda v: isinstance(v, numbers.Real) and not isinstance(v, (bool, np.bool_))
+    ).to_numpy(dtype=bool)
+
+
+def _parse_fechas_mixtas_sin_memo(
+    texto: pd.Series, *, dayfirst: bool, numericos: np.ndarray | None = None
+) -> pd.Series:
+    resultado = pd.Series(pd.NaT, index=texto.index, dtype="datetime64[ns]")
+    vacios = texto.eq("") | texto.str.lower().isin({"nan", "none", "nat", "null"})
+
+    # Serial de Sheets sólo si la celda es número o texto con decimales, y en rango plausible:
+    # "2024" o un folio "45123" en texto no son fechas.
+    candidatos = texto.str.match(FECHA_SERIAL_TEXTO_PATTERN)
+    if numericos is not None:
+        candidatos = candidatos | pd.Series(numericos, index=texto.index)
+    numeros = pd.to_numeric(texto.where(~vacios & candidatos), errors="coerce")
+    es_serial = numeros.between(FECHA_SERIAL_MIN, FECHA_SERIAL_MAX)
+    if es_serial.any():
+        resultado.loc[es_serial] = pd.to_datetime(
+            numeros[es_serial], unit="D", origin="1899-12-30", errors="coerce"
+        )
+
+    solo_digitos = ~vacios & ~es_serial & texto.str.match(FECHA_SOLO_DIGITOS_PATTERN)
+    if solo_digitos.any():
+        # Sólo se acepta AAAAMMDD; otros números en texto quedan como NaT.
+        resultado.loc[solo_digitos] = pd.to_datetime(texto[solo_digitos], format="%Y%m%d", errors="coerce")
+
+    restantes = ~vacios & ~es_serial & ~solo_digitos
+    es_iso = restantes & texto.str.match(FECHA_ISO_PATTERN)
+    if es_iso.any():
+        resultado.loc[es_iso] = _parse_fechas_por_formatos(texto[es_iso], FECHA_ISO_FORMATOS, dayfirst=False)
+
+    es_dia_mes = restantes & ~es_iso & texto.str.match(FECHA_DIA_MES_PATTERN)
+    if es_dia_mes.any():
+        d, m = ("%d", "%m") if dayfirst else ("%m", "%d")
+        formatos = tuple(
+            f"{d}{sep}{m}{sep}%Y{hora}"
+            for sep in ("/", "-")
+            for hora in (" %H:%M:%S", "", " %H:%M")
+        )
+        resultado.loc[es_dia_mes] = _parse_fechas_por_formatos(texto[es_dia_mes], formatos, dayfirst=dayfirst)
+
+    otros = restantes & ~es_iso & ~es_dia_mes
+    if otros.any():
+        resultado.loc[otros] = _parse_fechas_por_formatos(texto[otros], (), dayfirst=dayfirst)
+    return resultado
+
+
+def _fechas_texto_normalizado(series: pd.Series) -> pd.Series:
+    texto = series.astype(str).str.strip()
+    return texto.mask(series.isna(), "").reset_index(drop=True)
+
+
+def parse_fechas_mixtas(series: pd.Series, *, dayfirst: bool = True) -> pd.Series:
+    """Convierte una columna con seriales de Sheets, ISO y dd/mm a ``datetime64``.
+
+    Clasifica las celdas con máscaras, parsea cada clase en una sola llamada y
+    memoriza el resultado por contenido de la columna para no repetirlo en cada rerun.
+    """
+    if series is None or len(series) == 0:
+        return pd.Series(pd.NaT, index=getattr(series, "index", None), dtype="datetime64[ns]")
+
+    texto = _fechas_texto_normalizado(series)
+    numericos = _fechas_numericas(series)
+    digest = hashlib.sha1(pd.util.hash_pandas_object(texto, index=False).to_numpy().tobytes())
+    digest.update(np.packbits(numericos).tobytes())
+    key = (digest.hexdigest(), bool(dayfirst))
+
+    memo = _get_fechas_memo()
+    with memo["lock"]:
+        valores = memo["entries"].get(key)
+        if valores is not None:
+            memo["entries"].move_to_end(key)
+    if valores is None:
+        valores = _parse_fechas_mixtas_sin_memo(texto, dayfirst=dayfirst, numericos=numericos).to_numpy()
+        with memo["lock"]:
+            memo["entries"][key] = valores
+            while len(memo["entries"]) > FECHAS_MEMO_MAX_ENTRIES:
+                memo["entries"].popitem(last=False)
+
+    return pd.Series(valores, index=series.index, name=series.name, dtype="datetime64[ns]")
+
+
+def format_fechas_mixtas(series: pd.Series, *, with_time: bool = True, dayfirst: bool = True) -> pd.Series:
+    """Formatea fechas mixtas de manera uniforme; lo que no es fecha se deja como texto."""
+    parsed = parse_fechas_mixtas(series, dayfirst=dayfirst)
+    texto = _fechas_texto_normalizado(series).set_axis(series.index)
+    texto = texto.mask(texto.str.lower().isin({"nan", "none", "nat"}), "")
+    formateado = parsed.dt.strftime("%Y-%m-%d %H:%M:%S" if with_time else "%Y-%m-%d")
+    return formateado.where(parsed.notna(), texto)
 
 
 @st.cache_resource(ttl=60)
@@ -1180,6 +2213,118 @@ def normalize_folio_factura(value) -> str:
     return text
 
 
+# --- Claves normalizadas de pedido (vectorizadas) e índices por snapshot ---
+PEDIDO_KEY_ID_COL = "__key_id"
+PEDIDO_KEY_FOLIO_COL = "__key_folio"
+PEDIDO_KEY_INDEX_MAX = 8
+# Resultado de la búsqueda ``Cancelado[`` en el motivo, calculado una vez por snapshot.
+PEDIDO_CANCELADO_COL = "__cancelado"
+
+
+def _normalize_key_series(series: pd.Series, normalizar) -> pd.Series:
+    """Aplica ``normalizar`` una sola vez por valor distinto y expande con los códigos de ``factorize``.
+
+    Los ``.str`` de pandas sobre columnas object recorren la serie en Python una vez por
+    operación; normalizar solo los valores únicos es más rápido y da exactamente el
+    mismo resultado que la versión escalar (que empieza con ``str(value)``).
+    """
+    if series.empty:
+        return series.astype(object)
+    codes, uniques = pd.factorize(series.astype(str))
+    normalizados = np.array([normalizar(valor) for valor in uniques], dtype=object)
+    return pd.Series(normalizados[codes], index=series.index, name=series.name)
+
+
+def normalize_id_pedido_series(series: pd.Series) -> pd.Series:
+    """Equivalente vectorizado de ``normalize_id_pedido``."""
+    return _normalize_key_series(series, normalize_id_pedido)
+
+
+def normalize_folio_factura_series(series: pd.Series) -> pd.Series:
+    """Equivalente vectorizado de ``normalize_folio_factura``."""
+    return _normalize_key_series(series, normalize_folio_factura)
+
+
+def with_pedido_keys(df: pd.DataFrame) -> pd.DataFrame:
+    """Agrega (in place) las columnas ocultas de clave normalizada de ID y folio."""
+    if df is None or df.empty:
+        return df
+    # Claves nuevas: el frame deja de ser la versión del almacén de la que salió.
+    df.attrs.pop(FRAME_VERSION_ATTR, None)
+    if "ID_Pedido" in df.columns:
+        df[PEDIDO_KEY_ID_COL] = normalize_id_pedido_series(df["ID_Pedido"])
+    if "Folio_Factura" in df.columns:
+        df[PEDIDO_KEY_FOLIO_COL] = normalize_folio_factura_series(df["Folio_Factura"])
+    return df
+
+
+def pedido_id_keys(df: pd.DataFrame) -> pd.Series:
+    """ID normalizado por fila; usa la columna precalculada del snapshot si existe."""
+    if PEDIDO_KEY_ID_COL in df.columns:
+        return df[PEDIDO_KEY_ID_COL]
+    if "ID_Pedido" in df.columns:
+        return normalize_id_pedido_series(df["ID_Pedido"])
+    return pd.Series("", index=df.index, dtype=object)
+
+
+def pedido_folio_keys(df: pd.DataFrame) -> pd.Series:
+    """Folio normalizado por fila; usa la columna precalculada del snapshot si existe."""
+    if PEDIDO_KEY_FOLIO_COL in df.columns:
+        return df[PEDIDO_KEY_FOLIO_COL]
+    if "Folio_Factura" in df.columns:
+        return normalize_folio_factura_series(df["Folio_Factura"])
+    return pd.Series("", index=df.index, dtype=object)
+
+
+def _positions_by_key(keys: pd.Series) -> dict[str, list[int]]:
+    posiciones: dict[str, list[int]] = {}
+    for pos, key in enumerate(keys.tolist()):
+        if key:
+            posiciones.setdefault(key, []).append(pos)
+    return posiciones
+
+
+def _pedido_key_token(df: pd.DataFrame) -> str | None:
+    """Versión del snapshot (handle del almacén) si el frame trae sus claves precalculadas."""
+    if PEDIDO_KEY_ID_COL not in df.columns or PEDIDO_KEY_FOLIO_COL not in df.columns:
+        return None
+    return df.attrs.get(FRAME_VERSION_ATTR)
+
+
+def pedido_key_index(df: pd.DataFrame) -> dict[str, dict[str, list[int]]]:
+    """Índice hash ``{"id"|"folio": {clave: [posiciones]}}``, construido una vez por versión de snapshot.
+
+    Las vistas derivadas (filtros, orden) heredan ``attrs``; la entrada solo se
+    reutiliza si el índice de filas coincide con el del snapshot que la creó.
+    """
+    token = _pedido_key_token(df)
+    memo = st.session_state.setdefault("_pedido_key_indexes", {}) if token is not None else {}
+    entrada = memo.get(token)
+    if entrada is not None:
+        filas, indice = entrada
+        if filas is df.index or filas.equals(df.index):
+            return indice
+    indice = {
+        "id": _positions_by_key(pedido_id_keys(df)),
+        "folio": _positions_by_key(pedido_folio_keys(df)),
+    }
+    if token is not None and entrada is None:
+        while len(memo) >= PEDIDO_KEY_INDEX_MAX:
+            memo.pop(next(iter(memo)))
+        memo[token] = (df.index, indice)
+    return indice
+
+
+def find_pedido_positions(df: pd.DataFrame, pedido_id: str = "", folio: str = "") -> list[int]:
+    """Posiciones (``iloc``) del pedido: primero por ID normalizado y, si no hay, por folio."""
+    if df is None or df.empty:
+        return []
+    indice = pedido_key_index(df)
+    if pedido_id and pedido_id in indice["id"]:
+        return indice["id"][pedido_id]
+    if folio:
+        return indice["folio"].get(folio, [])
+    return []
 
 
 def clean_folio_for_ui(value) -> str:
@@ -1218,36 +2363,17 @@ def build_adjuntos_map_from_pedidos(
     if "ID_Pedido" not in df.columns:
         return empty_result
 
-    ids_normalizados = df["ID_Pedido"].apply(normalize_id_pedido)
+    ids_normalizados = pedido_id_keys(df)
+    ids_validos = ids_normalizados.ne("")
 
     def _build_for_column(column_name: str) -> dict[str, object]:
-        column_map: dict[str, object] = {}
-        if column_name not in df.columns:
-            return column_map
-
-        series = df[column_name]
-        for row_idx in df.index:
-            pedido_id = ids_normalizados.get(row_idx, "")
-            if not pedido_id:
-                continue
-
-            try:
-                raw_value = series.loc[row_idx]
-            except KeyError:
-                continue
-
-            try:
-                if pd.isna(raw_value):
-                    continue
-            except Exception:
-                pass
-
-            if isinstance(raw_value, str) and not raw_value.strip():
-                continue
-
-            column_map[pedido_id] = raw_value
+        if column_name not in df.columns:
+            return {}
 
-        return column_map
+        series = df[column_name]
+        # Celdas nulas o en blanco se omiten; los valores no texto se conservan tal cual.
+        mask = ids_validos & series.notna() & series.astype(str).str.strip().ne("")
+        return dict(zip(ids_normalizados[mask], series[mask]))
 
     adjuntos_map = _build_for_column("Adjuntos")
     adjuntos_surtido_map = _build_for_column("Adjuntos_Surtido")
@@ -1349,6 +2475,13 @@ def clean_cell_text(value) -> str:
     return text
 
 
+def clean_cell_text_series(series: pd.Series) -> pd.Series:
+    """Versión vectorizada de ``clean_cell_text`` para una columna completa."""
+    texto = series.astype(str)
+    nulos = series.isna() | texto.str.strip().str.lower().isin({"nan", "none", "null"})
+    return texto.mask(nulos, "")
+
+
 def build_link_fallback_map(
     df: pd.DataFrame | None,
     columns: list[str],
@@ -1361,26 +2494,20 @@ def build_link_fallback_map(
     if "ID_Pedido" not in df.columns:
         return {}
 
-    ids_normalizados = df["ID_Pedido"].apply(normalize_id_pedido)
-    resultado: dict[str, dict[str, str]] = {}
-
     columnas_validas = [col for col in columns if col in df.columns]
     if not columnas_validas:
         return {}
 
-    for row_idx in df.index:
-        pedido_id_norm = ids_normalizados.get(row_idx, "")
-        if not pedido_id_norm:
-            continue
-        fila = df.loc[row_idx]
-        valores = {
-            col: clean_cell_text(fila.get(col))  # type: ignore[index]
-            for col in columnas_validas
-        }
-        if any(valores.values()):
-            resultado[pedido_id_norm] = valores
+    ids_normalizados = pedido_id_keys(df)
+    valores = pd.DataFrame(
+        {col: clean_cell_text_series(df[col]).to_numpy() for col in columnas_validas},
+        index=df.index,
+    )
+    mask = ids_normalizados.ne("") & valores.ne("").any(axis=1)
+    if not mask.any():
+        return {}
 
-    return resultado
+    return dict(zip(ids_normalizados[mask], valores[mask].to_dict("records")))
 
 
 def resolve_adjuntos_link(
@@ -1445,6 +2572,7 @@ def resolve_adjuntos_link(
 GOOGLE_SHEET_ID = '1aWkSelodaz0nWfQx7FZAysGnIYGQFJxAN7RO3YgCiZY'
 
 
+@depende_de_hojas("datos_pedidos", "data_pedidos")
 @st.cache_data(ttl=300, max_entries=2)
 def cargar_pedidos_desde_google_sheet(sheet_id, worksheet_name, _nonce: int = 0):
     # 1) Intenta leer con reintentos usando el helper
@@ -1457,26 +2585,14 @@ def cargar_pedidos_desde_google_sheet(sheet_id, worksheet_name, _nonce: int = 0)
             df = pd.DataFrame()
         else:
             headers = ["" if h is None else str(h) for h in raw_values[0]]
-            num_cols = len(headers)
-
-            if num_cols == 0:
-                df = pd.DataFrame()
-            else:
-                rows = []
-                sheet_rows = []
-                for sheet_row_number, raw_row in enumerate(raw_values[1:], start=2):
-                    row = list(raw_row[:num_cols])
-                    if len(row) < num_cols:
-                        row.extend([""] * (num_cols - len(row)))
-                    row = ["" if cell is None else cell for cell in row]
-                    if all(str(cell).strip() == "" for cell in row):
-                        continue
-                    rows.append(row)
-                    sheet_rows.append(sheet_row_number)
-
-                df = pd.DataFrame(rows, columns=headers) if rows else pd.DataFrame(columns=headers)
-                if not df.empty:
-                    df["__sheet_row"] = sheet_rows
+            df, sheet_rows, _ = sheet_values_to_frame(
+                raw_values,
+                sufijo_duplicados=None,
+                descartar_vacias=True,
+                limpiar_encabezados=False,
+            )
+            if not df.empty:
+                df["__sheet_row"] = sheet_rows
 
         # 🔧 Normalización idéntica o equivalente a la tuya actual
         def _clean(s):
@@ -1524,24 +2640,291 @@ def cargar_pedidos_desde_google_sheet(sheet_id, worksheet_name, _nonce: int = 0)
         df = df.dropna(subset=["Folio_Factura", "ID_Pedido"], how="all")
 
         if "ID_Pedido" in df.columns:
-            df["ID_Pedido"] = df["ID_Pedido"].apply(normalize_id_pedido)
+            df["ID_Pedido"] = normalize_id_pedido_series(df["ID_Pedido"])
+        with_pedido_keys(df)
+        df[PEDIDO_CANCELADO_COL] = _motivo_cancelado_mask(df)
+
+        register_sheet_headers(worksheet_name, headers)
 
         # 2) Guarda snapshot “último bueno” por si falla luego
         # Snapshot ligero: evita duplicar memoria completa del DataFrame en cada recarga.
-        st.session_state[f"_lastgood_{worksheet_name}"] = (df.copy(deep=False), list(headers))
+        store_session_frame(f"_lastgood_{worksheet_name}", df)
+        st.session_state[f"_lastgood_{worksheet_name}_headers"] = list(headers)
         return df, headers
 
     except gspread.exceptions.APIError as e:
         # 3) Fallback: usa el último snapshot bueno si existe
-        snap = st.session_state.get(f"_lastgood_{worksheet_name}")
-        if snap:
+        snap = load_session_frame(f"_lastgood_{worksheet_name}")
+        if snap is not None:
             st.warning(f"♻️ Google Sheets dio un error temporal al leer '{worksheet_name}'. Mostrando el último dato bueno en caché.")
-            return snap[0], snap[1]
+            return snap, st.session_state.get(f"_lastgood_{worksheet_name}_headers", list(snap.columns))
         # 4) Si no hay snapshot, devuelve vacío pero sin matar la app
         st.error(f"❌ No se pudo leer '{worksheet_name}' (Google API). Intenta el botón de Recargar. Detalle: {e}")
         return pd.DataFrame(), []
 
 
+# --- Trazas de llamadas externas (Sheets / S3 / PDF) ---
+# Cuota por defecto de la API de Sheets (solicitudes por minuto por usuario, lectura y escritura por separado).
+SHEETS_QUOTA_POR_MINUTO = 60
+_SHEETS_OPERATION_PATTERNS = (
+    (re.compile(r"/values:batchUpdate$"), "values_batch_update"),
+    (re.compile(r"/values:batchGet$"), "values_batch_get"),
+    (re.compile(r"/values:batchClear$"), "values_batch_clear"),
+    (re.compile(r":batchUpdate$"), "batch_update"),
+    (re.compile(r"/values/[^/]+:append$"), "values_append"),
+    (re.compile(r"/values/[^/]+:clear$"), "values_clear"),
+)
+# Estados tras los que la app (o gspread con backoff) repite la misma llamada.
+SHEETS_RETRY_STATUSES = {429, 500, 502, 503, 504}
+SHEETS_RETRY_WINDOW_S = 120
+
+
+def _trace_section() -> str:
+    """Pestaña activa de la sesión que origina la llamada (``general`` fuera del script)."""
+    try:
+        tab_index = int(st.session_state.get(TAB_SESSION_KEY))
+    except Exception:
+        return "general"
+    labels = globals().get("tab_names") or []
+    return str(labels[tab_index]) if 0 <= tab_index < len(labels) else f"tab{tab_index + 1}"
+
+
+def record_trace_event(
+    service: str,
+    operation: str,
+    elapsed_s: float,
+    *,
+    kind: str = "read",
+    bytes_out: int = 0,
+    bytes_in: int = 0,
+    retries: int = 0,
+    status: int | str | None = None,
+    ok: bool = True,
+) -> None:
+    """Agrega una llamada al almacén de trazas; nunca interrumpe la llamada original."""
+    now = datetime.now()
+    event = {
+        "ts": now.timestamp(),
+        "minuto": now.strftime("%Y-%m-%d %H:%M"),
+        "service": service,
+        "operation": operation,
+        "kind": kind,
+        "ms": round(elapsed_s * 1000.0, 2),
+        "bytes_out": int(bytes_out or 0),
+        "bytes_in": int(bytes_in or 0),
+        "retries": int(retries or 0),
+        "status": status,
+        "ok": bool(ok),
+        "section": _trace_section(),
+    }
+    try:
+        store = get_trace_store()
+        with store["lock"]:
+            store["events"].append(event)
+    except Exception:
+        pass
+
+
+@contextmanager
+def trace_span(service: str, operation: str, *, kind: str = "read", bytes_out: int = 0):
+    """Mide un bloque arbitrario (p. ej. generar un documento) como una llamada externa."""
+    start = time.perf_counter()
+    ok = True
+    try:
+        yield
+    except Exception:
+        ok = False
+        raise
+    finally:
+        record_trace_event(service, operation, time.perf_counter() - start, kind=kind, bytes_out=bytes_out, ok=ok)
+
+
+def _sheets_operation_name(method: str, endpoint: str) -> tuple[str, str]:
+    """Traduce método + URL de la API de Sheets a (operación, read/write)."""
+    method = str(method or "").upper()
+    kind = "read" if method == "GET" else "write"
+    path = urlparse(str(endpoint or "")).path
+    for pattern, name in _SHEETS_OPERATION_PATTERNS:
+        if pattern.search(path):
+            return name, "read" if name == "values_batch_get" else kind
+    if "/values/" in path:
+        return ("values_get" if method == "GET" else "values_update"), kind
+    if "/drive/" in path or "/files" in path:
+        return f"drive_{method.lower()}", kind
+    if "/spreadsheets/" in path:
+        return ("fetch_metadata" if method == "GET" else f"spreadsheet_{method.lower()}"), kind
+    return method.lower() or "request", kind
+
+
+def _payload_size(payload) -> int:
+    if payload is None:
+        return 0
+    if isinstance(payload, (bytes, bytearray)):
+        return len(payload)
+    if isinstance(payload, str):
+        return len(payload.encode("utf-8"))
+    try:
+        return len(json.dumps(payload, separators=(",", ":"), default=str))
+    except Exception:
+        return 0
+
+
+def instrument_gspread_client(client):
+    """Envuelve ``request`` del cliente gspread para registrar latencia, tamaño y estado de cada llamada."""
+    if client is None or getattr(client, "_trace_instrumented", False):
+        return client
+    # gspread 6 delega las llamadas HTTP en ``http_client``; gspread 5 en el propio cliente.
+    target = getattr(client, "http_client", None) or client
+    original_request = target.request
+    # Último fallo reintentable por (método, URL): la siguiente llamada igual es un reintento,
+    # venga del backoff de gspread o de los bucles de reintento de la app.
+    fallidos: dict[tuple[str, str], float] = {}
+
+    def traced_request(method, endpoint, *args, **kwargs):
+        operation, kind = _sheets_operation_name(method, endpoint)
+        bytes_out = _payload_size(kwargs.get("json")) + _payload_size(kwargs.get("data"))
+        clave = (str(method or "").upper(), str(endpoint or ""))
+        fallo_previo = fallidos.pop(clave, None)
+        es_reintento = fallo_previo is not None and time.monotonic() - fallo_previo <= SHEETS_RETRY_WINDOW_S
+        start = time.perf_counter()
+        response = None
+        status = None
+        try:
+            response = original_request(method, endpoint, *args, **kwargs)
+            status = getattr(response, "status_code", None)
+            return response
+        except Exception as exc:
+            response = getattr(exc, "response", None)
+            status = getattr(response, "status_code", None) or type(exc).__name__
+            raise
+        finally:
+            content = getattr(response, "content", b"") if response is not None else b""
+            if status in SHEETS_RETRY_STATUSES or not isinstance(status, int):
+                if len(fallidos) > 512:
+                    fallidos.clear()
+                fallidos[clave] = time.monotonic()
+            record_trace_event(
+                "sheets",
+                operation,
+                time.perf_counter() - start,
+                kind=kind,
+                bytes_out=bytes_out,
+                bytes_in=len(content or b""),
+                retries=int(es_reintento),
+                status=status,
+                ok=isinstance(status, int) and status < 400,
+            )
+
+    target.request = traced_request
+    client._trace_instrumented = True
+    return client
+
+
+def instrument_boto3_client(client):
+    """Registra latencia, bytes y reintentos de cada operación del cliente boto3 vía eventos de botocore."""
+    if client is None or getattr(client, "_trace_instrumented", False):
+        return client
+    service = client.meta.service_model.service_name
+
+    def _before_call(params=None, model=None, context=None, **_kwargs):
+        if context is None:
+            return
+        context["_trace_start"] = time.perf_counter()
+        body = (params or {}).get("body")
+        bytes_out = _payload_size(body) if isinstance(body, (bytes, bytearray, str)) else 0
+        if not bytes_out:
+            bytes_out = int(((params or {}).get("headers") or {}).get("Content-Length", 0) or 0)
+        context["_trace_bytes_out"] = bytes_out
+
+    def _after_call(http_response=None, parsed=None, model=None, context=None, exception=None, **_kwargs):
+        context = context or {}
+        start = context.get("_trace_start")
+        if start is None or model is None:
+            return
+        metadata = (parsed or {}).get("ResponseMetadata", {}) if isinstance(parsed, dict) else {}
+        status = getattr(http_response, "status_code", None) or (type(exception).__name__ if exception else None)
+        headers = metadata.get("HTTPHeaders") or {}
+        # En ``after-call-error`` no hay respuesta parseada; botocore deja el intento en el contexto.
+        retries = metadata.get("RetryAttempts")
+        if retries is None:
+            retries = max(int((context.get("retries") or {}).get("attempt", 1) or 1) - 1, 0)
+        record_trace_event(
+            service,
+            xform_name(model.name),
+            time.perf_counter() - start,
+            kind="read" if model.http.get("method", "GET") in ("GET", "HEAD") else "write",
+            bytes_out=context.get("_trace_bytes_out", 0),
+            bytes_in=int(headers.get("content-length", 0) or 0),
+            retries=retries,
+            status=status,
+            ok=exception is None and isinstance(status, int) and status < 400,
+        )
+
+    client.meta.events.register(f"before-call.{service}", _before_call)
+    client.meta.events.register(f"after-call.{service}", _after_call)
+    client.meta.events.register(f"after-call-error.{service}", _after_call)
+    client._trace_instrumented = True
+    return client
+
+
+def summarize_trace_events(events: list[dict]) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Resume trazas en (latencias p50/p95 por operación, consumo de cuota de Sheets por minuto)."""
+    if not events:
+        return pd.DataFrame(), pd.DataFrame()
+    df = pd.DataFrame(events)
+    resumen = (
+        df.groupby(["service", "operation"])
+        .agg(
+            llamadas=("ms", "size"),
+            p50_ms=("ms", "median"),
+            p95_ms=("ms", lambda s: s.quantile(0.95)),
+            max_ms=("ms", "max"),
+            errores=("ok", lambda s: int((~s).sum())),
+            reintentos=("retries", "sum"),
+            kb_enviados=("bytes_out", lambda s: s.sum() / 1024),
+            kb_recibidos=("bytes_in", lambda s: s.sum() / 1024),
+            pestañas=("section", lambda s: ", ".join(sorted(set(s)))),
+        )
+        .round(1)
+        .sort_values("p95_ms", ascending=False)
+        .reset_index()
+    )
+    sheets = df[df["service"] == "sheets"]
+    if sheets.empty:
+        return resumen, pd.DataFrame()
+    por_minuto = sheets.pivot_table(index="minuto", columns="kind", values="ms", aggfunc="size", fill_value=0)
+    por_minuto = por_minuto.reindex(columns=["read", "write"], fill_value=0).sort_index(ascending=False)
+    por_minuto["% cuota lectura"] = (por_minuto["read"] / SHEETS_QUOTA_POR_MINUTO * 100).round(0)
+    por_minuto["% cuota escritura"] = (por_minuto["write"] / SHEETS_QUOTA_POR_MINUTO * 100).round(0)
+    return resumen, por_minuto.reset_index()
+
+
+def render_trace_panel() -> None:
+    """Panel de latencias p50/p95 por operación y cuota de Sheets por minuto."""
+    store = get_trace_store()
+    with store["lock"]:
+        events = list(store["events"])
+    with st.expander(f"⏱️ Latencias de servicios externos ({len(events)} llamadas registradas)"):
+        if not events:
+            st.caption("Aún no hay llamadas registradas en este proceso.")
+            return
+        secciones = sorted({e["section"] for e in events})
+        seccion = st.selectbox("Pestaña de origen", ["Todas"] + secciones, key="trace_panel_section")
+        if seccion != "Todas":
+            events = [e for e in events if e["section"] == seccion]
+        resumen, por_minuto = summarize_trace_events(events)
+        st.dataframe(resumen, use_container_width=True, hide_index=True)
+        if not por_minuto.empty:
+            st.markdown("**Cuota de Google Sheets por minuto**")
+            st.dataframe(por_minuto.head(15), use_container_width=True, hide_index=True)
+        if st.button("🧹 Limpiar trazas", key="trace_panel_clear"):
+            with store["lock"]:
+                store["events"].clear()
+
+
+start_rerun_profile("app_admin")
+
+
 @st.cache_resource
 def get_google_sheets_client():
     """
@@ -1563,7 +2946,7 @@ def get_google_sheets_client():
                 "https://www.googleapis.com/auth/drive",  # necesario si agregas hojas, etc.
             ]
             creds = GoogleCredentials.from_service_account_info(creds_dict, scopes=scopes)
-            client = gspread.authorize(creds)
+            client = instrument_gspread_client(gspread.authorize(creds))
             return client
 
         except Exception as e:
@@ -1573,7 +2956,6 @@ def get_google_sheets_client():
                 )
                 time.sleep(delay)
                 delay *= 2
-                st.cache_resource.clear()
             else:
                 st.error(
                     f"❌ No se pudo autenticar con Google Sheets tras {max_retries} intentos: {e}"
@@ -1610,10 +2992,14 @@ def get_spreadsheet(sheet_id: str):
         raise
 
 
-if "df_pedidos" not in st.session_state or "headers" not in st.session_state:
-    df_pedidos, headers = cargar_pedidos_desde_google_sheet(
-        GOOGLE_SHEET_ID, "datos_pedidos", st.session_state["pedidos_reload_nonce"]
-    )
+profile_checkpoint("carga_pedidos")
+reconcile_pedidos_snapshot()
+df_pedidos = load_session_frame("df_pedidos")
+if df_pedidos is None or "headers" not in st.session_state:
+    with profile_block("cargar_pedidos_desde_google_sheet"):
+        df_pedidos, headers = cargar_pedidos_desde_google_sheet(
+            GOOGLE_SHEET_ID, "datos_pedidos", st.session_state["pedidos_reload_nonce"]
+        )
     if "Tipo_Envio" in df_pedidos.columns:
         df_pedidos = df_pedidos[
             ~df_pedidos["Tipo_Envio"].isin(["🎓 Cursos y Eventos", "📋 Solicitudes de Guía"])
@@ -1630,28 +3016,37 @@ if "df_pedidos" not in st.session_state or "headers" not in st.session_state:
                 df_pedidos, headers = cargar_pedidos_desde_google_sheet(
                     GOOGLE_SHEET_ID, "datos_pedidos", st.session_state["pedidos_reload_nonce"]
                 )
-                st.session_state.df_pedidos = df_pedidos
+                store_session_frame("df_pedidos", df_pedidos)
                 st.session_state.headers = headers
                 st.toast("Reintentando...", icon="🔄")
                 rerun_current_tab()
         # No st.stop(): deja que otras pestañas/partes sigan funcionando
     if FECHA_CONFIRMADO_COL not in df_pedidos.columns:
         df_pedidos[FECHA_CONFIRMADO_COL] = ""
-    st.session_state.df_pedidos = df_pedidos
+    store_session_frame("df_pedidos", df_pedidos)
     st.session_state.headers = headers
     pedidos_pendientes_admin = _load_pedidos_pendientes_admin(st.session_state["pedidos_reload_nonce"])
     refresh_pedidos_pagados_no_confirmados(pedidos_pendientes_admin)
+    reset_pedidos_write_through_state()
 
-df_pedidos = st.session_state.df_pedidos
 headers = st.session_state.headers
-pedidos_pagados_no_confirmados = st.session_state.get('pedidos_pagados_no_confirmados', pd.DataFrame())
-if not pedidos_pagados_no_confirmados.empty and FECHA_CONFIRMADO_COL not in pedidos_pagados_no_confirmados.columns:
-    pedidos_pagados_no_confirmados[FECHA_CONFIRMADO_COL] = ""
-if not pedidos_pagados_no_confirmados.empty:
+pedidos_pagados_no_confirmados = load_pedidos_pagados_no_confirmados()
+if pedidos_pagados_no_confirmados is None:
+    # Desalojado del almacén compartido junto con su snapshot base: se recalcula desde las
+    # mismas fuentes que la carga normal (datos_pedidos + data_pedidos con ``__source_sheet``).
+    pedidos_pagados_no_confirmados = refresh_pedidos_pagados_no_confirmados(
+        _load_pedidos_pendientes_admin(st.session_state["pedidos_reload_nonce"])
+    )
+if not pedidos_pagados_no_confirmados.empty and (
+    FECHA_CONFIRMADO_COL not in pedidos_pagados_no_confirmados.columns
+    or "display_label" in pedidos_pagados_no_confirmados.columns
+):
+    if FECHA_CONFIRMADO_COL not in pedidos_pagados_no_confirmados.columns:
+        pedidos_pagados_no_confirmados[FECHA_CONFIRMADO_COL] = ""
     pedidos_pagados_no_confirmados = pedidos_pagados_no_confirmados.drop(
         columns=["display_label"], errors="ignore"
     )
-    st.session_state.pedidos_pagados_no_confirmados = pedidos_pagados_no_confirmados
+    store_session_frame("pedidos_pagados_no_confirmados", pedidos_pagados_no_confirmados)
 
 # --- CONFIGURACIÓN DE AWS S3 ---
 try:
@@ -1762,6 +3157,22 @@ def can_edit_brand_logo() -> bool:
     return query_user in BRAND_LOGO_EDITOR_USERS
 
 
+def can_view_trace_panel() -> bool:
+    """Define si el usuario actual puede ver el panel de latencias (``trace_admin_users`` en secrets)."""
+    permitidos = {str(u).strip().upper() for u in st.secrets.get("trace_admin_users", [])}
+    if not permitidos:
+        return False
+    usuario_param = st.query_params.get("usuario")
+    if isinstance(usuario_param, (list, tuple)):
+        usuario_param = usuario_param[0] if usuario_param else ""
+    candidatos = {
+        str(st.session_state.get("id_vendedor", "") or "").strip().upper(),
+        str(usuario_param or "").strip().upper(),
+    }
+    return bool((candidatos - {""}) & permitidos)
+
+
+profile_checkpoint("encabezado")
 render_brand_title("👨‍💼", "Administración", "TD")
 if can_edit_brand_logo():
     render_logo_uploader("assets/td_logo.png", "admin")
@@ -1770,11 +3181,16 @@ maybe_run_proactive_memory_guard()
 with st.expander("🧹 Mantenimiento de memoria", expanded=False):
     st.caption(
         "Si la app se pone lenta o aparece el error de límites de recursos, "
-        "usa este botón para limpiar cachés y estado temporal."
+        "usa este botón para liberar el estado temporal de tu sesión y recargar los datos."
     )
     current_df_mb = st.session_state.get("_session_df_memory_mb")
     if isinstance(current_df_mb, (int, float)):
         st.caption(f"Uso estimado actual en DataFrames de sesión: **{current_df_mb:.2f} MB**")
+    frame_stats = frame_store_stats()
+    st.caption(
+        f"Almacén compartido: **{frame_stats['mb']:.2f} MB** en {frame_stats['entradas']} tablas "
+        f"({frame_stats['sin_referencias']} sin sesiones activas; límite {FRAME_STORE_MAX_BYTES // (1024 * 1024)} MB)."
+    )
     if st.button("Liberar memoria y recargar", key="admin_release_memory"):
         release_app_memory()
         st.toast("Memoria temporal liberada. Recargando…", icon="🧹")
@@ -1791,7 +3207,7 @@ def get_s3_client_cached(): # Renombrado para evitar conflicto con la variable g
             aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
             region_name=AWS_REGION_NAME
         )
-        return s3
+        return instrument_boto3_client(s3)
     except Exception as e:
         st.error(f"❌ Error al autenticar AWS S3: {e}")
         return None
@@ -2097,6 +3513,41 @@ def get_s3_file_download_url(
     )
 
 
+PRESIGN_EXPIRES_SECONDS = 3600
+# Las firmas se reutilizan mientras les quede al menos ~10 minutos de vigencia.
+PRESIGN_CACHE_TTL_SECONDS = PRESIGN_EXPIRES_SECONDS - 600
+
+
+def presign_s3_url(url: str, prefer_inline_view: bool = True) -> str:
+    """Firma la URL de un objeto S3 con vigencia completa; otras URLs se regresan igual."""
+    if not is_s3_url(url):
+        return url
+    s3_client_instance = get_s3_client_cached()
+    if not s3_client_instance:
+        return url
+    return get_s3_file_download_url(
+        s3_client_instance,
+        url,
+        expires_in=PRESIGN_EXPIRES_SECONDS,
+        prefer_inline_view=prefer_inline_view,
+    )
+
+
+@st.cache_data(show_spinner=False, ttl=PRESIGN_CACHE_TTL_SECONDS, max_entries=5000)
+def presign_s3_url_cached(url: str, prefer_inline_view: bool = True) -> str:
+    """Firma (una sola vez por vigencia) la URL de un objeto S3; otras URLs se regresan igual."""
+    return presign_s3_url(url, prefer_inline_view)
+
+
+def presign_urls_batch(urls) -> dict[str, str]:
+    """Firma en una sola pasada un conjunto de URLs (deduplicadas) y regresa el mapa original ➜ firmada.
+
+    No usa el cache de firmas: quien guarda el resultado (p. ej. un Excel cacheado por
+    ``PRESIGN_CACHE_TTL_SECONDS``) necesita la vigencia completa desde este momento.
+    """
+    return {url: presign_s3_url(url) for url in dict.fromkeys(urls) if url}
+
+
 def clasificar_archivos_adjuntos(files: list[dict]) -> tuple[list[dict], list[dict], list[dict]]:
     """Clasifica archivos en comprobantes, facturas y otros.
 
@@ -2440,6 +3891,7 @@ def discover_comprobante_assets(
     return result
 
 # --- Inicializar clientes de Gspread y S3 ---
+profile_checkpoint("clientes")
 try:
     gc = get_google_sheets_client()
     s3_client = get_s3_client_cached() # Ahora llama a la función cacheada
@@ -2458,8 +3910,16 @@ except Exception as e:
     st.info("- La cuenta de AWS tenga permisos de lectura en el bucket S3.")
     st.stop()
 
+# Panel de latencias sólo para los usuarios listados en secrets (``trace_admin_users``), como en app_v.
+if can_view_trace_panel():
+    render_trace_panel()
+render_profile_panel()
+profile_checkpoint("pestañas")
+
 # Calcular pedidos pendientes para usar en ambos tabs
-pedidos_pagados_no_confirmados = st.session_state.get('pedidos_pagados_no_confirmados', pd.DataFrame())
+pedidos_pagados_no_confirmados = load_pedidos_pagados_no_confirmados()
+if pedidos_pagados_no_confirmados is None:
+    pedidos_pagados_no_confirmados = pd.DataFrame()
 
 # ---- TABS ADMIN ----
 # Mantiene la pestaña activa usando los query params de Streamlit
@@ -2555,6 +4015,7 @@ components.html(
 
 # --- INTERFAZ PRINCIPAL ---
 with tab1:
+    profile_checkpoint("tab1")
     if tab1_is_active:
         st.session_state[TAB_SESSION_KEY] = 0
         st.session_state["current_tab"] = "0"
@@ -2586,10 +4047,8 @@ with tab1:
             st.info("Todos los pedidos pagados han sido confirmados.")
         else:
             pedidos_nota_venta_terceros = pedidos_pagados_no_confirmados[
-                pedidos_pagados_no_confirmados.apply(
-                    lambda row: is_nota_venta_pedido(row) and is_venta_terceros_pedido(row),
-                    axis=1,
-                )
+                nota_venta_mask(pedidos_pagados_no_confirmados)
+                & venta_terceros_mask(pedidos_pagados_no_confirmados)
             ].copy()
 
             if not pedidos_nota_venta_terceros.empty:
@@ -2646,20 +4105,7 @@ with tab1:
                 df_vista = pedidos_pagados_no_confirmados[base_columns].copy()
 
                 if has_turno_data:
-                    def _format_turno_display(row: pd.Series) -> str:
-                        tipo_envio = str(row.get("Tipo_Envio", "")).strip()
-                        if not es_local(tipo_envio):
-                            return ""
-
-                        turno_raw = str(row.get("Turno", "") or "").strip()
-                        if not turno_raw or turno_raw.lower() in {"nan", "none"}:
-                            return ""
-
-                        return turno_raw
-
-                    df_vista[turno_display_col] = pedidos_pagados_no_confirmados.apply(
-                        _format_turno_display, axis=1
-                    )
+                    df_vista[turno_display_col] = turno_local_display(pedidos_pagados_no_confirmados)
                     ordered_cols = [
                         col for col in existing_columns if col in df_vista.columns
                     ]
@@ -2679,13 +4125,21 @@ with tab1:
                     for idx in tabla_pendientes.index
                 ]
 
+                bulk_confirm_mode = st.checkbox(
+                    "☑️ Confirmación masiva (seleccionar varios pedidos)",
+                    key="bulk_confirm_mode",
+                    help="Marca varias filas de la tabla, revísalas y confírmalas en un solo guardado.",
+                )
+                if not bulk_confirm_mode:
+                    st.session_state.pop("bulk_confirm_results", None)
+
                 pending_table_event = st.dataframe(
                     tabla_pendientes,
                     use_container_width=True,
                     hide_index=True,
                     on_select="rerun",
-                    selection_mode="single-row",
-                    key="pending_confirm_table_selector",
+                    selection_mode="multi-row" if bulk_confirm_mode else "single-row",
+                    key="pending_bulk_selector" if bulk_confirm_mode else "pending_confirm_table_selector",
                     column_config={"__pedido_selector_pos": None},
                 )
 
@@ -2694,7 +4148,64 @@ with tab1:
                     pending_selected_rows = pending_selection.get("rows", [])
                 else:
                     pending_selected_rows = getattr(pending_selection, "rows", [])
-                if pending_selected_rows:
+
+                if bulk_confirm_mode:
+                    bulk_positions = [
+                        int(tabla_pendientes.iloc[pos]["__pedido_selector_pos"])
+                        for pos in pending_selected_rows
+                        if 0 <= pos < len(tabla_pendientes)
+                    ]
+                    bulk_resultados = st.session_state.get("bulk_confirm_results")
+                    if bulk_resultados:
+                        ok_count = sum(1 for r in bulk_resultados if r["OK"])
+                        if ok_count == len(bulk_resultados):
+                            st.success(f"✅ {ok_count} comprobante(s) confirmados.")
+                        else:
+                            st.warning(
+                                f"⚠️ {ok_count} de {len(bulk_resultados)} comprobante(s) confirmados; revisa los que fallaron."
+                            )
+                        st.dataframe(pd.DataFrame(bulk_resultados), use_container_width=True, hide_index=True)
+
+                    if not bulk_positions:
+                        st.info("Selecciona en la tabla los pedidos que quieres confirmar.")
+                    else:
+                        seleccion_bulk = pedidos_pagados_no_confirmados.iloc[bulk_positions]
+                        st.markdown(f"#### 🔎 Revisión: {len(seleccion_bulk)} pedido(s) a confirmar")
+                        columnas_revision = [
+                            col
+                            for col in ("Folio_Factura", "Cliente", "Vendedor_Registro", "Tipo_Envio", "Estado_Pago", "Monto_Comprobante")
+                            if col in seleccion_bulk.columns
+                        ]
+                        st.dataframe(seleccion_bulk[columnas_revision], use_container_width=True, hide_index=True)
+                        no_confirmables = int(
+                            (~_columna_texto(seleccion_bulk, "Estado_Pago").map(is_estado_pago_confirmable).astype(bool)).sum()
+                        )
+                        if no_confirmables:
+                            st.warning(
+                                f"⚠️ {no_confirmables} pedido(s) no están pagados (✅) ni en No Aplica "
+                                "(p. ej. crédito): se reportarán como no confirmados."
+                            )
+                        st.caption(
+                            "Se marcará Comprobante_Confirmado = Sí y la fecha de confirmación; "
+                            "el estado de entrega de pedidos locales no se modifica."
+                        )
+                        if st.button(
+                            f"✅ Confirmar {len(seleccion_bulk)} comprobante(s)",
+                            key="bulk_confirm_submit",
+                            type="primary",
+                            disabled=st.session_state.get("confirmando_pedido", False),
+                        ):
+                            st.session_state["confirmando_pedido"] = True
+                            try:
+                                with st.spinner("Confirmando comprobantes..."):
+                                    st.session_state["bulk_confirm_results"] = bulk_confirm_comprobantes(seleccion_bulk)
+                            finally:
+                                st.session_state.pop("confirmando_pedido", None)
+                            st.session_state.pop("pending_bulk_selector", None)
+                            reset_pending_confirmation_selection_state()
+                            rerun_current_tab()
+
+                if pending_selected_rows and not bulk_confirm_mode:
                     pending_selected_display_pos = pending_selected_rows[0]
                     if 0 <= pending_selected_display_pos < len(tabla_pendientes):
                         pending_selected_row = tabla_pendientes.iloc[pending_selected_display_pos]
@@ -2722,21 +4233,8 @@ with tab1:
                 clear_comprobante_form_state()
                 st.session_state.pop("last_selected_pedido_key", None)
 
-            pedidos_pagados_no_confirmados["display_label"] = (
-                pedidos_pagados_no_confirmados.apply(
-                    lambda row: (
-                        f"📄 {row.get('Folio_Factura', 'N/A')} - "
-                        f"👤 {row.get('Cliente', 'N/A')} - "
-                        f"{row.get('Estado', 'N/A')} - "
-                        f"{row.get('Tipo_Envio', 'N/A')}"
-                        + (
-                            " - 🧾 Nota de venta"
-                            if is_nota_venta_pedido(row)
-                            else ""
-                        )
-                    ),
-                    axis=1,
-                )
+            pedidos_pagados_no_confirmados["display_label"] = etiqueta_pendiente_series(
+                pedidos_pagados_no_confirmados
             )
 
             pedido_options = pedidos_pagados_no_confirmados["display_label"].tolist()
@@ -2794,21 +4292,8 @@ with tab1:
                         "Estos pedidos locales fueron marcados como 🔴 No Pagado. "
                         "Se mantienen aquí para seguimiento."
                     )
-                    df_local_no_pagados["display_label_np"] = (
-                        df_local_no_pagados.apply(
-                            lambda row: (
-                                f"📄 {row.get('Folio_Factura', 'N/A')} - "
-                                f"👤 {row.get('Cliente', 'N/A')} - "
-                                f"{row.get('Estado', 'N/A')} - "
-                                f"{row.get('Tipo_Envio', 'N/A')}"
-                                + (
-                                    " - 🧾 Nota de venta"
-                                    if is_nota_venta_pedido(row)
-                                    else ""
-                                )
-                            ),
-                            axis=1,
-                        )
+                    df_local_no_pagados["display_label_np"] = etiqueta_pendiente_series(
+                        df_local_no_pagados
                     )
                     np_options = df_local_no_pagados["display_label_np"].tolist()
                     np_idx = st.selectbox(
@@ -2995,7 +4480,7 @@ with tab1:
                                 st.stop()
                             st.session_state["confirmando_pedido"] = True
                             try:
-                                df_source, worksheet, headers, _ = resolve_pedido_source_context(selected_pedido_data)
+                                df_source, worksheet, headers, source_sheet = resolve_pedido_source_context(selected_pedido_data)
                                 gsheet_row_index = resolve_gsheet_row_index(df_source, selected_pedido_data)
 
                                 # 🔹 OBTENER HOJA FRESCA (con reintentos) ANTES DE ESCRIBIR
@@ -3063,11 +4548,10 @@ with tab1:
 
                                 if updates:
                                     safe_batch_update(worksheet, updates)
-                                    if str(selected_pedido_data.get("__source_sheet", "datos_pedidos")) == "data_pedidos":
-                                        _get_ws_data.clear()
-                                    else:
-                                        _get_ws_datos.clear()
-                                    force_reload_pedidos_and_refresh_pendientes()
+                                    apply_pedido_write_through(
+                                        selected_pedido_data, source_sheet, gsheet_row_index,
+                                        local_updates, worksheet, headers,
+                                    )
 
                                 st.success("✅ Confirmación de crédito guardada exitosamente.")
                                 st.balloons()
@@ -3330,7 +4814,7 @@ with tab1:
                             st.stop()
                         st.session_state["confirmando_pedido"] = True
                         try:
-                            df_source, worksheet, headers, _ = resolve_pedido_source_context(selected_pedido_data)
+                            df_source, worksheet, headers, source_sheet = resolve_pedido_source_context(selected_pedido_data)
                             gsheet_row_index = resolve_gsheet_row_index(df_source, selected_pedido_data)
     
                             # Subir archivos a S3
@@ -3418,12 +4902,13 @@ with tab1:
     
                             if cell_updates:
                                 safe_batch_update(worksheet, cell_updates)
-                                if str(selected_pedido_data.get("__source_sheet", "datos_pedidos")) == "data_pedidos":
-                                    _get_ws_data.clear()
-                                else:
-                                    _get_ws_datos.clear()
-
-                            force_reload_pedidos_and_refresh_pendientes()
+                                local_updates = dict(updates)
+                                if nuevo_valor_adjuntos is not None:
+                                    local_updates["Adjuntos"] = nuevo_valor_adjuntos
+                                apply_pedido_write_through(
+                                    selected_pedido_data, source_sheet, gsheet_row_index,
+                                    local_updates, worksheet, headers,
+                                )
 
                             clear_comprobante_form_state()
                             reset_pending_confirmation_selection_state()
@@ -3558,9 +5043,7 @@ with tab1:
                     num_comprobantes = len(comprobantes) if 'comprobantes' in locals() else 0
                     estado_pago_raw = str(selected_pedido_data.get("Estado_Pago", "")).strip()
                     pedido_pago_no_aplica = is_estado_pago_no_aplica(estado_pago_raw)
-                    pedido_pagado_sin_confirmar = (
-                        estado_pago_raw.startswith("✅") or pedido_pago_no_aplica
-                    )
+                    pedido_pagado_sin_confirmar = is_estado_pago_confirmable(estado_pago_raw)
 
                     # Para pedidos marcados como pagados o No Aplica, permite capturar datos aunque no haya archivos en S3
                     if pedido_pagado_sin_confirmar and num_comprobantes == 0:
@@ -3718,7 +5201,7 @@ with tab1:
                                 st.stop()
                             st.session_state["confirmando_pedido"] = True
                             try:
-                                df_source, worksheet, headers, _ = resolve_pedido_source_context(selected_pedido_data)
+                                df_source, worksheet, headers, source_sheet = resolve_pedido_source_context(selected_pedido_data)
                                 gsheet_row_index = resolve_gsheet_row_index(df_source, selected_pedido_data)
 
                                 if FECHA_CONFIRMADO_COL not in df_pedidos.columns:
@@ -3759,12 +5242,11 @@ with tab1:
 
                                 if cell_updates:
                                     safe_batch_update(worksheet, cell_updates)
-                                    if str(selected_pedido_data.get("__source_sheet", "datos_pedidos")) == "data_pedidos":
-                                        _get_ws_data.clear()
-                                    else:
-                                        _get_ws_datos.clear()
+                                    apply_pedido_write_through(
+                                        selected_pedido_data, source_sheet, gsheet_row_index,
+                                        updates, worksheet, headers,
+                                    )
 
-                                force_reload_pedidos_and_refresh_pendientes()
                                 clear_comprobante_form_state()
                                 reset_pending_confirmation_selection_state()
                                 st.success("🎉 Comprobante confirmado exitosamente.")
@@ -3806,7 +5288,7 @@ with tab1:
                                     else:
                                         prefijo = f"Rechazo[{motivo}]"
                                         try:
-                                            df_source, worksheet, headers, _ = resolve_pedido_source_context(selected_pedido_data)
+                                            df_source, worksheet, headers, source_sheet = resolve_pedido_source_context(selected_pedido_data)
                                             gsheet_row_index = resolve_gsheet_row_index(df_source, selected_pedido_data)
 
                                             if FECHA_CONFIRMADO_COL not in df_pedidos.columns:
@@ -3834,11 +5316,10 @@ with tab1:
 
                                             if cell_updates:
                                                 safe_batch_update(worksheet, cell_updates)
-                                                if str(selected_pedido_data.get("__source_sheet", "datos_pedidos")) == "data_pedidos":
-                                                    _get_ws_data.clear()
-                                                else:
-                                                    _get_ws_datos.clear()
-                                                force_reload_pedidos_and_refresh_pendientes()
+                                                apply_pedido_write_through(
+                                                    selected_pedido_data, source_sheet, gsheet_row_index,
+                                                    updates, worksheet, headers,
+                                                )
                                                 st.success("🚫 Comprobante rechazado correctamente.")
                                                 st.session_state.pop(reject_toggle_key, None)
                                                 st.session_state.pop(reject_reason_key, None)
@@ -3875,7 +5356,7 @@ with tab1:
                                 else:
                                     prefijo = f"Cancelado[{motivo}]"
                                     try:
-                                        df_source, worksheet, headers, _ = resolve_pedido_source_context(selected_pedido_data)
+                                        df_source, worksheet, headers, source_sheet = resolve_pedido_source_context(selected_pedido_data)
                                         gsheet_row_index = resolve_gsheet_row_index(df_source, selected_pedido_data)
 
                                         updates = {
@@ -3894,11 +5375,10 @@ with tab1:
 
                                         if cell_updates:
                                             safe_batch_update(worksheet, cell_updates)
-                                            if str(selected_pedido_data.get("__source_sheet", "datos_pedidos")) == "data_pedidos":
-                                                _get_ws_data.clear()
-                                            else:
-                                                _get_ws_datos.clear()
-                                            force_reload_pedidos_and_refresh_pendientes()
+                                            apply_pedido_write_through(
+                                                selected_pedido_data, source_sheet, gsheet_row_index,
+                                                updates, worksheet, headers,
+                                            )
                                             st.success("🛑 Pedido cancelado y ocultado de la vista.")
                                             st.session_state.pop(cancel_toggle_key, None)
                                             st.session_state.pop(cancel_reason_key, None)
@@ -3914,6 +5394,7 @@ with tab1:
                                         st.error(f"❌ Error al cancelar el pedido: {e}")
 # --- TAB 2: PEDIDOS CONFIRMADOS ---
 with tab2:
+    profile_checkpoint("tab2")
     if tab2_is_active:
         st.session_state[TAB_SESSION_KEY] = 1
         st.session_state["current_tab"] = "1"
@@ -3945,8 +5426,8 @@ with tab2:
         if "Folio_Factura" not in trabajo.columns:
             trabajo["Folio_Factura"] = ""
 
-        trabajo["ID_Pedido"] = trabajo["ID_Pedido"].apply(normalize_id_pedido)
-        trabajo["Folio_Factura"] = trabajo["Folio_Factura"].apply(normalize_folio_factura)
+        trabajo["ID_Pedido"] = normalize_id_pedido_series(trabajo["ID_Pedido"])
+        trabajo["Folio_Factura"] = normalize_folio_factura_series(trabajo["Folio_Factura"])
         trabajo["Folio_Factura"] = trabajo["Folio_Factura"].fillna("")
 
         trabajo["__folio_key"] = trabajo["Folio_Factura"].replace("", "__EMPTY__")
@@ -3990,14 +5471,14 @@ with tab2:
         trabajo = df.copy()
 
         pedidos_norm = df_pedidos_src.copy()
-        pedidos_norm["__norm_id"] = pedidos_norm["ID_Pedido"].apply(normalize_id_pedido)
+        pedidos_norm["__norm_id"] = pedido_id_keys(pedidos_norm)
         pedidos_norm = pedidos_norm[pedidos_norm["__norm_id"] != ""]
 
         if pedidos_norm.empty:
             return trabajo
 
         pedidos_norm = pedidos_norm.drop_duplicates(subset="__norm_id", keep="last")
-        trabajo["__norm_id"] = trabajo["ID_Pedido"].apply(normalize_id_pedido)
+        trabajo["__norm_id"] = normalize_id_pedido_series(trabajo["ID_Pedido"])
 
         pedidos_norm = pedidos_norm.set_index("__norm_id")
 
@@ -4026,6 +5507,7 @@ with tab2:
 
         return trabajo
 
+    @depende_de_hojas("pedidos_confirmados")
     @st.cache_data(show_spinner=False, ttl=300, max_entries=1)
     def cargar_confirmados_guardados_cached(sheet_id: str, ws_name: str, _nonce: int):
         """
@@ -4065,10 +5547,10 @@ with tab2:
             if c not in df.columns:
                 df[c] = ""
         df = df.dropna(how='all')
-        df = df[df[campos_clave].apply(
-            lambda row: any(str(val).strip().lower() not in ["", "nan", "n/a"] for val in row),
-            axis=1
-        )]
+        con_clave = pd.Series(False, index=df.index)
+        for c in campos_clave:
+            con_clave |= ~df[c].astype(str).str.strip().str.lower().isin(["", "nan", "n/a"])
+        df = df[con_clave]
 
         registros_antes_deduplicado = len(df)
 
@@ -4103,7 +5585,8 @@ with tab2:
         deduplicados = max(registros_antes_deduplicado - len(df), 0)
 
         # Snapshot "último bueno"
-        st.session_state["_lastgood_confirmados"] = (df.copy(deep=False), headers[:])
+        store_session_frame("_lastgood_confirmados", df)
+        st.session_state["_lastgood_confirmados_headers"] = headers[:]
         return df, headers, deduplicados, total_filas_hoja
 
     # 📄 Cargar hoja 'pedidos_confirmados' con fallback a snapshot si la API falla
@@ -4118,10 +5601,11 @@ with tab2:
         duplicados_eliminados = 0
         total_original = 0
     except gspread.exceptions.APIError as e:
-        snap = st.session_state.get("_lastgood_confirmados")
-        if snap:
+        snap = load_session_frame("_lastgood_confirmados")
+        if snap is not None:
             st.warning("♻️ Error temporal al leer 'pedidos_confirmados'. Mostrando último snapshot bueno.")
-            df_confirmados_guardados, headers_confirmados = snap
+            df_confirmados_guardados = snap
+            headers_confirmados = st.session_state.get("_lastgood_confirmados_headers", list(snap.columns))
             duplicados_eliminados = st.session_state.get("_last_confirmados_dedup", 0)
             total_original = st.session_state.get("_last_confirmados_total", len(df_confirmados_guardados))
         else:
@@ -4155,10 +5639,8 @@ with tab2:
     df_confirmados_guardados = ensure_id_vendedor_column(df_confirmados_guardados, df_pedidos)
 
     if isinstance(df_confirmados_guardados, pd.DataFrame):
-        st.session_state["_lastgood_confirmados"] = (
-            df_confirmados_guardados.copy(deep=False),
-            headers_confirmados[:],
-        )
+        store_session_frame("_lastgood_confirmados", df_confirmados_guardados)
+        st.session_state["_lastgood_confirmados_headers"] = headers_confirmados[:]
 
     st.session_state["_last_confirmados_dedup"] = duplicados_eliminados
     st.session_state["_last_confirmados_total"] = total_original
@@ -4293,21 +5775,12 @@ with tab2:
                 pedido_id_norm = normalize_id_pedido(pedido_id_raw)
                 folio_norm = normalize_folio_factura(selected_local_row.get("Folio_Factura", ""))
 
-                df_pedidos_idx = pd.Index([])
-                if "ID_Pedido" in df_pedidos.columns and pedido_id_norm:
-                    df_pedidos_idx = df_pedidos[
-                        df_pedidos["ID_Pedido"].apply(normalize_id_pedido) == pedido_id_norm
-                    ].index
-
-                if df_pedidos_idx.empty and "Folio_Factura" in df_pedidos.columns and folio_norm:
-                    df_pedidos_idx = df_pedidos[
-                        df_pedidos["Folio_Factura"].apply(normalize_folio_factura) == folio_norm
-                    ].index
-
-                if df_pedidos_idx.empty:
+                posiciones = find_pedido_positions(df_pedidos, pedido_id_norm, folio_norm)
+                if not posiciones:
                     raise ValueError("No se encontró el pedido en la hoja 'datos_pedidos'.")
 
-                gsheet_row_index = df_pedidos_idx[0] + 2
+                # El loader descarta filas en blanco: la fila de hoja viene de ``__sheet_row``.
+                gsheet_row_index = int(df_pedidos["__sheet_row"].iloc[posiciones[0]])
                 worksheet = _get_ws_datos()
                 headers_local = ensure_sheet_column(worksheet, headers, ESTADO_ENTREGA_COL)
                 st.session_state.headers = headers_local
@@ -4326,9 +5799,12 @@ with tab2:
                 )
 
                 _get_ws_datos.clear()
-                cargar_pedidos_desde_google_sheet.clear()
-                df_pedidos.at[df_pedidos_idx[0], ESTADO_ENTREGA_COL] = estado_nuevo
-                st.session_state.df_pedidos = df_pedidos
+                invalidar_hojas("datos_pedidos")
+                # Reemplaza la columna completa: df_pedidos comparte datos con el almacén.
+                df_pedidos[ESTADO_ENTREGA_COL] = df_pedidos[ESTADO_ENTREGA_COL].where(
+                    np.arange(len(df_pedidos)) != posiciones[0], estado_nuevo
+                )
+                store_session_frame("df_pedidos", df_pedidos)
                 st.success("✅ Estado de entrega actualizado.")
                 st.toast("Estado de entrega actualizado", icon="📦")
                 rerun_current_tab()
@@ -4393,8 +5869,8 @@ with tab2:
                     df_pedidos_confirmados_fuentes = df_pedidos.copy()
 
                 if not df_confirmados_guardados.empty:
-                    ids_existentes_norm = df_confirmados_guardados["ID_Pedido"].apply(normalize_id_pedido)
-                    folios_existentes_norm = df_confirmados_guardados["Folio_Factura"].apply(normalize_folio_factura)
+                    ids_existentes_norm = normalize_id_pedido_series(df_confirmados_guardados["ID_Pedido"])
+                    folios_existentes_norm = normalize_folio_factura_series(df_confirmados_guardados["Folio_Factura"])
                     pares_existentes = {
                         (id_val, folio_val)
                         for id_val, folio_val in zip(ids_existentes_norm, folios_existentes_norm)
@@ -4403,15 +5879,8 @@ with tab2:
                 else:
                     pares_existentes = set()
 
-                if 'ID_Pedido' in df_pedidos_confirmados_fuentes.columns:
-                    serie_ids_normalizados = df_pedidos_confirmados_fuentes['ID_Pedido'].apply(normalize_id_pedido)
-                else:
-                    serie_ids_normalizados = pd.Series(["" for _ in range(len(df_pedidos_confirmados_fuentes))], index=df_pedidos_confirmados_fuentes.index)
-
-                if 'Folio_Factura' in df_pedidos_confirmados_fuentes.columns:
-                    serie_folios_normalizados = df_pedidos_confirmados_fuentes['Folio_Factura'].apply(normalize_folio_factura)
-                else:
-                    serie_folios_normalizados = pd.Series(["" for _ in range(len(df_pedidos_confirmados_fuentes))], index=df_pedidos_confirmados_fuentes.index)
+                serie_ids_normalizados = pedido_id_keys(df_pedidos_confirmados_fuentes)
+                serie_folios_normalizados = pedido_folio_keys(df_pedidos_confirmados_fuentes)
 
                 pares_normalizados = pd.Series(
                     list(zip(serie_ids_normalizados, serie_folios_normalizados)), index=df_pedidos_confirmados_fuentes.index
@@ -4667,7 +6136,7 @@ with tab2:
 
                 # Recargar
                 st.session_state["tab2_reload_nonce"] += 1
-                cargar_confirmados_guardados_cached.clear()
+                invalidar_hojas("pedidos_confirmados")
                 st.toast("Datos recargados", icon="🔄")
                 force_reload_pedidos_and_refresh_pendientes()
                 rerun_current_tab()
@@ -4685,7 +6154,7 @@ with tab2:
         df_confirmados_guardados = df_confirmados_guardados.copy()
 
         def _to_dt(s):
-            return pd.to_datetime(s, errors='coerce', dayfirst=True, infer_datetime_format=True)
+            return parse_fechas_mixtas(s, dayfirst=True)
 
         if "Fecha_Pago_Comprobante" in df_confirmados_guardados.columns:
             dt = _to_dt(df_confirmados_guardados["Fecha_Pago_Comprobante"])
@@ -4863,42 +6332,51 @@ with tab2:
         df_excel = df_excel.reindex(columns=columnas_excel_orden, fill_value="")
         df_excel = df_excel.fillna("")
 
-        if st.button("🧮 Preparar Excel Confirmados", key="prep_excel_confirmados"):
-            df_excel_export = df_excel.copy()
-
-            mask_clientes_credito = pd.Series([False] * len(df_excel_export), index=df_excel_export.index)
-            nombres_credito_lookup = set(nombres_credito_normalizados)
-            if nombres_credito_normalizados and "Cliente" in df_excel_export.columns:
-                mask_clientes_credito = df_excel_export["Cliente"].apply(
-                    lambda nombre_cliente: cliente_credito_match(
-                        nombre_cliente,
-                        nombres_credito_normalizados,
-                        nombres_credito_lookup,
+        excel_confirmados_version = dataframe_fingerprint(df_excel)
+        excel_confirmados_filtros = sorted(nombres_credito_normalizados or [])
+        excel_confirmados_cached = peek_cached_export(
+            "confirmados", excel_confirmados_version, excel_confirmados_filtros
+        )
+        preparar_excel_confirmados = st.button("🧮 Preparar Excel Confirmados", key="prep_excel_confirmados")
+        if preparar_excel_confirmados or excel_confirmados_cached is not None:
+
+            def _build_excel_confirmados() -> bytes:
+                mask_clientes_credito = None
+                nombres_credito_lookup = set(nombres_credito_normalizados)
+                if nombres_credito_normalizados and "Cliente" in df_excel.columns:
+                    mask_clientes_credito = df_excel["Cliente"].apply(
+                        lambda nombre_cliente: cliente_credito_match(
+                            nombre_cliente,
+                            nombres_credito_normalizados,
+                            nombres_credito_lookup,
+                        )
                     )
+
+                # Escritura en streaming: el resaltado de crédito se aplica al escribir cada fila.
+                return write_dataframe_xlsx_streaming(
+                    df_excel,
+                    "Confirmados",
+                    row_format_mask=mask_clientes_credito,
+                    row_format_props={
+                        "bg_color": "#D9EAF7",  # azul claro
+                        "font_color": "#0F172A",
+                    },
                 )
 
-            output_confirmados = BytesIO()
-            with pd.ExcelWriter(output_confirmados, engine='xlsxwriter') as writer:
-                df_excel_export.to_excel(writer, index=False, sheet_name='Confirmados')
-                if mask_clientes_credito.any():
-                    workbook = writer.book
-                    worksheet = writer.sheets["Confirmados"]
-                    credito_format = workbook.add_format(
-                        {
-                            "bg_color": "#D9EAF7",  # azul claro
-                            "font_color": "#0F172A",
-                        }
-                    )
-                    for excel_row, es_credito in enumerate(mask_clientes_credito.tolist(), start=1):
-                        if es_credito:
-                            worksheet.set_row(excel_row, None, credito_format)
-            data_xlsx = output_confirmados.getvalue()
+            data_xlsx = excel_confirmados_cached
+            if data_xlsx is None:
+                data_xlsx = get_or_build_export(
+                    "confirmados",
+                    excel_confirmados_version,
+                    excel_confirmados_filtros,
+                    _build_excel_confirmados,
+                )
 
             st.download_button(
                 label="📥 Descargar Excel Confirmados (últimos primero)",
                 data=data_xlsx,
                 file_name=f"confirmados_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                mime=XLSX_MIME,
                 key="download_excel_confirmados_ready",
             )
 
@@ -4926,6 +6404,7 @@ with tab2:
                          
 # --- TAB 3: CONFIRMACIÓN DE CASOS (Devoluciones + Garantías, con tabla y selectbox) ---
 with tab3, suppress(StopException):
+    profile_checkpoint("tab3")
     if tab3_is_active:
         st.session_state[TAB_SESSION_KEY] = 2
         st.session_state["current_tab"] = "2"
@@ -4935,276 +6414,10 @@ with tab3, suppress(StopException):
     import uuid, os, json, math, re, time
     import pandas as pd
     import gspread
-    # ⬇️ NUEVO: para generar/descargar el Word
-    from docx import Document
     from io import BytesIO
 
     tab3_alert = st.empty()
 
-    # ================== Helpers NUEVOS (solo para Word) ==================
-    PLACEHOLDER_PATTERN = re.compile(r"\{\{([^}]+)\}\}")
-
-    def _safe_value(v):
-        if v is None:
-            return "Sin registro"
-        s = str(v).strip()
-        return "Sin registro" if s.lower() in ("", "none", "nan", "n/a") else s
-
-    def _iter_paragraphs_within(container):
-        if container is None:
-            return
-
-        element = getattr(container, "_element", None)
-        if element is not None:
-            from docx.oxml.ns import qn
-            from docx.text.paragraph import Paragraph
-
-            parent = container
-            for para_element in element.iter(qn("w:p")):
-                yield Paragraph(para_element, parent)
-            return
-
-        for paragraph in getattr(container, "paragraphs", []):
-            yield paragraph
-        for table in getattr(container, "tables", []):
-            for row in table.rows:
-                for cell in row.cells:
-                    yield from _iter_paragraphs_within(cell)
-
-    def _replace_span_in_runs(runs, start: int, end: int, replacement: str) -> None:
-        current_pos = 0
-        start_run_idx = None
-        start_offset = 0
-        end_run_idx = None
-        end_offset = 0
-
-        for idx, run in enumerate(runs):
-            text = run.text or ""
-            run_start = current_pos
-            run_end = current_pos + len(text)
-
-            if start_run_idx is None and start < run_end:
-                start_run_idx = idx
-                start_offset = start - run_start
-
-            if start_run_idx is not None and end <= run_end:
-                end_run_idx = idx
-                end_offset = end - run_start
-                break
-
-            current_pos = run_end
-
-        if start_run_idx is None or end_run_idx is None:
-            return
-
-        if start_run_idx == end_run_idx:
-            run = runs[start_run_idx]
-            text = run.text or ""
-            run.text = text[:start_offset] + replacement + text[end_offset:]
-            return
-
-        start_run = runs[start_run_idx]
-        end_run = runs[end_run_idx]
-
-        start_text = start_run.text or ""
-        end_text = end_run.text or ""
-
-        start_run.text = start_text[:start_offset] + replacement
-        end_run.text = end_text[end_offset:]
-
-        for idx in range(start_run_idx + 1, end_run_idx):
-            runs[idx].text = ""
-
-    def _docx_replace_all(doc: Document, mapping: dict[str, str]) -> tuple[int, int, list[str]]:
-        """Reemplaza placeholders {{...}} en todo el documento.
-
-        Devuelve una tupla con (total_encontrados, total_reemplazados, placeholders_pendientes).
-        """
-
-        token_mapping = {f"{{{{{key}}}}}": _safe_value(value) for key, value in mapping.items()}
-        total_found = 0
-        total_replaced = 0
-
-        def _process_paragraph(paragraph) -> None:
-            nonlocal total_found, total_replaced
-
-            runs = list(paragraph.runs)
-            if not runs:
-                text = paragraph.text or ""
-                if not text:
-                    return
-                matches = PLACEHOLDER_PATTERN.findall(text)
-                total_found += len(matches)
-                new_text = text
-                for token, replacement in token_mapping.items():
-                    if token in new_text:
-                        occurrences = new_text.count(token)
-                        if occurrences:
-                            new_text = new_text.replace(token, replacement)
-                            total_replaced += occurrences
-                if new_text != text:
-                    paragraph.text = new_text
-                return
-
-            full_text = "".join(run.text or "" for run in runs)
-            if not full_text:
-                return
-
-            matches = PLACEHOLDER_PATTERN.findall(full_text)
-            total_found += len(matches)
-            if not matches:
-                return
-
-            for token, replacement in token_mapping.items():
-                if token == replacement:
-                    continue
-                token_len = len(token)
-                current_text = "".join(run.text or "" for run in runs)
-                if token not in current_text:
-                    continue
-                while True:
-                    idx = current_text.find(token)
-                    if idx == -1:
-                        break
-                    _replace_span_in_runs(runs, idx, idx + token_len, replacement)
-                    total_replaced += 1
-                    current_text = "".join(run.text or "" for run in runs)
-
-        # Cuerpo principal
-        for paragraph in _iter_paragraphs_within(doc):
-            _process_paragraph(paragraph)
-
-        # Encabezados y pies de página
-        seen_parts: set[int] = set()
-        for section in doc.sections:
-            for attr in (
-                "header",
-                "first_page_header",
-                "even_page_header",
-                "footer",
-                "first_page_footer",
-                "even_page_footer",
-            ):
-                part = getattr(section, attr, None)
-                part_id = id(part)
-                if part is None or part_id in seen_parts:
-                    continue
-                seen_parts.add(part_id)
-                for paragraph in _iter_paragraphs_within(part):
-                    _process_paragraph(paragraph)
-
-        # Revisión de placeholders restantes
-        remaining = []
-        for paragraph in _iter_paragraphs_within(doc):
-            text = "".join((run.text or "") for run in paragraph.runs) or paragraph.text
-            if not text:
-                continue
-            remaining.extend(PLACEHOLDER_PATTERN.findall(text))
-
-        seen_parts.clear()
-        for section in doc.sections:
-            for attr in (
-                "header",
-                "first_page_header",
-                "even_page_header",
-                "footer",
-                "first_page_footer",
-                "even_page_footer",
-            ):
-                part = getattr(section, attr, None)
-                part_id = id(part)
-                if part is None or part_id in seen_parts:
-                    continue
-                seen_parts.add(part_id)
-                for paragraph in _iter_paragraphs_within(part):
-                    text = "".join((run.text or "") for run in paragraph.runs) or paragraph.text
-                    if not text:
-                        continue
-                    remaining.extend(PLACEHOLDER_PATTERN.findall(text))
-
-        return total_found, total_replaced, remaining
-
-    def _replace_material_placeholder_with_table(
-        doc: Document,
-        placeholder_key: str,
-        material_rows: list[dict[str, str]],
-    ) -> int:
-        """Reemplaza {{Material_Devuelto}} por una tabla limpia en cada aparición."""
-        from docx.oxml import OxmlElement
-        from docx.oxml.ns import qn
-
-        def _normalize_material_cell(value) -> str:
-            raw = str(value or "").strip()
-            if raw.lower() in {"", "nan", "none", "n/a", "sin registro"}:
-                return "n/a"
-            return raw
-
-        def _set_cell_borders(cell) -> None:
-            tc = cell._tc
-            tc_pr = tc.get_or_add_tcPr()
-            tc_borders = tc_pr.find(qn("w:tcBorders"))
-            if tc_borders is None:
-                tc_borders = OxmlElement("w:tcBorders")
-                tc_pr.append(tc_borders)
-            for border_name in ("top", "left", "bottom", "right"):
-                border = tc_borders.find(qn(f"w:{border_name}"))
-                if border is None:
-                    border = OxmlElement(f"w:{border_name}")
-                    tc_borders.append(border)
-                border.set(qn("w:val"), "single")
-                border.set(qn("w:sz"), "8")
-                border.set(qn("w:space"), "0")
-                border.set(qn("w:color"), "FFFFFF")
-
-        token = f"{{{{{placeholder_key}}}}}"
-        replacements = 0
-        headers = ["Código", "Descripción", "Cantidad", "Monto IVA"]
-        style_names = {s.name for s in doc.styles if getattr(s, "name", None)}
-
-        for paragraph in list(_iter_paragraphs_within(doc)):
-            runs = list(paragraph.runs)
-            paragraph_text = "".join(run.text or "" for run in runs) if runs else (paragraph.text or "")
-            if token not in paragraph_text:
-                continue
-
-            if runs:
-                while True:
-                    current_text = "".join(run.text or "" for run in runs)
-                    idx = current_text.find(token)
-                    if idx == -1:
-                        break
-                    _replace_span_in_runs(runs, idx, idx + len(token), "")
-            else:
-                paragraph.text = paragraph_text.replace(token, "")
-
-            parent = paragraph._parent
-            table = parent.add_table(rows=len(material_rows) + 1, cols=4)
-            if "Table Grid" in style_names:
-                table.style = "Table Grid"
-
-            for col_idx, header in enumerate(headers):
-                header_cell = table.cell(0, col_idx)
-                header_cell.text = ""
-                p = header_cell.paragraphs[0]
-                run = p.add_run(header)
-                run.underline = True
-
-            for row_idx, row_data in enumerate(material_rows, start=1):
-                table.cell(row_idx, 0).text = _normalize_material_cell(row_data.get("Código"))
-                table.cell(row_idx, 1).text = _normalize_material_cell(row_data.get("Descripción"))
-                table.cell(row_idx, 2).text = _normalize_material_cell(row_data.get("Cantidad"))
-                table.cell(row_idx, 3).text = _normalize_material_cell(row_data.get("Monto IVA"))
-
-            for row_cells in table.rows:
-                for cell in row_cells.cells:
-                    _set_cell_borders(cell)
-
-            paragraph._p.addnext(table._tbl)
-            replacements += 1
-
-        return replacements
-    # =====================================================================
-
     # Estado local
     if "tab3_reload_nonce" not in st.session_state:
         st.session_state["tab3_reload_nonce"] = 0
@@ -5212,6 +6425,7 @@ with tab3, suppress(StopException):
         st.session_state["tab3_selected_idx"] = 0
 
     # Lectura con fallback
+    @depende_de_hojas("casos_especiales")
     @st.cache_data(show_spinner=False, ttl=300, max_entries=1)
     def get_raw_sheet_data_cached(sheet_id, worksheet_name, _nonce: int):
         try:
@@ -5220,11 +6434,13 @@ with tab3, suppress(StopException):
             except Exception:
                 ws = get_spreadsheet(sheet_id).worksheet(worksheet_name)
             vals = ws.get_all_values()
+            if vals:
+                register_sheet_headers(worksheet_name, vals[0])
             # guarda snapshot "último bueno" para futuros fallbacks
-            st.session_state["_tab3_lastgood"] = vals
+            store_session_frame("_tab3_lastgood", vals)
             return vals
         except gspread.exceptions.APIError:
-            snap = st.session_state.get("_tab3_lastgood")
+            snap = load_session_frame("_tab3_lastgood")
             if snap:
                 return snap
             raise
@@ -5243,7 +6459,7 @@ with tab3, suppress(StopException):
             if not allow_refresh("tab3_last_refresh", tab3_alert):
                 return
             st.session_state["tab3_reload_nonce"] += 1
-            get_raw_sheet_data_cached.clear()
+            invalidar_hojas("casos_especiales")
             st.toast("Casos recargados", icon="🔄")
             rerun_current_tab()
 
@@ -5286,8 +6502,8 @@ with tab3, suppress(StopException):
 
     seguimiento_autorizacion = "Autorización de devolución"
     df_folios_post = df_casos.copy()
-    df_folios_post = df_folios_post[df_folios_post.apply(is_devolucion_case_row, axis=1)]
-    df_folios_post["Folio_Factura"] = df_folios_post["Folio_Factura"].apply(normalize_folio_factura)
+    df_folios_post = df_folios_post[es_devolucion_mask(df_folios_post)]
+    df_folios_post["Folio_Factura"] = normalize_folio_factura_series(df_folios_post["Folio_Factura"])
     df_folios_post = df_folios_post[
         df_folios_post["Folio_Factura"].astype(str).str.startswith("*")
     ]
@@ -5333,6 +6549,98 @@ with tab3, suppress(StopException):
             hide_index=True,
         )
 
+    with st.expander("📦 Formatos de devolución por rango de fechas", expanded=False):
+        st.caption(
+            "Genera en un solo ZIP los formatos de todas las devoluciones confirmadas "
+            "(Estado_Caso = Aprobado) cuya fecha de recepción cae en el rango."
+        )
+        # Mismo criterio y mismas columnas que el formato que se descarga al confirmar
+        # cada caso (``is_dev`` y ``pick_first_col`` del formulario de abajo).
+        df_dev_confirmadas = df_casos[
+            _columna_texto(df_casos, "Tipo_Envio").str.strip().eq("🔁 Devolución")
+            & _columna_texto(df_casos, "Estado_Caso").str.strip().eq("Aprobado")
+        ]
+        columnas_casos = set(df_casos.columns)
+        col_fecha_bulk, col_nota_bulk, col_comentario_bulk = (
+            next((col for col in candidatas if col in columnas_casos), None)
+            for candidatas in (
+                ("Fecha_Recepcion_Garantia", "Fecha_Recepcion_Devolucion"),
+                ("Dictamen_Garantia_URL", "Nota_Credito_URL"),
+                ("Comentarios_Admin_Garantia", "Comentarios_Admin_Devolucion"),
+            )
+        )
+        if col_fecha_bulk:
+            fecha_recepcion_dev = parse_fechas_mixtas(df_dev_confirmadas[col_fecha_bulk], dayfirst=True)
+        else:
+            fecha_recepcion_dev = pd.Series(pd.NaT, index=df_dev_confirmadas.index, dtype="datetime64[ns]")
+
+        hoy_bulk = datetime.now(CDMX_TIMEZONE).date()
+        col_bulk_ini, col_bulk_fin = st.columns(2)
+        with col_bulk_ini:
+            bulk_fecha_ini = st.date_input("Desde", value=hoy_bulk, key="tab3_bulk_docx_desde")
+        with col_bulk_fin:
+            bulk_fecha_fin = st.date_input("Hasta", value=hoy_bulk, key="tab3_bulk_docx_hasta")
+
+        mask_rango = fecha_recepcion_dev.dt.date.between(bulk_fecha_ini, bulk_fecha_fin)
+        df_dev_rango = df_dev_confirmadas[mask_rango.fillna(False)]
+        st.caption(f"Devoluciones confirmadas en el rango: {len(df_dev_rango)}")
+
+        if st.button(
+            "🧮 Generar formatos (ZIP)",
+            key="tab3_bulk_docx_btn",
+            disabled=df_dev_rango.empty,
+        ):
+            zip_buffer = BytesIO()
+            generados = 0
+            errores_bulk: list[str] = []
+            nombres_usados: set[str] = set()
+            with st.spinner("Generando formatos de devolución..."):
+                with zipfile.ZipFile(zip_buffer, "w", compression=zipfile.ZIP_DEFLATED) as zip_file:
+                    for idx_bulk, row_bulk in df_dev_rango.iterrows():
+                        try:
+                            fecha_bulk = fecha_recepcion_dev.get(idx_bulk)
+                            mapping_bulk, tablas_bulk = build_devolucion_docx_inputs(
+                                row_bulk,
+                                fecha_recepcion=fecha_bulk.strftime("%Y-%m-%d") if pd.notna(fecha_bulk) else "",
+                                guias=row_bulk.get(GUIAS_DEVOLUCION_COL),
+                                seguimiento=row_bulk.get("Seguimiento"),
+                                nota_credito_url=row_bulk.get(col_nota_bulk, "") if col_nota_bulk else "",
+                                comentario_admin=row_bulk.get(col_comentario_bulk, "") if col_comentario_bulk else "",
+                                material_faltante=row_bulk.get("Material_Faltante"),
+                            )
+                            docx_bytes_bulk, _ = render_docx_template(
+                                DEVOLUCION_TEMPLATE_PATH,
+                                mapping_bulk,
+                                tablas_bulk,
+                            )
+                        except Exception as e:
+                            errores_bulk.append(f"{row_bulk.get('Cliente', '')} ({row_bulk.get('Folio_Factura', '')}): {e}")
+                            continue
+
+                        nombre_base = devolucion_docx_filename(row_bulk.get("Cliente", ""))[: -len(".docx")]
+                        folio_bulk = re.sub(r"[^A-Za-z0-9_-]", "", str(row_bulk.get("Folio_Factura", "") or ""))
+                        nombre_zip = f"{nombre_base}_{folio_bulk}" if folio_bulk else nombre_base
+                        candidato = nombre_zip
+                        sufijo = 2
+                        while candidato in nombres_usados:
+                            candidato = f"{nombre_zip}_{sufijo}"
+                            sufijo += 1
+                        nombres_usados.add(candidato)
+                        zip_file.writestr(f"{candidato}.docx", docx_bytes_bulk)
+                        generados += 1
+
+            if errores_bulk:
+                st.warning("⚠️ No se pudieron generar algunos formatos: " + "; ".join(errores_bulk))
+            if generados:
+                st.success(f"✅ Se generaron {generados} formatos de devolución.")
+                st.download_button(
+                    label="📥 Descargar formatos de devolución (ZIP)",
+                    data=zip_buffer.getvalue(),
+                    file_name=f"formatos_devolucion_{bulk_fecha_ini:%Y%m%d}_{bulk_fecha_fin:%Y%m%d}.zip",
+                    mime="application/zip",
+                    key="tab3_bulk_docx_download",
+                )
+
     st.markdown("---")
 
     # Utils
@@ -5704,9 +7012,13 @@ with tab3, suppress(StopException):
     df_pendientes = df_pendientes.sort_values(by="__Hora", ascending=True)
 
     # display incluye emoji del tipo
-    df_pendientes["__display__"] = df_pendientes.apply(
-        lambda rr: f"{rr.get('Tipo_Envio','')}  {str(rr.get('Folio_Factura','')).strip() or 's/folio'} – {str(rr.get('Cliente','')).strip() or 's/cliente'}  |  Esperado: {str(rr.get('Resultado_Esperado','')).strip()}",
-        axis=1
+    folio_display = _columna_str(df_pendientes, "Folio_Factura").str.strip()
+    cliente_display = _columna_str(df_pendientes, "Cliente").str.strip()
+    df_pendientes["__display__"] = (
+        _columna_str(df_pendientes, "Tipo_Envio")
+        + "  " + folio_display.where(folio_display.ne(""), "s/folio")
+        + " – " + cliente_display.where(cliente_display.ne(""), "s/cliente")
+        + "  |  Esperado: " + _columna_str(df_pendientes, "Resultado_Esperado").str.strip()
     )
     options = df_pendientes["__display__"].tolist()
 
@@ -6054,80 +7366,31 @@ with tab3, suppress(StopException):
 
             try:
                 with st.spinner("Generando formato de devolución..."):
-                    # Cargar plantilla desde el repo (GitHub → Streamlit)
-                    template_path = "plantillas/Formato_Devolución-M.docx"
-                    if not os.path.exists(template_path):
-                        raise FileNotFoundError(f"No se encontró la plantilla en: {template_path}")
-
-                    doc = Document(template_path)
-
-                    # Mapping exacto a placeholders del .docx
-                    raw_material_devuelto = row.get("Material_Devuelto")
-                    raw_material_faltante = material_faltante_final
-                    material_table_replacements = 0
-                    material_devuelto_mapping = None
-                    material_faltante_mapping = None
-                    if has_structured_material_format(raw_material_devuelto):
-                        material_rows_word = sanitize_material_rows_for_table(raw_material_devuelto)
-                        material_table_replacements = _replace_material_placeholder_with_table(
-                            doc,
-                            "Material_Devuelto",
-                            material_rows_word,
-                        )
-                    else:
-                        material_devuelto_mapping = str(raw_material_devuelto or "").strip() or "n/a"
-
-                    if has_structured_material_format(raw_material_faltante):
-                        material_rows_faltante_word = sanitize_material_rows_for_table(raw_material_faltante)
-                        material_table_replacements += _replace_material_placeholder_with_table(
-                            doc,
-                            "Material_Faltante",
-                            material_rows_faltante_word,
-                        )
-                    else:
-                        material_faltante_mapping = str(raw_material_faltante or "").strip() or "No aplica"
-                    mapping = {
-                        "Cliente": _safe_value(row.get("Cliente")),
-                        "Vendedor_Registro": _safe_value(row.get("Vendedor_Registro")),
-                        "Folio_Factura": _safe_value(row.get("Folio_Factura")),
-                        "Monto_Devuelto": _safe_value(row.get("Monto_Devuelto")),
-                        "Fecha_Recepcion_Devolucion": fecha_recepcion.strftime("%Y-%m-%d"),
-                        "Numero_Guias_Devolucion": _safe_value(guias_val),
-                        "Area_Responsable": _safe_value(row.get("Area_Responsable")),
-                        "Seguimiento": _safe_value(seguimiento_sel),
+                    mapping, table_placeholders = build_devolucion_docx_inputs(
+                        row,
+                        fecha_recepcion=fecha_recepcion.strftime("%Y-%m-%d"),
+                        guias=guias_val,
+                        seguimiento=seguimiento_sel,
                         # Para el formato: usamos el URL de la "nota" recién subida como principal (si existe)
-                        "Nota_Credito_URL": _safe_value(urls.get("principal", row.get("Nota_Credito_URL",""))),
-                        "Folio_Factura_Error": _safe_value(row.get("Folio_Factura_Error")),
-                        "Motivo_Detallado": _safe_value(row.get("Motivo_Detallado")),
-                        "Comentarios_Admin_Devolucion": _safe_value(comentario_admin),
-                    }
-                    if material_devuelto_mapping is not None:
-                        mapping["Material_Devuelto"] = material_devuelto_mapping
-                    if material_faltante_mapping is not None:
-                        mapping["Material_Faltante"] = material_faltante_mapping
-
-                    total_found, total_replaced, remaining_placeholders = _docx_replace_all(doc, mapping)
-
-                    # Guardar en memoria para descarga
-                    # Nota: se realiza un roundtrip de normalización para reducir
-                    # avisos de "contenido no legible" en Microsoft Word.
-                    out_buffer = BytesIO()
-                    doc.save(out_buffer)
-                    out_buffer.seek(0)
-                    normalized_doc = Document(out_buffer)
-                    normalized_buffer = BytesIO()
-                    normalized_doc.save(normalized_buffer)
-                    normalized_buffer.seek(0)
-
-                    cliente_archivo = str(row.get("Cliente", "") or "").strip() or "Cliente"
-                    cliente_archivo = re.sub(r"[^A-Za-z0-9ÁÉÍÓÚáéíóúÑñ _-]", "", cliente_archivo).strip()
-                    cliente_archivo = re.sub(r"\s+", "_", cliente_archivo) or "Cliente"
+                        nota_credito_url=urls.get("principal", row.get("Nota_Credito_URL", "")),
+                        comentario_admin=comentario_admin,
+                        material_faltante=material_faltante_final,
+                    )
+                    docx_bytes, docx_stats = render_docx_template(
+                        DEVOLUCION_TEMPLATE_PATH,
+                        mapping,
+                        table_placeholders,
+                    )
+                    material_table_replacements = docx_stats["material_tables"]
+                    total_found = docx_stats["found"]
+                    total_replaced = docx_stats["replaced"]
+                    remaining_placeholders = docx_stats["remaining"]
 
                     st.download_button(
                         label="📄 Descargar Formato de Devolución",
-                        data=normalized_buffer,
-                        file_name=f"Formato_Devolucion_{cliente_archivo}.docx",
-                        mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                        data=docx_bytes,
+                        file_name=devolucion_docx_filename(row.get("Cliente", "")),
+                        mime=DOCX_MIME,
                         use_container_width=True
                     )
                     pendientes = len(remaining_placeholders)
@@ -6156,7 +7419,7 @@ with tab3, suppress(StopException):
         if ok_all:
             tab3_alert.success("✅ Confirmación guardada.")
             st.session_state["tab3_reload_nonce"] += 1
-            get_raw_sheet_data_cached.clear()
+            invalidar_hojas("casos_especiales")
             st.toast("Confirmación guardada", icon="✅")
             force_reload_pedidos_and_refresh_pendientes()
             rerun_current_tab()
@@ -6167,6 +7430,7 @@ with tab3, suppress(StopException):
 
 # --- TAB 4: CASOS ESPECIALES (Descarga Devoluciones/Garantías) ---
 with tab4:
+    profile_checkpoint("tab4")
     if tab4_is_active:
         st.session_state[TAB_SESSION_KEY] = 3
         st.session_state["current_tab"] = "3"
@@ -6182,6 +7446,7 @@ with tab4:
         st.session_state["tab4_reload_nonce"] = 0
 
     # ✅ lector robusto con caché
+    @depende_de_hojas("casos_especiales")
     @st.cache_data(show_spinner=False, ttl=300, max_entries=1)
     def cargar_casos_especiales_cached(sheet_id: str, ws_name: str, _nonce: int):
         ws = safe_open_worksheet(sheet_id, ws_name)
@@ -6189,6 +7454,7 @@ with tab4:
         if not vals:
             return pd.DataFrame(), []
         headers = vals[0]
+        register_sheet_headers(ws_name, headers)
         df = pd.DataFrame(vals[1:], columns=headers)
         df = df.dropna(how="all")
         for c in ["ID_Pedido", "Cliente", "Folio_Factura", "Folio_Factura_Error", "Tipo_Envio", "Hora_Registro"]:
@@ -6211,20 +7477,20 @@ with tab4:
         df_ce, headers_ce = cargar_casos_especiales_cached(
             GOOGLE_SHEET_ID, "casos_especiales", prev_nonce
         )
-        st.session_state["_lastgood_casos_especiales"] = (
-            df_ce.copy(deep=False), headers_ce
-        )
+        store_session_frame("_lastgood_casos_especiales", df_ce)
+        st.session_state["_lastgood_casos_especiales_headers"] = list(headers_ce)
     except gspread.exceptions.WorksheetNotFound:
         st.error("❌ No existe la hoja 'casos_especiales'.")
         df_ce, headers_ce = pd.DataFrame(), []
     except gspread.exceptions.APIError as e:
         st.session_state["tab4_reload_nonce"] = max(0, prev_nonce - 1)
-        snap = st.session_state.get("_lastgood_casos_especiales")
-        if snap:
+        snap = load_session_frame("_lastgood_casos_especiales")
+        if snap is not None:
             st.warning(
                 "♻️ Google Sheets dio un error temporal al leer 'casos_especiales'. Mostrando el último dato bueno en caché."
             )
-            df_ce, headers_ce = snap
+            df_ce = snap
+            headers_ce = st.session_state.get("_lastgood_casos_especiales_headers", list(snap.columns))
         else:
             st.error(f"❌ Error al leer 'casos_especiales': {e}")
             df_ce, headers_ce = pd.DataFrame(), []
@@ -6276,31 +7542,6 @@ with tab4:
                 out.append(u)
         return out
 
-    def _build_document_links(value: str) -> str:
-        urls = _normalize_urls(value)
-        if not urls:
-            return ""
-        if len(urls) == 1:
-            return urls[0]
-        items = []
-        for i, url in enumerate(urls, start=1):
-            parsed = urlparse(url)
-            filename = unquote(os.path.basename(parsed.path)) if parsed.path else ""
-            label = filename or f"Documento {i}"
-            safe_url = html.escape(url, quote=True)
-            safe_label = html.escape(label)
-            items.append(
-                f'<li><a href="{safe_url}" target="_blank" rel="noopener noreferrer">{safe_label}</a></li>'
-            )
-        html_doc = (
-            "<!doctype html><html><head><meta charset=\"utf-8\">"
-            "<title>Documentos</title></head><body>"
-            "<h3>Documentos</h3><ol>"
-            + "".join(items)
-            + "</ol></body></html>"
-        )
-        return f"data:text/html;charset=utf-8,{quote(html_doc)}"
-
     # ------- Derivados de enlaces y campos mínimos -------
     for c in [
         "Adjuntos", "Hoja_Ruta_Mensajero", "Nota_Credito_URL",
@@ -6314,67 +7555,24 @@ with tab4:
         if c not in df_ce.columns:
             df_ce[c] = ""
 
-    def _resolve_urls_for_output(value) -> list[str]:
-        urls = _normalize_urls(value)
-        if not urls:
-            return []
-
-        resolved = []
-        for url in urls:
-            if s3_client and is_s3_url(url):
-                resolved.append(
-                    get_s3_file_download_url(
-                        s3_client,
-                        url,
-                        prefer_inline_view=True,
-                    )
-                )
-            else:
-                resolved.append(url)
-        return resolved
-
-    # Links listos para tabla/Excel
+    # Links_Adjuntos guarda URLs estables (sin firmar); la firma se hace al abrir
+    # un caso o al exportar, no en cada rerun para todas las filas.
     df_ce["Links_Adjuntos"] = df_ce["Adjuntos"].apply(
-        lambda v: "\n".join(_resolve_urls_for_output(v)) if str(v).strip() else ""
+        lambda v: "\n".join(_normalize_urls(v)) if str(v).strip() else ""
     )
     df_ce["Link_Guia"] = df_ce["Hoja_Ruta_Mensajero"].astype(str).fillna("")
     # prioriza dictamen garantía; si no, nota crédito
-    df_ce["Link_Dictamen_o_Nota"] = df_ce.apply(
-        lambda r: (str(r.get("Dictamen_Garantia_URL","")).strip() or str(r.get("Nota_Credito_URL","")).strip()),
-        axis=1
+    df_ce["Link_Dictamen_o_Nota"] = link_dictamen_o_nota(df_ce)
+    # Igual que Links_Adjuntos: URLs estables; la lista de documentos se arma al abrir el caso.
+    df_ce["Link_Doc_Adicional"] = df_ce["Documento_Adicional_URL"].apply(
+        lambda v: "\n".join(_normalize_urls(v)) if str(v).strip() else ""
     )
-    df_ce["Link_Doc_Adicional"] = df_ce["Documento_Adicional_URL"].astype(str).fillna("")
 
     df_view = df_ce.copy()
 
     # ------- Ordenar: últimos primero por Hora_Registro si existe -------
     def _to_dt(s):
-        return pd.to_datetime(s, errors='coerce', dayfirst=True, infer_datetime_format=True)
-
-    def _format_fecha_uniforme(value, with_time=True):
-        """Normaliza fechas mixtas (texto / serial de Sheets) a un formato uniforme."""
-        if value is None or (isinstance(value, float) and math.isnan(value)):
-            return ""
-
-        value_str = str(value).strip()
-        if not value_str or value_str.lower() in {"nan", "none"}:
-            return ""
-
-        parsed = pd.NaT
-        numeric_value = pd.to_numeric(value_str, errors="coerce")
-        if pd.notna(numeric_value):
-            # Serial de fecha en Google Sheets / Excel (base 1899-12-30).
-            parsed = pd.to_datetime(numeric_value, unit="D", origin="1899-12-30", errors="coerce")
-
-        if pd.isna(parsed):
-            parsed = pd.to_datetime(value_str, errors="coerce", dayfirst=True, infer_datetime_format=True)
-
-        if pd.isna(parsed):
-            return value_str
-
-        if with_time:
-            return parsed.strftime("%Y-%m-%d %H:%M:%S")
-        return parsed.strftime("%Y-%m-%d")
+        return parse_fechas_mixtas(s, dayfirst=True)
 
     if "Hora_Registro" in df_view.columns:
         dth = _to_dt(df_view["Hora_Registro"])
@@ -6440,53 +7638,110 @@ with tab4:
 
     for col in columnas_fecha_hora:
         if col in df_view_table.columns:
-            df_view_table[col] = df_view_table[col].apply(
-                lambda v: _format_fecha_uniforme(v, with_time=True)
-            )
+            df_view_table[col] = format_fechas_mixtas(df_view_table[col], with_time=True)
 
     for col in columnas_fecha:
         if col in df_view_table.columns:
-            df_view_table[col] = df_view_table[col].apply(
-                lambda v: _format_fecha_uniforme(v, with_time=False)
-            )
-
-    if "Link_Doc_Adicional" in df_view_table.columns:
-        df_view_table["Link_Doc_Adicional"] = df_view_table["Link_Doc_Adicional"].apply(
-            _build_document_links
-        )
+            df_view_table[col] = format_fechas_mixtas(df_view_table[col], with_time=False)
 
+    df_tabla = df_view_table[columnas_existentes]
     column_config = {}
-    if "Link_Doc_Adicional" in df_view_table.columns:
+    if "Link_Doc_Adicional" in df_tabla.columns:
+        # La celda enlaza el primer documento; el resto se lista al abrir el caso.
+        df_tabla = df_tabla.assign(
+            Link_Doc_Adicional=df_tabla["Link_Doc_Adicional"].str.split("\n", n=1).str[0]
+        )
         column_config["Link_Doc_Adicional"] = st.column_config.LinkColumn(
             "Link_Doc_Adicional",
             display_text="Abrir documentos",
+            help="Con varios documentos, ábrelos desde «📎 Ver adjuntos del caso».",
         )
 
     st.dataframe(
-        df_view_table[columnas_existentes],
+        df_tabla,
         use_container_width=True,
         hide_index=True,
         column_config=column_config or None,
     )
 
+    # ------- Abrir adjuntos de un caso (firma sólo las URLs del caso elegido) -------
+    def _split_links(value) -> list[str]:
+        return [u.strip() for u in str(value or "").split("\n") if u.strip()]
+
+    con_links = df_view_table["Links_Adjuntos"].astype(str).str.strip().ne("")
+    if "Link_Doc_Adicional" in df_view_table.columns:
+        con_links |= df_view_table["Link_Doc_Adicional"].astype(str).str.strip().ne("")
+    casos_con_adjuntos = df_view_table.index[con_links].tolist()
+    if casos_con_adjuntos:
+        def _etiqueta_caso(idx) -> str:
+            fila = df_view_table.loc[idx]
+            folio = str(fila.get("Folio_Factura", "") or "").strip() or "s/folio"
+            cliente = str(fila.get("Cliente", "") or "").strip() or "s/cliente"
+            return f"{folio} · {cliente} · {fila.get('Hora_Registro', '')}"
+
+        caso_idx = st.selectbox(
+            "📎 Ver adjuntos del caso",
+            options=[None] + casos_con_adjuntos,
+            format_func=lambda idx: "— Selecciona un caso —" if idx is None else _etiqueta_caso(idx),
+            key="casos_adjuntos_sel",
+        )
+        if caso_idx is not None:
+            for url in _split_links(df_view_table.at[caso_idx, "Links_Adjuntos"]):
+                nombre = unquote(os.path.basename(urlparse(url).path)) or url
+                st.markdown(f"- [{nombre}]({presign_s3_url_cached(url)})")
+            documentos = _split_links(df_view_table.at[caso_idx, "Link_Doc_Adicional"]) if (
+                "Link_Doc_Adicional" in df_view_table.columns
+            ) else []
+            if documentos:
+                st.markdown("**Documentos adicionales**")
+                for i, url in enumerate(documentos, start=1):
+                    nombre = unquote(os.path.basename(urlparse(url).path)) or f"Documento {i}"
+                    st.markdown(f"- [{nombre}]({presign_s3_url_cached(url)})")
+
     # ------- Descargar Excel (on-demand para evitar picos de memoria) -------
-    if st.button("🧮 Preparar Excel Casos Especiales", key="prep_excel_casos"):
-        output_casos = BytesIO()
-        with pd.ExcelWriter(
-            output_casos,
-            engine="xlsxwriter",
-            engine_kwargs={"options": {"strings_to_urls": False}},
-        ) as writer:
+    df_casos_excel = df_view_table[columnas_existentes]
+    # Las URLs firmadas expiran: el Excel se cachea a lo más una ventana (50 min) y se
+    # firma al construirse con vigencia de 1 h, así que nunca sirve enlaces vencidos.
+    excel_casos_ventana = int(time.time() // PRESIGN_CACHE_TTL_SECONDS)
+    excel_casos_version = dataframe_fingerprint(df_casos_excel)
+    excel_casos_cached = peek_cached_export(
+        "casos_especiales", excel_casos_version, {"ventana_firma": excel_casos_ventana}
+    )
+    preparar_excel_casos = st.button("🧮 Preparar Excel Casos Especiales", key="prep_excel_casos")
+    if preparar_excel_casos or excel_casos_cached is not None:
+
+        def _build_excel_casos() -> bytes:
             # Exporta exactamente lo que se muestra en la previsualización de la tabla
-            # (incluyendo normalización de fechas y links procesados).
-            df_view_table[columnas_existentes].to_excel(writer, index=False, sheet_name="casos_especiales")
-            # (opcional) se podría formatear celdas/hipervínculos aquí
-        data_xlsx = output_casos.getvalue()
+            # (incluyendo normalización de fechas y links procesados); los adjuntos
+            # se firman aquí, sin cache de firmas, en una sola pasada sobre las URLs únicas.
+            df_export = df_casos_excel
+            if "Links_Adjuntos" in df_export.columns:
+                links = df_export["Links_Adjuntos"].map(_split_links)
+                firmadas = presign_urls_batch(url for urls in links for url in urls)
+                df_export = df_export.assign(
+                    Links_Adjuntos=links.map(lambda urls: "\n".join(firmadas.get(u, u) for u in urls))
+                )
+            return write_dataframe_xlsx_streaming(
+                df_export,
+                "casos_especiales",
+                strings_to_urls=False,
+            )
+
+        data_xlsx = excel_casos_cached
+        if data_xlsx is None:
+            data_xlsx = get_or_build_export(
+                "casos_especiales",
+                excel_casos_version,
+                {"ventana_firma": excel_casos_ventana},
+                _build_excel_casos,
+            )
 
         st.download_button(
             label="📥 Descargar Excel Casos Especiales (últimos primero)",
             data=data_xlsx,
             file_name=f"casos_especiales_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            mime=XLSX_MIME,
             key="download_excel_casos_ready",
         )
+
+finish_rerun_profile()
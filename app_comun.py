@@ -0,0 +1,758 @@
+"""Piezas compartidas por ``app_v.py`` y ``app_admin.py``.
+
+Ambas apps importan de aquí los almacenes en proceso (``st.cache_resource``) y
+los helpers que antes vivían copiados en cada archivo.
+"""
+
+import hashlib
+import json
+import numbers
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import date, datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+import xlsxwriter
+
+
+# --- Almacén de trazas de llamadas externas (lo llenan las apps, lo lee el perfilador) ---
+TRACE_MAX_EVENTS = 5000
+
+
+@st.cache_resource
+def get_trace_store() -> dict:
+    """Almacén en proceso (compartido entre sesiones) con las últimas llamadas externas."""
+    return {"events": deque(maxlen=TRACE_MAX_EVENTS), "lock": threading.Lock()}
+
+
+# --- Perfilado opcional por rerun (?profile=1 o secret ``profile_reruns``) ---
+PROFILE_QUERY_PARAM = "profile"
+
+
+def profile_log_path(app: str) -> Path:
+    """Bitácora JSON lines de la app (``APP_PROFILE_LOG`` la fija para ambas)."""
+    return Path(os.environ.get("APP_PROFILE_LOG") or Path(tempfile.gettempdir()) / f"{app}_reruns.jsonl")
+
+
+@st.cache_resource
+def _get_profile_state() -> dict:
+    """Estado del perfilador compartido por reruns y sesiones de la app."""
+    return {"local": threading.local(), "log_lock": threading.Lock(), "copy_counter": False}
+
+
+def is_profiling_enabled() -> bool:
+    try:
+        if bool(st.secrets.get("profile_reruns", False)):
+            return True
+    except Exception:
+        pass
+    flag = st.query_params.get(PROFILE_QUERY_PARAM)
+    return str(flag or "").strip().lower() in {"1", "true", "si", "sí"}
+
+
+def _install_dataframe_copy_counter(state: dict) -> None:
+    """Cuenta ``DataFrame.copy`` sólo en el hilo de un rerun perfilado."""
+    if state["copy_counter"]:
+        return
+    original_copy = pd.DataFrame.copy
+    local = state["local"]
+
+    def counting_copy(self, *args, **kwargs):
+        profile = getattr(local, "profile", None)
+        if profile is not None:
+            profile["dataframe_copies"] += 1
+        return original_copy(self, *args, **kwargs)
+
+    pd.DataFrame.copy = counting_copy
+    state["copy_counter"] = True
+
+
+def _current_profile() -> dict | None:
+    return getattr(_get_profile_state()["local"], "profile", None)
+
+
+def start_rerun_profile(app: str) -> None:
+    """Inicia el perfil de este rerun; si el anterior terminó con st.stop() lo registra como incompleto."""
+    state = _get_profile_state()
+    pending = st.session_state.pop("_profile_pending", None)
+    if pending:
+        _finish_rerun_profile(pending, completed=False)
+    state["local"].profile = None
+    if not is_profiling_enabled():
+        return
+    _install_dataframe_copy_counter(state)
+    now = time.perf_counter()
+    profile = {
+        "app": app,
+        "started_wall": time.time(),
+        "section": "inicio",
+        "section_start": now,
+        "last_mark": now,
+        "sections": [],
+        "detalle": [],
+        "dataframe_copies": 0,
+        "section_copies": 0,
+    }
+    state["local"].profile = profile
+    st.session_state["_profile_pending"] = profile
+
+
+def profile_checkpoint(section: str) -> None:
+    """Cierra la sección en curso y abre ``section`` (tiempos por bloque del script)."""
+    profile = _current_profile()
+    if profile is None:
+        return
+    now = time.perf_counter()
+    profile["sections"].append({
+        "section": profile["section"],
+        "ms": round((now - profile["section_start"]) * 1000.0, 2),
+        "dataframe_copies": profile["dataframe_copies"] - profile["section_copies"],
+    })
+    profile["section"] = section
+    profile["section_start"] = now
+    profile["last_mark"] = now
+    profile["section_copies"] = profile["dataframe_copies"]
+
+
+@contextmanager
+def profile_block(name: str):
+    """Mide un cargador o exportación dentro de la sección actual."""
+    profile = _current_profile()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    copies_before = profile["dataframe_copies"]
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        profile["last_mark"] = end
+        profile["detalle"].append({
+            "section": profile["section"],
+            "name": name,
+            "ms": round((end - start) * 1000.0, 2),
+            "dataframe_copies": profile["dataframe_copies"] - copies_before,
+        })
+
+
+def finish_rerun_profile() -> None:
+    """Cierra el perfil del rerun actual (llamar al final del script)."""
+    profile = _current_profile()
+    if profile is None:
+        return
+    profile_checkpoint("fin")
+    st.session_state.pop("_profile_pending", None)
+    _finish_rerun_profile(profile, completed=True)
+
+
+def _finish_rerun_profile(profile: dict, *, completed: bool) -> None:
+    sections = list(profile["sections"])
+    if not completed:
+        # El rerun se detuvo (st.stop/rerun): la última sección termina en la última marca conocida.
+        sections.append({
+            "section": f"{profile['section']} (interrumpida)",
+            "ms": round((profile["last_mark"] - profile["section_start"]) * 1000.0, 2),
+            "dataframe_copies": profile["dataframe_copies"] - profile["section_copies"],
+        })
+    llamadas_externas: dict[str, dict] = {}
+    try:
+        store = get_trace_store()
+        with store["lock"]:
+            eventos = [e for e in store["events"] if e["ts"] >= profile["started_wall"]]
+        for evento in eventos:
+            resumen = llamadas_externas.setdefault(evento["service"], {"llamadas": 0, "ms": 0.0})
+            resumen["llamadas"] += 1
+            resumen["ms"] = round(resumen["ms"] + evento["ms"], 2)
+    except Exception:
+        pass
+
+    record = {
+        "app": profile["app"],
+        "deployment": os.environ.get("APP_DEPLOYMENT_ID") or os.environ.get("HOSTNAME", ""),
+        "ts": datetime.fromtimestamp(profile["started_wall"]).isoformat(timespec="seconds"),
+        "completed": completed,
+        "total_ms": round(sum(s["ms"] for s in sections), 2),
+        "dataframe_copies": profile["dataframe_copies"],
+        "sections": [s for s in sections if s["section"] != "fin"],
+        "detalle": profile["detalle"],
+        "llamadas_externas": llamadas_externas,
+    }
+    state = _get_profile_state()
+    log_path = profile_log_path(profile["app"])
+    try:
+        with state["log_lock"]:
+            log_path.parent.mkdir(parents=True, exist_ok=True)
+            with log_path.open("a", encoding="utf-8") as fh:
+                fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except OSError:
+        pass
+    st.session_state["_profile_last"] = record
+    state["local"].profile = None
+
+
+def render_profile_panel() -> None:
+    """Desglose del último rerun perfilado (el rerun actual se registra al terminar)."""
+    if not is_profiling_enabled():
+        return
+    record = st.session_state.get("_profile_last")
+    titulo = "🧪 Perfil del último rerun"
+    if record:
+        titulo += f" · {record['total_ms']:.0f} ms · {record['dataframe_copies']} copias de DataFrame"
+    with st.expander(titulo):
+        if not record:
+            st.caption("El desglose aparece a partir del siguiente rerun.")
+            return
+        if not record["completed"]:
+            st.caption("⚠️ El rerun terminó antes del final del script (st.stop/rerun).")
+        secciones = pd.DataFrame(record["sections"])
+        if not secciones.empty:
+            total = max(record["total_ms"], 0.01)
+            secciones["%"] = (secciones["ms"] / total * 100).round(1)
+            st.dataframe(secciones, use_container_width=True, hide_index=True)
+        if record["detalle"]:
+            st.markdown("**Cargadores y exportaciones**")
+            st.dataframe(pd.DataFrame(record["detalle"]), use_container_width=True, hide_index=True)
+        if record["llamadas_externas"]:
+            st.caption(
+                "Llamadas externas: "
+                + " | ".join(
+                    f"{servicio}: {datos['llamadas']} ({datos['ms']:.0f} ms)"
+                    for servicio, datos in record["llamadas_externas"].items()
+                )
+            )
+        st.caption(f"Registro JSON lines: {profile_log_path(record['app'])}")
+
+
+# --- Caché compartida de exportaciones Excel ---
+EXPORT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+@st.cache_resource
+def get_export_cache() -> dict:
+    """Almacén de archivos exportados compartido entre sesiones (LRU por tamaño en bytes)."""
+    return {"entries": OrderedDict(), "bytes": 0, "lock": threading.Lock()}
+
+
+def dataframe_fingerprint(df: pd.DataFrame | None) -> str:
+    """Huella de celdas e índice de un DataFrame; sirve como versión del snapshot exportado."""
+    if df is None:
+        return "none"
+    digest = hashlib.sha1()
+    digest.update(repr((df.shape, [str(c) for c in df.columns])).encode("utf-8"))
+    if not df.empty:
+        try:
+            # El índice cuenta: el almacén compartido y los pendientes dependen de sus etiquetas.
+            row_hashes = pd.util.hash_pandas_object(df, index=True)
+        except TypeError:
+            texto = df.astype(str)
+            texto.index = df.index.astype(str)
+            row_hashes = pd.util.hash_pandas_object(texto, index=True)
+        digest.update(row_hashes.to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _export_cache_key(export_type: str, version: str, filters) -> str:
+    payload = json.dumps([export_type, version, filters], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def peek_cached_export(export_type: str, version: str, filters=None) -> bytes | None:
+    """Devuelve el archivo ya generado para (versión, filtros, tipo) sin construirlo."""
+    cache = get_export_cache()
+    key = _export_cache_key(export_type, version, filters)
+    with cache["lock"]:
+        data = cache["entries"].get(key)
+        if data is not None:
+            cache["entries"].move_to_end(key)
+        return data
+
+
+def get_or_build_export(export_type: str, version: str, filters, builder) -> bytes:
+    """Sirve la exportación desde caché o la construye con ``builder`` y la registra."""
+    cached = peek_cached_export(export_type, version, filters)
+    if cached is not None:
+        return cached
+
+    with profile_block(f"export:{export_type}"):
+        data = builder()
+    if not isinstance(data, (bytes, bytearray)):
+        data = data.getvalue()
+    data = bytes(data)
+    if len(data) > EXPORT_CACHE_MAX_BYTES:
+        return data
+
+    cache = get_export_cache()
+    key = _export_cache_key(export_type, version, filters)
+    with cache["lock"]:
+        entries = cache["entries"]
+        previous = entries.pop(key, None)
+        if previous is not None:
+            cache["bytes"] -= len(previous)
+        entries[key] = data
+        cache["bytes"] += len(data)
+        while cache["bytes"] > EXPORT_CACHE_MAX_BYTES and entries:
+            _, evicted = entries.popitem(last=False)
+            cache["bytes"] -= len(evicted)
+    return data
+
+
+# --- Exportación XLSX fila por fila ---
+EXPORT_SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+
+def _xlsx_cell_value(value):
+    """Convierte un valor de pandas a un tipo que xlsxwriter escriba sin conversiones extra."""
+    if value is None:
+        return ""
+    if isinstance(value, np.bool_):
+        # ``np.bool_`` no es ``numbers.Number``: sin esto se escribiría como texto "True"/"False".
+        return bool(value)
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    try:
+        if pd.isna(value):
+            return ""
+    except (TypeError, ValueError):
+        pass
+    if isinstance(value, (str, numbers.Number, datetime, date)):
+        return value
+    return str(value)
+
+
+def write_dataframe_xlsx_streaming(
+    df: pd.DataFrame,
+    sheet_name: str,
+    *,
+    row_format_mask: pd.Series | None = None,
+    row_format_props: dict | None = None,
+    strings_to_urls: bool = True,
+) -> bytes:
+    """Escribe un DataFrame a XLSX fila por fila en modo ``constant_memory``.
+
+    Las filas marcadas en ``row_format_mask`` reciben ``row_format_props`` al
+    escribirse; el libro se arma en un temporal que pasa a disco si crece. Lo
+    acotado es la memoria de xlsxwriter mientras escribe: el archivo terminado
+    se devuelve como ``bytes`` (lo guardan la caché de exportaciones y
+    ``st.download_button``), así que sí queda completo en memoria una vez.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_BYTES) as spool:
+        workbook = xlsxwriter.Workbook(
+            spool,
+            {
+                "constant_memory": True,
+                "strings_to_urls": strings_to_urls,
+                "remove_timezone": True,
+                "tmpdir": tempfile.gettempdir(),
+            },
+        )
+        worksheet = workbook.add_worksheet(str(sheet_name)[:31])
+        header_format = workbook.add_format({"bold": True, "border": 1, "align": "center"})
+        base_formats = {
+            "datetime": workbook.add_format({"num_format": "yyyy-mm-dd hh:mm:ss"}),
+            "date": workbook.add_format({"num_format": "yyyy-mm-dd"}),
+            "cell": None,
+        }
+        highlight_formats = None
+        highlighted = None
+        if row_format_props and row_format_mask is not None:
+            highlight_formats = {
+                "datetime": workbook.add_format({**row_format_props, "num_format": "yyyy-mm-dd hh:mm:ss"}),
+                "date": workbook.add_format({**row_format_props, "num_format": "yyyy-mm-dd"}),
+                "cell": workbook.add_format(row_format_props),
+            }
+            highlighted = (
+                row_format_mask.reindex(df.index, fill_value=False).fillna(False).to_numpy(dtype=bool)
+            )
+
+        worksheet.write_row(0, 0, [str(col) for col in df.columns], header_format)
+        for row_pos, values in enumerate(df.itertuples(index=False, name=None)):
+            excel_row = row_pos + 1
+            formats = base_formats
+            if highlighted is not None and highlighted[row_pos]:
+                formats = highlight_formats
+                # En constant_memory el formato de fila debe fijarse antes de sus celdas.
+                worksheet.set_row(excel_row, None, formats["cell"])
+            for col_idx, raw_value in enumerate(values):
+                value = _xlsx_cell_value(raw_value)
+                if isinstance(value, datetime):
+                    worksheet.write_datetime(excel_row, col_idx, value, formats["datetime"])
+                elif isinstance(value, date):
+                    worksheet.write_datetime(excel_row, col_idx, value, formats["date"])
+                else:
+                    worksheet.write(excel_row, col_idx, value, formats["cell"])
+
+        workbook.close()
+        spool.seek(0)
+        return spool.read()
+
+
+# --- Almacén compartido de DataFrames (la sesión guarda solo el handle) ---
+FRAME_STORE_MAX_BYTES = 384 * 1024 * 1024
+FRAME_LEASE_SECONDS = 30 * 60
+SHARED_FRAME_PREFIX = "shared-frame:"
+# ``attrs`` con el handle del almacén: versión del snapshot que heredan sus copias superficiales.
+FRAME_VERSION_ATTR = "frame_version"
+
+
+@st.cache_resource
+def get_frame_store() -> dict:
+    """Un solo ejemplar por contenido para todas las sesiones; LRU por bytes con referencias por sesión."""
+    return {"entries": OrderedDict(), "bytes": 0, "lock": threading.Lock()}
+
+
+def _frame_session_id() -> str:
+    session_id = st.session_state.get("_frame_session_id")
+    if not session_id:
+        session_id = uuid.uuid4().hex
+        st.session_state["_frame_session_id"] = session_id
+    return session_id
+
+
+def _shared_value_bytes(value) -> int:
+    if isinstance(value, pd.DataFrame):
+        try:
+            return int(value.memory_usage(deep=True).sum())
+        except Exception:
+            return 0
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(
+            sys.getsizeof(fila) + sum(sys.getsizeof(celda) for celda in fila)
+            if isinstance(fila, (list, tuple)) else sys.getsizeof(fila)
+            for fila in value
+        )
+    return sys.getsizeof(value)
+
+
+def _shared_value_fingerprint(value) -> str:
+    if isinstance(value, pd.DataFrame):
+        return dataframe_fingerprint(value)
+    payload = json.dumps(value, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _evict_shared_frames_locked(store: dict, now: float, keep: str) -> None:
+    """Expira referencias vencidas y desaloja por LRU: primero lo que ninguna sesión usa (nunca ``keep``)."""
+    entries = store["entries"]
+    for entry in entries.values():
+        for session_id, touched in list(entry["refs"].items()):
+            if now - touched > FRAME_LEASE_SECONDS:
+                del entry["refs"][session_id]
+    for solo_sin_referencias in (True, False):
+        for handle in list(entries):
+            if store["bytes"] <= FRAME_STORE_MAX_BYTES:
+                return
+            if handle == keep or (solo_sin_referencias and entries[handle]["refs"]):
+                continue
+            store["bytes"] -= entries.pop(handle)["bytes"]
+
+
+def derived_frame_version(df: pd.DataFrame, *cambios) -> str | None:
+    """Versión de ``df`` tras aplicarle ``cambios`` a la versión del almacén de la que salió.
+
+    Evita re-hashear el frame completo en parches pequeños; None si ``df`` no viene del almacén.
+    """
+    base = df.attrs.get(FRAME_VERSION_ATTR)
+    if base is None:
+        return None
+    payload = json.dumps([base, cambios], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def put_shared_frame(namespace: str, value, version: str | None = None) -> str:
+    """Registra ``value`` (DataFrame o lista de filas) y devuelve su handle; mismo contenido, misma copia.
+
+    ``version`` reemplaza la huella de contenido cuando quien llama ya la conoce.
+    """
+    handle = f"{namespace}:{version or _shared_value_fingerprint(value)}"
+    now = time.time()
+    session_id = _frame_session_id()
+    store = get_frame_store()
+    with store["lock"]:
+        entry = store["entries"].get(handle)
+        if entry is None:
+            if isinstance(value, pd.DataFrame):
+                # Objeto propio del almacén: las columnas que luego agregue quien llamó no se cuelan.
+                value = value.copy(deep=False)
+                value.attrs[FRAME_VERSION_ATTR] = handle
+            entry = {"value": value, "bytes": _shared_value_bytes(value), "refs": {}}
+            store["entries"][handle] = entry
+            store["bytes"] += entry["bytes"]
+        else:
+            store["entries"].move_to_end(handle)
+        entry["refs"][session_id] = now
+        _evict_shared_frames_locked(store, now, handle)
+    return handle
+
+
+def get_shared_frame(handle: str):
+    """Valor compartido de ``handle`` o None si fue desalojado.
+
+    Los DataFrames se entregan como copia superficial: agregar o reemplazar
+    columnas no toca la versión compartida (no modificar celdas en sitio).
+    """
+    store = get_frame_store()
+    with store["lock"]:
+        entry = store["entries"].get(handle)
+        if entry is None:
+            return None
+        store["entries"].move_to_end(handle)
+        entry["refs"][_frame_session_id()] = time.time()
+        value = entry["value"]
+    if isinstance(value, pd.DataFrame):
+        return value.copy(deep=False)
+    return value
+
+
+def store_session_frame(key: str, value, namespace: str | None = None, version: str | None = None) -> None:
+    """Guarda en sesión solo el handle de ``value``; el contenido vive una vez en el almacén compartido."""
+    if not isinstance(value, (pd.DataFrame, list, tuple)):
+        st.session_state[key] = value
+        return
+    previous = st.session_state.get(key)
+    handle = put_shared_frame(namespace or key, value, version)
+    st.session_state[key] = SHARED_FRAME_PREFIX + handle
+    if isinstance(previous, str) and previous.startswith(SHARED_FRAME_PREFIX) and previous != st.session_state[key]:
+        _release_frame_handles([previous[len(SHARED_FRAME_PREFIX):]])
+
+
+def load_session_frame(key: str, default=None):
+    """Resuelve el handle guardado en ``key`` (ver ``get_shared_frame``).
+
+    Devuelve ``default`` si la clave no existe o el contenido fue desalojado.
+    """
+    value = st.session_state.get(key)
+    if isinstance(value, str) and value.startswith(SHARED_FRAME_PREFIX):
+        value = get_shared_frame(value[len(SHARED_FRAME_PREFIX):])
+    elif isinstance(value, pd.DataFrame):
+        value = value.copy(deep=False)
+    return default if value is None else value
+
+
+def _release_frame_handles(handles) -> None:
+    session_id = _frame_session_id()
+    store = get_frame_store()
+    with store["lock"]:
+        for handle in handles:
+            entry = store["entries"].get(handle)
+            if entry is not None:
+                entry["refs"].pop(session_id, None)
+
+
+def release_session_frames() -> None:
+    """Suelta todas las referencias de esta sesión (el contenido queda para otras sesiones o el LRU)."""
+    handles = [
+        value[len(SHARED_FRAME_PREFIX):]
+        for value in st.session_state.values()
+        if isinstance(value, str) and value.startswith(SHARED_FRAME_PREFIX)
+    ]
+    _release_frame_handles(handles)
+
+
+def frame_store_stats() -> dict:
+    store = get_frame_store()
+    with store["lock"]:
+        return {
+            "entradas": len(store["entries"]),
+            "mb": round(store["bytes"] / (1024 * 1024), 2),
+            "sin_referencias": sum(1 for entry in store["entries"].values() if not entry["refs"]),
+        }
+
+
+# --- Registro de dependencias de caché (hoja → datasets derivados) ---
+# Cada loader cacheado declara con ``@depende_de_hojas(...)`` (encima de su
+# ``@st.cache_data``) de qué hojas se deriva. Tras una escritura se llama a
+# ``invalidar_hojas(hoja)`` y solo se limpian esos datasets; los clientes de
+# Sheets/S3 y las worksheets (``st.cache_resource``) se conservan. Lo que una
+# app deba marcar además (réplicas, calendarios) lo registra con
+# ``@al_invalidar_hojas``.
+_CACHE_LOADERS: dict[str, object] = {}
+_AL_INVALIDAR: dict[str, object] = {}
+
+
+@st.cache_resource
+def get_cache_registry() -> dict:
+    """Dependencias conocidas (compartidas entre sesiones) y loaders pendientes de limpiar."""
+    return {"dependencias": {}, "pendientes": set(), "lock": threading.Lock()}
+
+
+def depende_de_hojas(*hojas: str):
+    """Registra que el loader cacheado se deriva de ``hojas``."""
+
+    def registrar(cached_fn):
+        nombre = getattr(cached_fn, "__name__", "") or repr(cached_fn)
+        registry = get_cache_registry()
+        with registry["lock"]:
+            for hoja in hojas:
+                registry["dependencias"].setdefault(hoja, set()).add(nombre)
+            pendiente = nombre in registry["pendientes"]
+            registry["pendientes"].discard(nombre)
+        _CACHE_LOADERS[nombre] = cached_fn
+        if pendiente:
+            # Se invalidó antes de que este rerun llegara a definirlo.
+            cached_fn.clear()
+        return cached_fn
+
+    return registrar
+
+
+def al_invalidar_hojas(fn):
+    """Registra ``fn(hojas)`` para correr al final de cada ``invalidar_hojas`` (uno por nombre)."""
+    _AL_INVALIDAR[getattr(fn, "__name__", "") or repr(fn)] = fn
+    return fn
+
+
+def invalidar_hojas(*hojas: str) -> list[str]:
+    """Limpia solo los datasets cacheados que dependen de ``hojas`` (todas si no se indica ninguna)."""
+    registry = get_cache_registry()
+    with registry["lock"]:
+        dependencias = registry["dependencias"]
+        nombres = set()
+        for hoja in hojas or tuple(dependencias):
+            nombres |= dependencias.get(hoja, set())
+        # Loaders definidos más abajo en el script: se limpian al registrarse.
+        registry["pendientes"] |= {nombre for nombre in nombres if nombre not in _CACHE_LOADERS}
+    for nombre in sorted(nombres):
+        clear_fn = getattr(_CACHE_LOADERS.get(nombre), "clear", None)
+        if not callable(clear_fn):
+            continue
+        try:
+            clear_fn()
+        except Exception:
+            continue
+    for extra in list(_AL_INVALIDAR.values()):
+        extra(hojas)
+    return sorted(nombres)
+
+
+# --- Registro compartido de encabezados por hoja ---
+@st.cache_resource
+def get_header_registry() -> dict:
+    """Encabezados por hoja, compartidos entre sesiones y alimentados por cada lectura completa."""
+    return {"hojas": {}, "lock": threading.Lock()}
+
+
+def register_sheet_headers(sheet_name: str, headers) -> list[str]:
+    """Registra los encabezados vistos en un snapshot; si cambiaron, reemplaza el mapa de columnas."""
+    limpios = [str(h).strip() for h in (headers or [])]
+    while limpios and not limpios[-1]:
+        limpios.pop()
+    if not sheet_name or not limpios:
+        return limpios
+    registro = get_header_registry()
+    with registro["lock"]:
+        actual = registro["hojas"].get(sheet_name)
+        if actual is None or actual["headers"] != limpios:
+            columnas: dict[str, int] = {}
+            for posicion, nombre in enumerate(limpios, start=1):
+                if nombre:
+                    columnas.setdefault(nombre, posicion)
+            registro["hojas"][sheet_name] = {
+                "headers": limpios,
+                "columnas": columnas,
+                "version": (actual["version"] + 1) if actual else 1,
+            }
+    return list(limpios)
+
+
+def get_sheet_headers(sheet_name: str, worksheet=None) -> list[str]:
+    """Encabezados registrados de la hoja; lee la fila 1 solo si aún no hay registro."""
+    actual = get_header_registry()["hojas"].get(sheet_name)
+    if actual is not None:
+        return list(actual["headers"])
+    if worksheet is None:
+        return []
+    return register_sheet_headers(sheet_name, worksheet.row_values(1))
+
+
+def sheet_column_map(sheet_name: str, worksheet=None) -> dict[str, int]:
+    """Nombre de columna → número de columna (base 1) según el registro."""
+    if sheet_name not in get_header_registry()["hojas"]:
+        get_sheet_headers(sheet_name, worksheet)
+    actual = get_header_registry()["hojas"].get(sheet_name)
+    return dict(actual["columnas"]) if actual else {}
+
+
+# --- Valores de hoja → DataFrame ---
+def sheet_values_to_frame(
+    values,
+    *,
+    sufijo_duplicados: str | None = "_",
+    descartar_vacias: bool = False,
+    limpiar_encabezados: bool = True,
+) -> tuple[pd.DataFrame, np.ndarray, dict[str, list[int]]]:
+    """Convierte ``get_all_values()`` en DataFrame sin armar un dict por fila.
+
+    Rellena o recorta las filas al ancho del encabezado, renombra encabezados
+    vacíos (``col_N``) y repetidos (``base{sufijo}N``; con ``sufijo_duplicados=None``
+    se dejan tal cual) y, si se pide, descarta filas en blanco. Devuelve el
+    DataFrame (dtype object), el número de fila real en la hoja de cada fila
+    conservada y ``{encabezado: [columnas]}`` de los repetidos.
+    """
+    sin_filas = np.empty(0, dtype=np.int64)
+    if not values:
+        return pd.DataFrame(), sin_filas, {}
+
+    encabezados = ["" if h is None else str(h) for h in values[0]]
+    if limpiar_encabezados:
+        encabezados = [h.strip() for h in encabezados]
+    duplicados: dict[str, list[int]] = {}
+    if sufijo_duplicados is None:
+        columnas = encabezados
+    else:
+        columnas = []
+        conteo: dict[str, int] = {}
+        primera: dict[str, int] = {}
+        for idx, header in enumerate(encabezados, start=1):
+            base = header or f"col_{idx}"
+            repeticiones = conteo.get(base, 0)
+            conteo[base] = repeticiones + 1
+            primera.setdefault(base, idx)
+            if repeticiones:
+                duplicados.setdefault(base, [primera[base]]).append(idx)
+                base = f"{base}{sufijo_duplicados}{repeticiones + 1}"
+            columnas.append(base)
+
+    ancho = len(columnas)
+    if not ancho:
+        return pd.DataFrame(), sin_filas, duplicados
+
+    cuerpo = values[1:]
+    if any(len(fila) != ancho for fila in cuerpo):
+        cuerpo = [
+            fila if len(fila) == ancho
+            else list(fila[:ancho]) + [""] * (ancho - len(fila))
+            for fila in cuerpo
+        ]
+    datos = np.array(cuerpo, dtype=object) if cuerpo else np.empty((0, ancho), dtype=object)
+    datos[np.equal(datos, None)] = ""
+    filas = np.arange(2, len(cuerpo) + 2, dtype=np.int64)
+
+    if descartar_vacias and cuerpo:
+        # Una fila se conserva si alguna celda tiene texto; se revisa columna por
+        # columna solo sobre las filas aún sin decidir y solo en celdas no vacías.
+        con_datos = np.zeros(len(cuerpo), dtype=bool)
+        pendientes = np.arange(len(cuerpo))
+        for j in range(ancho):
+            if not len(pendientes):
+                break
+            celdas = datos[pendientes, j]
+            no_vacias = np.flatnonzero(celdas != "")
+            llenas = np.zeros(len(celdas), dtype=bool)
+            llenas[no_vacias] = [str(celda).strip() != "" for celda in celdas[no_vacias]]
+            con_datos[pendientes[llenas]] = True
+            pendientes = pendientes[~llenas]
+        datos = datos[con_datos]
+        filas = filas[con_datos]
+
+    return pd.DataFrame(datos, columns=columnas), filas, duplicados
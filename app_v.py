@@ -9,6 +9,7 @@ import json
 import base64
 import uuid
 import pandas as pd
+import numpy as np
 import pdfplumber
 from openpyxl import load_workbook
 from openpyxl.styles import Font, PatternFill
@@ -22,6 +23,16 @@ import re
 import gspread
 import html
 from typing import Dict, List, Optional
+import copy
+import hashlib
+import numbers
+import warnings
+import sqlite3
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict
+from contextlib import closing, contextmanager
 from difflib import SequenceMatcher
 from urllib.parse import quote, urlsplit, urlunsplit, urlparse, unquote
 from urllib.request import Request, urlopen
@@ -35,6 +46,29 @@ from gspread.exceptions import APIError, GSpreadException
 
 # NEW: Import boto3 for AWS S3
 import boto3
+from botocore import xform_name
+
+from app_comun import (
+    XLSX_MIME,
+    al_invalidar_hojas,
+    dataframe_fingerprint,
+    depende_de_hojas,
+    finish_rerun_profile,
+    get_or_build_export,
+    get_shared_frame,
+    get_sheet_headers,
+    get_trace_store,
+    invalidar_hojas,
+    peek_cached_export,
+    profile_block,
+    profile_checkpoint,
+    put_shared_frame,
+    register_sheet_headers,
+    render_profile_panel,
+    sheet_values_to_frame,
+    start_rerun_profile,
+    write_dataframe_xlsx_streaming,
+)
 
 # --- STREAMLIT CONFIGURATION ---
 st.set_page_config(page_title="App Vendedores TD", layout="wide")
@@ -581,81 +615,230 @@ def parse_route_header_date(text: str) -> Optional[date]:
         return None
 
 
-@st.cache_data(ttl=300, show_spinner=False)
-def get_local_route_closure_map(sheet_id: str) -> Dict[str, set[str]]:
-    """Read route sheets and return closed shifts by ISO date."""
-    closures: Dict[str, set[str]] = {}
-    if not sheet_id:
-        return closures
+# Orígenes de caché que no son hojas de pedidos (ver ``depende_de_hojas`` en app_comun).
+CACHE_ORIGEN_S3 = "s3:archivos"
+CACHE_ORIGEN_RUTAS = "hojas_ruta"
+
+
+@al_invalidar_hojas
+def _invalidar_replica_y_cierres(hojas: tuple[str, ...]) -> None:
+    """Tras ``invalidar_hojas`` marca como viejas la réplica SQLite y el calendario de cierres."""
+    hojas_replica = [hoja for hoja in hojas if hoja in REPLICA_TABLAS] if hojas else []
+    if hojas_replica or not hojas:
+        marcar_replica_desactualizada(*hojas_replica)
+    if not hojas or CACHE_ORIGEN_RUTAS in hojas:
+        marcar_cierres_ruta_desactualizados()
+
+
+# --- Calendario de cierres de ruta (columna C de las hojas de ruta) ---
+# Solo se descarga la columna C; cada hoja guarda cuántas filas ya se procesaron y
+# la huella de ese prefijo, así que el refresco solo parsea lo que se agregó al
+# final (si cambia algo ya procesado se reparsea esa hoja). El calendario se
+# persiste en disco y lo refresca un hilo, de modo que el selector de turnos
+# de tab1 siempre lee de memoria.
+ROUTE_CLOSURES_PATH = Path(
+    os.environ.get("APP_ROUTE_CLOSURES") or Path(tempfile.gettempdir()) / "ventas_td_cierres_ruta.json"
+)
+ROUTE_CLOSURES_REFRESH_SECONDS = 300
+ROUTE_CLOSURES_DIAS_BLOQUEO = 21
+ROUTE_CLOSURE_SHEETS = [
+    (["Hoja_Ruta_Mañana", "Hoja_Ruta_Manana"], "☀️ Local Mañana", "LOCAL MANANA"),
+    (["Hoja_Ruta_Tarde"], "🌙 Local Tarde", "LOCAL TARDE"),
+    (["Hoja_Ruta_Saltillo"], "🌵 Saltillo", "SALTILLO"),
+]
+
+
+def _parse_route_closure_cells(
+    celdas: list[str],
+    shift_label: str,
+    section_tag: str,
+    closures: Dict[str, set[str]],
+    pending_cerrada: bool = False,
+) -> bool:
+    """Agrega a ``closures`` los cierres encontrados en ``celdas`` (columna C) y devuelve el pendiente final."""
+    for celda in celdas:
+        col_c = str(celda or "").strip()
+        if not col_c:
+            continue
+
+        normalized_line = (
+            col_c.upper()
+            .replace("Á", "A")
+            .replace("É", "E")
+            .replace("Í", "I")
+            .replace("Ó", "O")
+            .replace("Ú", "U")
+            .replace("Ñ", "N")
+        )
+        contains_cerrada = "CERRADA" in normalized_line
+        parsed_date = parse_route_header_date(col_c)
+        contains_section = section_tag in normalized_line
+
+        # Casos soportados en columna C:
+        # 1) "CERRADA" en fila previa, y después encabezado+turno.
+        # 2) Encabezado+turno y "CERRADA" en la misma celda (con saltos de línea).
+        if contains_cerrada and not parsed_date and not contains_section:
+            pending_cerrada = True
+            continue
+
+        if parsed_date and contains_section:
+            if contains_cerrada or pending_cerrada:
+                closures.setdefault(parsed_date.isoformat(), set()).add(shift_label)
+            pending_cerrada = False
+            continue
+
+        # Si aparece un nuevo encabezado/turno sin CERRADA, limpiamos pendiente.
+        if parsed_date or contains_section:
+            pending_cerrada = False
+    return pending_cerrada
+
+
+def _huella_celdas(celdas: list[str]) -> str:
+    return hashlib.sha1("\n".join(str(c) for c in celdas).encode("utf-8")).hexdigest()
+
+
+def _calendario_vacio(sheet_id: str) -> dict:
+    return {"sheet_id": sheet_id, "anio": datetime.now().year, "actualizado_at": 0.0, "hojas": {}, "cierres": {}, "bloqueos": {}}
+
+
+def cargar_calendario_cierres(sheet_id: str) -> dict:
+    """Calendario persistido en disco; vacío si no existe, es de otra hoja o de otro año."""
     try:
-        client = build_gspread_client()
-        spreadsheet = client.open_by_key(sheet_id)
+        calendario = json.loads(ROUTE_CLOSURES_PATH.read_text(encoding="utf-8"))
     except Exception:
-        return closures
+        return _calendario_vacio(sheet_id)
+    if calendario.get("sheet_id") != sheet_id or calendario.get("anio") != datetime.now().year:
+        return _calendario_vacio(sheet_id)
+    return calendario
 
-    configs = [
-        (["Hoja_Ruta_Mañana", "Hoja_Ruta_Manana"], "☀️ Local Mañana", "LOCAL MANANA"),
-        (["Hoja_Ruta_Tarde"], "🌙 Local Tarde", "LOCAL TARDE"),
-        (["Hoja_Ruta_Saltillo"], "🌵 Saltillo", "SALTILLO"),
-    ]
-    for ws_name_candidates, shift_label, section_tag in configs:
-        values = None
+
+def _guardar_calendario_cierres(calendario: dict) -> None:
+    tmp_path = ROUTE_CLOSURES_PATH.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(calendario, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp_path, ROUTE_CLOSURES_PATH)
+
+
+def actualizar_calendario_cierres(spreadsheet, calendario: dict, hoy: date | None = None) -> dict:
+    """Relee la columna C de cada hoja de ruta y parsea solo las filas nuevas; devuelve el calendario nuevo."""
+    anio = datetime.now().year
+    previo = calendario if calendario.get("anio") == anio else _calendario_vacio(calendario.get("sheet_id", ""))
+    hojas: dict[str, dict] = {}
+    for ws_name_candidates, shift_label, section_tag in ROUTE_CLOSURE_SHEETS:
+        celdas = None
         for ws_name in ws_name_candidates:
             try:
-                values = spreadsheet.worksheet(ws_name).get_all_values()
+                celdas = spreadsheet.worksheet(ws_name).col_values(3)
                 break
             except Exception:
                 continue
-        if values is None:
+        estado = previo["hojas"].get(shift_label)
+        if celdas is None:
+            if estado:
+                hojas[shift_label] = estado
             continue
 
+        procesadas = int(estado["filas"]) if estado else 0
+        if not estado or procesadas > len(celdas) or _huella_celdas(celdas[:procesadas]) != estado["huella"]:
+            procesadas = 0
+        closures: Dict[str, set[str]] = {}
         pending_cerrada = False
-        for row in values:
-            # El reporte operativo usa la columna C para estados/encabezados de turno.
-            # Leemos primero esa columna para evitar falsos positivos en otras columnas.
-            col_c = str(row[2] if len(row) > 2 else "" or "").strip()
-            if not col_c:
-                continue
+        if procesadas:
+            closures = {iso: {shift_label} for iso in estado["fechas"]}
+            pending_cerrada = bool(estado["pendiente"])
+        pending_cerrada = _parse_route_closure_cells(
+            celdas[procesadas:], shift_label, section_tag, closures, pending_cerrada
+        )
+        hojas[shift_label] = {
+            "filas": len(celdas),
+            "huella": _huella_celdas(celdas),
+            "pendiente": pending_cerrada,
+            "fechas": sorted(closures),
+        }
 
-            normalized_line = (
-                col_c.upper()
-                .replace("Á", "A")
-                .replace("É", "E")
-                .replace("Í", "I")
-                .replace("Ó", "O")
-                .replace("Ú", "U")
-                .replace("Ñ", "N")
-            )
-            contains_cerrada = "CERRADA" in normalized_line
-            parsed_date = parse_route_header_date(col_c)
-            contains_section = section_tag in normalized_line
-
-            # Casos soportados en columna C:
-            # 1) "CERRADA" en fila previa, y después encabezado+turno.
-            # 2) Encabezado+turno y "CERRADA" en la misma celda (con saltos de línea).
-            if contains_cerrada and not parsed_date and not contains_section:
-                pending_cerrada = True
-                continue
+    cierres: Dict[str, list[str]] = {}
+    for shift_label, estado in hojas.items():
+        for iso in estado["fechas"]:
+            cierres.setdefault(iso, []).append(shift_label)
+    hoy = hoy or date.today()
+    proximos = (hoy + timedelta(days=n) for n in range(ROUTE_CLOSURES_DIAS_BLOQUEO + 1))
+    bloqueos = {d.isoformat(): cierres[d.isoformat()] for d in proximos if d.isoformat() in cierres}
+    return {
+        "sheet_id": previo.get("sheet_id", ""),
+        "anio": anio,
+        "actualizado_at": time.time(),
+        "hojas": hojas,
+        "cierres": cierres,
+        "bloqueos": bloqueos,
+    }
+
+
+@st.cache_resource
+def get_route_closure_state() -> dict:
+    """Calendario de cierres del proceso y el hilo que lo refresca."""
+    return {"lock": threading.Lock(), "thread": None, "client": None, "calendario": None, "error": ""}
 
-            if parsed_date and contains_section:
-                if contains_cerrada or pending_cerrada:
-                    closures.setdefault(parsed_date.isoformat(), set()).add(shift_label)
-                pending_cerrada = False
-                continue
 
-            # Si aparece un nuevo encabezado/turno sin CERRADA, limpiamos pendiente.
-            if parsed_date or contains_section:
-                pending_cerrada = False
+def _refrescar_calendario_cierres(state: dict) -> None:
+    try:
+        calendario = state["calendario"]
+        spreadsheet = state["client"].open_by_key(calendario["sheet_id"])
+        nuevo = actualizar_calendario_cierres(spreadsheet, calendario)
+        state["calendario"] = nuevo
+        state["error"] = ""
+        _guardar_calendario_cierres(nuevo)
+    except Exception as e:
+        # Se conserva el último calendario y se reintenta en el siguiente periodo de refresco.
+        state["calendario"] = {**state["calendario"], "actualizado_at": time.time()}
+        state["error"] = f"{type(e).__name__}: {e}"
+
+
+def ensure_route_closures(client, sheet_id: str) -> dict | None:
+    """Devuelve el calendario vigente sin esperar a la red; si está viejo agenda un refresco en segundo plano.
+
+    Solo la primera vez, sin nada en disco, se lee de forma síncrona.
+    """
+    if client is None or not sheet_id:
+        return None
+    state = get_route_closure_state()
+    state["client"] = client
+    with state["lock"]:
+        if state["calendario"] is None or state["calendario"].get("sheet_id") != sheet_id:
+            state["calendario"] = cargar_calendario_cierres(sheet_id)
+        calendario = state["calendario"]
+        if time.time() - calendario.get("actualizado_at", 0) < ROUTE_CLOSURES_REFRESH_SECONDS:
+            return calendario
+        hilo = state["thread"]
+        if hilo is not None and hilo.is_alive():
+            return calendario
+        if not calendario["hojas"]:
+            _refrescar_calendario_cierres(state)
+            return state["calendario"]
+        hilo = threading.Thread(
+            target=_refrescar_calendario_cierres, args=(state,), name="cierres-ruta", daemon=True
+        )
+        state["thread"] = hilo
+        hilo.start()
+    return calendario
 
-    return closures
+
+def marcar_cierres_ruta_desactualizados() -> None:
+    """El siguiente acceso refresca el calendario (en segundo plano)."""
+    calendario = get_route_closure_state()["calendario"]
+    if calendario is not None:
+        calendario["actualizado_at"] = 0.0
 
 
 def get_blocked_local_shifts_for_date(delivery_date: date) -> set[str]:
     sheet_id = str(st.secrets.get("reportes_almacen_sheet_id", "") or "").strip()
     if not sheet_id or not isinstance(delivery_date, date):
         return set()
-    closure_map = get_local_route_closure_map(sheet_id)
-    return closure_map.get(delivery_date.isoformat(), set())
+    calendario = ensure_route_closures(g_spread_client, sheet_id)
+    if not calendario:
+        return set()
+    iso = delivery_date.isoformat()
+    if iso in calendario["bloqueos"]:
+        return set(calendario["bloqueos"][iso])
+    return set(calendario["cierres"].get(iso, ()))
 
 def get_blocked_local_shifts_for_options(
     delivery_date: date,
@@ -673,31 +856,60 @@ def get_blocked_local_shifts_for_options(
 
     return applicable_blocked_shifts
 
-def build_local_route_sheet(template_path: Path, payload: Dict[str, object]) -> BytesIO:
-    """Fill the local delivery Excel template and return it in memory."""
-    workbook = load_workbook(template_path)
+LOCAL_ROUTE_SHEET_CELLS = {
+    "B2": "fecha",
+    "F2": "dia_entrega",
+    "B3": "cliente",
+    "F3": "hora_entrega",
+    "B4": "recibe",
+    "E5": "referencias",
+    "B5": "calle_no",
+    "B6": "tipo_inmueble",
+    "D6": "interior",
+    "B7": "acceso_privada",
+    "D7": "colonia",
+    "B8": "municipio",
+    "D8": "cp",
+    "B9": "telefonos",
+    "D10": "estado_pago",
+    "D11": "forma_pago",
+    "D12": "vendedor",
+    "G10": "total_factura",
+    "G11": "adeudo_anterior",
+    "G12": "gran_total",
+}
+
+
+@st.cache_resource(max_entries=8)
+def _load_excel_template_cached(template_path: str, mtime_ns: int) -> tuple[bytes, object]:
+    """Lee y parsea una plantilla Excel una sola vez por versión del archivo."""
+    _ = mtime_ns
+    template_bytes = Path(template_path).read_bytes()
+    return template_bytes, load_workbook(BytesIO(template_bytes))
+
+
+def open_excel_template(template_path: Path):
+    """Devuelve una copia independiente de la plantilla ya parseada en memoria."""
+    template_path = Path(template_path)
+    template_bytes, workbook = _load_excel_template_cached(
+        str(template_path), template_path.stat().st_mtime_ns
+    )
+    try:
+        return copy.deepcopy(workbook)
+    except Exception:
+        return load_workbook(BytesIO(template_bytes))
+
+
+def _fill_local_route_workbook(workbook, payload: Dict[str, object]) -> None:
     worksheet = workbook[workbook.sheetnames[0]]
+    for cell_ref, payload_key in LOCAL_ROUTE_SHEET_CELLS.items():
+        worksheet[cell_ref] = payload.get(payload_key, "")
 
-    worksheet["B2"] = payload.get("fecha", "")
-    worksheet["F2"] = payload.get("dia_entrega", "")
-    worksheet["B3"] = payload.get("cliente", "")
-    worksheet["F3"] = payload.get("hora_entrega", "")
-    worksheet["B4"] = payload.get("recibe", "")
-    worksheet["E5"] = payload.get("referencias", "")
-    worksheet["B5"] = payload.get("calle_no", "")
-    worksheet["B6"] = payload.get("tipo_inmueble", "")
-    worksheet["D6"] = payload.get("interior", "")
-    worksheet["B7"] = payload.get("acceso_privada", "")
-    worksheet["D7"] = payload.get("colonia", "")
-    worksheet["B8"] = payload.get("municipio", "")
-    worksheet["D8"] = payload.get("cp", "")
-    worksheet["B9"] = payload.get("telefonos", "")
-    worksheet["D10"] = payload.get("estado_pago", "")
-    worksheet["D11"] = payload.get("forma_pago", "")
-    worksheet["D12"] = payload.get("vendedor", "")
-    worksheet["G10"] = payload.get("total_factura", "")
-    worksheet["G11"] = payload.get("adeudo_anterior", "")
-    worksheet["G12"] = payload.get("gran_total", "")
+
+def build_local_route_sheet(template_path: Path, payload: Dict[str, object]) -> BytesIO:
+    """Fill the local delivery Excel template and return it in memory."""
+    workbook = open_excel_template(template_path)
+    _fill_local_route_workbook(workbook, payload)
 
     output = BytesIO()
     workbook.save(output)
@@ -705,13 +917,55 @@ def build_local_route_sheet(template_path: Path, payload: Dict[str, object]) ->
     return output
 
 
+def pedidos_locales_confirmados_mask(df: pd.DataFrame) -> pd.Series:
+    """Pedidos locales con comprobante confirmado: los únicos que llevan hoja de ruta en lote."""
+    tipo = _columna_texto(df, "Tipo_Envio").str.strip()
+    confirmado = _columna_texto(df, "Comprobante_Confirmado").str.strip()
+    return tipo.eq("📍 Pedido Local") & confirmado.eq("Sí")
+
+
+def build_local_route_sheets_zip(
+    template_path: Path,
+    df_pedidos: pd.DataFrame,
+    df_clientes_locales: pd.DataFrame,
+) -> tuple[BytesIO, List[str]]:
+    """Genera en una sola pasada las hojas de ruta de los pedidos locales confirmados en un ZIP."""
+    if df_pedidos is not None and not df_pedidos.empty:
+        df_pedidos = df_pedidos[pedidos_locales_confirmados_mask(df_pedidos)]
+    payloads = build_local_route_payloads_from_pedidos(df_pedidos, df_clientes_locales)
+
+    output = BytesIO()
+    filenames: List[str] = []
+    used_names: set[str] = set()
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED) as zip_file:
+        for payload in payloads:
+            workbook = open_excel_template(template_path)
+            _fill_local_route_workbook(workbook, payload)
+            sheet_buffer = BytesIO()
+            workbook.save(sheet_buffer)
+
+            base_name = slugify_local_route_client_name(payload.get("cliente", ""))
+            folio_slug = slugify_local_route_client_name(payload.get("folio", ""), fallback="")
+            filename = f"{base_name}_{folio_slug}" if folio_slug else base_name
+            candidate = filename
+            suffix = 2
+            while candidate in used_names:
+                candidate = f"{filename}_{suffix}"
+                suffix += 1
+            used_names.add(candidate)
+            filenames.append(f"{candidate}.xlsx")
+            zip_file.writestr(f"{candidate}.xlsx", sheet_buffer.getvalue())
+    output.seek(0)
+    return output, filenames
+
+
 def build_daily_deposit_report_sheet(
     template_path: Path,
     df_filtrado: pd.DataFrame,
     fecha_filtro,
 ) -> BytesIO:
     """Fill the daily deposit report template preserving workbook styles and formulas."""
-    workbook = load_workbook(template_path)
+    workbook = open_excel_template(template_path)
     worksheet = workbook[workbook.sheetnames[0]]
 
     fecha_filtro_dt = pd.to_datetime(fecha_filtro, errors="coerce")
@@ -720,31 +974,46 @@ def build_daily_deposit_report_sheet(
     )
     worksheet["C9"] = fecha_filtro_excel
 
+    def _texto(col: str) -> pd.Series:
+        if col not in df_filtrado.columns:
+            return pd.Series("", index=df_filtrado.index, dtype="object")
+        return df_filtrado[col].fillna("").astype(str).str.strip()
+
+    # Conversión vectorizada de columnas antes de escribir celdas.
+    fecha_pago_raw = _texto("Fecha_Pago_Comprobante")
+    fecha_pago_dt = parse_fechas_mixtas(fecha_pago_raw, dayfirst=False)
+    fechas_pago = [
+        fecha.date() if pd.notna(fecha) else texto
+        for fecha, texto in zip(fecha_pago_dt, fecha_pago_raw)
+    ]
+    montos = (
+        pd.to_numeric(df_filtrado.get("Monto_Comprobante", pd.Series(dtype="object")), errors="coerce")
+        .reindex(df_filtrado.index)
+        .fillna(0.0)
+        .astype(float)
+        .tolist()
+    )
+    columnas_texto = zip(
+        _texto("Cliente"),
+        _texto("Folio_Factura"),
+        _texto("Forma_Pago_Comprobante"),
+        _texto("Banco_Destino_Pago"),
+        _texto("Comentario"),
+    )
+
     fila_inicio = 14
-    for indice, (_, registro) in enumerate(df_filtrado.iterrows()):
+    for indice, (fecha_pago_excel, monto_valor, (cliente, folio, forma, banco, comentario)) in enumerate(
+        zip(fechas_pago, montos, columnas_texto)
+    ):
         fila_actual = fila_inicio + indice
-
-        fecha_pago_dt = pd.to_datetime(registro.get("Fecha_Pago_Comprobante"), errors="coerce")
-        fecha_pago_excel = (
-            fecha_pago_dt.date()
-            if pd.notna(fecha_pago_dt)
-            else str(registro.get("Fecha_Pago_Comprobante") or "").strip()
-        )
-
-        monto = pd.to_numeric(registro.get("Monto_Comprobante"), errors="coerce")
-        monto_valor = float(monto) if pd.notna(monto) else 0.0
-
-        comentario = registro.get("Comentario")
-        comentario_limpio = "" if pd.isna(comentario) else str(comentario).strip()
-
         worksheet[f"B{fila_actual}"] = fecha_pago_excel
-        worksheet[f"C{fila_actual}"] = str(registro.get("Cliente") or "").strip()
-        worksheet[f"D{fila_actual}"] = str(registro.get("Folio_Factura") or "").strip()
-        worksheet[f"E{fila_actual}"] = str(registro.get("Forma_Pago_Comprobante") or "").strip()
-        worksheet[f"F{fila_actual}"] = str(registro.get("Banco_Destino_Pago") or "").strip()
+        worksheet[f"C{fila_actual}"] = cliente
+        worksheet[f"D{fila_actual}"] = folio
+        worksheet[f"E{fila_actual}"] = forma
+        worksheet[f"F{fila_actual}"] = banco
         worksheet[f"G{fila_actual}"] = monto_valor
         worksheet[f"H{fila_actual}"] = monto_valor
-        worksheet[f"J{fila_actual}"] = comentario_limpio
+        worksheet[f"J{fila_actual}"] = comentario
 
     output = BytesIO()
     workbook.save(output)
@@ -849,6 +1118,65 @@ def build_local_route_file_from_payload(
     return route_file_payload, route_filename
 
 
+def build_local_route_payloads_from_pedidos(
+    df_pedidos: pd.DataFrame,
+    df_clientes_locales: pd.DataFrame,
+) -> List[Dict[str, str]]:
+    """Arma los payloads de hoja de ruta de varios pedidos locales usando Clientes_Locales."""
+    if df_pedidos is None or df_pedidos.empty:
+        return []
+
+    def _txt(value) -> str:
+        if value is None:
+            return ""
+        try:
+            if pd.isna(value):
+                return ""
+        except (TypeError, ValueError):
+            pass
+        return str(value).strip()
+
+    clientes_por_nombre: dict[str, dict] = {}
+    if df_clientes_locales is not None and not df_clientes_locales.empty:
+        for record in df_clientes_locales.to_dict("records"):
+            key = _txt(record.get("normalized_cliente")) or normalize_client_history_text(
+                _txt(record.get("Cliente"))
+            )
+            if key:
+                clientes_por_nombre[key] = record
+
+    payloads: List[Dict[str, str]] = []
+    for pedido in df_pedidos.to_dict("records"):
+        cliente = _txt(pedido.get("Cliente"))
+        datos_cliente = clientes_por_nombre.get(normalize_client_history_text(cliente), {})
+        fecha_entrega = pd.to_datetime(pedido.get("Fecha_Entrega"), errors="coerce")
+        monto = pd.to_numeric(_txt(pedido.get("Monto_Comprobante")).replace(",", ""), errors="coerce")
+        payloads.append(
+            build_local_route_payload(
+                fecha_entrega=fecha_entrega.date() if pd.notna(fecha_entrega) else None,
+                registro_cliente=cliente,
+                subtipo_local=_txt(pedido.get("Turno")),
+                recibe=_txt(datos_cliente.get("Recibe")),
+                referencias_hoja_ruta=_txt(datos_cliente.get("Referencias")),
+                calle_no=_txt(datos_cliente.get("CalleyNumero")),
+                tipo_inmueble=_txt(datos_cliente.get("Tipo_Inmueble")),
+                interior=_txt(datos_cliente.get("Interior")),
+                acceso_privada=_txt(datos_cliente.get("Acceso_Privada")),
+                colonia=_txt(datos_cliente.get("Col")),
+                municipio=_txt(datos_cliente.get("Municipio")),
+                cp=_txt(datos_cliente.get("C_P.")),
+                telefonos=_txt(datos_cliente.get("Tels")),
+                estado_pago=_txt(pedido.get("Estado_Pago")),
+                forma_pago=_txt(pedido.get("Forma_Pago_Comprobante")),
+                vendedor=_txt(pedido.get("Vendedor_Registro")),
+                total_factura=float(monto) if pd.notna(monto) else 0.0,
+                adeudo_anterior=0.0,
+                folio=_txt(pedido.get("Folio_Factura")),
+            )
+        )
+    return payloads
+
+
 def parse_sheet_row_number(value) -> Optional[int]:
     """Return a normalized Google Sheet row number or ``None`` if missing."""
     if value is None:
@@ -941,6 +1269,160 @@ def is_devolucion_case_row(row: pd.Series) -> bool:
     return False
 
 
+# --- Columnas derivadas vectorizadas (mismas reglas que las funciones por fila) ---
+
+
+def _columna_texto(df: pd.DataFrame, col: str) -> pd.Series:
+    """Columna como texto con nulos en blanco; serie vacía si la columna no existe."""
+    if col not in df.columns:
+        return pd.Series("", index=df.index, dtype=object)
+    serie = df[col]
+    return serie.where(serie.notna(), "").astype(str)
+
+
+def _columna_str(df: pd.DataFrame, col: str, default: str = "") -> pd.Series:
+    """``str(row.get(col, default))`` para toda la columna."""
+    if col not in df.columns:
+        return pd.Series(default, index=df.index, dtype=object)
+    return df[col].astype(str)
+
+
+def _columna_serie(df: pd.DataFrame, col: str) -> pd.Series:
+    """``row.get(col)`` para toda la columna (``None`` si no existe)."""
+    if col not in df.columns:
+        return pd.Series(None, index=df.index, dtype=object)
+    return df[col]
+
+
+def _aplicar_por_valor(serie: pd.Series, funcion) -> pd.Series:
+    """Evalúa ``funcion`` una sola vez por valor distinto de una columna sin nulos."""
+    codes, uniques = pd.factorize(serie)
+    valores = np.array([funcion(v) for v in uniques], dtype=object)
+    return pd.Series(valores[codes], index=serie.index, dtype=object)
+
+
+def _normalizar_por_valor(serie: pd.Series) -> pd.Series:
+    """``normalizar(v).strip().lower()`` por valor distinto."""
+    return _aplicar_por_valor(serie, lambda v: normalizar(v).strip().lower())
+
+
+def es_devolucion_mask(df: pd.DataFrame) -> pd.Series:
+    """Versión vectorizada de ``is_devolucion_case_row``."""
+    mask = pd.Series(False, index=df.index)
+    for col in ("Tipo_Caso", "Tipo_Envio"):
+        mask |= _columna_texto(df, col).str.lower().str.contains("devoluci", regex=False)
+    return mask
+
+
+def es_pedido_cdmx_modificable_mask(df: pd.DataFrame) -> pd.Series:
+    """Versión vectorizada de ``es_pedido_cdmx_modificable``."""
+    tipo = _normalizar_por_valor(_columna_texto(df, "Tipo_Envio"))
+    turno = _normalizar_por_valor(_columna_texto(df, "Turno"))
+    local_cdmx = normalizar("🌆 Local CDMX").strip().lower()
+    recoge_aula = normalizar("🎓 Recoge en Aula").strip().lower()
+    turnos_uber = [normalizar(turno_uber).strip().lower() for turno_uber in UBER_TURNO_OPTIONS]
+    seleccion = np.select(
+        [
+            tipo.eq(normalizar("📍 Pedido Local").strip().lower()),
+            tipo.eq(normalizar(UBER_TIPO_ENVIO).strip().lower()),
+            tipo.eq(normalizar("🎓 Cursos y Eventos").strip().lower()),
+        ],
+        [
+            turno.isin([local_cdmx, recoge_aula]),
+            turno.isin(turnos_uber),
+            turno.eq(local_cdmx),
+        ],
+        default=False,
+    )
+    return pd.Series(seleccion, index=df.index, dtype=bool)
+
+
+def filtro_envio_combinado(df: pd.DataFrame) -> pd.Series:
+    """Turno para pedidos locales con turno capturado; en otro caso el Tipo_Envio."""
+    if "Tipo_Envio" not in df.columns:
+        return pd.Series("", index=df.index, dtype=object)
+    tipo = df["Tipo_Envio"]
+    if "Turno" not in df.columns:
+        return tipo.copy()
+    turno = df["Turno"]
+    usar_turno = (
+        tipo.astype(str).eq("📍 Pedido Local")
+        & turno.notna()
+        & turno.astype(str).str.strip().ne("")
+    )
+    return turno.where(usar_turno, tipo)
+
+
+def inferir_tipo_envio_casos(df: pd.DataFrame) -> pd.Series:
+    """Tipo_Envio de casos especiales; si viene vacío se deduce de Tipo_Caso."""
+    tipo = _columna_str(df, "Tipo_Envio").str.strip()
+    caso = _columna_str(df, "Tipo_Caso").str.lower()
+    seleccion = np.select(
+        [tipo.ne(""), caso.str.startswith("devol"), caso.str.startswith("garan")],
+        [tipo.to_numpy(dtype=object), "🔁 Devolución", "🛠 Garantía"],
+        default="Caso especial",
+    )
+    return pd.Series(seleccion, index=df.index, dtype=object)
+
+
+def etiqueta_pedido_series(df: pd.DataFrame, marcar_casos_especiales: bool = False) -> pd.Series:
+    """``📄 folio - cliente - estado - tipo`` por pedido (``[CE]`` para casos especiales)."""
+    folio = _columna_texto(df, "Folio_Factura")
+    etiqueta = (
+        "📄 " + folio.mask(folio.eq(""), "Sin Folio")
+        + " - " + _columna_texto(df, "Cliente")
+        + " - " + _columna_texto(df, "Estado")
+        + " - " + _columna_texto(df, "Tipo_Envio")
+    )
+    if marcar_casos_especiales:
+        fuente = df["Fuente"] if "Fuente" in df.columns else pd.Series("", index=df.index)
+        etiqueta = etiqueta + " " + fuente.eq("casos_especiales").map({True: "[CE]", False: ""})
+    return etiqueta
+
+
+def opciones_pedido_series(df: pd.DataFrame, fuente, ids: pd.Series) -> pd.Series:
+    """Clave ``fuente|id|fila`` por pedido; las repetidas se desambiguan con el índice."""
+    numeros = [parse_sheet_row_number(valor) for valor in _columna_serie(df, "Sheet_Row_Number")]
+    filas = pd.Series([str(n) if n else "sin_fila" for n in numeros], index=df.index, dtype=object)
+    opciones = fuente + "|" + ids.mask(ids.eq(""), "sin_id") + "|" + filas
+    repetidas = opciones.duplicated(keep=False)
+    if repetidas.any():
+        sufijo = pd.Series(df.index.astype(str), index=df.index)
+        opciones = opciones.where(~repetidas, opciones + "|" + sufijo)
+    return opciones
+
+
+def etiqueta_no_entregado_series(df: pd.DataFrame) -> pd.Series:
+    """``folio (o ID) - cliente - tipo`` por pedido no entregado, con textos por defecto."""
+    folio = _columna_str(df, "Folio_Factura").str.strip()
+    pedido_id = _columna_str(df, "ID_Pedido").str.strip()
+    cliente = _columna_str(df, "Cliente").str.strip()
+    tipo = _columna_str(df, "Tipo_Envio").str.strip()
+    return (
+        folio.where(folio.ne(""), pedido_id.where(pedido_id.ne(""), "Sin folio"))
+        + " - " + cliente.where(cliente.ne(""), "Sin Cliente")
+        + " - " + tipo.where(tipo.ne(""), "Sin Tipo")
+    )
+
+
+def coincide_caso_especial_mask(df: pd.DataFrame, busqueda: str) -> pd.Series:
+    """Casos cuyo cliente o folio (normal o erróneo) coincide con la búsqueda."""
+    keyword_cliente = normalizar(str(busqueda).strip())
+    keyword_folio = normalizar_folio(str(busqueda).strip())
+    # Cada regla se evalúa una vez por valor distinto de la columna.
+    coincide = _aplicar_por_valor(
+        _columna_texto(df, "Cliente").str.strip(),
+        lambda nombre: coincide_nombre_cliente_busqueda(nombre, keyword_cliente),
+    ).astype(bool)
+    if keyword_folio:
+        for col_folio in ("Folio_Factura", "Folio_Factura_Error"):
+            coincide |= _aplicar_por_valor(
+                _columna_texto(df, col_folio).str.strip(),
+                lambda folio: keyword_folio in normalizar_folio(folio) or normalizar_folio(folio) in keyword_folio,
+            ).astype(bool)
+    return coincide
+
+
 class CachedUploadedFile(BytesIO):
     """Archivo en memoria con atributo ``name`` para reutilizar carga a S3."""
 
@@ -1260,24 +1742,8 @@ def worksheet_to_dataframe_safe(worksheet, retries: int = 3, base_delay: float =
     if not values:
         return pd.DataFrame()
 
-    headers_raw = [str(h).strip() for h in values[0]]
-    headers: list[str] = []
-    seen: dict[str, int] = {}
-    for idx, header in enumerate(headers_raw, start=1):
-        base = header or f"col_{idx}"
-        count = seen.get(base, 0)
-        seen[base] = count + 1
-        headers.append(base if count == 0 else f"{base}_{count + 1}")
-
-    records: list[dict[str, str]] = []
-    max_columns = len(headers)
-    for row_values in values[1:]:
-        row = list(row_values[:max_columns])
-        if len(row) < max_columns:
-            row.extend([""] * (max_columns - len(row)))
-        records.append({headers[i]: row[i] for i in range(max_columns)})
-
-    return pd.DataFrame(records)
+    df, _, _ = sheet_values_to_frame(values)
+    return df
 
 
 @st.cache_data(ttl=60)
@@ -1324,97 +1790,206 @@ def get_missing_dhl_mexico_required_fields(address_data: dict[str, str]) -> list
         if not str(address_data.get(key, "") or "").strip():
             missing.append(label)
     return missing
-def obtener_resumen_guias_vendedor(id_vendedor_norm: str, refresh_token: float | None = None) -> dict:
-    """Obtiene resumen de guías cargadas para mostrar aviso rápido en encabezado."""
+@depende_de_hojas("data_pedidos", "datos_pedidos", "casos_especiales")
+@st.cache_data(ttl=60)
+def cargar_datos_guias_unificadas(refresh_token: float | None = None):
+    # ---------- A) hojas de pedidos (histórico + operativa) ----------
     _ = refresh_token
-    if not id_vendedor_norm:
-        return {"total": 0, "clientes": [], "keys": []}
-
-    def _load_pedidos_sheet(ws_getter) -> pd.DataFrame:
-        try:
-            ws = ws_getter(refresh_token)
-            return worksheet_to_dataframe_safe(ws)
-        except Exception:
+    def _normalizar_guias_pedidos(df_ped: pd.DataFrame, fuente: str) -> pd.DataFrame:
+        if df_ped.empty:
             return pd.DataFrame()
 
-    df_ped_operativa = _load_pedidos_sheet(get_worksheet_operativa)
-    df_ped_historica = _load_pedidos_sheet(get_worksheet_historico)
-    df_ped = pd.concat([df_ped_operativa, df_ped_historica], ignore_index=True)
+        for col in ["ID_Pedido","Cliente","Vendedor_Registro","Tipo_Envio","Estado",
+                    "Fecha_Entrega","Hora_Registro","Folio_Factura","id_vendedor","Completados_Limpiado",
+                    "Adjuntos_Guia", "Hoja_Ruta_Mensajero"]:
+            if col not in df_ped.columns:
+                df_ped[col] = ""
+
+        df_work = df_ped.copy()
+        guides_primary = df_work["Adjuntos_Guia"].astype(str).str.strip()
+        guides_fallback = df_work["Hoja_Ruta_Mensajero"].astype(str).str.strip()
+        df_work["Adjuntos_Guia_Consolidado"] = guides_primary.mask(guides_primary.eq(""), guides_fallback)
 
+        df_res = df_work[df_work["Adjuntos_Guia_Consolidado"].astype(str).str.strip() != ""].copy()
+        if df_res.empty:
+            return df_res
+
+        df_res["Adjuntos_Guia"] = df_res["Adjuntos_Guia_Consolidado"].astype(str)
+        df_res["Fuente"] = fuente
+        df_res["URLs_Guia"] = df_res["Adjuntos_Guia"].astype(str)
+        df_res["Ultima_Guia"] = df_res["URLs_Guia"].apply(
+            lambda s: s.split(",")[-1].strip() if isinstance(s, str) and s.strip() else ""
+        )
+        return df_res
+
+    # datos_pedidos (histórico)
+    try:
+        ws_ped_hist = get_worksheet_historico(refresh_token)
+        df_ped_hist = worksheet_to_dataframe_safe(ws_ped_hist)
+    except Exception:
+        df_ped_hist = pd.DataFrame()
+
+    # data_pedidos (operativa)
     try:
-        ws_casos = get_worksheet_casos_especiales()
-        df_casos = pd.DataFrame(ws_casos.get_all_records())
+        ws_ped_op = get_worksheet_operativa(refresh_token)
+        df_ped_op = worksheet_to_dataframe_safe(ws_ped_op)
+    except Exception:
+        df_ped_op = pd.DataFrame()
+
+    df_a_hist = _normalizar_guias_pedidos(df_ped_hist, SHEET_PEDIDOS_HISTORICOS)
+    df_a_op = _normalizar_guias_pedidos(df_ped_op, SHEET_PEDIDOS_OPERATIVOS)
+
+    # ---------- B) casos_especiales ----------
+    try:
+        df_casos = get_casos_especiales_view("con_guias", refresh_token)
     except Exception:
         df_casos = pd.DataFrame()
 
-    for col in ["id_vendedor", "Adjuntos_Guia", "Hoja_Ruta_Mensajero", "Cliente", "ID_Pedido", "Folio_Factura", "Completados_Limpiado", "Hora_Registro"]:
-        if col not in df_ped.columns:
-            df_ped[col] = ""
+    if df_casos.empty:
+        df_b = pd.DataFrame(columns=[
+            "ID_Pedido","Cliente","Vendedor_Registro","Tipo_Envio","Estado",
+            "Fecha_Entrega","Hora_Registro","Folio_Factura","Adjuntos_Guia",
+            "URLs_Guia","Ultima_Guia","Fuente","id_vendedor","Completados_Limpiado"
+        ])
+    else:
+        df_b = df_casos.copy()
+        if df_b.empty:
+            df_b = pd.DataFrame(columns=[
+                "ID_Pedido","Cliente","Vendedor_Registro","Tipo_Envio","Estado",
+                "Fecha_Entrega","Hora_Registro","Folio_Factura","Adjuntos_Guia",
+                "URLs_Guia","Ultima_Guia","Fuente","id_vendedor","Completados_Limpiado"
+            ])
+        else:
+            df_b["Hoja_Ruta_Mensajero"] = df_b["Guia_Consolidada"].astype(str)
+            df_b["Adjuntos_Guia"] = df_b["Guia_Consolidada"].astype(str)
+            df_b["URLs_Guia"] = df_b["Adjuntos_Guia"]
+            df_b["Ultima_Guia"] = df_b["URLs_Guia"].apply(
+                lambda s: s.split(",")[-1].strip() if isinstance(s, str) and s.strip() else ""
+            )
 
-    for col in ["id_vendedor", "Hoja_Ruta_Mensajero", "Adjuntos_Guia", "Cliente", "ID_Pedido", "Folio_Factura", "Completados_Limpiado", "Hora_Registro"]:
-        if col not in df_casos.columns:
-            df_casos[col] = ""
+            df_b["Tipo_Envio"] = inferir_tipo_envio_casos(df_b)
+            df_b["Fuente"] = "casos_especiales"
 
-    df_ped = df_ped.copy()
-    ped_guides_col = df_ped["Adjuntos_Guia"].astype(str).str.strip()
-    ped_guide_fallback = df_ped["Hoja_Ruta_Mensajero"].astype(str).str.strip()
-    df_ped["Guia_Consolidada"] = ped_guides_col.mask(ped_guides_col.eq(""), ped_guide_fallback)
+        for col in ["Adjuntos_Guia","URLs_Guia","Ultima_Guia","Fuente"]:
+            if col not in df_b.columns:
+                df_b[col] = ""
 
-    df_ped = df_ped[
-        (df_ped["id_vendedor"].apply(normalize_vendedor_id) == id_vendedor_norm)
-        & (df_ped["Guia_Consolidada"].astype(str).str.strip() != "")
-        & (df_ped["Completados_Limpiado"].fillna("").astype(str).str.strip() == "")
-    ].copy()
+    columnas_finales = ["ID_Pedido","Cliente","Vendedor_Registro","Tipo_Envio","Estado",
+                        "Fecha_Entrega","Hora_Registro","Folio_Factura",
+                        "Adjuntos_Guia","URLs_Guia","Ultima_Guia","Fuente","id_vendedor","Completados_Limpiado"]
+    df_a_hist = df_a_hist[columnas_finales] if not df_a_hist.empty else pd.DataFrame(columns=columnas_finales)
+    df_a_op = df_a_op[columnas_finales] if not df_a_op.empty else pd.DataFrame(columns=columnas_finales)
+    df_b = df_b[columnas_finales] if not df_b.empty else pd.DataFrame(columns=columnas_finales)
 
-    casos_guides_col = df_casos["Hoja_Ruta_Mensajero"].astype(str).str.strip()
-    casos_guide_fallback = df_casos["Adjuntos_Guia"].astype(str).str.strip()
-    df_casos["Guia_Consolidada"] = casos_guides_col.mask(casos_guides_col.eq(""), casos_guide_fallback)
+    df = pd.concat([df_a_hist, df_a_op, df_b], ignore_index=True)
 
-    df_casos = df_casos[
-        (df_casos["id_vendedor"].apply(normalize_vendedor_id) == id_vendedor_norm)
-        & (df_casos["Guia_Consolidada"].astype(str).str.strip() != "")
-        & (df_casos["Completados_Limpiado"].fillna("").astype(str).str.strip() == "")
-    ].copy()
+    if not df.empty:
+        for col_fecha in ["Fecha_Entrega", "Hora_Registro"]:
+            # Motor vectorizado: seriales, ISO y dd/mm se parsean por clase y se memorizan.
+            df[col_fecha] = parse_fechas_mixtas(df[col_fecha], dayfirst=FECHAS_HOJA_DAYFIRST)
+
+        df["Fecha_Filtro_Referencia"] = df["Hora_Registro"]
+        mask_ref_vacia = df["Fecha_Filtro_Referencia"].isna()
+        df.loc[mask_ref_vacia, "Fecha_Filtro_Referencia"] = df.loc[mask_ref_vacia, "Fecha_Entrega"]
+
+        df["Folio_O_ID"] = df["Folio_Factura"].astype(str).str.strip()
+        df.loc[df["Folio_O_ID"] == "", "Folio_O_ID"] = df["ID_Pedido"].astype(str).str.strip()
+
+        if df["Fecha_Filtro_Referencia"].notna().any():
+            df = df.sort_values(by="Fecha_Filtro_Referencia", ascending=False)
+        elif df["Fecha_Entrega"].notna().any():
+            df = df.sort_values(by="Fecha_Entrega", ascending=False)
+        elif df["Hora_Registro"].notna().any():
+            df = df.sort_values(by="Hora_Registro", ascending=False)
+
+    return df
+
+
+GUIAS_ALERTA_VENTANA_HORAS = 12
+
+
+@depende_de_hojas("data_pedidos", "datos_pedidos", "casos_especiales")
+@st.cache_data(ttl=60, show_spinner=False)
+def get_guias_alert_index(refresh_token: float | None = None) -> dict[str, list[tuple]]:
+    """Tabla de alertas de guías agrupada por id_vendedor, derivada una vez por snapshot de guías."""
+    df = cargar_datos_guias_unificadas(refresh_token)
+    if df.empty:
+        return {}
+
+    df = df[
+        df["Hora_Registro"].notna()
+        & df["Completados_Limpiado"].fillna("").astype(str).str.strip().eq("")
+    ]
+    if df.empty:
+        return {}
+
+    pedido_ref = df["ID_Pedido"].astype(str).str.strip()
+    pedido_ref = pedido_ref.mask(pedido_ref.eq(""), df["Folio_Factura"].astype(str).str.strip())
+    alertas = pd.DataFrame({
+        "id_vendedor_norm": df["id_vendedor"].map(normalize_vendedor_id),
+        "Hora_Registro": df["Hora_Registro"],
+        "alert_key": df["Fuente"].astype(str).str.strip() + "::" + pedido_ref + "::"
+        + df["Ultima_Guia"].astype(str).str.strip(),
+        "Cliente": df["Cliente"].astype(str).str.strip(),
+    })
+    alertas = alertas[alertas["id_vendedor_norm"].ne("")].sort_values("Hora_Registro")
+    return {
+        vendedor: list(grupo[["Hora_Registro", "alert_key", "Cliente"]].itertuples(index=False, name=None))
+        for vendedor, grupo in alertas.groupby("id_vendedor_norm", sort=False)
+    }
+
+
+def obtener_resumen_guias_vendedor(id_vendedor_norm: str, refresh_token: float | None = None) -> dict:
+    """Obtiene resumen de guías cargadas (últimas 12 h) desde el índice precalculado por vendedor."""
+    vacio = {"total": 0, "clientes": [], "keys": [], "clientes_por_key": {}}
+    if not id_vendedor_norm:
+        return vacio
+    try:
+        alertas_vendedor = get_guias_alert_index(refresh_token).get(id_vendedor_norm, [])
+    except Exception:
+        return vacio
+
+    cutoff = datetime.now() - timedelta(hours=GUIAS_ALERTA_VENTANA_HORAS)
+    clientes_por_key: dict[str, str] = {}
+    for hora_registro, alert_key, cliente in alertas_vendedor:
+        if hora_registro >= cutoff:
+            clientes_por_key.setdefault(alert_key, cliente)
 
-    for df_tmp in (df_ped, df_casos):
-        try:
-            df_tmp["Hora_Registro_dt"] = pd.to_datetime(df_tmp["Hora_Registro"], errors="coerce", format="mixed")
-        except (TypeError, ValueError):
-            df_tmp["Hora_Registro_dt"] = pd.to_datetime(df_tmp["Hora_Registro"], errors="coerce")
-
-    cutoff_12h = datetime.now() - timedelta(hours=12)
-    df_ped = df_ped[df_ped["Hora_Registro_dt"].notna() & (df_ped["Hora_Registro_dt"] >= cutoff_12h)].copy()
-    df_casos = df_casos[df_casos["Hora_Registro_dt"].notna() & (df_casos["Hora_Registro_dt"] >= cutoff_12h)].copy()
-
-    clientes = []
-    keys = []
-
-    for _, row in df_ped.iterrows():
-        cliente = str(row.get("Cliente", "")).strip()
-        if cliente:
-            clientes.append(cliente)
-        pedido_ref = str(row.get("ID_Pedido", "")).strip() or str(row.get("Folio_Factura", "")).strip()
-        guia_ref = str(row.get("Guia_Consolidada", "")).strip()
-        if pedido_ref and guia_ref:
-            keys.append(f"pedidos::{pedido_ref}::{guia_ref}")
-
-    for _, row in df_casos.iterrows():
-        cliente = str(row.get("Cliente", "")).strip()
-        if cliente:
-            clientes.append(cliente)
-        pedido_ref = str(row.get("ID_Pedido", "")).strip() or str(row.get("Folio_Factura", "")).strip()
-        guia_ref = str(row.get("Guia_Consolidada", "")).strip()
-        if pedido_ref and guia_ref:
-            keys.append(f"casos_especiales::{pedido_ref}::{guia_ref}")
-
-    unique_keys = sorted(set(keys))
     return {
-        "total": int(len(unique_keys)),
-        "clientes": list(dict.fromkeys(clientes)),
-        "keys": unique_keys,
+        "total": int(len(clientes_por_key)),
+        "clientes": list(dict.fromkeys(c for c in clientes_por_key.values() if c)),
+        "keys": sorted(clientes_por_key),
+        "clientes_por_key": clientes_por_key,
     }
 
 
+def ensure_sheet_columns(worksheet, sheet_name: str, columnas) -> list[str]:
+    """Agrega al final de la fila 1 las columnas faltantes y devuelve los encabezados vigentes.
+
+    Solo cuando falta alguna columna se relee la fila 1 (otra sesión pudo agregarla ya);
+    se escriben únicamente las celdas nuevas y el registro queda actualizado.
+    """
+    headers = get_sheet_headers(sheet_name, worksheet)
+    if all(col in headers for col in columnas):
+        return headers
+    headers = register_sheet_headers(sheet_name, worksheet.row_values(1))
+    faltantes = [col for col in dict.fromkeys(columnas) if col not in headers]
+    if not faltantes:
+        return headers
+
+    inicio = len(headers) + 1
+    fin = len(headers) + len(faltantes)
+    col_count = getattr(worksheet, "col_count", 0) or 0
+    if col_count and col_count < fin:
+        worksheet.add_cols(fin - col_count)
+    worksheet.update(
+        f"{rowcol_to_a1(1, inicio)}:{rowcol_to_a1(1, fin)}",
+        [faltantes],
+        value_input_option="RAW",
+    )
+    return register_sheet_headers(sheet_name, headers + faltantes)
+
+
 def load_sheet_records_with_row_numbers(worksheet):
     """Return DataFrame rows with their real Google Sheet indices preserved."""
 
@@ -1426,36 +2001,142 @@ def load_sheet_records_with_row_numbers(worksheet):
     if not all_values:
         return pd.DataFrame(), []
 
-    headers_raw = all_values[0]
-    headers = [str(h).strip() for h in headers_raw]
+    headers = [str(h).strip() for h in all_values[0]]
+    register_sheet_headers(getattr(worksheet, "title", ""), headers)
 
-    max_columns = len(headers)
-    records: List[Dict[str, str]] = []
-    row_numbers: List[int] = []
+    df_records, row_numbers, _ = sheet_values_to_frame(
+        all_values, sufijo_duplicados=None, descartar_vacias=True
+    )
+    if df_records.empty:
+        return pd.DataFrame(), headers
 
-    for row_index, row_values in enumerate(all_values[1:], start=2):
-        normalized_row = list(row_values[:max_columns])
-        if len(normalized_row) < max_columns:
-            normalized_row.extend([""] * (max_columns - len(normalized_row)))
+    if df_records.columns.duplicated().any():
+        # Con encabezados repetidos gana la última columna, como al armar registros por nombre.
+        orden = list(dict.fromkeys(df_records.columns))
+        df_records = df_records.loc[:, ~df_records.columns.duplicated(keep="last")][orden]
+    df_records.insert(0, "Sheet_Row_Number", row_numbers)
+    return df_records, headers
 
-        if not any(str(cell).strip() for cell in normalized_row):
-            continue
 
-        record = {
-            headers[col_idx]: normalized_row[col_idx] if col_idx < len(normalized_row) else ""
-            for col_idx in range(max_columns)
-        }
-        records.append(record)
-        row_numbers.append(row_index)
+CASOS_ESPECIALES_TTL_SECONDS = 90
+CASOS_ESPECIALES_COLUMNAS = [
+    # Identificación y encabezado
+    "ID_Pedido", "Cliente", "Vendedor_Registro", "id_vendedor", "Folio_Factura", "Folio_Factura_Error",
+    "Hora_Registro", "Tipo_Envio", "Tipo_Caso", "Estado", "Estado_Caso", "Turno",
+    # Refacturación
+    "Refacturacion_Tipo", "Refacturacion_Subtipo", "Folio_Factura_Refacturada",
+    # Detalle del caso
+    "Resultado_Esperado", "Motivo_Detallado", "Material_Devuelto", "Monto_Devuelto", "Motivo_NotaVenta",
+    "Area_Responsable", "Nombre_Responsable", "Numero_Cliente_RFC", "Tipo_Envio_Original", "Estatus_OrigenF",
+    "Direccion_Guia_Retorno", "Direccion_Envio", "Numero_Serie", "Fecha_Compra",
+    # Fechas/recepción y documentos de cierre
+    "Fecha_Entrega", "Fecha_Recepcion_Devolucion", "Estado_Recepcion", "Fecha_Completado",
+    "Nota_Credito_URL", "Documento_Adicional_URL", "Comentarios_Admin_Devolucion",
+    "Modificacion_Surtido", "Adjuntos_Surtido",
+    # Adjuntos/guías
+    "Adjuntos", "Adjuntos_Guia", "Hoja_Ruta_Mensajero", "Completados_Limpiado",
+    # Otros
+    "Hora_Proceso", "Seguimiento",
+]
+CASOS_ESPECIALES_VISTAS = ("abiertos", "devoluciones_autorizadas_sin_folio", "con_guias")
+SEGUIMIENTO_AUTORIZACION_DEVOLUCION = "Autorización de devolución"
 
-    df_records = pd.DataFrame(records)
-    if df_records.empty:
-        return df_records, headers
 
-    df_records.insert(0, "Sheet_Row_Number", row_numbers)
-    return df_records, headers
+@depende_de_hojas("casos_especiales")
+@st.cache_data(ttl=CASOS_ESPECIALES_TTL_SECONDS, show_spinner=False)
+def get_casos_especiales_base() -> tuple[pd.DataFrame, list[str], dict]:
+    """Lee y parsea 'casos_especiales' una sola vez; todas las vistas derivan de este snapshot."""
+    ws = get_worksheet_casos_especiales()
+    values = ws.get_all_values() if ws is not None else []
+    meta = {"loaded_at": time.time(), "version": "", "headers_duplicados": ""}
+    if not values:
+        return pd.DataFrame(), [], meta
+
+    headers = [str(h).strip() for h in values[0]]
+    register_sheet_headers("casos_especiales", headers)
+    df, filas, duplicados = sheet_values_to_frame(values, descartar_vacias=True)
+    if duplicados:
+        meta["headers_duplicados"] = ", ".join(
+            f"{header} (columnas {', '.join(map(str, indices))})" for header, indices in duplicados.items()
+        )
+    if df.empty:
+        return pd.DataFrame(), headers, meta
+    df.insert(0, "Sheet_Row_Number", filas)
+
+    for col in CASOS_ESPECIALES_COLUMNAS:
+        if col not in df.columns:
+            df[col] = ""
+
+    # Algunas versiones de la hoja usan 'FechaCompra'; se toma cuando 'Fecha_Compra' viene vacía.
+    if "FechaCompra" in df.columns:
+        fecha_compra_vacia = df["Fecha_Compra"].astype(str).str.strip().eq("")
+        df["Fecha_Compra"] = df["Fecha_Compra"].mask(fecha_compra_vacia, df["FechaCompra"])
+
+    meta["version"] = dataframe_fingerprint(df)
+    return df, headers, meta
+
+
+def load_casos_especiales_snapshot(
+    refresh_token: float | None = None,
+) -> tuple[pd.DataFrame, list[str], dict]:
+    """Snapshot compartido de casos especiales; un ``refresh_token`` más nuevo que el snapshot fuerza relectura."""
+    df, headers, meta = get_casos_especiales_base()
+    if refresh_token and float(refresh_token) > float(meta.get("loaded_at", 0.0)):
+        clear_casos_especiales_cache()
+        df, headers, meta = get_casos_especiales_base()
+    return df, headers, meta
+
+
+@depende_de_hojas("casos_especiales")
+@st.cache_data(ttl=CASOS_ESPECIALES_TTL_SECONDS, max_entries=16, show_spinner=False)
+def _build_casos_especiales_view(view_name: str, version: str, _df_base: pd.DataFrame) -> pd.DataFrame:
+    """Proyección memoizada por versión del snapshot base."""
+    _ = version
+    df = _df_base
+    if df.empty:
+        return pd.DataFrame(columns=df.columns)
+
+    if view_name == "abiertos":
+        seguimiento = df["Seguimiento"].fillna("").astype(str).str.strip().str.lower()
+        return df[~seguimiento.eq("cerrado")].copy()
+
+    if view_name == "devoluciones_autorizadas_sin_folio":
+        tipo = (df["Tipo_Caso"].astype(str) + " " + df["Tipo_Envio"].astype(str)).str.lower()
+        mask = (
+            tipo.str.contains("devoluci", regex=False)
+            & df["Seguimiento"].astype(str).str.strip().eq(SEGUIMIENTO_AUTORIZACION_DEVOLUCION)
+            & df["Folio_Factura"].map(is_empty_folio)
+        )
+        vista = df[mask].copy()
+        vista["id_vendedor_norm"] = vista["id_vendedor"].map(normalize_vendedor_id)
+        return vista
+
+    if view_name == "con_guias":
+        hoja_ruta = df["Hoja_Ruta_Mensajero"].astype(str).str.strip()
+        adjuntos_guia = df["Adjuntos_Guia"].astype(str).str.strip()
+        guia = hoja_ruta.mask(hoja_ruta.eq(""), adjuntos_guia)
+        con_guia = guia.ne("")
+        vista = df[con_guia].copy()
+        vista["Guia_Consolidada"] = guia[con_guia]
+        vista["id_vendedor_norm"] = vista["id_vendedor"].map(normalize_vendedor_id)
+        return vista
+
+    raise ValueError(f"Vista de casos especiales desconocida: {view_name}")
+
+
+def get_casos_especiales_view(view_name: str, refresh_token: float | None = None) -> pd.DataFrame:
+    """Regresa una vista derivada (ver ``CASOS_ESPECIALES_VISTAS``) sin volver a leer ni parsear la hoja."""
+    df, _headers, meta = load_casos_especiales_snapshot(refresh_token)
+    return _build_casos_especiales_view(view_name, meta.get("version", ""), df)
+
 
+def clear_casos_especiales_cache() -> None:
+    """Invalida el snapshot de casos especiales y todas sus vistas."""
+    get_casos_especiales_base.clear()
+    _build_casos_especiales_view.clear()
 
+
+@depende_de_hojas("data_pedidos", "datos_pedidos")
 @st.cache_data(ttl=90)
 def get_tab3_pending_comprobante_dataset(
     refresh_token: float | None = None,
@@ -1659,24 +2340,201 @@ def allow_refresh(key: str, container=st, cooldown: int = REFRESH_COOLDOWN) -> b
     return True
 
 
-def clear_app_caches() -> None:
-    """Reinicia las conexiones y datos cacheados para forzar una recarga completa."""
-    st.cache_data.clear()
-
-    # Limpiar solo funciones cacheadas que expongan `.clear()`.
-    for cached_fn in (
-        cargar_pedidos,
-        get_google_sheets_client,
-        get_worksheet_operativa,
-        get_worksheet_historico,
-        get_worksheet_clientes_locales,
-        get_worksheet_zonas_remotas,
-        get_worksheet_casos_especiales,
-        get_s3_client,
-    ):
-        clear_fn = getattr(cached_fn, "clear", None)
-        if callable(clear_fn):
-            clear_fn()
+def clear_app_caches() -> None:
+    """Fuerza la recarga de todos los datasets registrados; los clientes de Sheets/S3 se conservan."""
+    invalidar_hojas()
+
+
+def reset_broken_clients() -> list[str]:
+    """Reinicia solo los clientes cuya verificación de conexión falla en este momento."""
+    statuses = {status["name"]: status for status in build_connection_statuses(g_spread_client, s3_client)}
+    reiniciados = []
+    if not statuses.get("Google Sheets", {}).get("ok", True):
+        for cached_fn in (
+            get_google_sheets_client,
+            get_worksheet_operativa,
+            get_worksheet_historico,
+            get_worksheet_clientes_locales,
+            get_worksheet_zonas_remotas,
+            get_worksheet_casos_especiales,
+        ):
+            cached_fn.clear()
+        reiniciados.append("Google Sheets")
+    if not statuses.get("AWS S3", {}).get("ok", True):
+        get_s3_client.clear()
+        reiniciados.append("AWS S3")
+    return reiniciados
+
+
+# --- Motor vectorizado de fechas mixtas ---
+# Seriales de Sheets/Excel plausibles para pedidos: 1970-01-01 .. 2099-12-31.
+FECHA_SERIAL_MIN = 25569
+FECHA_SERIAL_MAX = 73051
+FECHA_SERIAL_TEXTO_PATTERN = r"^\d+\.\d+$"
+FECHA_SOLO_DIGITOS_PATTERN = r"^\d+$"
+FECHA_OFFSET_PATTERN = r"\d{1,2}:\d{2}(?::\d{2}(?:\.\d+)?)?\s*(?:Z|[+-]\d{2}:?\d{2})$"
+FECHAS_ZONA_LOCAL = "America/Mexico_City"
+FECHA_ISO_PATTERN = r"^\d{4}-\d{1,2}-\d{1,2}"
+FECHA_DIA_MES_PATTERN = r"^\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}"
+FECHA_ISO_FORMATOS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d", "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M:%S")
+FECHAS_MEMO_MAX_ENTRIES = 64
+# Orden día/mes de las fechas de las hojas; lo comparten la réplica y los filtros en pandas.
+FECHAS_HOJA_DAYFIRST = False
+
+
+@st.cache_resource
+def _get_fechas_memo() -> dict:
+    """Memo compartido de columnas de fechas ya parseadas (por contenido de la columna)."""
+    return {"entries": OrderedDict(), "lock": threading.Lock()}
+
+
+def _fechas_a_naive(parsed: pd.Series) -> pd.Series:
+    """Deja todo en hora local de CDMX sin zona, venga o no con offset."""
+    if isinstance(parsed.dtype, pd.DatetimeTZDtype):
+        return parsed.dt.tz_convert(FECHAS_ZONA_LOCAL).dt.tz_localize(None)
+    if parsed.dtype == object:
+        return pd.to_datetime(
+            parsed.map(
+                lambda v: v.tz_convert(FECHAS_ZONA_LOCAL).tz_localize(None)
+                if getattr(v, "tzinfo", None) is not None
+                else v
+            ),
+            errors="coerce",
+        )
+    return parsed
+
+
+def _to_datetime_mixto(texto: pd.Series, *, dayfirst: bool, utc: bool = False) -> pd.Series:
+    # Los offsets mezclados (-06:00 y Z en la misma llamada) provocan un FutureWarning de pandas;
+    # el resultado se normaliza igual en ``_fechas_a_naive``.
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", FutureWarning)
+        try:
+            return pd.to_datetime(texto, errors="coerce", format="mixed", dayfirst=dayfirst, utc=utc)
+        except (TypeError, ValueError):
+            return pd.to_datetime(texto, errors="coerce", dayfirst=dayfirst, utc=utc)
+
+
+def _parse_fechas_por_formatos(texto: pd.Series, formatos: tuple[str, ...], *, dayfirst: bool) -> pd.Series:
+    """Prueba formatos exactos en bloque y deja a ``format='mixed'`` solo lo que sobra."""
+    resultado = pd.Series(pd.NaT, index=texto.index, dtype="datetime64[ns]")
+    pendientes = texto
+    for formato in formatos:
+        if pendientes.empty:
+            break
+        parsed = pd.to_datetime(pendientes, format=formato, errors="coerce")
+        ok = parsed.notna()
+        resultado.loc[ok[ok].index] = parsed[ok]
+        pendientes = pendientes[~ok]
+    if not pendientes.empty:
+        # Con offset se parsea en UTC y se pasa a hora local; sin offset se toma tal cual.
+        con_zona = pendientes.str.contains(FECHA_OFFSET_PATTERN, regex=True)
+        if con_zona.any():
+            parsed = _to_datetime_mixto(pendientes[con_zona], dayfirst=dayfirst, utc=True)
+            resultado.loc[parsed.index] = _fechas_a_naive(parsed)
+        if not con_zona.all():
+            parsed = _to_datetime_mixto(pendientes[~con_zona], dayfirst=dayfirst)
+            resultado.loc[parsed.index] = _fechas_a_naive(parsed)
+    return resultado
+
+
+def _fechas_numericas(series: pd.Series) -> np.ndarray:
+    """Máscara de celdas que llegan como número (no texto) desde la hoja."""
+    if pd.api.types.is_bool_dtype(series):
+        return np.zeros(len(series), dtype=bool)
+    if pd.api.types.is_numeric_dtype(series):
+        return np.ones(len(series), dtype=bool)
+    return series.map(
+        lambda v: isinstance(v, numbers.Real) and not isinstance(v, (bool, np.bool_))
+    ).to_numpy(dtype=bool)
+
+
+def _parse_fechas_mixtas_sin_memo(
+    texto: pd.Series, *, dayfirst: bool, numericos: np.ndarray | None = None
+) -> pd.Series:
+    resultado = pd.Series(pd.NaT, index=texto.index, dtype="datetime64[ns]")
+    vacios = texto.eq("") | texto.str.lower().isin({"nan", "none", "nat", "null"})
+
+    # Serial de Sheets sólo si la celda es número o texto con decimales, y en rango plausible:
+    # "2024" o un folio "45123" en texto no son fechas.
+    candidatos = texto.str.match(FECHA_SERIAL_TEXTO_PATTERN)
+    if numericos is not None:
+        candidatos = candidatos | pd.Series(numericos, index=texto.index)
+    numeros = pd.to_numeric(texto.where(~vacios & candidatos), errors="coerce")
+    es_serial = numeros.between(FECHA_SERIAL_MIN, FECHA_SERIAL_MAX)
+    if es_serial.any():
+        resultado.loc[es_serial] = pd.to_datetime(
+            numeros[es_serial], unit="D", origin="1899-12-30", errors="coerce"
+        )
+
+    solo_digitos = ~vacios & ~es_serial & texto.str.match(FECHA_SOLO_DIGITOS_PATTERN)
+    if solo_digitos.any():
+        # Sólo se acepta AAAAMMDD; otros números en texto quedan como NaT.
+        resultado.loc[solo_digitos] = pd.to_datetime(texto[solo_digitos], format="%Y%m%d", errors="coerce")
+
+    restantes = ~vacios & ~es_serial & ~solo_digitos
+    es_iso = restantes & texto.str.match(FECHA_ISO_PATTERN)
+    if es_iso.any():
+        resultado.loc[es_iso] = _parse_fechas_por_formatos(texto[es_iso], FECHA_ISO_FORMATOS, dayfirst=False)
+
+    es_dia_mes = restantes & ~es_iso & texto.str.match(FECHA_DIA_MES_PATTERN)
+    if es_dia_mes.any():
+        d, m = ("%d", "%m") if dayfirst else ("%m", "%d")
+        formatos = tuple(
+            f"{d}{sep}{m}{sep}%Y{hora}"
+            for sep in ("/", "-")
+            for hora in (" %H:%M:%S", "", " %H:%M")
+        )
+        resultado.loc[es_dia_mes] = _parse_fechas_por_formatos(texto[es_dia_mes], formatos, dayfirst=dayfirst)
+
+    otros = restantes & ~es_iso & ~es_dia_mes
+    if otros.any():
+        resultado.loc[otros] = _parse_fechas_por_formatos(texto[otros], (), dayfirst=dayfirst)
+    return resultado
+
+
+def _fechas_texto_normalizado(series: pd.Series) -> pd.Series:
+    texto = series.astype(str).str.strip()
+    return texto.mask(series.isna(), "").reset_index(drop=True)
+
+
+def parse_fechas_mixtas(series: pd.Series, *, dayfirst: bool = True) -> pd.Series:
+    """Convierte una columna con seriales de Sheets, ISO y dd/mm a ``datetime64``.
+
+    Clasifica las celdas con máscaras, parsea cada clase en una sola llamada y
+    memoriza el resultado por contenido de la columna para no repetirlo en cada rerun.
+    """
+    if series is None or len(series) == 0:
+        return pd.Series(pd.NaT, index=getattr(series, "index", None), dtype="datetime64[ns]")
+
+    texto = _fechas_texto_normalizado(series)
+    numericos = _fechas_numericas(series)
+    digest = hashlib.sha1(pd.util.hash_pandas_object(texto, index=False).to_numpy().tobytes())
+    digest.update(np.packbits(numericos).tobytes())
+    key = (digest.hexdigest(), bool(dayfirst))
+
+    memo = _get_fechas_memo()
+    with memo["lock"]:
+        valores = memo["entries"].get(key)
+        if valores is not None:
+            memo["entries"].move_to_end(key)
+    if valores is None:
+        valores = _parse_fechas_mixtas_sin_memo(texto, dayfirst=dayfirst, numericos=numericos).to_numpy()
+        with memo["lock"]:
+            memo["entries"][key] = valores
+            while len(memo["entries"]) > FECHAS_MEMO_MAX_ENTRIES:
+                memo["entries"].popitem(last=False)
+
+    return pd.Series(valores, index=series.index, name=series.name, dtype="datetime64[ns]")
+
+
+def format_fechas_mixtas(series: pd.Series, *, with_time: bool = True, dayfirst: bool = True) -> pd.Series:
+    """Formatea fechas mixtas de manera uniforme; lo que no es fecha se deja como texto."""
+    parsed = parse_fechas_mixtas(series, dayfirst=dayfirst)
+    texto = _fechas_texto_normalizado(series).set_axis(series.index)
+    texto = texto.mask(texto.str.lower().isin({"nan", "none", "nat"}), "")
+    formateado = parsed.dt.strftime("%Y-%m-%d %H:%M:%S" if with_time else "%Y-%m-%d")
+    return formateado.where(parsed.notna(), texto)
 
 
 def ensure_user_logged_in() -> str:
@@ -1815,8 +2673,6 @@ def render_lazy_tab_placeholder(tab_index: int, key_prefix: str, message: str) -
     st.caption(message)
     if st.button("🔄 Cargar esta pestaña ahora", key=f"{key_prefix}_load_now"):
         st.query_params.update({"tab": str(tab_index)})
-        clear_app_caches()
-        get_cached_connection_statuses.clear()
         pass  # Evita recarga inmediata; los cambios se aplican al enviar el formulario
 
 
@@ -2062,6 +2918,268 @@ EMPTY_CLIENTES_LOCALES_DATASET = pd.DataFrame(
 )
 LAST_SUCCESSFUL_CLIENTES_LOCALES_DATASET = EMPTY_CLIENTES_LOCALES_DATASET.copy()
 
+# --- Trazas de llamadas externas (Sheets / S3 / PDF) ---
+# Cuota por defecto de la API de Sheets (solicitudes por minuto por usuario, lectura y escritura por separado).
+SHEETS_QUOTA_POR_MINUTO = 60
+_SHEETS_OPERATION_PATTERNS = (
+    (re.compile(r"/values:batchUpdate$"), "values_batch_update"),
+    (re.compile(r"/values:batchGet$"), "values_batch_get"),
+    (re.compile(r"/values:batchClear$"), "values_batch_clear"),
+    (re.compile(r":batchUpdate$"), "batch_update"),
+    (re.compile(r"/values/[^/]+:append$"), "values_append"),
+    (re.compile(r"/values/[^/]+:clear$"), "values_clear"),
+)
+# Estados tras los que la app (o gspread con backoff) repite la misma llamada.
+SHEETS_RETRY_STATUSES = {429, 500, 502, 503, 504}
+SHEETS_RETRY_WINDOW_S = 120
+
+
+def _trace_section() -> str:
+    """Pestaña activa de la sesión que origina la llamada (``general`` fuera del script)."""
+    try:
+        tab_index = int(st.session_state.get("current_tab_index"))
+    except Exception:
+        return "general"
+    labels = globals().get("tabs_labels") or []
+    return str(labels[tab_index]) if 0 <= tab_index < len(labels) else f"tab{tab_index + 1}"
+
+
+def record_trace_event(
+    service: str,
+    operation: str,
+    elapsed_s: float,
+    *,
+    kind: str = "read",
+    bytes_out: int = 0,
+    bytes_in: int = 0,
+    retries: int = 0,
+    status: int | str | None = None,
+    ok: bool = True,
+) -> None:
+    """Agrega una llamada al almacén de trazas; nunca interrumpe la llamada original."""
+    now = datetime.now()
+    event = {
+        "ts": now.timestamp(),
+        "minuto": now.strftime("%Y-%m-%d %H:%M"),
+        "service": service,
+        "operation": operation,
+        "kind": kind,
+        "ms": round(elapsed_s * 1000.0, 2),
+        "bytes_out": int(bytes_out or 0),
+        "bytes_in": int(bytes_in or 0),
+        "retries": int(retries or 0),
+        "status": status,
+        "ok": bool(ok),
+        "section": _trace_section(),
+    }
+    try:
+        store = get_trace_store()
+        with store["lock"]:
+            store["events"].append(event)
+    except Exception:
+        pass
+
+
+@contextmanager
+def trace_span(service: str, operation: str, *, kind: str = "read", bytes_out: int = 0):
+    """Mide un bloque arbitrario (p. ej. un parseo con pdfplumber) como una llamada externa."""
+    start = time.perf_counter()
+    ok = True
+    try:
+        yield
+    except Exception:
+        ok = False
+        raise
+    finally:
+        record_trace_event(service, operation, time.perf_counter() - start, kind=kind, bytes_out=bytes_out, ok=ok)
+
+
+def _sheets_operation_name(method: str, endpoint: str) -> tuple[str, str]:
+    """Traduce método + URL de la API de Sheets a (operación, read/write)."""
+    method = str(method or "").upper()
+    kind = "read" if method == "GET" else "write"
+    path = urlparse(str(endpoint or "")).path
+    for pattern, name in _SHEETS_OPERATION_PATTERNS:
+        if pattern.search(path):
+            return name, "read" if name == "values_batch_get" else kind
+    if "/values/" in path:
+        return ("values_get" if method == "GET" else "values_update"), kind
+    if "/drive/" in path or "/files" in path:
+        return f"drive_{method.lower()}", kind
+    if "/spreadsheets/" in path:
+        return ("fetch_metadata" if method == "GET" else f"spreadsheet_{method.lower()}"), kind
+    return method.lower() or "request", kind
+
+
+def _payload_size(payload) -> int:
+    if payload is None:
+        return 0
+    if isinstance(payload, (bytes, bytearray)):
+        return len(payload)
+    if isinstance(payload, str):
+        return len(payload.encode("utf-8"))
+    try:
+        return len(json.dumps(payload, separators=(",", ":"), default=str))
+    except Exception:
+        return 0
+
+
+def instrument_gspread_client(client):
+    """Envuelve ``request`` del cliente gspread para registrar latencia, tamaño y estado de cada llamada."""
+    if client is None or getattr(client, "_trace_instrumented", False):
+        return client
+    # gspread 6 delega las llamadas HTTP en ``http_client``; gspread 5 en el propio cliente.
+    target = getattr(client, "http_client", None) or client
+    original_request = target.request
+    # Último fallo reintentable por (método, URL): la siguiente llamada igual es un reintento,
+    # venga del backoff de gspread o de los bucles de reintento de la app.
+    fallidos: dict[tuple[str, str], float] = {}
+
+    def traced_request(method, endpoint, *args, **kwargs):
+        operation, kind = _sheets_operation_name(method, endpoint)
+        bytes_out = _payload_size(kwargs.get("json")) + _payload_size(kwargs.get("data"))
+        clave = (str(method or "").upper(), str(endpoint or ""))
+        fallo_previo = fallidos.pop(clave, None)
+        es_reintento = fallo_previo is not None and time.monotonic() - fallo_previo <= SHEETS_RETRY_WINDOW_S
+        start = time.perf_counter()
+        response = None
+        status = None
+        try:
+            response = original_request(method, endpoint, *args, **kwargs)
+            status = getattr(response, "status_code", None)
+            return response
+        except Exception as exc:
+            response = getattr(exc, "response", None)
+            status = getattr(response, "status_code", None) or type(exc).__name__
+            raise
+        finally:
+            content = getattr(response, "content", b"") if response is not None else b""
+            if status in SHEETS_RETRY_STATUSES or not isinstance(status, int):
+                if len(fallidos) > 512:
+                    fallidos.clear()
+                fallidos[clave] = time.monotonic()
+            record_trace_event(
+                "sheets",
+                operation,
+                time.perf_counter() - start,
+                kind=kind,
+                bytes_out=bytes_out,
+                bytes_in=len(content or b""),
+                retries=int(es_reintento),
+                status=status,
+                ok=isinstance(status, int) and status < 400,
+            )
+
+    target.request = traced_request
+    client._trace_instrumented = True
+    return client
+
+
+def instrument_boto3_client(client):
+    """Registra latencia, bytes y reintentos de cada operación del cliente boto3 vía eventos de botocore."""
+    if client is None or getattr(client, "_trace_instrumented", False):
+        return client
+    service = client.meta.service_model.service_name
+
+    def _before_call(params=None, model=None, context=None, **_kwargs):
+        if context is None:
+            return
+        context["_trace_start"] = time.perf_counter()
+        body = (params or {}).get("body")
+        bytes_out = _payload_size(body) if isinstance(body, (bytes, bytearray, str)) else 0
+        if not bytes_out:
+            bytes_out = int(((params or {}).get("headers") or {}).get("Content-Length", 0) or 0)
+        context["_trace_bytes_out"] = bytes_out
+
+    def _after_call(http_response=None, parsed=None, model=None, context=None, exception=None, **_kwargs):
+        context = context or {}
+        start = context.get("_trace_start")
+        if start is None or model is None:
+            return
+        metadata = (parsed or {}).get("ResponseMetadata", {}) if isinstance(parsed, dict) else {}
+        status = getattr(http_response, "status_code", None) or (type(exception).__name__ if exception else None)
+        headers = metadata.get("HTTPHeaders") or {}
+        # En ``after-call-error`` no hay respuesta parseada; botocore deja el intento en el contexto.
+        retries = metadata.get("RetryAttempts")
+        if retries is None:
+            retries = max(int((context.get("retries") or {}).get("attempt", 1) or 1) - 1, 0)
+        record_trace_event(
+            service,
+            xform_name(model.name),
+            time.perf_counter() - start,
+            kind="read" if model.http.get("method", "GET") in ("GET", "HEAD") else "write",
+            bytes_out=context.get("_trace_bytes_out", 0),
+            bytes_in=int(headers.get("content-length", 0) or 0),
+            retries=retries,
+            status=status,
+            ok=exception is None and isinstance(status, int) and status < 400,
+        )
+
+    client.meta.events.register(f"before-call.{service}", _before_call)
+    client.meta.events.register(f"after-call.{service}", _after_call)
+    client.meta.events.register(f"after-call-error.{service}", _after_call)
+    client._trace_instrumented = True
+    return client
+
+
+def summarize_trace_events(events: list[dict]) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Resume trazas en (latencias p50/p95 por operación, consumo de cuota de Sheets por minuto)."""
+    if not events:
+        return pd.DataFrame(), pd.DataFrame()
+    df = pd.DataFrame(events)
+    resumen = (
+        df.groupby(["service", "operation"])
+        .agg(
+            llamadas=("ms", "size"),
+            p50_ms=("ms", "median"),
+            p95_ms=("ms", lambda s: s.quantile(0.95)),
+            max_ms=("ms", "max"),
+            errores=("ok", lambda s: int((~s).sum())),
+            reintentos=("retries", "sum"),
+            kb_enviados=("bytes_out", lambda s: s.sum() / 1024),
+            kb_recibidos=("bytes_in", lambda s: s.sum() / 1024),
+            pestañas=("section", lambda s: ", ".join(sorted(set(s)))),
+        )
+        .round(1)
+        .sort_values("p95_ms", ascending=False)
+        .reset_index()
+    )
+    sheets = df[df["service"] == "sheets"]
+    if sheets.empty:
+        return resumen, pd.DataFrame()
+    por_minuto = sheets.pivot_table(index="minuto", columns="kind", values="ms", aggfunc="size", fill_value=0)
+    por_minuto = por_minuto.reindex(columns=["read", "write"], fill_value=0).sort_index(ascending=False)
+    por_minuto["% cuota lectura"] = (por_minuto["read"] / SHEETS_QUOTA_POR_MINUTO * 100).round(0)
+    por_minuto["% cuota escritura"] = (por_minuto["write"] / SHEETS_QUOTA_POR_MINUTO * 100).round(0)
+    return resumen, por_minuto.reset_index()
+
+
+def render_trace_panel() -> None:
+    """Panel de latencias p50/p95 por operación y cuota de Sheets por minuto."""
+    store = get_trace_store()
+    with store["lock"]:
+        events = list(store["events"])
+    with st.expander(f"⏱️ Latencias de servicios externos ({len(events)} llamadas registradas)"):
+        if not events:
+            st.caption("Aún no hay llamadas registradas en este proceso.")
+            return
+        secciones = sorted({e["section"] for e in events})
+        seccion = st.selectbox("Pestaña de origen", ["Todas"] + secciones, key="trace_panel_section")
+        if seccion != "Todas":
+            events = [e for e in events if e["section"] == seccion]
+        resumen, por_minuto = summarize_trace_events(events)
+        st.dataframe(resumen, use_container_width=True, hide_index=True)
+        if not por_minuto.empty:
+            st.markdown("**Cuota de Google Sheets por minuto**")
+            st.dataframe(por_minuto.head(15), use_container_width=True, hide_index=True)
+        if st.button("🧹 Limpiar trazas", key="trace_panel_clear"):
+            with store["lock"]:
+                store["events"].clear()
+
+
+start_rerun_profile("app_v")
+
+
 def build_gspread_client():
     credentials_json_str = st.secrets["google_credentials"]
     creds_dict = json.loads(credentials_json_str)
@@ -2069,7 +3187,7 @@ def build_gspread_client():
         creds_dict["private_key"] = creds_dict["private_key"].replace("\\n", "\n").strip()
     scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
     creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-    return gspread.authorize(creds)
+    return instrument_gspread_client(gspread.authorize(creds))
 
 
 def format_gspread_api_error(error: APIError) -> str:
@@ -2101,7 +3219,7 @@ def get_google_sheets_client(refresh_token: float | None = None):
             creds_dict["private_key"] = creds_dict["private_key"].replace("\\n", "\n").strip()
         scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
         creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-        return gspread.authorize(creds)
+        return instrument_gspread_client(gspread.authorize(creds))
 
     max_attempts = 5
     for attempt in range(max_attempts):
@@ -2221,27 +3339,122 @@ def get_worksheet_casos_especiales(refresh_token: float | None = None):
     return spreadsheet.worksheet("casos_especiales")
 
 
-def get_remote_postal_codes() -> set[str]:
-    """Obtiene los códigos postales de la hoja Zonas_Remotas como strings normalizados.
+# --- Códigos postales de zonas remotas (bitset en memoria, respaldo en disco) ---
+# Los CP de 5 dígitos viven en un bitset de 100 000 posiciones y los más largos en
+# un conjunto aparte; consultar un CP es leer memoria. Un hilo relee la columna A
+# de Zonas_Remotas cuando el índice envejece y solo lo reemplaza si la lectura
+# trae códigos, así que una falla de Sheets conserva el último índice bueno.
+REMOTE_CP_PATH = Path(
+    os.environ.get("APP_REMOTE_CP") or Path(tempfile.gettempdir()) / "ventas_td_zonas_remotas.npz"
+)
+REMOTE_CP_REFRESH_SECONDS = 15 * 60
+
+
+def normalize_remote_cp(value: object) -> str:
+    """Solo dígitos; los CP de hasta 5 dígitos se completan con ceros a la izquierda."""
+    digits = re.sub(r"\D", "", str(value or "").strip())
+    return digits.zfill(5) if digits and len(digits) <= 5 else digits
+
+
+def build_remote_cp_index(valores) -> tuple[np.ndarray, frozenset[str]]:
+    """Bitset de CP de 5 dígitos y conjunto de los códigos más largos."""
+    bits = np.zeros(100_000, dtype=bool)
+    extras: set[str] = set()
+    for value in valores:
+        codigo = normalize_remote_cp(value)
+        if len(codigo) == 5:
+            bits[int(codigo)] = True
+        elif codigo:
+            extras.add(codigo)
+    return bits, frozenset(extras)
 
-    No se cachea para evitar guardar respuestas vacías cuando Google Sheets falla
-    temporalmente y así no marcar falsos negativos en el verificador.
-    """
-    worksheet = get_worksheet_zonas_remotas(st.session_state.get("remote_zones_refresh_token"))
-    if worksheet is None:
-        return set()
 
+@st.cache_resource
+def get_remote_cp_state() -> dict:
+    """Índice de CP remotos del proceso y el hilo que lo refresca."""
+    return {
+        "lock": threading.Lock(),
+        "thread": None,
+        "worksheet": None,
+        "bits": None,
+        "extras": frozenset(),
+        "actualizado_at": 0.0,
+        "error": "",
+    }
+
+
+def _cargar_remote_cp_disco(state: dict) -> None:
     try:
-        valores = worksheet.col_values(1)[1:]  # omite encabezado
+        with np.load(REMOTE_CP_PATH) as datos:
+            bits = np.unpackbits(datos["bits"])[:100_000].astype(bool)
+            extras = frozenset(str(codigo) for codigo in datos["extras"])
+            actualizado_at = float(datos["actualizado_at"])
     except Exception:
-        return set()
+        return
+    state["bits"], state["extras"], state["actualizado_at"] = bits, extras, actualizado_at
 
-    codigos: set[str] = set()
-    for value in valores:
-        digits = re.sub(r"\D", "", str(value or "").strip())
-        if digits:
-            codigos.add(digits.zfill(5) if len(digits) <= 5 else digits)
-    return codigos
+
+def _refrescar_remote_cp(state: dict) -> None:
+    try:
+        valores = state["worksheet"].col_values(1)[1:]  # omite encabezado
+        bits, extras = build_remote_cp_index(valores)
+        if not bits.any() and not extras:
+            raise ValueError("Zonas_Remotas sin códigos postales")
+    except Exception as e:
+        # Último índice bueno; se reintenta en el siguiente periodo.
+        state["actualizado_at"] = time.time() - REMOTE_CP_REFRESH_SECONDS / 2 if state["bits"] is not None else 0.0
+        state["error"] = f"{type(e).__name__}: {e}"
+        return
+    ahora = time.time()
+    state["bits"], state["extras"], state["actualizado_at"] = bits, extras, ahora
+    state["error"] = ""
+    try:
+        tmp_path = REMOTE_CP_PATH.with_name(REMOTE_CP_PATH.stem + ".tmp.npz")
+        np.savez(
+            tmp_path,
+            bits=np.packbits(bits),
+            extras=np.array(sorted(extras), dtype=str),
+            actualizado_at=np.float64(ahora),
+        )
+        os.replace(tmp_path, REMOTE_CP_PATH)
+    except Exception:
+        pass
+
+
+def ensure_remote_postal_codes(worksheet) -> bool:
+    """Deja listo el índice de CP remotos; True si hay uno disponible.
+
+    Usa memoria o disco sin esperar a la red y agenda el refresco en segundo plano;
+    solo se lee de forma síncrona cuando no existe ningún índice todavía.
+    """
+    state = get_remote_cp_state()
+    if worksheet is not None:
+        state["worksheet"] = worksheet
+    with state["lock"]:
+        if state["bits"] is None:
+            _cargar_remote_cp_disco(state)
+        vigente = time.time() - state["actualizado_at"] < REMOTE_CP_REFRESH_SECONDS
+        hilo = state["thread"]
+        if vigente or state["worksheet"] is None or (hilo is not None and hilo.is_alive()):
+            return state["bits"] is not None
+        if state["bits"] is None:
+            _refrescar_remote_cp(state)
+            return state["bits"] is not None
+        hilo = threading.Thread(target=_refrescar_remote_cp, args=(state,), name="zonas-remotas", daemon=True)
+        state["thread"] = hilo
+        hilo.start()
+    return True
+
+
+def is_remote_postal_code(cp_normalized: str) -> bool:
+    """Consulta en memoria del índice de CP remotos (``normalize_remote_cp`` ya aplicado)."""
+    state = get_remote_cp_state()
+    bits = state["bits"]
+    if bits is None or not cp_normalized:
+        return False
+    if len(cp_normalized) == 5 and cp_normalized.isdigit():
+        return bool(bits[int(cp_normalized)])
+    return cp_normalized in state["extras"]
 
 
 def normalize_client_history_text(value: object) -> str:
@@ -2350,10 +3563,11 @@ def ensure_clientes_locales_headers(worksheet) -> list[str]:
         raise Exception("No se pudo abrir la hoja Clientes_Locales.")
     last_header_cell = rowcol_to_a1(1, len(CLIENTES_LOCALES_HEADERS))
     headers_range = f"A1:{last_header_cell}"
-    current_headers = worksheet.row_values(1)
+    sheet_name = getattr(worksheet, "title", "")
+    current_headers = get_sheet_headers(sheet_name, worksheet)
     if current_headers != CLIENTES_LOCALES_HEADERS:
         worksheet.update(headers_range, [CLIENTES_LOCALES_HEADERS], value_input_option="RAW")
-        get_sheet_headers.clear()
+        register_sheet_headers(sheet_name, CLIENTES_LOCALES_HEADERS)
     try:
         # Columna G = Tels. Formato texto plano para prevenir evaluaciones como fórmula.
         worksheet.format("G:G", {"numberFormat": {"type": "TEXT"}})
@@ -2363,6 +3577,7 @@ def ensure_clientes_locales_headers(worksheet) -> list[str]:
     return CLIENTES_LOCALES_HEADERS
 
 
+@depende_de_hojas("Clientes_Locales")
 @st.cache_data(ttl=120)
 def load_clientes_locales_dataset(refresh_token: float | None = None) -> pd.DataFrame:
     """Carga Clientes_Locales con metadatos normalizados para coincidencias flexibles."""
@@ -2601,50 +3816,19 @@ def upsert_cliente_local_if_missing(record: dict[str, str]) -> tuple[str, str]:
     return "inserted", "Dirección agregada al historial del cliente."
 
 
-@st.cache_data(ttl=300)
-def get_sheet_headers(sheet_name: str):
-    """Obtiene y cachea los encabezados de la hoja especificada."""
-    if sheet_name == "casos_especiales":
-        ws = get_worksheet_casos_especiales()
-    elif sheet_name == SHEET_PEDIDOS_HISTORICOS:
-        ws = get_worksheet_historico()
-    else:
-        ws = get_worksheet_operativa()
-    return ws.row_values(1) if ws else []
-
-
-@st.cache_data(ttl=180)
 def obtener_devoluciones_autorizadas_sin_folio(id_vendedor_normalizado: str) -> int:
     """Cuenta devoluciones autorizadas sin Folio Nuevo para el vendedor actual."""
     if not id_vendedor_normalizado:
         return 0
 
     try:
-        ws_casos = get_worksheet_casos_especiales()
-        df_casos, _ = load_sheet_records_with_row_numbers(ws_casos)
+        df_alertas = get_casos_especiales_view("devoluciones_autorizadas_sin_folio")
     except Exception:
         return 0
 
-    if df_casos.empty:
+    if df_alertas.empty:
         return 0
-
-    if "id_vendedor" not in df_casos.columns:
-        df_casos["id_vendedor"] = ""
-    if "Seguimiento" not in df_casos.columns:
-        df_casos["Seguimiento"] = ""
-    if "Folio_Factura" not in df_casos.columns:
-        df_casos["Folio_Factura"] = ""
-
-    seguimiento_autorizacion = "Autorización de devolución"
-    df_alertas = df_casos[df_casos.apply(is_devolucion_case_row, axis=1)].copy()
-    df_alertas = df_alertas[
-        df_alertas["id_vendedor"].apply(normalize_vendedor_id) == id_vendedor_normalizado
-    ]
-    mask = (
-        df_alertas["Seguimiento"].astype(str).str.strip().eq(seguimiento_autorizacion)
-        & df_alertas["Folio_Factura"].apply(is_empty_folio)
-    )
-    return int(mask.sum())
+    return int(df_alertas["id_vendedor_norm"].eq(id_vendedor_normalizado).sum())
 
 
 # --- AWS S3 CONFIGURATION (NEW) ---
@@ -2676,7 +3860,7 @@ def get_s3_client():
             region_name=AWS_REGION
         )
         st.session_state.pop("s3_error", None)
-        return s3
+        return instrument_boto3_client(s3)
     except Exception as e:
         st.session_state["s3_error"] = f"❌ Error al inicializar el cliente S3: {e}"
         return None
@@ -2859,6 +4043,7 @@ def display_connection_status_badge(statuses: list[dict[str, object]]) -> None:
 
 
 # ✅ Clientes listos para usar en cualquier parte
+profile_checkpoint("clientes")
 g_spread_client = get_google_sheets_client()
 s3_client = get_s3_client()
 
@@ -3057,22 +4242,7 @@ def rerun_with_tab2_loading(message: str = "⏳ Actualizando la modificación de
 
 def clear_order_related_caches() -> None:
     """Limpia cachés de lectura para reflejar pedidos recién registrados sin recargar la app."""
-    for fn_name in (
-        "cargar_pedidos",
-        "cargar_pedidos_ventas_reportes",
-        "cargar_pedidos_combinados",
-        "cargar_pedidos_busqueda",
-        "obtener_resumen_guias_vendedor",
-        "get_tab3_pending_comprobante_dataset",
-        "get_tab4_casos_especiales_dataset",
-    ):
-        clear_fn = getattr(globals().get(fn_name), "clear", None)
-        if not callable(clear_fn):
-            continue
-        try:
-            clear_fn()
-        except Exception:
-            continue
+    invalidar_hojas(SHEET_PEDIDOS_OPERATIVOS, SHEET_PEDIDOS_HISTORICOS, "casos_especiales")
 
 
 @st.cache_data(ttl=CONNECTION_STATUS_TTL_SECONDS, show_spinner=False)
@@ -3082,6 +4252,348 @@ def get_cached_connection_statuses() -> list[dict[str, object]]:
 
 
 
+# --- Réplica local de lectura (SQLite) ---
+REPLICA_DB_PATH = Path(
+    os.environ.get("APP_REPLICA_DB") or Path(tempfile.gettempdir()) / "ventas_td_replica.sqlite3"
+)
+REPLICA_REFRESH_SECONDS = 120
+REPLICA_MAX_AGE_SECONDS = 600
+REPLICA_DEMANDA_SECONDS = 30 * 60
+REPLICA_TABLAS = {
+    SHEET_PEDIDOS_OPERATIVOS: {
+        "indices": ("ID_Pedido", "Vendedor_Registro", "id_vendedor", "Tipo_Envio", "Estado", "Estado_Entrega"),
+        "fechas": ("Hora_Registro", "Fecha_Entrega"),
+    },
+    SHEET_PEDIDOS_HISTORICOS: {
+        "indices": ("ID_Pedido", "Vendedor_Registro", "id_vendedor", "Tipo_Envio", "Estado", "Estado_Entrega"),
+        "fechas": ("Hora_Registro", "Fecha_Entrega"),
+    },
+    "casos_especiales": {
+        "indices": ("ID_Pedido", "Vendedor_Registro", "id_vendedor", "Tipo_Envio", "Estado", "Estado_Caso"),
+        "fechas": ("Hora_Registro",),
+    },
+    "pedidos_confirmados": {
+        "indices": ("ID_Pedido", "Vendedor_Registro", "Tipo_Envio", "Estado_Pago", "Estado_Entrega"),
+        "fechas": ("Fecha_Entrega", "Fecha_Pago_Comprobante"),
+    },
+    SHEET_CLIENTES_LOCALES: {
+        "indices": ("Cliente",),
+        "fechas": ("Fecha_Ultimo_Uso",),
+    },
+}
+_REPLICA_OPERADORES = {"=", "!=", ">=", "<=", ">", "<", "IN", "NOT IN", "NOT IN NOCASE"}
+
+
+def replica_fecha(columna: str) -> str:
+    """Columna ISO derivada (``YYYY-MM-DD HH:MM:SS``) que indexa una fecha de la hoja."""
+    return f"{columna}__iso"
+
+
+def _replica_tabla(hoja: str) -> str:
+    return "r_" + re.sub(r"\W+", "_", hoja.strip().lower())
+
+
+def replica_habilitada() -> bool:
+    try:
+        return bool(st.secrets.get("replica_sheets", True))
+    except Exception:
+        return True
+
+
+def _replica_connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(REPLICA_DB_PATH, timeout=30, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS replica_meta ("
+        "hoja TEXT PRIMARY KEY, tabla TEXT, headers TEXT, filas INTEGER, version TEXT, "
+        "synced_at REAL, invalidado_at REAL DEFAULT 0)"
+    )
+    return conn
+
+
+@st.cache_resource
+def get_replica_state() -> dict:
+    """Estado del refresco en segundo plano (hilo, demanda por hoja y últimos errores)."""
+    return {
+        "lock": threading.Lock(),
+        "wake": threading.Event(),
+        "thread": None,
+        "client": None,
+        "demanda": {},
+        "errores": {},
+    }
+
+
+def _replica_meta(hoja: str) -> dict | None:
+    try:
+        with closing(_replica_connect()) as conn:
+            fila = conn.execute(
+                "SELECT tabla, headers, filas, version, synced_at, invalidado_at FROM replica_meta WHERE hoja = ?",
+                (hoja,),
+            ).fetchone()
+    except sqlite3.Error:
+        return None
+    if not fila:
+        return None
+    tabla, headers, filas, version, synced_at, invalidado_at = fila
+    return {
+        "tabla": tabla,
+        "headers": json.loads(headers or "[]"),
+        "filas": int(filas or 0),
+        "version": version,
+        "synced_at": float(synced_at or 0),
+        "invalidado_at": float(invalidado_at or 0),
+    }
+
+
+def sync_replica_table(hoja: str, client=None, state: dict | None = None) -> int:
+    """Copia la hoja completa a su tabla SQLite (cambio atómico) y devuelve las filas copiadas."""
+    state = state or get_replica_state()
+    client = client or state["client"]
+    if client is None:
+        raise RuntimeError("Sin cliente de Google Sheets para sincronizar la réplica.")
+    config = REPLICA_TABLAS[hoja]
+    tabla = _replica_tabla(hoja)
+
+    inicio = time.time()
+    valores = client.open_by_key(GOOGLE_SHEET_ID).worksheet(hoja).get_all_values()
+    version = hashlib.sha1(json.dumps(valores, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    meta = _replica_meta(hoja)
+    if meta and meta["version"] == version:
+        with closing(_replica_connect()) as conn:
+            conn.execute("UPDATE replica_meta SET synced_at = ? WHERE hoja = ?", (inicio, hoja))
+        return meta["filas"]
+
+    headers: list[str] = []
+    vistos: dict[str, int] = {}
+    for idx, raw_header in enumerate(valores[0] if valores else [], start=1):
+        base = str(raw_header).strip() or f"col_{idx}"
+        repeticiones = vistos.get(base, 0)
+        vistos[base] = repeticiones + 1
+        headers.append(base if not repeticiones else f"{base}_{repeticiones + 1}")
+
+    ancho = len(headers)
+    filas = []
+    sheet_rows = []
+    for sheet_row, fila in enumerate(valores[1:], start=2):
+        fila = list(fila[:ancho]) + [""] * max(0, ancho - len(fila))
+        if not any(str(celda).strip() for celda in fila):
+            continue
+        filas.append(fila)
+        sheet_rows.append(sheet_row)
+
+    df = pd.DataFrame(filas, columns=headers, dtype=object)
+    df["__sheet_row"] = sheet_rows
+    indices = [c for c in config["indices"] if c in df.columns]
+    for columna in indices:
+        df[columna] = df[columna].astype(str).str.strip()
+    for columna in config["fechas"]:
+        if columna in df.columns:
+            fechas = _parse_fechas_mixtas_sin_memo(
+                _fechas_texto_normalizado(df[columna]),
+                dayfirst=FECHAS_HOJA_DAYFIRST,
+                numericos=_fechas_numericas(df[columna]),
+            )
+            df[replica_fecha(columna)] = fechas.dt.strftime("%Y-%m-%d %H:%M:%S").where(fechas.notna(), None).to_numpy()
+            indices.append(replica_fecha(columna))
+
+    with state["lock"], closing(_replica_connect()) as conn:
+        nueva = f"{tabla}__nueva"
+        conn.execute(f'DROP TABLE IF EXISTS "{nueva}"')
+        df.to_sql(nueva, conn, index=False)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(f'DROP TABLE IF EXISTS "{tabla}"')
+            conn.execute(f'ALTER TABLE "{nueva}" RENAME TO "{tabla}"')
+            for n, columna in enumerate(indices):
+                conn.execute(f'CREATE INDEX "ix_{tabla}_{n}" ON "{tabla}" ("{columna}")')
+            conn.execute(
+                "INSERT INTO replica_meta (hoja, tabla, headers, filas, version, synced_at, invalidado_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0) ON CONFLICT(hoja) DO UPDATE SET "
+                "tabla = excluded.tabla, headers = excluded.headers, filas = excluded.filas, "
+                "version = excluded.version, synced_at = excluded.synced_at",
+                (hoja, tabla, json.dumps(headers, ensure_ascii=False), len(df), version, inicio),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return len(df)
+
+
+def _replica_refresher_loop(state: dict) -> None:
+    while True:
+        state["wake"].wait(REPLICA_REFRESH_SECONDS)
+        state["wake"].clear()
+        ahora = time.time()
+        for hoja, ultimo_uso in list(state["demanda"].items()):
+            if ahora - ultimo_uso > REPLICA_DEMANDA_SECONDS:
+                continue
+            meta = _replica_meta(hoja)
+            vigente = (
+                meta is not None
+                and meta["synced_at"] > meta["invalidado_at"]
+                and ahora - meta["synced_at"] < REPLICA_REFRESH_SECONDS
+            )
+            if vigente:
+                continue
+            try:
+                sync_replica_table(hoja, state=state)
+                state["errores"].pop(hoja, None)
+            except Exception as e:
+                state["errores"][hoja] = f"{type(e).__name__}: {e}"
+
+
+def ensure_replica_refresher(client) -> None:
+    """Arranca (una vez por proceso) el hilo que mantiene sincronizadas las hojas consultadas."""
+    if client is None or not replica_habilitada():
+        return
+    state = get_replica_state()
+    state["client"] = client
+    with state["lock"]:
+        hilo = state["thread"]
+        if hilo is not None and hilo.is_alive():
+            return
+        hilo = threading.Thread(
+            target=_replica_refresher_loop, args=(state,), name="replica-sheets", daemon=True
+        )
+        state["thread"] = hilo
+        hilo.start()
+
+
+def replica_lista(hoja: str) -> bool:
+    """True si la réplica de ``hoja`` está vigente; si no, la agenda para el hilo de refresco."""
+    if hoja not in REPLICA_TABLAS or not replica_habilitada():
+        return False
+    state = get_replica_state()
+    state["demanda"][hoja] = time.time()
+    meta = _replica_meta(hoja)
+    vigente = (
+        meta is not None
+        and meta["synced_at"] > meta["invalidado_at"]
+        and time.time() - meta["synced_at"] < REPLICA_MAX_AGE_SECONDS
+    )
+    if not vigente:
+        state["wake"].set()
+    return vigente
+
+
+def marcar_replica_desactualizada(*hojas: str) -> None:
+    """Invalida la réplica tras una escritura: las lecturas vuelven a la hoja hasta el próximo sync."""
+    hojas = hojas or tuple(REPLICA_TABLAS)
+    try:
+        with closing(_replica_connect()) as conn:
+            conn.executemany(
+                "UPDATE replica_meta SET invalidado_at = ? WHERE hoja = ?",
+                [(time.time(), hoja) for hoja in hojas],
+            )
+    except sqlite3.Error:
+        pass
+    get_replica_state()["wake"].set()
+
+
+def _replica_valor(valor, operador: str):
+    if isinstance(valor, datetime):
+        return valor.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(valor, date):
+        return f"{valor.isoformat()} 23:59:59" if operador == "<=" else valor.isoformat()
+    return valor
+
+
+def _replica_where(filtros, columnas_tabla: set[str]) -> tuple[str, list] | None:
+    """Traduce ``[(columna, operador, valor), ...]`` a SQL; None si falta alguna columna."""
+    condiciones = []
+    parametros: list = []
+    for columna, operador, valor in filtros:
+        if columna not in columnas_tabla or operador not in _REPLICA_OPERADORES:
+            return None
+        if operador.startswith("IN") or operador.startswith("NOT IN"):
+            valores = [_replica_valor(v, operador) for v in valor]
+            marcas = ", ".join("?" for _ in valores) or "NULL"
+            if operador == "NOT IN NOCASE":
+                condiciones.append(f'"{columna}" COLLATE NOCASE NOT IN ({marcas})')
+            else:
+                condiciones.append(f'"{columna}" {operador} ({marcas})')
+            parametros.extend(valores)
+        else:
+            condiciones.append(f'"{columna}" {operador} ?')
+            parametros.append(_replica_valor(valor, operador))
+    return (" WHERE " + " AND ".join(condiciones) if condiciones else ""), parametros
+
+
+def query_replica(
+    hoja: str,
+    filtros=(),
+    columnas: list[str] | None = None,
+    limite: int | None = None,
+    exigir_vigencia: bool = True,
+):
+    """Filas de la réplica que cumplen ``filtros`` (consulta indexada).
+
+    Devuelve None si la réplica no está vigente o no tiene alguna columna pedida;
+    el llamador entonces usa su lectura directa de Google Sheets.
+    ``exigir_vigencia=False`` sirve para consultas encadenadas del mismo rerun.
+    """
+    if exigir_vigencia and not replica_lista(hoja):
+        return None
+    meta = _replica_meta(hoja)
+    if meta is None:
+        return None
+    columnas_tabla = set(meta["headers"]) | {replica_fecha(c) for c in REPLICA_TABLAS[hoja]["fechas"]}
+    where = _replica_where(filtros, columnas_tabla)
+    if where is None:
+        return None
+    columnas = [c for c in (columnas or meta["headers"]) if c in meta["headers"]]
+    seleccion = ", ".join(f'"{c}"' for c in columnas) or "*"
+    sql = f'SELECT {seleccion} FROM "{meta["tabla"]}"{where[0]} ORDER BY "__sheet_row"'
+    if limite is not None:
+        sql += f" LIMIT {int(limite)}"
+    try:
+        with closing(_replica_connect()) as conn:
+            return pd.read_sql_query(sql, conn, params=where[1]).fillna("")
+    except (sqlite3.Error, pd.errors.DatabaseError):
+        return None
+
+
+def replica_distinct(hoja: str, columna: str, filtros=(), exigir_vigencia: bool = True) -> list[str] | None:
+    """Valores distintos de ``columna`` bajo ``filtros``, en orden de aparición en la hoja."""
+    if exigir_vigencia and not replica_lista(hoja):
+        return None
+    meta = _replica_meta(hoja)
+    if meta is None:
+        return None
+    columnas_tabla = set(meta["headers"]) | {replica_fecha(c) for c in REPLICA_TABLAS[hoja]["fechas"]}
+    where = _replica_where(filtros, columnas_tabla)
+    if where is None or columna not in meta["headers"]:
+        return None
+    try:
+        with closing(_replica_connect()) as conn:
+            filas = conn.execute(
+                f'SELECT "{columna}" FROM "{meta["tabla"]}"{where[0]} '
+                f'GROUP BY "{columna}" ORDER BY MIN("__sheet_row")',
+                where[1],
+            ).fetchall()
+    except sqlite3.Error:
+        return None
+    return [str(fila[0]) for fila in filas if fila[0] is not None]
+
+
+def describe_replica(hoja: str) -> str:
+    meta = _replica_meta(hoja)
+    if not meta:
+        return ""
+    antiguedad = max(int(time.time() - meta["synced_at"]), 0)
+    return f"🗄️ Filtrado sobre réplica local de '{hoja}' ({meta['filas']} filas, sincronizada hace {antiguedad} s)."
+
+
+ensure_replica_refresher(g_spread_client)
+# Precarga (o agenda) el calendario de cierres antes de que tab1 pinte el selector de turnos.
+ensure_route_closures(g_spread_client, str(st.secrets.get("reportes_almacen_sheet_id", "") or "").strip())
+
+
+@depende_de_hojas("data_pedidos")
 @st.cache_data(ttl=300)
 def cargar_pedidos():
     sheet = g_spread_client.open_by_key("1aWkSelodaz0nWfQx7FZAysGnIYGQFJxAN7RO3YgCiZY").worksheet(SHEET_PEDIDOS_OPERATIVOS)
@@ -3089,6 +4601,118 @@ def cargar_pedidos():
     return pd.DataFrame(data)
 
 
+# --- Agregado diario de ventas (📊 Ventas y Reportes) ---
+VENTAS_REPORTE_COLUMNAS = (
+    "Folio_Factura",
+    "Cliente",
+    "Monto_Comprobante",
+    "Comprobante_Confirmado",
+    "Forma_Pago_Comprobante",
+    "Tipo_Envio",
+    "Vendedor_Registro",
+    "Hora_Registro",
+)
+VENTAS_AGREGADO_DIMENSIONES = ("Vendedor_Registro", "Forma_Pago_Comprobante", "Tipo_Envio")
+VENTAS_FECHA_COL = "__fecha_registro"
+VENTAS_HUELLA_COL = "__huella"
+
+
+def _ventas_texto(df: pd.DataFrame, col: str) -> pd.Series:
+    if col not in df.columns:
+        return pd.Series("", index=df.index, dtype="object")
+    return df[col].astype(str).fillna("")
+
+
+def ventas_montos(serie: pd.Series) -> pd.Series:
+    """Montos de comprobante como float (sin separador de miles; inválidos = 0)."""
+    return pd.to_numeric(serie.astype(str).str.replace(",", "", regex=False), errors="coerce").fillna(0.0)
+
+
+def huellas_ventas(df: pd.DataFrame) -> np.ndarray:
+    """Hash por fila de las columnas del reporte; detecta filas nuevas o editadas."""
+    if df.empty:
+        return np.empty(0, dtype=np.uint64)
+    columnas = pd.DataFrame({col: _ventas_texto(df, col) for col in VENTAS_REPORTE_COLUMNAS}, index=df.index)
+    return pd.util.hash_pandas_object(columnas, index=False).to_numpy(dtype=np.uint64)
+
+
+def agregar_ventas_diarias(df: pd.DataFrame) -> pd.DataFrame:
+    """Suma monto y pedidos por día de registro, vendedor, forma de pago y tipo de envío."""
+    claves = ["fecha", *VENTAS_AGREGADO_DIMENSIONES]
+    if df.empty:
+        return pd.DataFrame({
+            "fecha": pd.Series(dtype="datetime64[ns]"),
+            **{col: pd.Series(dtype="object") for col in VENTAS_AGREGADO_DIMENSIONES},
+            "monto": pd.Series(dtype="float64"),
+            "pedidos": pd.Series(dtype="int64"),
+        })
+    if VENTAS_FECHA_COL in df.columns:
+        fechas = df[VENTAS_FECHA_COL]
+    else:
+        fechas = pd.to_datetime(_ventas_texto(df, "Hora_Registro"), errors="coerce")
+    filas = pd.DataFrame({
+        "fecha": fechas.dt.normalize(),
+        **{col: _ventas_texto(df, col) for col in VENTAS_AGREGADO_DIMENSIONES},
+        "monto": ventas_montos(_ventas_texto(df, "Monto_Comprobante")),
+        "pedidos": 1,
+    })
+    return filas.groupby(claves, dropna=False, sort=False, as_index=False)[["monto", "pedidos"]].sum()
+
+
+@st.cache_resource
+def get_ventas_agregado_state() -> dict:
+    """Agregado diario de ventas del proceso y las huellas de las filas que ya suma."""
+    return {
+        "lock": threading.Lock(),
+        "huellas": np.empty(0, dtype=np.uint64),
+        "agregado": None,
+        "version": "",
+    }
+
+
+def actualizar_agregado_ventas(df: pd.DataFrame) -> tuple[pd.DataFrame, str]:
+    """Devuelve el agregado diario al día con ``df`` y su versión.
+
+    Si el snapshot solo agrega filas al final (pedidos nuevos) se suman únicamente
+    esas filas; cualquier edición de filas ya sumadas reconstruye el agregado.
+    """
+    if VENTAS_HUELLA_COL in df.columns:
+        huellas = df[VENTAS_HUELLA_COL].to_numpy(dtype=np.uint64)
+    else:
+        huellas = huellas_ventas(df)
+
+    state = get_ventas_agregado_state()
+    with state["lock"]:
+        previas = state["huellas"]
+        agregado = state["agregado"]
+        if agregado is not None and np.array_equal(previas, huellas):
+            return agregado, state["version"]
+
+        n_previas = len(previas)
+        if agregado is not None and 0 < n_previas < len(huellas) and np.array_equal(previas, huellas[:n_previas]):
+            nuevas = agregar_ventas_diarias(df.iloc[n_previas:])
+            agregado = (
+                pd.concat([agregado, nuevas], ignore_index=True)
+                .groupby(["fecha", *VENTAS_AGREGADO_DIMENSIONES], dropna=False, sort=False, as_index=False)
+                [["monto", "pedidos"]]
+                .sum()
+            )
+        else:
+            agregado = agregar_ventas_diarias(df)
+
+        version = hashlib.sha1(huellas.tobytes()).hexdigest()
+        state.update(huellas=huellas.copy(), agregado=agregado, version=version)
+        return agregado, version
+
+
+def filtrar_agregado_ventas(agregado: pd.DataFrame, mes: str) -> pd.DataFrame:
+    """Renglones del agregado del mes ``AAAA-MM`` (o todos con ``"Todos"``)."""
+    if mes == "Todos":
+        return agregado
+    return agregado[agregado["fecha"].dt.to_period("M").astype("string") == mes]
+
+
+@depende_de_hojas("datos_pedidos")
 @st.cache_data(ttl=300)
 def cargar_pedidos_ventas_reportes():
     """Carga pedidos de datos_pedidos filtrando solo turnos CDMX/Aula para la vista de reportes."""
@@ -3109,17 +4733,7 @@ def cargar_pedidos_ventas_reportes():
         if not valores:
             return pd.DataFrame()
 
-        encabezados_raw = valores[0]
-        encabezados: list[str] = []
-        vistos: dict[str, int] = {}
-        for idx, h in enumerate(encabezados_raw, start=1):
-            base = str(h).strip() or f"col_{idx}"
-            n = vistos.get(base, 0) + 1
-            vistos[base] = n
-            encabezados.append(base if n == 1 else f"{base}__{n}")
-
-        filas = valores[1:] if len(valores) > 1 else []
-        frame = pd.DataFrame(filas, columns=encabezados)
+        frame, _, _ = sheet_values_to_frame(valores, sufijo_duplicados="__")
 
     if frame.empty:
         return frame
@@ -3132,24 +4746,29 @@ def cargar_pedidos_ventas_reportes():
         normalizar("🎓 Recoge en Aula").strip().lower(),
         *(normalizar(turno_uber).strip().lower() for turno_uber in UBER_TURNO_OPTIONS),
     }
-    frame["Turno_norm"] = (
-        frame["Turno"]
-        .astype(str)
-        .apply(normalizar)
-        .str.strip()
-        .str.lower()
-    )
-    frame = frame[frame["Turno_norm"].isin(turnos_validos_norm)].copy()
-    frame.drop(columns=["Turno_norm"], inplace=True)
+    turno_norm = _normalizar_por_valor(frame["Turno"].astype(str))
+    frame = frame[turno_norm.isin(turnos_validos_norm)].copy()
     frame["Fuente"] = SHEET_PEDIDOS_HISTORICOS
+    # Una vez por snapshot: fecha de registro y huella por fila para el agregado diario.
+    frame[VENTAS_FECHA_COL] = pd.to_datetime(frame.get("Hora_Registro", ""), errors="coerce")
+    frame[VENTAS_HUELLA_COL] = huellas_ventas(frame)
     return frame
 
 
+profile_checkpoint("login")
 usuario_activo = ensure_user_logged_in()
 
+profile_checkpoint("estado_conexion")
 connection_statuses = get_cached_connection_statuses()
 display_connection_status_badge(connection_statuses)
 
+# Panel de latencias sólo para los usuarios listados en secrets (``trace_admin_users``).
+if str(usuario_activo).strip().upper() in {
+    str(u).strip().upper() for u in st.secrets.get("trace_admin_users", [])
+}:
+    render_trace_panel()
+render_profile_panel()
+
 status_by_name = {status["name"]: status for status in connection_statuses}
 
 internet_status = status_by_name.get("Internet")
@@ -3176,6 +4795,7 @@ if s3_status and not s3_status.get("ok", False):
         pass  # Evita recarga inmediata; los cambios se aplican al enviar el formulario
     st.stop()
 
+profile_checkpoint("encabezado")
 nombre_vendedor_activo = get_session_vendedor_name() or usuario_activo
 st.markdown(f"<h3 class='home-welcome-title'>👋 Bienvenido, {nombre_vendedor_activo}</h3>", unsafe_allow_html=True)
 
@@ -3241,8 +4861,9 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
-remote_postal_codes = get_remote_postal_codes()
-remote_codes_loaded = len(remote_postal_codes) > 0
+remote_codes_loaded = ensure_remote_postal_codes(
+    get_worksheet_zonas_remotas(st.session_state.get("remote_zones_refresh_token"))
+)
 _home_col_left, home_col_validator, _home_col_right = st.columns([1, 1.2, 1])
 with home_col_validator:
     st.markdown("##### ⚡ Verificador de Zonas Remotas")
@@ -3255,8 +4876,7 @@ with home_col_validator:
         help="Se valida en cuanto escribes o pegas el código postal.",
     )
 
-    cp_digits = re.sub(r"\D", "", str(cp_input or "").strip())
-    cp_normalized = cp_digits.zfill(5) if cp_digits and len(cp_digits) <= 5 else cp_digits
+    cp_normalized = normalize_remote_cp(cp_input)
 
     if cp_normalized and not remote_codes_loaded:
         st.markdown(
@@ -3269,7 +4889,7 @@ with home_col_validator:
             unsafe_allow_html=True,
         )
     elif cp_normalized:
-        if cp_normalized in remote_postal_codes:
+        if is_remote_postal_code(cp_normalized):
             st.markdown(
                 (
                     "<div class='remote-zone-status remote-zone-status--remote'>"
@@ -3293,6 +4913,7 @@ with home_col_validator:
 if st.button("🔄 Recargar Página y Conexión", help="Haz clic aquí si algo no carga o da error de Google Sheets."):
     if allow_refresh("main_last_refresh"):
         clear_app_caches()
+        reset_broken_clients()
         get_cached_connection_statuses.clear()
         pass  # Evita recarga inmediata; los cambios se aplican al enviar el formulario
 
@@ -3562,6 +5183,7 @@ with st.expander("🧮 Calculadora de descuento", expanded=False):
         )
 # --- FIN BLOQUE: Calculadora de descuento ---
 
+profile_checkpoint("avisos")
 id_vendedor_sesion_global = normalize_vendedor_id(st.session_state.get("id_vendedor", ""))
 if id_vendedor_sesion_global:
     pendientes_devoluciones_home = obtener_devoluciones_autorizadas_sin_folio(id_vendedor_sesion_global)
@@ -3637,6 +5259,7 @@ def coincide_nombre_cliente_busqueda(nombre: object, keyword: object) -> bool:
             return False
     return True
 
+@depende_de_hojas(CACHE_ORIGEN_S3)
 @st.cache_data(ttl=300)
 def obtener_prefijo_s3(pedido_id):
     posibles_prefijos = [
@@ -3652,6 +5275,7 @@ def obtener_prefijo_s3(pedido_id):
             continue
     return None
 
+@depende_de_hojas(CACHE_ORIGEN_S3)
 @st.cache_data(ttl=300)
 def obtener_archivos_pdf_validos(prefix):
     try:
@@ -3662,6 +5286,7 @@ def obtener_archivos_pdf_validos(prefix):
         st.error(f"❌ Error al listar archivos en S3 para prefijo {prefix}: {e}")
         return []
 
+@depende_de_hojas(CACHE_ORIGEN_S3)
 @st.cache_data(ttl=300)
 def obtener_todos_los_archivos(prefix):
     try:
@@ -3674,8 +5299,10 @@ def obtener_todos_los_archivos(prefix):
 def extraer_texto_pdf(s3_key):
     try:
         response = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=s3_key)
-        with pdfplumber.open(BytesIO(response["Body"].read())) as pdf:
-            return "\n".join(page.extract_text() or "" for page in pdf.pages)
+        pdf_bytes = response["Body"].read()
+        with trace_span("pdfplumber", "extract_text", bytes_out=len(pdf_bytes)):
+            with pdfplumber.open(BytesIO(pdf_bytes)) as pdf:
+                return "\n".join(page.extract_text() or "" for page in pdf.pages)
     except Exception as e:
         return f"[ERROR AL LEER PDF]: {e}"
 
@@ -4052,6 +5679,7 @@ def render_caso_especial(row, show_material: bool = True):
     st.markdown("---")
 
 # --- Initialize Gspread Client and S3 Client ---
+profile_checkpoint("pestañas")
 s3_client = get_s3_client()  # Initialize S3 client
 
 # Removed the old try-except block for client initialization
@@ -4226,6 +5854,7 @@ if (
 
 # --- TAB 1: REGISTER NEW ORDER ---
 with tab1:
+    profile_checkpoint("tab1")
     restore_tab1_form_state_for_retry()
     pending_cache_key = get_pending_submission_key()
     if not st.session_state.get("tab1_draft_recovered_once"):
@@ -6423,22 +8052,16 @@ with tab1:
                         )
                         rerun_with_pedido_loading()
 
-                    headers = worksheet.row_values(1)
                     required_headers = ["Direccion_Guia_Retorno", "Direccion_Envio", "Estatus_OrigenF"]
-                    missing_headers = [col for col in required_headers if col not in headers]
-                    if missing_headers:
-                        try:
-                            new_headers = headers + missing_headers
-                            worksheet.update('A1', [new_headers])
-                            get_sheet_headers.clear()
-                            headers = worksheet.row_values(1)
-                        except Exception as header_error:
-                            set_pedido_submission_status(
-                                "error",
-                                "❌ Falla al subir el pedido.",
-                                f"No se pudieron preparar las columnas de direcciones: {header_error}",
-                            )
-                            rerun_with_pedido_loading()
+                    try:
+                        headers = ensure_sheet_columns(worksheet, "casos_especiales", required_headers)
+                    except Exception as header_error:
+                        set_pedido_submission_status(
+                            "error",
+                            "❌ Falla al subir el pedido.",
+                            f"No se pudieron preparar las columnas de direcciones: {header_error}",
+                        )
+                        rerun_with_pedido_loading()
                 else:
                     worksheet = (
                         get_worksheet_historico()
@@ -6455,7 +8078,6 @@ with tab1:
                             f"No fue posible acceder a la hoja de pedidos ({destino_hoja}).",
                         )
                         rerun_with_pedido_loading()
-                    headers = worksheet.row_values(1)
                     required_headers = [
                         "Tipo_Venta",
                         "Condicion_Venta_Terceros",
@@ -6467,21 +8089,15 @@ with tab1:
                     ]
                     if tipo_envio == "🚚 Pedido Foráneo":
                         required_headers.append("Direccion_Guia_Retorno")
-                    if required_headers:
-                        missing_headers = [col for col in required_headers if col not in headers]
-                        if missing_headers:
-                            try:
-                                new_headers = headers + missing_headers
-                                worksheet.update('A1', [new_headers])
-                                get_sheet_headers.clear()
-                                headers = worksheet.row_values(1)
-                            except Exception as header_error:
-                                set_pedido_submission_status(
-                                    "error",
-                                    "❌ Falla al subir el pedido.",
-                                    f"No se pudieron preparar las columnas de direcciones: {header_error}",
-                                )
-                                rerun_with_pedido_loading()
+                    try:
+                        headers = ensure_sheet_columns(worksheet, worksheet.title, required_headers)
+                    except Exception as header_error:
+                        set_pedido_submission_status(
+                            "error",
+                            "❌ Falla al subir el pedido.",
+                            f"No se pudieron preparar las columnas de direcciones: {header_error}",
+                        )
+                        rerun_with_pedido_loading()
 
                 if not headers:
                     set_pedido_submission_status(
@@ -6501,7 +8117,7 @@ with tab1:
                         "warning",
                         "⚠️ Cuota de Google Sheets alcanzada. Reintentando...",
                     )
-                    st.cache_resource.clear()
+                    # Cuota agotada no es un cliente roto: se conserva la conexión y solo se espera.
                     time.sleep(6)
                     rerun_with_pedido_loading()
                 else:
@@ -6900,6 +8516,7 @@ def es_pedido_cdmx_modificable(row: pd.Series) -> bool:
     return False
 
 
+@depende_de_hojas("data_pedidos", "datos_pedidos")
 @st.cache_data(ttl=300)
 def cargar_pedidos_combinados(solo_cdmx: bool = False, solo_historico: bool = False):
     """
@@ -6954,18 +8571,21 @@ def cargar_pedidos_combinados(solo_cdmx: bool = False, solo_historico: bool = Fa
     df_datos['Seguimiento'] = df_datos['Seguimiento'].fillna("")
 
     if solo_cdmx and not solo_historico:
-        df_datos = df_datos[df_datos.apply(es_pedido_cdmx_modificable, axis=1)].copy()
+        df_datos = df_datos[es_pedido_cdmx_modificable_mask(df_datos)].copy()
 
     for c in ['Tipo_Envio','Vendedor_Registro','Estado','Folio_Factura','Folio_Factura_Refacturada','id_vendedor_Mod']:
         if c in df_datos.columns:
             df_datos[c] = df_datos[c].astype(str)
 
     df_datos["Fuente"] = hoja_pedidos_modificables
+    # 🔽 Filtro combinado por envío (usa Turno si es Local), una vez por snapshot
+    df_datos["Filtro_Envio_Combinado"] = filtro_envio_combinado(df_datos)
     return df_datos.copy()
 
 # --- TAB VENTAS Y REPORTES (vista CDMX de usuarios duales) ---
 if tab_ventas_reportes is not None:
     with tab_ventas_reportes:
+        profile_checkpoint("ventas_reportes")
         if TAB_INDEX_REPORTES is not None and default_tab == TAB_INDEX_REPORTES:
             st.session_state["current_tab_index"] = TAB_INDEX_REPORTES
 
@@ -6981,24 +8601,17 @@ if tab_ventas_reportes is not None:
             st.info("No hay pedidos para mostrar.")
         else:
 
-            columnas_reporte = [
-                "Folio_Factura",
-                "Cliente",
-                "Monto_Comprobante",
-                "Comprobante_Confirmado",
-                "Forma_Pago_Comprobante",
-                "Tipo_Envio",
-                "Vendedor_Registro",
-                "Hora_Registro",
-            ]
+            columnas_reporte = list(VENTAS_REPORTE_COLUMNAS)
             for col in columnas_reporte:
                 if col not in df_ventas.columns:
                     df_ventas[col] = ""
 
             df_ventas_base = df_ventas.copy()
+            # Totales pre-sumados por día/vendedor/forma de pago/envío; solo suma pedidos nuevos.
+            agregado_ventas, version_ventas = actualizar_agregado_ventas(df_ventas)
 
             if "Hora_Registro" in df_ventas.columns:
-                fecha_hora_registro = pd.to_datetime(df_ventas["Hora_Registro"], errors="coerce")
+                fecha_hora_registro = df_ventas[VENTAS_FECHA_COL]
                 df_ventas["fecha_hora_registro"] = fecha_hora_registro
                 df_ventas["mes_registro"] = fecha_hora_registro.dt.to_period("M").astype("string")
 
@@ -7025,178 +8638,196 @@ if tab_ventas_reportes is not None:
             st.dataframe(
                 df_ventas[columnas_reporte].reset_index(drop=True),
                 use_container_width=True,
-                hide_index=True,
-            )
-            st.caption(f"Total de pedidos encontrados: {len(df_ventas)}")
-
-            ventas_excel_buffer = BytesIO()
-            with pd.ExcelWriter(ventas_excel_buffer, engine="openpyxl") as writer:
-                columnas_excel_map = {
-                    "Folio_Factura": "N de Factura",
-                    "Cliente": "Nombre",
-                    "Monto_Comprobante": "Monto",
-                    "Forma_Pago_Comprobante": "Metodo de pago",
-                    "Vendedor_Registro": "Vendedor",
-                    "Hora_Registro": "Fecha",
-                    "Comprobante_Confirmado": "Abonada",
-                }
-                columnas_excel_orden = [
-                    "Folio_Factura",
-                    "Cliente",
-                    "Monto_Comprobante",
-                    "Forma_Pago_Comprobante",
-                    "Vendedor_Registro",
-                    "Hora_Registro",
-                    "Comprobante_Confirmado",
-                ]
+                hide_index=True,
+            )
+            st.caption(f"Total de pedidos encontrados: {len(df_ventas)}")
 
-                def _df_excel_desde_base(df_base: pd.DataFrame) -> pd.DataFrame:
-                    return df_base[columnas_excel_orden].rename(columns=columnas_excel_map)
+            def _build_ventas_excel() -> bytes:
+                ventas_excel_buffer = BytesIO()
+                with pd.ExcelWriter(ventas_excel_buffer, engine="openpyxl") as writer:
+                    columnas_excel_map = {
+                        "Folio_Factura": "N de Factura",
+                        "Cliente": "Nombre",
+                        "Monto_Comprobante": "Monto",
+                        "Forma_Pago_Comprobante": "Metodo de pago",
+                        "Vendedor_Registro": "Vendedor",
+                        "Hora_Registro": "Fecha",
+                        "Comprobante_Confirmado": "Abonada",
+                    }
+                    columnas_excel_orden = [
+                        "Folio_Factura",
+                        "Cliente",
+                        "Monto_Comprobante",
+                        "Forma_Pago_Comprobante",
+                        "Vendedor_Registro",
+                        "Hora_Registro",
+                        "Comprobante_Confirmado",
+                    ]
 
-                df_ventas_excel = _df_excel_desde_base(df_ventas)
-                main_sheet_name = "Ventas Totales"
-                if filtro_mes != "Todos":
-                    try:
-                        anio_sheet, mes_sheet = filtro_mes.split("-")
-                        main_sheet_name = f"Ventas {mes_sheet}/{anio_sheet}"
-                    except (ValueError, AttributeError):
-                        main_sheet_name = "Ventas Totales"
+                    def _df_excel_desde_base(df_base: pd.DataFrame) -> pd.DataFrame:
+                        return df_base[columnas_excel_orden].rename(columns=columnas_excel_map)
 
-                # Excel no permite "/" en nombres de hoja; se usa "-" como equivalente visual.
-                main_sheet_name = main_sheet_name.replace("/", "-")
+                    df_ventas_excel = _df_excel_desde_base(df_ventas)
+                    main_sheet_name = "Ventas Totales"
+                    if filtro_mes != "Todos":
+                        try:
+                            anio_sheet, mes_sheet = filtro_mes.split("-")
+                            main_sheet_name = f"Ventas {mes_sheet}/{anio_sheet}"
+                        except (ValueError, AttributeError):
+                            main_sheet_name = "Ventas Totales"
 
-                df_ventas_excel.to_excel(writer, index=False, sheet_name=main_sheet_name)
-                ws = writer.sheets[main_sheet_name]
+                    # Excel no permite "/" en nombres de hoja; se usa "-" como equivalente visual.
+                    main_sheet_name = main_sheet_name.replace("/", "-")
 
-                def _monto_columna(serie: pd.Series) -> pd.Series:
-                    return pd.to_numeric(serie.astype(str).str.replace(",", "", regex=False), errors="coerce").fillna(0.0)
+                    df_ventas_excel.to_excel(writer, index=False, sheet_name=main_sheet_name)
+                    ws = writer.sheets[main_sheet_name]
 
-                def _col_texto(df_base: pd.DataFrame, col: str) -> pd.Series:
-                    if col not in df_base.columns:
-                        return pd.Series("", index=df_base.index, dtype="object")
-                    return df_base[col].astype(str).fillna("")
+                    def _norm_texto(valor: object) -> str:
+                        return normalizar(str(valor)).strip().lower()
 
-                def _norm_texto(valor: object) -> str:
-                    return normalizar(str(valor)).strip().lower()
+                    # Los montos salen del agregado diario; las filas solo se recorren para listar.
+                    agregado_mes = filtrar_agregado_ventas(agregado_ventas, filtro_mes)
+                    montos = agregado_mes["monto"]
+                    normas_agregado = {
+                        col: _normalizar_por_valor(agregado_mes[col]) for col in VENTAS_AGREGADO_DIMENSIONES
+                    }
+                    tipo_envio_norm = normas_agregado["Tipo_Envio"]
+                    vendedor_norm = normas_agregado["Vendedor_Registro"]
 
-                montos = _monto_columna(df_ventas["Monto_Comprobante"])
-                tipo_envio_norm = _col_texto(df_ventas, "Tipo_Envio").apply(_norm_texto)
-                forma_pago_norm = _col_texto(df_ventas, "Forma_Pago_Comprobante").apply(_norm_texto)
-                vendedor_col = _col_texto(df_ventas, "Vendedor_Registro")
-                vendedor_norm = vendedor_col.apply(_norm_texto)
+                    resumen_filas = [
+                        ("Venta total CDMX", float(montos.sum())),
+                        ("Venta total regulares", ""),
+                        (
+                            "Ventas Cursos CDMX",
+                            float(montos[tipo_envio_norm.eq(_norm_texto("🎓 Cursos y Eventos"))].sum()),
+                        ),
+                    ]
 
-                resumen_filas = [
-                    ("Venta total CDMX", float(montos.sum())),
-                    ("Venta total regulares", ""),
-                    (
-                        "Ventas Cursos CDMX",
-                        float(montos[tipo_envio_norm.eq(_norm_texto("🎓 Cursos y Eventos"))].sum()),
-                    ),
-                ]
+                    vendedores_en_lista = (
+                        agregado_mes["Vendedor_Registro"][vendedor_norm.ne("")]
+                        .drop_duplicates()
+                        .sort_values(key=lambda s: s.str.lower())
+                        .tolist()
+                    )
+                    montos_por_vendedor = montos.groupby(vendedor_norm).sum()
+                    for vendedor in vendedores_en_lista:
+                        monto_vendedor = float(montos_por_vendedor.get(_norm_texto(vendedor), 0.0))
+                        resumen_filas.append((f"Ventas {vendedor}", monto_vendedor))
+
+                    mapa_forma_pago = [
+                        ("Pagos Transferencia", "Transferencia"),
+                        ("Pagos TC", "Tarjeta de Crédito"),
+                        ("Pagos TD", "Tarjeta de Débito"),
+                        ("Deposito Efectivo", "Depósito en Efectivo"),
+                        ("Efectivo", "Efectivo"),
+                        ("Link de Pago", "Link de Pago"),
+                    ]
+                    for etiqueta, valor_forma_pago in mapa_forma_pago:
+                        monto_forma_pago = float(
+                            montos[normas_agregado["Forma_Pago_Comprobante"].eq(_norm_texto(valor_forma_pago))].sum()
+                        )
+                        resumen_filas.append((etiqueta, monto_forma_pago))
+
+                    fila_inicio_resumen = len(df_ventas) + 4  # encabezado + datos + 2 filas vacías
+                    col_inicio_resumen = 2  # mover una columna a la izquierda (B-C)
+                    color_header = PatternFill(fill_type="solid", fgColor="FFFFFF")
+                    color_bloque_naranja = PatternFill(fill_type="solid", fgColor="EBC3A5")
+                    color_bloque_verde = PatternFill(fill_type="solid", fgColor="A9D08E")
+                    color_bloque_azul = PatternFill(fill_type="solid", fgColor="A5B5D4")
+                    font_negrita = Font(bold=True)
+                    borde_verde = Border(
+                        left=Side(style="thin", color="2E7D32"),
+                        right=Side(style="thin", color="2E7D32"),
+                        top=Side(style="thin", color="2E7D32"),
+                        bottom=Side(style="thin", color="2E7D32"),
+                    )
 
-                vendedores_en_lista = (
-                    vendedor_col[vendedor_norm.ne("")]
-                    .drop_duplicates()
-                    .sort_values(key=lambda s: s.str.lower())
-                    .tolist()
-                )
-                for vendedor in vendedores_en_lista:
-                    monto_vendedor = float(montos[vendedor_norm.eq(_norm_texto(vendedor))].sum())
-                    resumen_filas.append((f"Ventas {vendedor}", monto_vendedor))
-
-                mapa_forma_pago = [
-                    ("Pagos Transferencia", "Transferencia"),
-                    ("Pagos TC", "Tarjeta de Crédito"),
-                    ("Pagos TD", "Tarjeta de Débito"),
-                    ("Deposito Efectivo", "Depósito en Efectivo"),
-                    ("Efectivo", "Efectivo"),
-                    ("Link de Pago", "Link de Pago"),
-                ]
-                for etiqueta, valor_forma_pago in mapa_forma_pago:
-                    monto_forma_pago = float(montos[forma_pago_norm.eq(_norm_texto(valor_forma_pago))].sum())
-                    resumen_filas.append((etiqueta, monto_forma_pago))
-
-                fila_inicio_resumen = len(df_ventas) + 4  # encabezado + datos + 2 filas vacías
-                col_inicio_resumen = 2  # mover una columna a la izquierda (B-C)
-                color_header = PatternFill(fill_type="solid", fgColor="FFFFFF")
-                color_bloque_naranja = PatternFill(fill_type="solid", fgColor="EBC3A5")
-                color_bloque_verde = PatternFill(fill_type="solid", fgColor="A9D08E")
-                color_bloque_azul = PatternFill(fill_type="solid", fgColor="A5B5D4")
-                font_negrita = Font(bold=True)
-                borde_verde = Border(
-                    left=Side(style="thin", color="2E7D32"),
-                    right=Side(style="thin", color="2E7D32"),
-                    top=Side(style="thin", color="2E7D32"),
-                    bottom=Side(style="thin", color="2E7D32"),
-                )
+                    # Formato encabezados de la tabla principal (similar a referencia)
+                    color_header_tabla = PatternFill(fill_type="solid", fgColor="8EA9DB")
+
+                    def _aplicar_formato_encabezado(ws_obj, total_columnas: int) -> None:
+                        for col_idx in range(1, total_columnas + 1):
+                            celda_header = ws_obj.cell(row=1, column=col_idx)
+                            celda_header.fill = color_header_tabla
+                            celda_header.font = font_negrita
+                            celda_header.border = borde_verde
+
+                    _aplicar_formato_encabezado(ws, len(df_ventas_excel.columns))
+
+                    ws.cell(row=fila_inicio_resumen, column=col_inicio_resumen, value="Resumen")
+                    ws.cell(row=fila_inicio_resumen, column=col_inicio_resumen).fill = color_header
+                    ws.cell(row=fila_inicio_resumen, column=col_inicio_resumen).font = font_negrita
+                    ws.cell(row=fila_inicio_resumen, column=col_inicio_resumen + 1, value="Monto")
+                    ws.cell(row=fila_inicio_resumen, column=col_inicio_resumen + 1).fill = color_header
+                    ws.cell(row=fila_inicio_resumen, column=col_inicio_resumen + 1).font = font_negrita
+
+                    for i, (etiqueta, monto) in enumerate(resumen_filas, start=1):
+                        celda_label = ws.cell(row=fila_inicio_resumen + i, column=col_inicio_resumen, value=etiqueta)
+                        if i <= 3:
+                            celda_label.fill = color_bloque_naranja
+                        elif i <= 5:
+                            celda_label.fill = color_bloque_verde
+                        else:
+                            celda_label.fill = color_bloque_azul
+                        celda_label.font = font_negrita
+                        celda_monto = ws.cell(row=fila_inicio_resumen + i, column=col_inicio_resumen + 1, value=monto)
+                        celda_monto.font = font_negrita
+                        if monto != "":
+                            celda_monto.number_format = '"$"#,##0.00'
+
+                    def _forma_pago_es(valor: str):
+                        objetivo = _norm_texto(valor)
+                        return "Forma_Pago_Comprobante", lambda serie: serie.eq(objetivo)
+
+                    secciones_hojas = [
+                        ("Transferencia", *_forma_pago_es("Transferencia")),
+                        ("TC", *_forma_pago_es("Tarjeta de Crédito")),
+                        ("TD", *_forma_pago_es("Tarjeta de Débito")),
+                        ("Efectivo", *_forma_pago_es("Efectivo")),
+                        ("Link", *_forma_pago_es("Link de Pago")),
+                        ("Deposito", *_forma_pago_es("Depósito en Efectivo")),
+                        ("Juan", "Vendedor_Registro", lambda serie: serie.str.startswith(_norm_texto("JUAN"))),
+                        (
+                            "Cursos",
+                            "Tipo_Envio",
+                            lambda serie: serie.str.contains(_norm_texto("Cursos y Eventos"), na=False),
+                        ),
+                    ]
+                    normas_filas = {
+                        col: _normalizar_por_valor(_ventas_texto(df_ventas, col)) for col in VENTAS_AGREGADO_DIMENSIONES
+                    }
 
-                # Formato encabezados de la tabla principal (similar a referencia)
-                color_header_tabla = PatternFill(fill_type="solid", fgColor="8EA9DB")
-
-                def _aplicar_formato_encabezado(ws_obj, total_columnas: int) -> None:
-                    for col_idx in range(1, total_columnas + 1):
-                        celda_header = ws_obj.cell(row=1, column=col_idx)
-                        celda_header.fill = color_header_tabla
-                        celda_header.font = font_negrita
-                        celda_header.border = borde_verde
-
-                _aplicar_formato_encabezado(ws, len(df_ventas_excel.columns))
-
-                ws.cell(row=fila_inicio_resumen, column=col_inicio_resumen, value="Resumen")
-                ws.cell(row=fila_inicio_resumen, column=col_inicio_resumen).fill = color_header
-                ws.cell(row=fila_inicio_resumen, column=col_inicio_resumen).font = font_negrita
-                ws.cell(row=fila_inicio_resumen, column=col_inicio_resumen + 1, value="Monto")
-                ws.cell(row=fila_inicio_resumen, column=col_inicio_resumen + 1).fill = color_header
-                ws.cell(row=fila_inicio_resumen, column=col_inicio_resumen + 1).font = font_negrita
-
-                for i, (etiqueta, monto) in enumerate(resumen_filas, start=1):
-                    celda_label = ws.cell(row=fila_inicio_resumen + i, column=col_inicio_resumen, value=etiqueta)
-                    if i <= 3:
-                        celda_label.fill = color_bloque_naranja
-                    elif i <= 5:
-                        celda_label.fill = color_bloque_verde
-                    else:
-                        celda_label.fill = color_bloque_azul
-                    celda_label.font = font_negrita
-                    celda_monto = ws.cell(row=fila_inicio_resumen + i, column=col_inicio_resumen + 1, value=monto)
-                    celda_monto.font = font_negrita
-                    if monto != "":
-                        celda_monto.number_format = '"$"#,##0.00'
-
-                secciones_hojas = [
-                    ("Transferencia", forma_pago_norm.eq(_norm_texto("Transferencia"))),
-                    ("TC", forma_pago_norm.eq(_norm_texto("Tarjeta de Crédito"))),
-                    ("TD", forma_pago_norm.eq(_norm_texto("Tarjeta de Débito"))),
-                    ("Efectivo", forma_pago_norm.eq(_norm_texto("Efectivo"))),
-                    ("Link", forma_pago_norm.eq(_norm_texto("Link de Pago"))),
-                    ("Deposito", forma_pago_norm.eq(_norm_texto("Depósito en Efectivo"))),
-                    ("Juan", vendedor_norm.str.startswith(_norm_texto("JUAN"))),
-                    ("Cursos", tipo_envio_norm.str.contains(_norm_texto("Cursos y Eventos"), na=False)),
-                ]
+                    for nombre_hoja, columna_seccion, condicion in secciones_hojas:
+                        df_ventas_seccion = df_ventas[condicion(normas_filas[columna_seccion])].copy()
+                        if df_ventas_seccion.empty:
+                            continue
 
-                for nombre_hoja, mascara in secciones_hojas:
-                    df_ventas_seccion = df_ventas[mascara].copy()
-                    if df_ventas_seccion.empty:
-                        continue
+                        df_seccion = _df_excel_desde_base(df_ventas_seccion)
+                        df_seccion.to_excel(writer, index=False, sheet_name=nombre_hoja)
 
-                    df_seccion = _df_excel_desde_base(df_ventas_seccion)
-                    df_seccion.to_excel(writer, index=False, sheet_name=nombre_hoja)
+                        ws_seccion = writer.sheets[nombre_hoja]
+                        _aplicar_formato_encabezado(ws_seccion, len(df_seccion.columns))
 
-                    ws_seccion = writer.sheets[nombre_hoja]
-                    _aplicar_formato_encabezado(ws_seccion, len(df_seccion.columns))
+                        total_vendido = float(montos[condicion(normas_agregado[columna_seccion])].sum())
+                        fila_total = len(df_seccion) + 2
+                        col_monto = df_seccion.columns.get_loc("Monto") + 1
+                        col_label = max(1, col_monto - 1)
 
-                    total_vendido = float(_monto_columna(df_ventas_seccion["Monto_Comprobante"]).sum())
-                    fila_total = len(df_seccion) + 2
-                    col_monto = df_seccion.columns.get_loc("Monto") + 1
-                    col_label = max(1, col_monto - 1)
+                        celda_total_label = ws_seccion.cell(row=fila_total, column=col_label, value="TOTAL VENDIDO")
+                        celda_total_label.font = font_negrita
+                        celda_total_label.fill = color_bloque_verde
 
-                    celda_total_label = ws_seccion.cell(row=fila_total, column=col_label, value="TOTAL VENDIDO")
-                    celda_total_label.font = font_negrita
-                    celda_total_label.fill = color_bloque_verde
+                        celda_total_monto = ws_seccion.cell(row=fila_total, column=col_monto, value=total_vendido)
+                        celda_total_monto.font = font_negrita
+                        celda_total_monto.number_format = '"$"#,##0.00'
+                return ventas_excel_buffer.getvalue()
 
-                    celda_total_monto = ws_seccion.cell(row=fila_total, column=col_monto, value=total_vendido)
-                    celda_total_monto.font = font_negrita
-                    celda_total_monto.number_format = '"$"#,##0.00'
+            ventas_excel_bytes = get_or_build_export(
+                "ventas_reportes",
+                version_ventas,
+                {"mes": filtro_mes},
+                _build_ventas_excel,
+            )
 
             month_names_es = {
                 1: "Enero", 2: "Febrero", 3: "Marzo", 4: "Abril", 5: "Mayo", 6: "Junio",
@@ -7214,9 +8845,9 @@ if tab_ventas_reportes is not None:
 
             st.download_button(
                 label="📥 Descargar ventas (Excel)",
-                data=ventas_excel_buffer.getvalue(),
+                data=ventas_excel_bytes,
                 file_name=nombre_archivo,
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                mime=XLSX_MIME,
                 key="tab_reportes_descargar_ventas_excel",
             )
 
@@ -7237,13 +8868,7 @@ if tab_ventas_reportes is not None:
                 if col not in df_ventas_base.columns:
                     df_ventas_base[col] = ""
 
-            forma_pago_normalizada = (
-                df_ventas_base["Forma_Pago_Comprobante"]
-                .astype(str)
-                .apply(normalizar)
-                .str.strip()
-                .str.lower()
-            )
+            forma_pago_normalizada = _normalizar_por_valor(df_ventas_base["Forma_Pago_Comprobante"].astype(str))
             df_reporte_diario = df_ventas_base[
                 forma_pago_normalizada.eq(normalizar("Depósito en Efectivo").lower())
             ].copy()
@@ -7319,6 +8944,7 @@ if reset_inputs_tab2_flag:
         st.session_state.pop(key, None)
 
 with tab2:
+    profile_checkpoint("tab2")
     tab2_is_active = default_tab == TAB_INDEX_TAB2
     if tab2_is_active:
         st.session_state["current_tab_index"] = TAB_INDEX_TAB2
@@ -7365,6 +8991,8 @@ with tab2:
             id_vendedor_tabs in TAB1_CDMX_ONLY_VIEW_IDS
             or (id_vendedor_tabs in TAB1_DUAL_VIEW_IDS and tab1_view_mode_tabs == "cdmx")
         )
+        # Sin réplica: la pestaña escribe por Sheet_Row_Number sobre lo que lee, y los cambios
+        # hechos desde la app de administración no marcan la réplica como desactualizada.
         df_pedidos = cargar_pedidos_combinados(tab2_cdmx_view_active)
     except Exception as e:
         message_placeholder_tab2.error(f"❌ Error al cargar pedidos para modificación: {e}")
@@ -7390,12 +9018,6 @@ with tab2:
             fallback_v = df_pedidos['Vendedor'].astype(str).str.strip()
             df_pedidos.loc[df_pedidos['Vendedor_Registro'] == "", 'Vendedor_Registro'] = fallback_v
 
-        # 🔽 Filtro combinado por envío (usa Turno si es Local)
-        df_pedidos['Filtro_Envio_Combinado'] = df_pedidos.apply(
-            lambda row: row['Turno'] if (str(row.get('Tipo_Envio',"")) == "📍 Pedido Local" and pd.notna(row.get('Turno')) and str(row.get('Turno')).strip()) else row.get('Tipo_Envio', ''),
-            axis=1
-        )
-
         # ----------------- Controles de filtro -----------------
         col1, col2 = st.columns(2)
 
@@ -7480,38 +9102,13 @@ with tab2:
                 filtered_orders = filtered_orders.sort_values(by='Fecha_Entrega', ascending=False).reset_index(drop=True)
 
             # 🏷️ Etiqueta de display (marca [CE] si es de casos_especiales)
-            def _s(x):
-                return "" if pd.isna(x) else str(x)
-
-            filtered_orders['display_label'] = filtered_orders.apply(
-                lambda row: (
-                    f"📄 {(_s(row['Folio_Factura']) or 'Sin Folio')}"
-                    f" - {_s(row['Cliente'])}"
-                    f" - {_s(row['Estado'])}"
-                    f" - {_s(row['Tipo_Envio'])}"
-                    f" {'[CE]' if row.get('Fuente','')=='casos_especiales' else ''}"
-                ),
-                axis=1
-            )
-
-            base_option_values = filtered_orders.apply(
-                lambda row: (
-                    f"{row.get('Fuente', SHEET_PEDIDOS_OPERATIVOS)}|"
-                    f"{_s(row.get('ID_Pedido', '')) or 'sin_id'}|"
-                    f"{parse_sheet_row_number(row.get('Sheet_Row_Number')) or 'sin_fila'}"
-                ),
-                axis=1
+            filtered_orders['display_label'] = etiqueta_pedido_series(filtered_orders, marcar_casos_especiales=True)
+            filtered_orders['option_value'] = opciones_pedido_series(
+                filtered_orders,
+                _columna_str(filtered_orders, 'Fuente', SHEET_PEDIDOS_OPERATIVOS),
+                _columna_texto(filtered_orders, 'ID_Pedido'),
             )
 
-            filtered_orders['option_value'] = base_option_values
-
-            duplicate_mask = filtered_orders['option_value'].duplicated(keep=False)
-            if duplicate_mask.any():
-                filtered_orders.loc[duplicate_mask, 'option_value'] = filtered_orders.loc[duplicate_mask].apply(
-                    lambda row: f"{base_option_values[row.name]}|{row.name}",
-                    axis=1
-                )
-
             option_label_map = dict(
                 zip(filtered_orders['option_value'], filtered_orders['display_label'])
             )
@@ -8293,15 +9890,12 @@ with tab2:
                                     hoja_objetivo = selected_source if selected_source in {SHEET_PEDIDOS_OPERATIVOS, SHEET_PEDIDOS_HISTORICOS} else "casos_especiales"
                                     worksheet = sh.worksheet(hoja_objetivo)
 
-                                    headers = worksheet.row_values(1)
+                                    headers = get_sheet_headers(hoja_objetivo, worksheet)
                                     if "ID_Pedido" not in headers:
                                         feedback_slot.empty()
                                         feedback_slot.error(f"❌ No se encontró la columna 'ID_Pedido' en la hoja {hoja_objetivo}.")
                                         st.stop()
-                                    if TAB2_MODIFICATION_TYPE_COLUMN not in headers:
-                                        headers = headers + [TAB2_MODIFICATION_TYPE_COLUMN]
-                                        worksheet.update("A1", [headers], value_input_option="RAW")
-                                        get_sheet_headers.clear()
+                                    headers = ensure_sheet_columns(worksheet, hoja_objetivo, [TAB2_MODIFICATION_TYPE_COLUMN])
 
                                     id_col_index = headers.index("ID_Pedido")
                                     selected_order_id_normalized = str(selected_order_id).strip()
@@ -8781,6 +10375,7 @@ with tab2:
 # --- TAB SCHAVA: MODIFY datos_pedidos ---
 if tab_schava_datos_pedidos is not None:
     with tab_schava_datos_pedidos:
+        profile_checkpoint("schava_datos_pedidos")
         tab_schava_is_active = default_tab == TAB_INDEX_SCHAVA_DATOS
         if tab_schava_is_active:
             st.session_state["current_tab_index"] = TAB_INDEX_SCHAVA_DATOS
@@ -8830,13 +10425,14 @@ if tab_schava_datos_pedidos is not None:
                 available_search_columns_schava = [
                     col for col in search_columns_schava if col in filtered_schava.columns
                 ]
-                search_blob_schava = (
-                    filtered_schava[available_search_columns_schava]
-                    .fillna("")
-                    .astype(str)
-                    .agg(" ".join, axis=1)
-                    .apply(lambda value: normalizar(value).lower())
-                )
+                columnas_blob_schava = [
+                    filtered_schava[col].fillna("").astype(str)
+                    for col in available_search_columns_schava
+                ]
+                search_blob_schava = columnas_blob_schava[0] if columnas_blob_schava else pd.Series("", index=filtered_schava.index)
+                for columna_blob in columnas_blob_schava[1:]:
+                    search_blob_schava = search_blob_schava + " " + columna_blob
+                search_blob_schava = search_blob_schava.map(lambda value: normalizar(value).lower())
                 filtered_schava = filtered_schava[
                     search_blob_schava.str.contains(re.escape(normalized_query_schava), na=False)
                 ]
@@ -8869,33 +10465,12 @@ if tab_schava_datos_pedidos is not None:
                         ascending=False,
                     ).reset_index(drop=True)
 
-                def _schava_s(value):
-                    return "" if pd.isna(value) else str(value)
-
-                filtered_schava["display_label"] = filtered_schava.apply(
-                    lambda row: (
-                        f"📄 {(_schava_s(row.get('Folio_Factura', '')) or 'Sin Folio')}"
-                        f" - {_schava_s(row.get('Cliente', ''))}"
-                        f" - {_schava_s(row.get('Estado', ''))}"
-                        f" - {_schava_s(row.get('Tipo_Envio', ''))}"
-                    ),
-                    axis=1,
-                )
-                base_option_values_schava = filtered_schava.apply(
-                    lambda row: (
-                        f"{SHEET_PEDIDOS_HISTORICOS}|"
-                        f"{_schava_s(row.get('ID_Pedido', '')) or 'sin_id'}|"
-                        f"{parse_sheet_row_number(row.get('Sheet_Row_Number')) or 'sin_fila'}"
-                    ),
-                    axis=1,
+                filtered_schava["display_label"] = etiqueta_pedido_series(filtered_schava)
+                filtered_schava["option_value"] = opciones_pedido_series(
+                    filtered_schava,
+                    SHEET_PEDIDOS_HISTORICOS,
+                    _columna_texto(filtered_schava, "ID_Pedido"),
                 )
-                filtered_schava["option_value"] = base_option_values_schava
-                duplicate_mask_schava = filtered_schava["option_value"].duplicated(keep=False)
-                if duplicate_mask_schava.any():
-                    filtered_schava.loc[duplicate_mask_schava, "option_value"] = filtered_schava.loc[duplicate_mask_schava].apply(
-                        lambda row: f"{base_option_values_schava[row.name]}|{row.name}",
-                        axis=1,
-                    )
 
                 option_label_map_schava = dict(zip(filtered_schava["option_value"], filtered_schava["display_label"]))
                 placeholder_schava = "__schava_select_order_placeholder__"
@@ -8965,11 +10540,9 @@ if tab_schava_datos_pedidos is not None:
                             client_schava = build_gspread_client()
                             sh_schava = client_schava.open_by_key(GOOGLE_SHEET_ID)
                             worksheet_schava = sh_schava.worksheet(SHEET_PEDIDOS_HISTORICOS)
-                            headers_schava = get_sheet_headers(SHEET_PEDIDOS_HISTORICOS)
-                            if TAB2_MODIFICATION_TYPE_COLUMN not in headers_schava:
-                                headers_schava = headers_schava + [TAB2_MODIFICATION_TYPE_COLUMN]
-                                worksheet_schava.update("A1", [headers_schava], value_input_option="RAW")
-                                get_sheet_headers.clear()
+                            headers_schava = ensure_sheet_columns(
+                                worksheet_schava, SHEET_PEDIDOS_HISTORICOS, [TAB2_MODIFICATION_TYPE_COLUMN]
+                            )
 
                             row_number_schava = parse_sheet_row_number(row_schava.get("Sheet_Row_Number"))
                             if row_number_schava is None:
@@ -9079,6 +10652,7 @@ if tab_schava_datos_pedidos is not None:
 
 # --- TAB 3: PENDING PROOF OF PAYMENT ---
 with tab3:
+    profile_checkpoint("tab3")
     tab3_is_active = default_tab == TAB_INDEX_TAB3
     if tab3_is_active:
         st.session_state["current_tab_index"] = TAB_INDEX_TAB3
@@ -9207,23 +10781,22 @@ with tab3:
                 pedidos_sin_comprobante['Fecha_Entrega'] = pd.to_datetime(pedidos_sin_comprobante['Fecha_Entrega'], errors='coerce')
                 pedidos_sin_comprobante = pedidos_sin_comprobante.sort_values(by='Fecha_Entrega', ascending=False).reset_index(drop=True)
 
-            pedidos_sin_comprobante['display_label'] = pedidos_sin_comprobante.apply(lambda row:
-                f"📄 {row.get('Folio_Factura', 'N/A') or row.get('ID_Pedido', 'N/A')} - {row.get('Cliente', 'N/A')} - {row.get('Estado', 'N/A')} [{row.get('Fuente', 'N/A')}]", axis=1)
-            base_option_values = pedidos_sin_comprobante.apply(
-                lambda row: (
-                    f"{str(row.get('Fuente', SHEET_PEDIDOS_HISTORICOS)).strip()}|"
-                    f"{str(row.get('ID_Pedido', '')).strip() or 'sin_id'}|"
-                    f"{parse_sheet_row_number(row.get('Sheet_Row_Number')) or 'sin_fila'}"
-                ),
-                axis=1,
-            )
-            pedidos_sin_comprobante['option_value'] = base_option_values
-            duplicate_mask = pedidos_sin_comprobante['option_value'].duplicated(keep=False)
-            if duplicate_mask.any():
-                pedidos_sin_comprobante.loc[duplicate_mask, 'option_value'] = pedidos_sin_comprobante.loc[duplicate_mask].apply(
-                    lambda row: f"{base_option_values[row.name]}|{row.name}",
-                    axis=1,
+            folio_comprobante = _columna_str(pedidos_sin_comprobante, 'Folio_Factura', 'N/A')
+            if 'Folio_Factura' in pedidos_sin_comprobante.columns:
+                folio_comprobante = folio_comprobante.where(pedidos_sin_comprobante['Folio_Factura'].notna(), "")
+            pedidos_sin_comprobante['display_label'] = (
+                "📄 " + folio_comprobante.where(
+                    folio_comprobante.ne(""), _columna_str(pedidos_sin_comprobante, 'ID_Pedido', 'N/A')
                 )
+                + " - " + _columna_str(pedidos_sin_comprobante, 'Cliente', 'N/A')
+                + " - " + _columna_str(pedidos_sin_comprobante, 'Estado', 'N/A')
+                + " [" + _columna_str(pedidos_sin_comprobante, 'Fuente', 'N/A') + "]"
+            )
+            pedidos_sin_comprobante['option_value'] = opciones_pedido_series(
+                pedidos_sin_comprobante,
+                _columna_str(pedidos_sin_comprobante, 'Fuente', SHEET_PEDIDOS_HISTORICOS).str.strip(),
+                _columna_str(pedidos_sin_comprobante, 'ID_Pedido').str.strip(),
+            )
 
             option_label_map = dict(zip(pedidos_sin_comprobante['option_value'], pedidos_sin_comprobante['display_label']))
 
@@ -9339,7 +10912,7 @@ with tab3:
                                     st.error("❌ No se encontró la hoja de origen del pedido seleccionado.")
                                     st.stop()
                                 if not headers_source:
-                                    headers_source = worksheet_obj.row_values(1)
+                                    headers_source = get_sheet_headers(worksheet_obj.title, worksheet_obj)
                                 if "ID_Pedido" not in headers_source:
                                     st.error("❌ La hoja no contiene la columna 'ID_Pedido'.")
                                     st.stop()
@@ -9459,7 +11032,7 @@ with tab3:
                             st.error("❌ No se encontró la hoja de origen del pedido seleccionado.")
                             st.stop()
                         if not headers_source:
-                            headers_source = worksheet_obj.row_values(1)
+                            headers_source = get_sheet_headers(worksheet_obj.title, worksheet_obj)
                         if 'ID_Pedido' not in headers_source:
                             st.error("❌ La hoja no contiene la columna 'ID_Pedido'.")
                             st.stop()
@@ -9560,7 +11133,7 @@ with tab3:
                                 st.error("❌ No se encontró la hoja de origen del pedido seleccionado.")
                                 st.stop()
                             if not headers_source:
-                                headers_source = worksheet_obj.row_values(1)
+                                headers_source = get_sheet_headers(worksheet_obj.title, worksheet_obj)
                             required_cols = ['ID_Pedido', 'Estado_Pago', 'Comentario']
                             missing_cols = [col for col in required_cols if col not in headers_source]
                             if missing_cols:
@@ -9643,99 +11216,19 @@ def partir_urls(value):
     return out
 
 
-@st.cache_data(ttl=90)
 def get_tab4_casos_especiales_dataset(
     refresh_token: float | None = None,
 ) -> tuple[pd.DataFrame, list[str]]:
-    """Carga casos especiales con número de fila para la pestaña 4."""
-    _ = refresh_token
-
-    ws = get_worksheet_casos_especiales()
-    df, headers = load_sheet_records_with_row_numbers(ws)
-    if df.empty:
-        return pd.DataFrame(), headers
-
-    columnas_necesarias = [
-        "ID_Pedido","Cliente","Vendedor_Registro","Folio_Factura","Folio_Factura_Error",
-        "Hora_Registro","Tipo_Envio","Tipo_Caso","Estado","Estado_Caso","Turno",
-        "Refacturacion_Tipo","Refacturacion_Subtipo","Folio_Factura_Refacturada",
-        "Resultado_Esperado","Motivo_Detallado","Material_Devuelto","Monto_Devuelto","Motivo_NotaVenta",
-        "Area_Responsable","Nombre_Responsable","Numero_Cliente_RFC","Tipo_Envio_Original","Estatus_OrigenF",
-        "Direccion_Guia_Retorno","Direccion_Envio","Numero_Serie","Fecha_Compra",
-        "Fecha_Entrega","Fecha_Recepcion_Devolucion","Estado_Recepcion",
-        "Nota_Credito_URL","Documento_Adicional_URL","Comentarios_Admin_Devolucion",
-        "Modificacion_Surtido","Adjuntos_Surtido","Adjuntos","Hoja_Ruta_Mensajero",
-        "Hora_Proceso","Seguimiento","id_vendedor",
-    ]
-    for col in columnas_necesarias:
-        if col not in df.columns:
-            df[col] = ""
-
-    if "Fecha_Compra" not in df.columns and "FechaCompra" in df.columns:
-        df["Fecha_Compra"] = df["FechaCompra"]
-    elif "Fecha_Compra" in df.columns and "FechaCompra" in df.columns and df["Fecha_Compra"].eq("").all():
-        df["Fecha_Compra"] = df["Fecha_Compra"].where(df["Fecha_Compra"].astype(str).str.strip() != "", df["FechaCompra"])
-
+    """Casos especiales con número de fila para la pestaña 4 (snapshot compartido)."""
+    df, headers, _meta = load_casos_especiales_snapshot(refresh_token)
     return df, headers
 
 
-@st.cache_data(ttl=300)
-def cargar_casos_especiales():
-    """
-    Lee la hoja 'casos_especiales' usando tu helper get_worksheet_casos_especiales()
-    y garantiza todas las columnas que la UI usa.
-    """
-    ws = get_worksheet_casos_especiales()
-    data = ws.get_all_records()
-    df = pd.DataFrame(data)
-
-    columnas_necesarias = [
-        # Identificación y encabezado
-        "ID_Pedido","Cliente","Vendedor_Registro","Folio_Factura","Folio_Factura_Error",
-        "Hora_Registro","Tipo_Envio","Estado","Estado_Caso","Turno",
-        # Refacturación
-        "Refacturacion_Tipo","Refacturacion_Subtipo","Folio_Factura_Refacturada",
-        # Detalle del caso
-        "Resultado_Esperado","Motivo_Detallado","Material_Devuelto","Monto_Devuelto","Motivo_NotaVenta",
-        "Area_Responsable","Nombre_Responsable","Numero_Cliente_RFC","Tipo_Envio_Original","Estatus_OrigenF",
-        "Direccion_Guia_Retorno","Direccion_Envio",
-        # ⚙️ NUEVO: Garantías
-        "Numero_Serie","Fecha_Compra",  # (si tu hoja usa 'FechaCompra', abajo la normalizamos)
-        # Fechas/recepción
-        "Fecha_Entrega","Fecha_Recepcion_Devolucion","Estado_Recepcion",
-        # Documentos de cierre
-        "Nota_Credito_URL","Documento_Adicional_URL","Comentarios_Admin_Devolucion",
-        # Modificación de surtido
-        "Modificacion_Surtido","Adjuntos_Surtido",
-        # Adjuntos/guía
-        "Adjuntos","Hoja_Ruta_Mensajero",
-        # Otros
-        "Hora_Proceso",
-        # Seguimiento
-        "Seguimiento"
-    ]
-    for c in columnas_necesarias:
-        if c not in df.columns:
-            df[c] = ""
-
-    # Quitar casos cerrados
-    df["Seguimiento"] = df["Seguimiento"].fillna("")
-    df = df[~df["Seguimiento"].astype(str).str.lower().eq("cerrado")]
-
-    # Normaliza 'Fecha_Compra' si en la hoja existe como 'FechaCompra'
-    if "Fecha_Compra" not in df.columns and "FechaCompra" in df.columns:
-        df["Fecha_Compra"] = df["FechaCompra"]
-    elif "Fecha_Compra" in df.columns and "FechaCompra" in df.columns and df["Fecha_Compra"].eq("").all():
-        # Si ambas existen pero 'Fecha_Compra' viene vacía, usa 'FechaCompra'
-        df["Fecha_Compra"] = df["Fecha_Compra"].where(df["Fecha_Compra"].astype(str).str.strip() != "", df["FechaCompra"])
-
-    return df
-
-
 
 
 # --- TAB 4: CASOS ESPECIALES ---
 with tab4:
+    profile_checkpoint("tab4")
     tab4_is_active = default_tab == TAB_INDEX_TAB4
     if tab4_is_active:
         st.session_state["current_tab_index"] = TAB_INDEX_TAB4
@@ -9751,13 +11244,10 @@ with tab4:
                 "tab4_casos_refresh_token",
                 0.0,
             )
-            df_casos_ref, headers_casos_ref = get_tab4_casos_especiales_dataset(tab4_refresh_token)
-            df_casos = df_casos_ref.copy()
+            with profile_block("casos_especiales"):
+                df_casos_ref, headers_casos_ref = get_tab4_casos_especiales_dataset(tab4_refresh_token)
+                df_casos = get_casos_especiales_view("abiertos", tab4_refresh_token)
             ws_casos_ref = get_worksheet_casos_especiales()
-
-            if "Seguimiento" in df_casos.columns:
-                df_casos["Seguimiento"] = df_casos["Seguimiento"].fillna("")
-                df_casos = df_casos[~df_casos["Seguimiento"].astype(str).str.lower().eq("cerrado")]
         except Exception as e:
             st.error(f"❌ Error al cargar casos especiales: {e}")
             df_casos = pd.DataFrame()
@@ -9797,7 +11287,7 @@ with tab4:
             if df_casos_ref.empty or ws_casos_ref is None:
                 st.info("No hay devoluciones sin refacturar por mostrar.")
             else:
-                df_sin_refacturar = df_casos_ref[df_casos_ref.apply(is_devolucion_case_row, axis=1)].copy()
+                df_sin_refacturar = df_casos_ref[es_devolucion_mask(df_casos_ref)].copy()
                 df_sin_refacturar = df_sin_refacturar[
                     df_sin_refacturar["Seguimiento"].astype(str).str.strip().eq(seguimiento_autorizacion)
                     & df_sin_refacturar["Folio_Factura"].apply(is_empty_folio)
@@ -10000,10 +11490,8 @@ with tab4:
                                         st.session_state.pop(f"{row_key}_folio_input", None)
                                         st.session_state.pop(f"{row_key}_notas_devolucion", None)
                                         st.session_state.pop(f"{row_key}_direccion_guia_retorno", None)
-                                        cargar_casos_especiales.clear()
-                                        get_tab4_casos_especiales_dataset.clear()
+                                        clear_casos_especiales_cache()
                                         st.session_state["tab4_casos_refresh_token"] = time.time()
-                                        obtener_devoluciones_autorizadas_sin_folio.clear()
                                         pass  # Evita recarga inmediata; los cambios se aplican al enviar el formulario
                                     except Exception as e:
                                         st.error(f"❌ No se pudo guardar el Folio Nuevo: {e}")
@@ -10065,25 +11553,7 @@ with tab4:
                 filtered_casos = df_casos.copy()
 
                 if str(busqueda_casos or "").strip():
-                    keyword_cliente_casos = normalizar(str(busqueda_casos).strip())
-                    keyword_folio_casos = normalizar_folio(str(busqueda_casos).strip())
-
-                    def _coincide_caso_especial(row: pd.Series) -> bool:
-                        nombre = str(row.get("Cliente", "") or "").strip()
-                        folio = str(row.get("Folio_Factura", "") or "").strip()
-                        folio_error = str(row.get("Folio_Factura_Error", "") or "").strip()
-                        folio_norm = normalizar_folio(folio)
-                        folio_error_norm = normalizar_folio(folio_error)
-                        coincide_cliente = coincide_nombre_cliente_busqueda(nombre, keyword_cliente_casos)
-                        coincide_folio = bool(keyword_folio_casos) and (
-                            keyword_folio_casos in folio_norm
-                            or keyword_folio_casos in folio_error_norm
-                            or folio_norm in keyword_folio_casos
-                            or folio_error_norm in keyword_folio_casos
-                        )
-                        return bool(coincide_cliente or coincide_folio)
-
-                    filtered_casos = filtered_casos[filtered_casos.apply(_coincide_caso_especial, axis=1)]
+                    filtered_casos = filtered_casos[coincide_caso_especial_mask(filtered_casos, busqueda_casos)]
 
                 if (
                     selected_vendedor_casos != "Todos"
@@ -10123,8 +11593,10 @@ with tab4:
                     st.dataframe(filtered_casos[columnas_mostrar], use_container_width=True, hide_index=True)
 
                     filtered_casos = filtered_casos.copy()
-                    filtered_casos["display_label"] = filtered_casos.apply(
-                        lambda r: f"{r['Estado']} - {r['Cliente']} ({r['Tipo_Envio']})", axis=1
+                    filtered_casos["display_label"] = (
+                        filtered_casos["Estado"].astype(str)
+                        + " - " + filtered_casos["Cliente"].astype(str)
+                        + " (" + filtered_casos["Tipo_Envio"].astype(str) + ")"
                     )
                     selected_case = st.selectbox(
                         "📂 Selecciona un caso para ver detalles",
@@ -10338,10 +11810,8 @@ with tab4:
 
                                     if cell_updates:
                                         safe_batch_update(ws_casos_ref, cell_updates)
-                                    cargar_casos_especiales.clear()
-                                    get_tab4_casos_especiales_dataset.clear()
+                                    clear_casos_especiales_cache()
                                     st.session_state["tab4_casos_refresh_token"] = time.time()
-                                    obtener_devoluciones_autorizadas_sin_folio.clear()
                                     st.success("✅ Caso especial actualizado correctamente.")
                                     st.toast("✅ Caso especial actualizado", icon="📁")
                                 except Exception as e:
@@ -10353,142 +11823,8 @@ def fijar_tab5_activa():
     """Mantiene referencia de pestaña activa sin tocar query params en render."""
     st.session_state["current_tab_index"] = TAB_INDEX_TAB5
 
-@st.cache_data(ttl=60)
-def cargar_datos_guias_unificadas(refresh_token: float | None = None):
-    # ---------- A) hojas de pedidos (histórico + operativa) ----------
-    _ = refresh_token
-    def _normalizar_guias_pedidos(df_ped: pd.DataFrame, fuente: str) -> pd.DataFrame:
-        if df_ped.empty:
-            return pd.DataFrame()
-
-        for col in ["ID_Pedido","Cliente","Vendedor_Registro","Tipo_Envio","Estado",
-                    "Fecha_Entrega","Hora_Registro","Folio_Factura","id_vendedor","Completados_Limpiado",
-                    "Adjuntos_Guia", "Hoja_Ruta_Mensajero"]:
-            if col not in df_ped.columns:
-                df_ped[col] = ""
-
-        df_work = df_ped.copy()
-        guides_primary = df_work["Adjuntos_Guia"].astype(str).str.strip()
-        guides_fallback = df_work["Hoja_Ruta_Mensajero"].astype(str).str.strip()
-        df_work["Adjuntos_Guia_Consolidado"] = guides_primary.mask(guides_primary.eq(""), guides_fallback)
-
-        df_res = df_work[df_work["Adjuntos_Guia_Consolidado"].astype(str).str.strip() != ""].copy()
-        if df_res.empty:
-            return df_res
-
-        df_res["Adjuntos_Guia"] = df_res["Adjuntos_Guia_Consolidado"].astype(str)
-        df_res["Fuente"] = fuente
-        df_res["URLs_Guia"] = df_res["Adjuntos_Guia"].astype(str)
-        df_res["Ultima_Guia"] = df_res["URLs_Guia"].apply(
-            lambda s: s.split(",")[-1].strip() if isinstance(s, str) and s.strip() else ""
-        )
-        return df_res
-
-    # datos_pedidos (histórico)
-    try:
-        ws_ped_hist = get_worksheet_historico(refresh_token)
-        df_ped_hist = worksheet_to_dataframe_safe(ws_ped_hist)
-    except Exception:
-        df_ped_hist = pd.DataFrame()
-
-    # data_pedidos (operativa)
-    try:
-        ws_ped_op = get_worksheet_operativa(refresh_token)
-        df_ped_op = worksheet_to_dataframe_safe(ws_ped_op)
-    except Exception:
-        df_ped_op = pd.DataFrame()
-
-    df_a_hist = _normalizar_guias_pedidos(df_ped_hist, SHEET_PEDIDOS_HISTORICOS)
-    df_a_op = _normalizar_guias_pedidos(df_ped_op, SHEET_PEDIDOS_OPERATIVOS)
-
-    # ---------- B) casos_especiales ----------
-    try:
-        ws_casos = get_worksheet_casos_especiales()
-        df_casos = pd.DataFrame(ws_casos.get_all_records())
-    except Exception:
-        df_casos = pd.DataFrame()
-
-    if df_casos.empty:
-        df_b = pd.DataFrame(columns=[
-            "ID_Pedido","Cliente","Vendedor_Registro","Tipo_Envio","Estado",
-            "Fecha_Entrega","Hora_Registro","Folio_Factura","Adjuntos_Guia",
-            "URLs_Guia","Ultima_Guia","Fuente","id_vendedor","Completados_Limpiado"
-        ])
-    else:
-        for col in ["ID_Pedido","Cliente","Vendedor_Registro","Tipo_Envio","Estado",
-                    "Fecha_Entrega","Hora_Registro","Folio_Factura","Adjuntos_Guia","Hoja_Ruta_Mensajero","Tipo_Caso","id_vendedor","Completados_Limpiado"]:
-            if col not in df_casos.columns:
-                df_casos[col] = ""
-
-        df_casos_work = df_casos.copy()
-        mask_casos_vacio = df_casos_work["Hoja_Ruta_Mensajero"].astype(str).str.strip().eq("")
-        df_casos_work.loc[mask_casos_vacio, "Hoja_Ruta_Mensajero"] = df_casos_work.loc[mask_casos_vacio, "Adjuntos_Guia"].astype(str)
-
-        df_b = df_casos_work[df_casos_work["Hoja_Ruta_Mensajero"].astype(str).str.strip() != ""].copy()
-        if df_b.empty:
-            df_b = pd.DataFrame(columns=[
-                "ID_Pedido","Cliente","Vendedor_Registro","Tipo_Envio","Estado",
-                "Fecha_Entrega","Hora_Registro","Folio_Factura","Adjuntos_Guia",
-                "URLs_Guia","Ultima_Guia","Fuente","id_vendedor","Completados_Limpiado"
-            ])
-        else:
-            df_b["Adjuntos_Guia"] = df_b["Hoja_Ruta_Mensajero"].astype(str)
-            df_b["URLs_Guia"] = df_b["Adjuntos_Guia"]
-            df_b["Ultima_Guia"] = df_b["URLs_Guia"].apply(
-                lambda s: s.split(",")[-1].strip() if isinstance(s, str) and s.strip() else ""
-            )
-
-            def _infer_tipo_envio(row):
-                t_env = str(row.get("Tipo_Envio","")).strip()
-                if t_env:
-                    return t_env
-                t_caso = str(row.get("Tipo_Caso","")).lower()
-                if t_caso.startswith("devol"):
-                    return "🔁 Devolución"
-                if t_caso.startswith("garan"):
-                    return "🛠 Garantía"
-                return "Caso especial"
-            df_b["Tipo_Envio"] = df_b.apply(_infer_tipo_envio, axis=1)
-            df_b["Fuente"] = "casos_especiales"
-
-        for col in ["Adjuntos_Guia","URLs_Guia","Ultima_Guia","Fuente"]:
-            if col not in df_b.columns:
-                df_b[col] = ""
-
-    columnas_finales = ["ID_Pedido","Cliente","Vendedor_Registro","Tipo_Envio","Estado",
-                        "Fecha_Entrega","Hora_Registro","Folio_Factura",
-                        "Adjuntos_Guia","URLs_Guia","Ultima_Guia","Fuente","id_vendedor","Completados_Limpiado"]
-    df_a_hist = df_a_hist[columnas_finales] if not df_a_hist.empty else pd.DataFrame(columns=columnas_finales)
-    df_a_op = df_a_op[columnas_finales] if not df_a_op.empty else pd.DataFrame(columns=columnas_finales)
-    df_b = df_b[columnas_finales] if not df_b.empty else pd.DataFrame(columns=columnas_finales)
-
-    df = pd.concat([df_a_hist, df_a_op, df_b], ignore_index=True)
-
-    if not df.empty:
-        for col_fecha in ["Fecha_Entrega", "Hora_Registro"]:
-            # `format="mixed"` mejora la lectura de valores heterogéneos entre hojas.
-            try:
-                df[col_fecha] = pd.to_datetime(df[col_fecha], errors="coerce", format="mixed")
-            except (TypeError, ValueError):
-                df[col_fecha] = pd.to_datetime(df[col_fecha], errors="coerce")
-
-        df["Fecha_Filtro_Referencia"] = df["Hora_Registro"]
-        mask_ref_vacia = df["Fecha_Filtro_Referencia"].isna()
-        df.loc[mask_ref_vacia, "Fecha_Filtro_Referencia"] = df.loc[mask_ref_vacia, "Fecha_Entrega"]
-
-        df["Folio_O_ID"] = df["Folio_Factura"].astype(str).str.strip()
-        df.loc[df["Folio_O_ID"] == "", "Folio_O_ID"] = df["ID_Pedido"].astype(str).str.strip()
-
-        if df["Fecha_Filtro_Referencia"].notna().any():
-            df = df.sort_values(by="Fecha_Filtro_Referencia", ascending=False)
-        elif df["Fecha_Entrega"].notna().any():
-            df = df.sort_values(by="Fecha_Entrega", ascending=False)
-        elif df["Hora_Registro"].notna().any():
-            df = df.sort_values(by="Hora_Registro", ascending=False)
-
-    return df
-
 with tab5:
+    profile_checkpoint("tab5")
     tab5_is_active = default_tab == TAB_INDEX_TAB5
     if tab5_is_active:
         st.session_state["current_tab_index"] = TAB_INDEX_TAB5
@@ -10504,24 +11840,27 @@ with tab5:
 
     current_refresh_token = st.session_state.get("guias_refresh_token")
     cache_payload = st.session_state.get("tab5_guias_dataset_cache")
-    use_cached_df = (
+    df_guias = None
+    if (
         isinstance(cache_payload, dict)
         and cache_payload.get("refresh_token") == current_refresh_token
-        and isinstance(cache_payload.get("df"), pd.DataFrame)
+        and cache_payload.get("handle")
         and not refresh_pressed
-    )
+    ):
+        df_guias = get_shared_frame(cache_payload["handle"])
 
-    if use_cached_df:
-        df_guias = cache_payload["df"].copy()
-    else:
+    if df_guias is None:
+        # Sin réplica: este mismo dataset alimenta las alertas de guías nuevas, así que ya está
+        # completo en caché y los filtros de la vista se aplican sobre él.
         try:
-            df_guias = cargar_datos_guias_unificadas(current_refresh_token)
+            with profile_block("cargar_datos_guias_unificadas"):
+                df_guias = cargar_datos_guias_unificadas(current_refresh_token)
         except Exception as e:
             st.error(f"❌ Error al cargar datos de guías: {e}")
             df_guias = pd.DataFrame()
         st.session_state["tab5_guias_dataset_cache"] = {
             "refresh_token": current_refresh_token,
-            "df": df_guias.copy(),
+            "handle": put_shared_frame("tab5_guias", df_guias),
         }
 
     if df_guias.empty:
@@ -10543,50 +11882,8 @@ with tab5:
         # Aviso de guías para el vendedor de la sesión. Se calcula antes de
         # aplicar filtros visuales para que el aviso por ID vendedor no se
         # esconda por la fecha o vendedor seleccionados en la tabla.
-        df_guias_alert_source = df_guias.copy()
-        if "id_vendedor" not in df_guias_alert_source.columns:
-            df_guias_alert_source["id_vendedor"] = ""
-        if "Hora_Registro" not in df_guias_alert_source.columns:
-            df_guias_alert_source["Hora_Registro"] = pd.NaT
-
-        try:
-            df_guias_alert_source["Hora_Registro_alerta"] = pd.to_datetime(
-                df_guias_alert_source["Hora_Registro"], errors="coerce", format="mixed"
-            )
-        except (TypeError, ValueError):
-            df_guias_alert_source["Hora_Registro_alerta"] = pd.to_datetime(
-                df_guias_alert_source["Hora_Registro"], errors="coerce"
-            )
-        cutoff_guias_alerta = datetime.now() - timedelta(hours=12)
-        df_guias_alert_source = df_guias_alert_source[
-            df_guias_alert_source["Hora_Registro_alerta"].notna()
-            & (df_guias_alert_source["Hora_Registro_alerta"] >= cutoff_guias_alerta)
-        ].copy()
-
-        df_guias_alert_source["id_vendedor_norm"] = df_guias_alert_source["id_vendedor"].apply(normalize_vendedor_id)
-        if id_vendedor_sesion:
-            df_guias_sesion = df_guias_alert_source[
-                df_guias_alert_source["id_vendedor_norm"] == id_vendedor_sesion
-            ].copy()
-        else:
-            df_guias_sesion = pd.DataFrame(columns=df_guias_alert_source.columns)
-
-        if "Completados_Limpiado" not in df_guias_sesion.columns:
-            df_guias_sesion["Completados_Limpiado"] = ""
-        df_guias_alertas = df_guias_sesion[
-            df_guias_sesion["Completados_Limpiado"].fillna("").astype(str).str.strip() == ""
-        ].copy()
-
-        current_guias_map: Dict[str, str] = {}
-        if not df_guias_alertas.empty:
-            for _, row in df_guias_alertas.iterrows():
-                row_key = "::".join([
-                    str(row.get("Fuente", "")).strip(),
-                    str(row.get("ID_Pedido", "")).strip(),
-                    str(row.get("Ultima_Guia", "")).strip(),
-                ])
-                cliente = str(row.get("Cliente", "")).strip() or "Cliente sin nombre"
-                current_guias_map[row_key] = cliente
+        resumen_guias_sesion = obtener_resumen_guias_vendedor(id_vendedor_sesion, current_refresh_token)
+        current_guias_map: Dict[str, str] = dict(resumen_guias_sesion.get("clientes_por_key", {}))
 
         guias_signature = "|".join(sorted(current_guias_map.keys()))
         prev_keys_raw = st.session_state.get("tab5_guias_keys", [])
@@ -10597,7 +11894,7 @@ with tab5:
 
         if id_vendedor_sesion and prev_keys and nuevas_keys:
             nuevas = len(nuevas_keys)
-            clientes_nuevos = [current_guias_map.get(k, "Cliente sin nombre") for k in nuevas_keys]
+            clientes_nuevos = [current_guias_map.get(k) or "Cliente sin nombre" for k in nuevas_keys]
             clientes_unicos = list(dict.fromkeys(clientes_nuevos))
             detalle_clientes = ", ".join(clientes_unicos[:3])
             if len(clientes_unicos) > 3:
@@ -10720,9 +12017,12 @@ with tab5:
 
         st.markdown("### 📥 Selecciona un Pedido para Ver la Última Guía Subida")
 
-        df_guias["display_label"] = df_guias.apply(
-            lambda row: f"📄 {row['Folio_O_ID']} – {row['Cliente']} – {row['Vendedor_Registro']} ({row['Tipo_Envio']}) · {row['Fuente']}",
-            axis=1
+        df_guias["display_label"] = (
+            "📄 " + df_guias["Folio_O_ID"].astype(str)
+            + " – " + df_guias["Cliente"].astype(str)
+            + " – " + df_guias["Vendedor_Registro"].astype(str)
+            + " (" + df_guias["Tipo_Envio"].astype(str) + ") · "
+            + df_guias["Fuente"].astype(str)
         )
 
         pedido_seleccionado = st.selectbox(
@@ -10761,6 +12061,7 @@ with tab5:
 
 # --- TAB 6: PEDIDOS NO ENTREGADOS ---
 with tab6:
+    profile_checkpoint("tab6")
     tab6_is_active = default_tab == TAB_INDEX_TAB6
     if tab6_is_active:
         st.session_state["current_tab_index"] = TAB_INDEX_TAB6
@@ -10769,12 +12070,19 @@ with tab6:
     if st.button("🔄 Actualizar listado", key="refresh_no_entregados"):
         if allow_refresh("no_entregados_last_refresh"):
             cargar_pedidos.clear()
+            marcar_replica_desactualizada(SHEET_PEDIDOS_OPERATIVOS)
             st.toast("🔄 Datos de pedidos recargados")
             pass  # Evita recarga inmediata; los cambios se aplican al enviar el formulario
 
     if tab6_is_active:
         try:
-            df_pedidos_no_entregados = cargar_pedidos()
+            df_pedidos_no_entregados = query_replica(
+                SHEET_PEDIDOS_OPERATIVOS, [("Estado_Entrega", "=", "⏳ No Entregado")]
+            )
+            if df_pedidos_no_entregados is None:
+                df_pedidos_no_entregados = cargar_pedidos()
+            else:
+                st.caption(describe_replica(SHEET_PEDIDOS_OPERATIVOS))
         except Exception as e:
             st.error(f"❌ Error al cargar los pedidos: {e}")
             df_pedidos_no_entregados = pd.DataFrame()
@@ -10823,20 +12131,7 @@ with tab6:
                     ).dt.strftime("%Y-%m-%d")
                 st.dataframe(tabla_visual, use_container_width=True, hide_index=True)
 
-            df_pedidos_no_entregados["display_label"] = df_pedidos_no_entregados.apply(
-                lambda row: " - ".join(
-                    [
-                        (
-                            str(row.get("Folio_Factura", "")).strip()
-                            or str(row.get("ID_Pedido", "")).strip()
-                            or "Sin folio"
-                        ),
-                        str(row.get("Cliente", "")).strip() or "Sin Cliente",
-                        str(row.get("Tipo_Envio", "")).strip() or "Sin Tipo",
-                    ]
-                ),
-                axis=1,
-            )
+            df_pedidos_no_entregados["display_label"] = etiqueta_no_entregado_series(df_pedidos_no_entregados)
 
             pedido_seleccionado_no_entregado = st.selectbox(
                 "📋 Selecciona un pedido para actualizar la entrega",
@@ -10933,7 +12228,7 @@ with tab6:
                             if worksheet is None:
                                 st.error("❌ No se pudo acceder a la hoja de Google Sheets para actualizar el pedido.")
                             else:
-                                headers = worksheet.row_values(1)
+                                headers = get_sheet_headers(SHEET_PEDIDOS_OPERATIVOS, worksheet)
                                 try:
                                     df_completo = cargar_pedidos()
                                 except Exception as e:
@@ -11020,6 +12315,7 @@ with tab6:
                                             try:
                                                 safe_batch_update(worksheet, updates)
                                                 cargar_pedidos.clear()
+                                                marcar_replica_desactualizada(SHEET_PEDIDOS_OPERATIVOS)
                                                 st.success("✅ Pedido actualizado correctamente.")
                                                 pass  # Evita recarga inmediata; los cambios se aplican al enviar el formulario
                                             except Exception as e:
@@ -11027,15 +12323,17 @@ with tab6:
 
 # --- TAB 7: DOWNLOAD DATA ---
 with tab7:
+    profile_checkpoint("tab7")
     tab7_is_active = default_tab == TAB_INDEX_TAB7
     if tab7_is_active:
         st.session_state["current_tab_index"] = TAB_INDEX_TAB7
     st.header("⬇️ Descargar Datos de Pedidos")
 
+    @depende_de_hojas("datos_pedidos")
     @st.cache_data(ttl=60)
     def cargar_todos_los_pedidos():
         worksheet = get_worksheet()
-        headers = worksheet.row_values(1)
+        headers = get_sheet_headers(worksheet.title, worksheet)
         if headers:
             try:
                 df = pd.DataFrame(worksheet.get_all_records())
@@ -11045,33 +12343,16 @@ with tab7:
                 valores = worksheet.get_all_values()
                 if not valores:
                     return pd.DataFrame(), []
-                headers_unicos = []
-                conteo_headers = {}
-                headers_duplicados = {}
-                primera_columna_por_header = {}
-                for idx, raw_header in enumerate(valores[0], start=1):
-                    base = str(raw_header).strip() or f"col_{idx}"
-                    repeticiones = conteo_headers.get(base, 0)
-                    conteo_headers[base] = repeticiones + 1
-                    primera_columna_por_header.setdefault(base, idx)
-                    if repeticiones:
-                        headers_duplicados.setdefault(base, []).append(idx)
-                        base = f"{base}_{repeticiones + 1}"
-                    headers_unicos.append(base)
+                df, _, headers_duplicados = sheet_values_to_frame(valores)
                 if headers_duplicados:
                     detalle_duplicados = ", ".join(
-                        f"{header} (columnas {', '.join(map(str, [primera_columna_por_header[header], *indices]))})"
+                        f"{header} (columnas {', '.join(map(str, indices))})"
                         for header, indices in headers_duplicados.items()
                     )
                     st.warning(
                         "Se detectaron encabezados duplicados en Google Sheets para la pestaña de descarga. "
                         f"Se usarán nombres temporales para continuar. Detalles: {detalle_duplicados}"
                     )
-                registros = []
-                for fila in valores[1:]:
-                    fila_normalizada = list(fila) + [""] * max(0, len(headers_unicos) - len(fila))
-                    registros.append(dict(zip(headers_unicos, fila_normalizada)))
-                df = pd.DataFrame(registros)
             if "Adjuntos_Guia" not in df.columns:
                 df["Adjuntos_Guia"] = ""
             return df, headers
@@ -11079,38 +12360,57 @@ with tab7:
 
     df_all_pedidos = pd.DataFrame()
     headers = []
+    # Con réplica vigente los filtros se resuelven como consultas indexadas y solo
+    # se traen las filas que cumplen; sin ella se usa la hoja completa como antes.
+    tab7_usa_replica = tab7_is_active and replica_lista(SHEET_PEDIDOS_HISTORICOS)
+    tab7_filtros_replica = [("ID_Pedido", "NOT IN NOCASE", ["", "n/a", "nan"])]
+
+    def preparar_pedidos_descarga(df_pedidos_descarga: pd.DataFrame) -> pd.DataFrame:
+        if "Adjuntos_Guia" not in df_pedidos_descarga.columns:
+            df_pedidos_descarga["Adjuntos_Guia"] = ""
+
+        # 🧹 AÑADIDO: Filtrar filas donde 'Folio_Factura' y 'ID_Pedido' son ambos vacíos
+        df_pedidos_descarga = df_pedidos_descarga.dropna(subset=['Folio_Factura', 'ID_Pedido'], how='all')
+
+        # 🧹 Eliminar registros vacíos o inválidos con ID_Pedido en blanco, 'nan', 'N/A'
+        df_pedidos_descarga = df_pedidos_descarga[
+            df_pedidos_descarga['ID_Pedido'].astype(str).str.strip().ne('') &
+            df_pedidos_descarga['ID_Pedido'].astype(str).str.lower().ne('n/a') &
+            df_pedidos_descarga['ID_Pedido'].astype(str).str.lower().ne('nan')
+        ]
 
-    if tab7_is_active:
-        try:
-            df_all_pedidos, headers = cargar_todos_los_pedidos()
-
-            if "Adjuntos_Guia" not in df_all_pedidos.columns:
-                df_all_pedidos["Adjuntos_Guia"] = ""
-
-            # 🧹 AÑADIDO: Filtrar filas donde 'Folio_Factura' y 'ID_Pedido' son ambos vacíos
-            df_all_pedidos = df_all_pedidos.dropna(subset=['Folio_Factura', 'ID_Pedido'], how='all')
-
-            # 🧹 Eliminar registros vacíos o inválidos con ID_Pedido en blanco, 'nan', 'N/A'
-            df_all_pedidos = df_all_pedidos[
-                df_all_pedidos['ID_Pedido'].astype(str).str.strip().ne('') &
-                df_all_pedidos['ID_Pedido'].astype(str).str.lower().ne('n/a') &
-                df_all_pedidos['ID_Pedido'].astype(str).str.lower().ne('nan')
-            ]
+        if 'Fecha_Entrega' in df_pedidos_descarga.columns:
+            # Mismo parser que la columna ISO de la réplica: ambos caminos filtran igual.
+            df_pedidos_descarga['Fecha_Entrega'] = parse_fechas_mixtas(
+                df_pedidos_descarga['Fecha_Entrega'], dayfirst=FECHAS_HOJA_DAYFIRST
+            )
 
-            if 'Fecha_Entrega' in df_all_pedidos.columns:
-                df_all_pedidos['Fecha_Entrega'] = pd.to_datetime(df_all_pedidos['Fecha_Entrega'], errors='coerce')
+        if 'Vendedor_Registro' in df_pedidos_descarga.columns:
+            df_pedidos_descarga['Vendedor_Registro'] = df_pedidos_descarga['Vendedor_Registro'].apply(
+                lambda x: x if x in VENDEDORES_LIST else 'Otro/Desconocido' if pd.notna(x) and str(x).strip() != '' else 'N/A'
+            ).astype(str)
+        else:
+            st.warning("La columna 'Vendedor_Registro' no se encontró en el Google Sheet para el filtrado. Asegúrate de que exista y esté correctamente nombrada.")
 
-            if 'Vendedor_Registro' in df_all_pedidos.columns:
-                df_all_pedidos['Vendedor_Registro'] = df_all_pedidos['Vendedor_Registro'].apply(
-                    lambda x: x if x in VENDEDORES_LIST else 'Otro/Desconocido' if pd.notna(x) and str(x).strip() != '' else 'N/A'
-                ).astype(str)
-            else:
-                st.warning("La columna 'Vendedor_Registro' no se encontró en el Google Sheet para el filtrado. Asegúrate de que exista y esté correctamente nombrada.")
+        if 'Folio_Factura' in df_pedidos_descarga.columns:
+            df_pedidos_descarga['Folio_Factura'] = df_pedidos_descarga['Folio_Factura'].astype(str).replace('nan', '')
+        else:
+            st.warning("La columna 'Folio_Factura' no se encontró en el Google Sheet. No se podrá mostrar en la vista previa.")
+        return df_pedidos_descarga
 
-            if 'Folio_Factura' in df_all_pedidos.columns:
-                df_all_pedidos['Folio_Factura'] = df_all_pedidos['Folio_Factura'].astype(str).replace('nan', '')
+    if tab7_is_active:
+        try:
+            if tab7_usa_replica:
+                # Una fila basta para saber si hay datos y con qué columnas.
+                df_all_pedidos = query_replica(
+                    SHEET_PEDIDOS_HISTORICOS, tab7_filtros_replica, limite=1, exigir_vigencia=False
+                )
+                tab7_usa_replica = df_all_pedidos is not None
+            if tab7_usa_replica:
+                df_all_pedidos = preparar_pedidos_descarga(df_all_pedidos)
             else:
-                st.warning("La columna 'Folio_Factura' no se encontró en el Google Sheet. No se podrá mostrar en la vista previa.")
+                df_all_pedidos, headers = cargar_todos_los_pedidos()
+                df_all_pedidos = preparar_pedidos_descarga(df_all_pedidos)
         except Exception as e:
             st.error(f"❌ Error al cargar datos para descarga: {e}")
             st.info("Asegúrate de que la primera fila de tu Google Sheet contiene los encabezados esperados y que la API de Google Sheets está habilitada.")
@@ -11146,6 +12446,7 @@ with tab7:
             if time_filter == "Últimas 24 horas":
                 start_datetime = current_time - timedelta(hours=24)
                 filtered_df_download = filtered_df_download[filtered_df_download['Fecha_Entrega'] >= start_datetime]
+                tab7_filtros_replica.append((replica_fecha("Fecha_Entrega"), ">=", start_datetime))
             else:
                 if time_filter == "Últimos 7 días":
                     start_date = current_time.date() - timedelta(days=7)
@@ -11153,12 +12454,21 @@ with tab7:
                     start_date = current_time.date() - timedelta(days=30)
 
                 filtered_df_download = filtered_df_download[filtered_df_download['Fecha_Solo_Fecha'] >= start_date]
+                tab7_filtros_replica.append((replica_fecha("Fecha_Entrega"), ">=", start_date))
 
             filtered_df_download = filtered_df_download.drop(columns=['Fecha_Solo_Fecha'])
 
 
         if 'Vendedor_Registro' in df_all_pedidos.columns:
-            unique_vendedores_en_df = set(filtered_df_download['Vendedor_Registro'].unique())
+            if tab7_usa_replica:
+                unique_vendedores_en_df = {
+                    vendedor if vendedor in VENDEDORES_LIST else 'Otro/Desconocido' if vendedor.strip() else 'N/A'
+                    for vendedor in replica_distinct(
+                        SHEET_PEDIDOS_HISTORICOS, "Vendedor_Registro", tab7_filtros_replica, exigir_vigencia=False
+                    ) or []
+                }
+            else:
+                unique_vendedores_en_df = set(filtered_df_download['Vendedor_Registro'].unique())
 
             options_for_selectbox = ["Todos"]
             for vendedor_nombre in VENDEDORES_LIST:
@@ -11180,6 +12490,12 @@ with tab7:
 
             if selected_vendedor != "Todos":
                 filtered_df_download = filtered_df_download[filtered_df_download['Vendedor_Registro'] == selected_vendedor]
+                if selected_vendedor == 'Otro/Desconocido':
+                    tab7_filtros_replica.append(("Vendedor_Registro", "NOT IN", [*VENDEDORES_LIST, ""]))
+                elif selected_vendedor == 'N/A':
+                    tab7_filtros_replica.append(("Vendedor_Registro", "=", ""))
+                else:
+                    tab7_filtros_replica.append(("Vendedor_Registro", "=", selected_vendedor))
         else:
             st.warning("La columna 'Vendedor_Registro' no está disponible en los datos cargados para aplicar este filtro. Por favor, asegúrate de que el nombre de la columna en tu Google Sheet sea 'Vendedor_Registro'.")
 
@@ -11200,15 +12516,32 @@ with tab7:
             )
             if selected_tipo_envio_download != "Todos":
                 filtered_df_download = filtered_df_download[filtered_df_download['Tipo_Envio'] == selected_tipo_envio_download]
+                tab7_filtros_replica.append(("Tipo_Envio", "=", selected_tipo_envio_download))
         else:
             st.warning("La columna 'Tipo_Envio' no se encontró para aplicar el filtro de tipo de envío.")
 
 
         if 'Estado' in filtered_df_download.columns:
-            unique_estados = ["Todos"] + list(filtered_df_download['Estado'].dropna().unique())
+            if tab7_usa_replica:
+                estados_presentes = replica_distinct(
+                    SHEET_PEDIDOS_HISTORICOS, "Estado", tab7_filtros_replica, exigir_vigencia=False
+                ) or []
+            else:
+                estados_presentes = list(filtered_df_download['Estado'].dropna().unique())
+            unique_estados = ["Todos"] + estados_presentes
             selected_estado = st.selectbox("Filtrar por Estado:", unique_estados, key="download_estado_filter_tab6")
             if selected_estado != "Todos":
                 filtered_df_download = filtered_df_download[filtered_df_download['Estado'] == selected_estado]
+                tab7_filtros_replica.append(("Estado", "=", selected_estado))
+
+        if tab7_usa_replica:
+            df_replica_tab7 = query_replica(SHEET_PEDIDOS_HISTORICOS, tab7_filtros_replica, exigir_vigencia=False)
+            if df_replica_tab7 is None:
+                st.warning("⚠️ No se pudo consultar la réplica local. Recarga la pestaña para leer desde Google Sheets.")
+                filtered_df_download = filtered_df_download.iloc[0:0]
+            else:
+                filtered_df_download = preparar_pedidos_descarga(df_replica_tab7)
+                st.caption(describe_replica(SHEET_PEDIDOS_HISTORICOS))
 
         st.markdown("---")
         st.subheader("Vista Previa de Datos a Descargar")
@@ -11229,9 +12562,25 @@ with tab7:
         st.dataframe(display_df, use_container_width=True, hide_index=True)
 
         if not filtered_df_download.empty:
-            output = BytesIO()
-            with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                # Crear copia para exportar solo columnas seguras
+            excel_filtrado_version = dataframe_fingerprint(filtered_df_download)
+            excel_filtrado_filtros = {
+                "tiempo": time_filter,
+                "vendedor": st.session_state.get("download_vendedor_filter_tab6_final", "Todos"),
+                "tipo_envio": st.session_state.get("download_tipo_envio_filter", "Todos"),
+                "estado": st.session_state.get("download_estado_filter_tab6", "Todos"),
+            }
+            processed_data = peek_cached_export(
+                "pedidos_filtrados", excel_filtrado_version, excel_filtrado_filtros
+            )
+            preparar_excel_filtrado = False
+            if processed_data is None:
+                preparar_excel_filtrado = st.button(
+                    "🧮 Preparar Excel Filtrado",
+                    key="tab7_prep_excel_filtrado",
+                )
+
+            def _build_excel_filtrado() -> bytes:
+                # Exportar solo columnas seguras
                 columnas_excluidas = [
                     "ID_Pedido", "Adjuntos", "Adjuntos_Surtido", "Adjuntos_Guia",
                     "Completados_Limpiado", "Fecha_Pago_Comprobante",
@@ -11240,30 +12589,57 @@ with tab7:
                 ]
                 columnas_finales = [col for col in filtered_df_download.columns if col not in columnas_excluidas]
 
-                excel_df = filtered_df_download[columnas_finales].copy()
-
-                # Convertir fechas a texto legible
-                for col in excel_df.columns:
-                    if "fecha" in col.lower() or "Fecha" in col:
-                        excel_df[col] = pd.to_datetime(excel_df[col], errors='coerce').dt.strftime('%Y-%m-%d')
-
+                # Convertir fechas a texto legible sin copiar el resto de columnas
+                columnas_fecha_texto = {
+                    col: pd.to_datetime(filtered_df_download[col], errors='coerce').dt.strftime('%Y-%m-%d')
+                    for col in columnas_finales
+                    if "fecha" in col.lower()
+                }
+                excel_df = filtered_df_download[columnas_finales].assign(**columnas_fecha_texto)
 
-                # Asegúrate de que las fechas estén en formato string
-                for fecha_col in ['Fecha_Entrega', 'Fecha_Pago_Comprobante']:
-                    if fecha_col in excel_df.columns:
-                        excel_df[fecha_col] = pd.to_datetime(excel_df[fecha_col], errors='coerce').dt.strftime('%Y-%m-%d')
+                return write_dataframe_xlsx_streaming(excel_df, 'Pedidos_Filtrados')
 
-                excel_df.to_excel(writer, index=False, sheet_name='Pedidos_Filtrados')
+            if preparar_excel_filtrado:
+                processed_data = get_or_build_export(
+                    "pedidos_filtrados",
+                    excel_filtrado_version,
+                    excel_filtrado_filtros,
+                    _build_excel_filtrado,
+                )
 
-            processed_data = output.getvalue()
+            if processed_data is not None:
+                st.download_button(
+                    label="📥 Descargar Excel Filtrado",
+                    data=processed_data,
+                    file_name=f"pedidos_filtrados_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
+                    mime=XLSX_MIME,
+                    help="Haz clic para descargar los datos de la tabla mostrada arriba en formato Excel."
+                )
 
-            st.download_button(
-                label="📥 Descargar Excel Filtrado",
-                data=processed_data,
-                file_name=f"pedidos_filtrados_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                help="Haz clic para descargar los datos de la tabla mostrada arriba en formato Excel."
-            )
+            if st.session_state.get("download_tipo_envio_filter") == "📍 Pedido Local":
+                st.markdown("---")
+                st.subheader("🗺️ Hojas de ruta locales")
+                st.caption("Genera en una sola operación la hoja de ruta de cada pedido local confirmado del filtro.")
+                route_template_path = Path("plantillas") / "FORMATO DE ENTREGA LOCAL limpia.xlsx"
+                if not route_template_path.exists():
+                    st.error(f"No se encontró la plantilla de hoja de ruta en: {route_template_path}")
+                elif st.button("🧮 Generar hojas de ruta (ZIP)", key="tab7_generar_hojas_ruta_zip"):
+                    route_zip_buffer, route_filenames = build_local_route_sheets_zip(
+                        route_template_path,
+                        filtered_df_download,
+                        load_clientes_locales_dataset(),
+                    )
+                    st.caption(
+                        f"Se generaron {len(route_filenames)} hojas de ruta "
+                        "(solo pedidos locales con comprobante confirmado)."
+                    )
+                    st.download_button(
+                        label="📥 Descargar hojas de ruta (ZIP)",
+                        data=route_zip_buffer.getvalue(),
+                        file_name=f"hojas_ruta_locales_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
+                        mime="application/zip",
+                        key="tab7_descargar_hojas_ruta_zip",
+                    )
         else:
             st.info("No hay datos que coincidan con los filtros seleccionados para descargar.")
 # --- Helpers exclusivos para Tab 8 (Buscar Pedido) ---
@@ -11316,6 +12692,17 @@ def get_s3_file_download_url_busqueda_cached(object_key_or_url, expires_in=60480
     return get_s3_file_download_url_busqueda(s3_client, object_key_or_url, expires_in=expires_in)
 
 
+def enlaces_busqueda(archivos):
+    """(key, url) para cada archivo de un resultado; las URLs se firman al mostrar, no se guardan en sesión."""
+    enlaces = []
+    for archivo in archivos or []:
+        if isinstance(archivo, (list, tuple)):  # resultados guardados antes con la URL ya firmada
+            enlaces.append((archivo[0], archivo[1]))
+        else:
+            enlaces.append((archivo, get_s3_file_download_url_busqueda_cached(archivo)))
+    return enlaces
+
+
 def resolver_nombre_y_enlace_busqueda(valor, etiqueta_fallback):
     valor = str(valor).strip()
     if not valor:
@@ -11539,48 +12926,29 @@ def render_caso_especial_busqueda(res):
     st.markdown("---")
 
 
-def _leer_registros_hoja_busqueda(nombre_hoja: str, retries: int = 5, base_delay: float = 0.8):
-    """Lee una hoja con reintentos para errores transitorios/cuota (incluye 409)."""
+def _leer_registros_hoja_busqueda(nombre_hoja: str, retries: int = 5, base_delay: float = 0.8) -> pd.DataFrame:
+    """Lee una hoja como DataFrame con reintentos para errores transitorios/cuota (incluye 409)."""
     last_error = None
     for attempt in range(retries):
         try:
             sheet = g_spread_client.open_by_key(GOOGLE_SHEET_ID).worksheet(nombre_hoja)
             try:
-                return sheet.get_all_records()
+                return pd.DataFrame(sheet.get_all_records())
             except GSpreadException as e:
                 if "header row in the worksheet is not unique" not in str(e):
                     raise
                 valores = sheet.get_all_values()
-                if not valores:
-                    return []
-                headers_raw = valores[0]
-                headers = []
-                conteo_headers = {}
-                headers_duplicados = {}
-                primera_columna_por_header = {}
-                for idx, raw_header in enumerate(headers_raw, start=1):
-                    base = str(raw_header).strip() or f"col_{idx}"
-                    repeticiones = conteo_headers.get(base, 0)
-                    conteo_headers[base] = repeticiones + 1
-                    primera_columna_por_header.setdefault(base, idx)
-                    if repeticiones:
-                        headers_duplicados.setdefault(base, []).append(idx)
-                        base = f"{base}_{repeticiones + 1}"
-                    headers.append(base)
+                df, _, headers_duplicados = sheet_values_to_frame(valores)
                 if headers_duplicados:
                     detalle_duplicados = ", ".join(
-                        f"{header} (columnas {', '.join(map(str, [primera_columna_por_header[header], *indices]))})"
+                        f"{header} (columnas {', '.join(map(str, indices))})"
                         for header, indices in headers_duplicados.items()
                     )
                     st.session_state.setdefault("_busqueda_headers_duplicados", {})[nombre_hoja] = detalle_duplicados
                     print(
                         f"[BUSQUEDA_PEDIDOS] Encabezados duplicados detectados en hoja '{nombre_hoja}': {detalle_duplicados}"
                     )
-                registros = []
-                for fila in valores[1:]:
-                    fila_normalizada = list(fila) + [""] * max(0, len(headers) - len(fila))
-                    registros.append(dict(zip(headers, fila_normalizada)))
-                return registros
+                return df
         except APIError as e:
             last_error = e
             status = getattr(getattr(e, "response", None), "status_code", None)
@@ -11597,19 +12965,22 @@ def _leer_registros_hoja_busqueda(nombre_hoja: str, retries: int = 5, base_delay
             raise
     if last_error:
         raise last_error
-    return []
+    return pd.DataFrame()
 
 
+@depende_de_hojas("data_pedidos", "datos_pedidos")
 @st.cache_data(ttl=300)
 def cargar_hoja_pedidos_busqueda(nombre_hoja):
-    data = _leer_registros_hoja_busqueda(nombre_hoja)
-    df = pd.DataFrame(data)
+    df = query_replica(nombre_hoja)
+    if df is None:
+        df = _leer_registros_hoja_busqueda(nombre_hoja)
     for c in PEDIDOS_COLUMNAS_MINIMAS:
         if c not in df.columns:
             df[c] = ""
     return df
 
 
+@depende_de_hojas("data_pedidos", "datos_pedidos")
 @st.cache_data(ttl=300)
 def cargar_pedidos_busqueda():
     pedidos_frames = [cargar_hoja_pedidos_busqueda(nombre_hoja) for nombre_hoja in PEDIDOS_SHEETS]
@@ -11618,10 +12989,11 @@ def cargar_pedidos_busqueda():
     return pd.concat(pedidos_frames, ignore_index=True, sort=False)
 
 
-@st.cache_data(ttl=300)
 def cargar_casos_especiales_busqueda():
-    data = _leer_registros_hoja_busqueda("casos_especiales")
-    df = pd.DataFrame(data)
+    df, _headers, meta = load_casos_especiales_snapshot()
+    df = df.drop(columns=["Sheet_Row_Number"], errors="ignore")
+    if meta.get("headers_duplicados"):
+        st.session_state.setdefault("_busqueda_headers_duplicados", {})["casos_especiales"] = meta["headers_duplicados"]
 
     columnas_ejemplo = [
         "ID_Pedido", "Hora_Registro", "Vendedor_Registro", "Cliente", "Folio_Factura", "Folio_Factura_Error", "Tipo_Envio",
@@ -11642,6 +13014,7 @@ def cargar_casos_especiales_busqueda():
 
 # --- TAB 8: SEARCH ORDER ---
 with tab8:
+    profile_checkpoint("tab8")
     tab8_is_active = default_tab == TAB_INDEX_TAB8
     if tab8_is_active:
         st.session_state["current_tab_index"] = TAB_INDEX_TAB8
@@ -11809,9 +13182,9 @@ with tab8:
                     "Refacturacion_Subtipo": str(row.get("Refacturacion_Subtipo", "")).strip(),
                     "Folio_Factura_Refacturada": str(row.get("Folio_Factura_Refacturada", "")).strip(),
                     "Coincidentes": [],
-                    "Comprobantes": [(f["Key"], get_s3_file_download_url_busqueda_cached(f["Key"])) for f in comprobantes],
-                    "Facturas": [(f["Key"], get_s3_file_download_url_busqueda_cached(f["Key"])) for f in facturas],
-                    "Otros": [(f["Key"], get_s3_file_download_url_busqueda_cached(f["Key"])) for f in otros],
+                    "Comprobantes": [f["Key"] for f in comprobantes],
+                    "Facturas": [f["Key"] for f in facturas],
+                    "Otros": [f["Key"] for f in otros],
                 })
 
             df_casos = cargar_casos_especiales_busqueda()
@@ -11873,11 +13246,11 @@ with tab8:
                         if waybill_match:
                             st.code(f"📦 WAYBILL detectado: {waybill_match.group(1)}")
 
-                        archivos_coincidentes.append((key, get_s3_file_download_url_busqueda_cached(key)))
+                        archivos_coincidentes.append(key)
                         todos_los_archivos = obtener_todos_los_archivos(prefix)
                         comprobantes = [f for f in todos_los_archivos if "comprobante" in f["Key"].lower()]
                         facturas = [f for f in todos_los_archivos if "factura" in f["Key"].lower()]
-                        otros = [f for f in todos_los_archivos if f not in comprobantes and f not in facturas and f["Key"] != archivos_coincidentes[0][0]]
+                        otros = [f for f in todos_los_archivos if f not in comprobantes and f not in facturas and f["Key"] != archivos_coincidentes[0]]
 
                         resultados.append({
                             "__source": "pedidos",
@@ -11902,9 +13275,9 @@ with tab8:
                             "Refacturacion_Subtipo": str(row.get("Refacturacion_Subtipo", "")).strip(),
                             "Folio_Factura_Refacturada": str(row.get("Folio_Factura_Refacturada", "")).strip(),
                             "Coincidentes": archivos_coincidentes,
-                            "Comprobantes": [(f["Key"], get_s3_file_download_url_busqueda_cached(f["Key"])) for f in comprobantes],
-                            "Facturas": [(f["Key"], get_s3_file_download_url_busqueda_cached(f["Key"])) for f in facturas],
-                            "Otros": [(f["Key"], get_s3_file_download_url_busqueda_cached(f["Key"])) for f in otros],
+                            "Comprobantes": [f["Key"] for f in comprobantes],
+                            "Facturas": [f["Key"] for f in facturas],
+                            "Otros": [f["Key"] for f in otros],
                         })
                         break
 
@@ -12015,21 +13388,21 @@ with tab8:
 
                         if res.get("Coincidentes"):
                             st.markdown("#### 🔍 Guías detectadas en S3:")
-                            for key, url in res["Coincidentes"]:
+                            for key, url in enlaces_busqueda(res["Coincidentes"]):
                                 nombre = key.split("/")[-1]
                                 st.markdown(f'- <a href="{url}" target="_blank">🔍 {nombre}</a>', unsafe_allow_html=True)
                         if res.get("Comprobantes"):
                             st.markdown("#### 🧾 Comprobantes:")
-                            for key, url in res["Comprobantes"]:
+                            for key, url in enlaces_busqueda(res["Comprobantes"]):
                                 nombre = key.split("/")[-1]
                                 st.markdown(f'- <a href="{url}" target="_blank">📄 {nombre}</a>', unsafe_allow_html=True)
                         if res.get("Facturas"):
                             st.markdown("#### 📁 Facturas:")
-                            for key, url in res["Facturas"]:
+                            for key, url in enlaces_busqueda(res["Facturas"]):
                                 nombre = key.split("/")[-1]
                                 st.markdown(f'- <a href="{url}" target="_blank">📄 {nombre}</a>', unsafe_allow_html=True)
                         adjuntos_hoja = res.get("Adjuntos_urls") or []
-                        otros_s3 = res.get("Otros") or []
+                        otros_s3 = enlaces_busqueda(res.get("Otros"))
                         otros_items = []
                         claves_vistas = set()
 
@@ -12057,19 +13430,19 @@ with tab8:
                             _registrar_clave(clave)
                             _registrar_clave(raw_url)
 
-                        for key, url in res.get("Coincidentes") or []:
+                        for key, url in enlaces_busqueda(res.get("Coincidentes")):
                             clave = extract_s3_key_busqueda(key) or key
                             _registrar_clave(clave)
                             if url:
                                 _registrar_clave(extract_s3_key_busqueda(url) or url)
 
-                        for key, url in res.get("Comprobantes") or []:
+                        for key, url in enlaces_busqueda(res.get("Comprobantes")):
                             clave = extract_s3_key_busqueda(key) or key
                             _registrar_clave(clave)
                             if url:
                                 _registrar_clave(extract_s3_key_busqueda(url) or url)
 
-                        for key, url in res.get("Facturas") or []:
+                        for key, url in enlaces_busqueda(res.get("Facturas")):
                             clave = extract_s3_key_busqueda(key) or key
                             _registrar_clave(clave)
                             if url:
@@ -12109,3 +13482,5 @@ with tab8:
             if filtro_fechas_activo_render:
                 mensaje += " Revisa el rango de fechas seleccionado."
             st.warning(mensaje)
+
+finish_rerun_profile()
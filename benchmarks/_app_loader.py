@@ -0,0 +1,105 @@
+"""Carga funciones puras de las apps Streamlit sin ejecutar la interfaz.
+
+Los archivos ``app_admin.py`` y ``app_v.py`` ejecutan la UI al importarse, así
+que los benchmarks extraen únicamente las funciones de módulo que necesitan
+(vía ``ast``) y las compilan en un espacio de nombres aislado. Lo que las apps
+importan de ``app_comun.py`` se busca también ahí.
+"""
+
+import ast
+import json
+import re
+import time
+import unicodedata
+from datetime import date, datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def _iter_module_statements(body):
+    """Recorre el módulo incluyendo bloques ``with``/``if``/``try`` (cuerpos de pestañas).
+
+    Permite extraer helpers definidos dentro de una pestaña; si un nombre se
+    repite se usa la primera definición.
+    """
+    for node in body:
+        yield node
+        if isinstance(node, (ast.With, ast.If, ast.Try)):
+            for child_body in (
+                getattr(node, "body", []),
+                getattr(node, "orelse", []),
+                getattr(node, "finalbody", []),
+            ):
+                yield from _iter_module_statements(child_body)
+
+
+COMMON_MODULE = "app_comun.py"
+
+
+def _collect_nodes(source_path: Path, wanted: set[str]) -> list:
+    tree = ast.parse(source_path.read_text(encoding="utf-8"), filename=str(source_path))
+    nodes = []
+    seen_defs = set()
+    for node in _iter_module_statements(tree.body):
+        if isinstance(node, ast.FunctionDef) and node.name in wanted and node.name not in seen_defs:
+            # Los decoradores de Streamlit (cache_data, etc.) no aplican fuera de la app.
+            node.decorator_list = []
+            nodes.append(node)
+            seen_defs.add(node.name)
+        elif isinstance(node, ast.Assign) and any(
+            isinstance(target, ast.Name) and target.id in wanted for target in node.targets
+        ):
+            nodes.append(node)
+    return nodes
+
+
+def _node_name(node) -> str:
+    return getattr(node, "name", None) or node.targets[0].id
+
+
+def load_functions(app_file: str, names: list[str], extra_globals: dict | None = None) -> dict:
+    """Devuelve ``{nombre: función}`` compilando solo las definiciones pedidas."""
+    source_path = REPO_ROOT / app_file
+    wanted = set(names)
+    nodes = _collect_nodes(source_path, wanted)
+    found = {_node_name(node) for node in nodes}
+    comunes = []
+    if app_file != COMMON_MODULE and wanted - found:
+        # Lo que no está en la app viene de ``from app_comun import ...``; se ejecuta
+        # primero, como el import al inicio del archivo.
+        comunes = _collect_nodes(REPO_ROOT / COMMON_MODULE, wanted - found)
+        found |= {_node_name(node) for node in comunes}
+    missing = wanted - found
+    if missing:
+        raise LookupError(f"No se encontraron en {app_file}: {sorted(missing)}")
+
+    namespace = {
+        "ast": ast,
+        "json": json,
+        "re": re,
+        "time": time,
+        "unicodedata": unicodedata,
+        "date": date,
+        "datetime": datetime,
+        "np": np,
+        "pd": pd,
+    }
+    namespace.update(extra_globals or {})
+    for path, body in ((REPO_ROOT / COMMON_MODULE, comunes), (source_path, nodes)):
+        if body:
+            exec(compile(ast.Module(body=body, type_ignores=[]), str(path), "exec"), namespace)
+    return {name: namespace[name] for name in names}
+
+
+def timeit(fn, *args, repeat: int = 3, **kwargs) -> float:
+    """Mejor tiempo (segundos) de ``repeat`` ejecuciones."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best
@@ -0,0 +1,196 @@
+"""Micro-benchmark de los mapas de adjuntos y enlaces de ``app_admin.py``.
+
+Compara las versiones vectorizadas actuales contra las implementaciones
+fila por fila anteriores (copiadas abajo) y verifica que el resultado sea
+idéntico. Uso:
+
+    python benchmarks/bench_adjuntos.py [filas]
+"""
+
+import random
+import re
+import sys
+
+import pandas as pd
+
+from _app_loader import load_functions, timeit
+
+fns = load_functions(
+    "app_admin.py",
+    [
+        "normalize_id_pedido",
+        "PEDIDO_KEY_ID_COL",
+        "_normalize_key_series",
+        "normalize_id_pedido_series",
+        "pedido_id_keys",
+        "clean_cell_text",
+        "clean_cell_text_series",
+        "build_adjuntos_map_from_pedidos",
+        "build_link_fallback_map",
+        "expand_link_adjuntos_columns",
+    ],
+)
+normalize_id_pedido = fns["normalize_id_pedido"]
+clean_cell_text = fns["clean_cell_text"]
+
+
+# --- Implementaciones previas (fila por fila) ----------------------------------
+
+def legacy_build_adjuntos_map_from_pedidos(df):
+    ids_normalizados = df["ID_Pedido"].apply(normalize_id_pedido)
+
+    def _build_for_column(column_name):
+        column_map = {}
+        if column_name not in df.columns:
+            return column_map
+        series = df[column_name]
+        for row_idx in df.index:
+            pedido_id = ids_normalizados.get(row_idx, "")
+            if not pedido_id:
+                continue
+            raw_value = series.loc[row_idx]
+            try:
+                if pd.isna(raw_value):
+                    continue
+            except Exception:
+                pass
+            if isinstance(raw_value, str) and not raw_value.strip():
+                continue
+            column_map[pedido_id] = raw_value
+        return column_map
+
+    return (
+        _build_for_column("Adjuntos"),
+        _build_for_column("Adjuntos_Surtido"),
+        _build_for_column("Adjuntos_Guia"),
+    )
+
+
+def legacy_build_link_fallback_map(df, columns):
+    ids_normalizados = df["ID_Pedido"].apply(normalize_id_pedido)
+    resultado = {}
+    columnas_validas = [col for col in columns if col in df.columns]
+    for row_idx in df.index:
+        pedido_id_norm = ids_normalizados.get(row_idx, "")
+        if not pedido_id_norm:
+            continue
+        fila = df.loc[row_idx]
+        valores = {col: clean_cell_text(fila.get(col)) for col in columnas_validas}
+        if any(valores.values()):
+            resultado[pedido_id_norm] = valores
+    return resultado
+
+
+def legacy_expand_link_adjuntos_columns(df):
+    df_expanded = df.copy()
+    existentes = [c for c in df_expanded.columns if re.fullmatch(r"Link_Adjuntos_\d+", c)]
+    if existentes:
+        df_expanded = df_expanded.drop(columns=existentes)
+    if "Link_Adjuntos" not in df_expanded.columns:
+        return df_expanded, []
+
+    def _split_links(valor):
+        bruto = str(valor or "")
+        partes = [p.strip() for p in bruto.replace("\n", ",").split(",") if p and p.strip()]
+        return list(dict.fromkeys(partes))
+
+    enlaces_por_fila = df_expanded["Link_Adjuntos"].fillna("").apply(_split_links)
+    max_enlaces = int(enlaces_por_fila.map(len).max() or 0) if not enlaces_por_fila.empty else 0
+    columnas_creadas = []
+    for idx in range(max_enlaces):
+        nombre_columna = f"Link_Adjuntos_{idx + 1}"
+        columnas_creadas.append(nombre_columna)
+        df_expanded[nombre_columna] = enlaces_por_fila.apply(
+            lambda enlaces, i=idx: enlaces[i] if len(enlaces) > i else ""
+        )
+    return df_expanded, columnas_creadas
+
+
+# --- Datos sintéticos ----------------------------------------------------------
+
+def build_frame(rows: int, seed: int = 7) -> pd.DataFrame:
+    rng = random.Random(seed)
+
+    def _link():
+        return f"https://bucket.s3.amazonaws.com/adjuntos_pedidos/PED-{rng.randint(1, 9999)}/f{rng.randint(1, 5)}.pdf"
+
+    def _maybe(value):
+        roll = rng.random()
+        if roll < 0.15:
+            return ""
+        if roll < 0.2:
+            return None
+        if roll < 0.23:
+            return "nan"
+        return value
+
+    ids = []
+    for i in range(rows):
+        roll = rng.random()
+        if roll < 0.05:
+            ids.append("")
+        elif roll < 0.1:
+            ids.append(f"{i}.0")
+        else:
+            ids.append(f"PED-{i // 2:06d}")
+
+    links = []
+    for _ in range(rows):
+        n = rng.randint(0, 4)
+        parts = [_link() for _ in range(n)]
+        if parts and rng.random() < 0.3:
+            parts.append(parts[0])
+        sep = "\n" if rng.random() < 0.3 else ", "
+        links.append(sep.join(parts))
+
+    return pd.DataFrame(
+        {
+            "ID_Pedido": ids,
+            "Adjuntos": [_maybe(_link()) for _ in range(rows)],
+            "Adjuntos_Surtido": [_maybe(_link()) for _ in range(rows)],
+            "Adjuntos_Guia": [_maybe(_link()) for _ in range(rows)],
+            "Link_Comprobante": [_maybe(_link()) for _ in range(rows)],
+            "Link_Guia": [_maybe(_link()) for _ in range(rows)],
+            "Link_Adjuntos": links,
+        }
+    )
+
+
+def main() -> None:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    df = build_frame(rows)
+    link_cols = ["Link_Comprobante", "Link_Guia", "Link_Adjuntos"]
+
+    assert fns["build_adjuntos_map_from_pedidos"](df) == legacy_build_adjuntos_map_from_pedidos(df)
+    assert fns["build_link_fallback_map"](df, link_cols) == legacy_build_link_fallback_map(df, link_cols)
+    nuevo, cols_nuevo = fns["expand_link_adjuntos_columns"](df)
+    viejo, cols_viejo = legacy_expand_link_adjuntos_columns(df)
+    assert cols_nuevo == cols_viejo
+    pd.testing.assert_frame_equal(nuevo, viejo)
+
+    casos = [
+        (
+            "build_adjuntos_map_from_pedidos",
+            lambda: legacy_build_adjuntos_map_from_pedidos(df),
+            lambda: fns["build_adjuntos_map_from_pedidos"](df),
+        ),
+        (
+            "build_link_fallback_map",
+            lambda: legacy_build_link_fallback_map(df, link_cols),
+            lambda: fns["build_link_fallback_map"](df, link_cols),
+        ),
+        (
+            "expand_link_adjuntos_columns",
+            lambda: legacy_expand_link_adjuntos_columns(df),
+            lambda: fns["expand_link_adjuntos_columns"](df),
+        ),
+    ]
+    print(f"filas={rows}")
+    for nombre, legacy_fn, nuevo_fn in casos:
+        t_legacy = timeit(legacy_fn, repeat=1)
+        t_nuevo = timeit(nuevo_fn, repeat=3)
+        print(f"{nombre:<34} anterior={t_legacy:8.3f}s  vectorizado={t_nuevo:8.3f}s  x{t_legacy / t_nuevo:6.1f}")
+
+
+if __name__ == "__main__":
+    main()
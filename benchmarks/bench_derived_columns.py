@@ -0,0 +1,282 @@
+"""Paridad y tiempos de las columnas derivadas vectorizadas de ambas apps.
+
+Cada regla se compara contra la versión fila por fila anterior
+(``DataFrame.apply(..., axis=1)``), que se conserva abajo; las versiones
+vectorizadas se cargan y llaman directamente de cada app. Uso:
+
+    python benchmarks/bench_derived_columns.py [filas]
+"""
+
+import random
+import sys
+from typing import Optional
+
+import pandas as pd
+
+from _app_loader import load_functions, timeit
+from generators import CLIENTES_BASE, ESTADOS, TIPOS_ENVIO, TURNOS
+
+v = load_functions(
+    "app_v.py",
+    [
+        "UBER_TIPO_ENVIO",
+        "UBER_TURNO_CLIENTE",
+        "UBER_TURNO_TD",
+        "UBER_TURNO_OPTIONS",
+        "normalizar",
+        "normalizar_folio",
+        "_tokenizar_nombre_busqueda",
+        "coincide_nombre_cliente_busqueda",
+        "parse_sheet_row_number",
+        "is_devolucion_case_row",
+        "es_pedido_cdmx_modificable",
+        "_columna_texto",
+        "_columna_str",
+        "_columna_serie",
+        "_aplicar_por_valor",
+        "_normalizar_por_valor",
+        "es_devolucion_mask",
+        "es_pedido_cdmx_modificable_mask",
+        "filtro_envio_combinado",
+        "inferir_tipo_envio_casos",
+        "etiqueta_pedido_series",
+        "opciones_pedido_series",
+        "etiqueta_no_entregado_series",
+        "coincide_caso_especial_mask",
+    ],
+    {"Optional": Optional},
+)
+a = load_functions(
+    "app_admin.py",
+    [
+        "TIPOS_ENVIO_LOCAL",
+        "es_local",
+        "has_text_value",
+        "is_nota_venta_pedido",
+        "is_venta_terceros_pedido",
+        "is_devolucion_case_row",
+        "_columna_texto",
+        "_columna_str",
+        "has_text_value_series",
+        "nota_venta_mask",
+        "venta_terceros_mask",
+        "es_devolucion_mask",
+        "turno_local_display",
+        "etiqueta_pendiente_series",
+        "link_dictamen_o_nota",
+    ],
+)
+FUENTE_DEFAULT = "data_pedidos"
+
+
+# --- Implementaciones previas (fila por fila) ----------------------------------
+
+def legacy_infer_tipo_envio(df):
+    def _infer_tipo_envio(row):
+        t_env = str(row.get("Tipo_Envio", "")).strip()
+        if t_env:
+            return t_env
+        t_caso = str(row.get("Tipo_Caso", "")).lower()
+        if t_caso.startswith("devol"):
+            return "🔁 Devolución"
+        if t_caso.startswith("garan"):
+            return "🛠 Garantía"
+        return "Caso especial"
+
+    return df.apply(_infer_tipo_envio, axis=1)
+
+
+def legacy_filtro_envio(df):
+    return df.apply(
+        lambda row: row['Turno'] if (str(row.get('Tipo_Envio', "")) == "📍 Pedido Local" and pd.notna(row.get('Turno')) and str(row.get('Turno')).strip()) else row.get('Tipo_Envio', ''),
+        axis=1
+    )
+
+
+def legacy_label_y_opciones(df, fuente_default, marcar_ce):
+    def _s(x):
+        return "" if pd.isna(x) else str(x)
+
+    etiquetas = df.apply(
+        lambda row: (
+            f"📄 {(_s(row['Folio_Factura']) or 'Sin Folio')}"
+            f" - {_s(row['Cliente'])}"
+            f" - {_s(row['Estado'])}"
+            f" - {_s(row['Tipo_Envio'])}"
+            + (f" {'[CE]' if row.get('Fuente', '') == 'casos_especiales' else ''}" if marcar_ce else "")
+        ),
+        axis=1,
+    )
+    base = df.apply(
+        lambda row: (
+            f"{row.get('Fuente', fuente_default)}|"
+            f"{_s(row.get('ID_Pedido', '')) or 'sin_id'}|"
+            f"{v['parse_sheet_row_number'](row.get('Sheet_Row_Number')) or 'sin_fila'}"
+        ),
+        axis=1,
+    )
+    opciones = base.copy()
+    duplicados = opciones.duplicated(keep=False)
+    if duplicados.any():
+        opciones.loc[duplicados] = df.loc[duplicados].apply(lambda row: f"{base[row.name]}|{row.name}", axis=1)
+    return etiquetas, opciones
+
+
+def legacy_no_entregado(df):
+    return df.apply(
+        lambda row: " - ".join(
+            [
+                (
+                    str(row.get("Folio_Factura", "")).strip()
+                    or str(row.get("ID_Pedido", "")).strip()
+                    or "Sin folio"
+                ),
+                str(row.get("Cliente", "")).strip() or "Sin Cliente",
+                str(row.get("Tipo_Envio", "")).strip() or "Sin Tipo",
+            ]
+        ),
+        axis=1,
+    )
+
+
+def legacy_coincide_caso(df, busqueda):
+    keyword_cliente = v["normalizar"](busqueda.strip())
+    keyword_folio = v["normalizar_folio"](busqueda.strip())
+    normalizar_folio = v["normalizar_folio"]
+
+    def _coincide(row):
+        nombre = str(row.get("Cliente", "") or "").strip()
+        folio_norm = normalizar_folio(str(row.get("Folio_Factura", "") or "").strip())
+        folio_error_norm = normalizar_folio(str(row.get("Folio_Factura_Error", "") or "").strip())
+        coincide_cliente = v["coincide_nombre_cliente_busqueda"](nombre, keyword_cliente)
+        coincide_folio = bool(keyword_folio) and (
+            keyword_folio in folio_norm
+            or keyword_folio in folio_error_norm
+            or folio_norm in keyword_folio
+            or folio_error_norm in keyword_folio
+        )
+        return bool(coincide_cliente or coincide_folio)
+
+    return df.apply(_coincide, axis=1)
+
+
+def legacy_turno_display(df):
+    def _format_turno_display(row):
+        tipo_envio = str(row.get("Tipo_Envio", "")).strip()
+        if not a["es_local"](tipo_envio):
+            return ""
+        turno_raw = str(row.get("Turno", "") or "").strip()
+        if not turno_raw or turno_raw.lower() in {"nan", "none"}:
+            return ""
+        return turno_raw
+
+    return df.apply(_format_turno_display, axis=1)
+
+
+def legacy_etiqueta_pendiente(df):
+    return df.apply(
+        lambda row: (
+            f"📄 {row.get('Folio_Factura', 'N/A')} - "
+            f"👤 {row.get('Cliente', 'N/A')} - "
+            f"{row.get('Estado', 'N/A')} - "
+            f"{row.get('Tipo_Envio', 'N/A')}"
+            + (" - 🧾 Nota de venta" if a["is_nota_venta_pedido"](row) else "")
+        ),
+        axis=1,
+    )
+
+
+def legacy_link_dictamen(df):
+    return df.apply(
+        lambda r: (str(r.get("Dictamen_Garantia_URL", "")).strip() or str(r.get("Nota_Credito_URL", "")).strip()),
+        axis=1,
+    )
+
+
+# --- Datos sintéticos ----------------------------------------------------------
+
+def build_frame(rows: int, seed: int = 23) -> pd.DataFrame:
+    rng = random.Random(seed)
+
+    def _maybe(value, vacio=0.15):
+        roll = rng.random()
+        if roll < vacio:
+            return ""
+        if roll < vacio + 0.03:
+            return None
+        if roll < vacio + 0.05:
+            return "nan"
+        return value
+
+    tipos = TIPOS_ENVIO + ["🚗 Uber", "📍 Local CDMX", " 📍 Pedido Local "]
+    turnos = TURNOS + ["👤 Cliente Uber", "🏢 TD Uber", "  "]
+    filas = []
+    for i in range(rows):
+        filas.append(
+            {
+                "ID_Pedido": _maybe(f"PED-{i // 3:06d}", 0.05),
+                "Folio_Factura": _maybe(f"F{rng.randint(1000, 99999)}"),
+                "Folio_Factura_Error": _maybe(f"F{rng.randint(1000, 99999)}", 0.8),
+                "Cliente": _maybe(rng.choice(CLIENTES_BASE), 0.05),
+                "Estado": rng.choice(ESTADOS),
+                "Tipo_Envio": _maybe(rng.choice(tipos), 0.1),
+                "Tipo_Caso": _maybe(rng.choice(["Devolución", "Garantía", "devolucion parcial", "Otro"]), 0.3),
+                "Turno": _maybe(rng.choice(turnos), 0.2),
+                "Fuente": rng.choice([FUENTE_DEFAULT, "casos_especiales", "datos_pedidos"]),
+                "Sheet_Row_Number": _maybe(str(rng.randint(2, rows // 2 + 3)), 0.05),
+                "Motivo_NotaVenta": _maybe("Cliente sin RFC", 0.7),
+                "Tipo_Venta": _maybe(rng.choice(["Venta terceros", " venta TERCEROS ", "Directa"]), 0.4),
+                "Dictamen_Garantia_URL": _maybe(f"https://s3/dictamen/{i}.pdf", 0.6),
+                "Nota_Credito_URL": _maybe(f"https://s3/nota/{i}.pdf", 0.5),
+            }
+        )
+    return pd.DataFrame(filas)
+
+
+def main() -> None:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    df = build_frame(rows)
+
+    casos = [
+        ("is_devolucion (app_v)", lambda: df.apply(v["is_devolucion_case_row"], axis=1),
+         lambda: v["es_devolucion_mask"](df)),
+        ("is_devolucion (admin)", lambda: df.apply(a["is_devolucion_case_row"], axis=1),
+         lambda: a["es_devolucion_mask"](df)),
+        ("es_pedido_cdmx_modificable", lambda: df.apply(v["es_pedido_cdmx_modificable"], axis=1),
+         lambda: v["es_pedido_cdmx_modificable_mask"](df)),
+        ("Filtro_Envio_Combinado", lambda: legacy_filtro_envio(df), lambda: v["filtro_envio_combinado"](df)),
+        ("_infer_tipo_envio", lambda: legacy_infer_tipo_envio(df), lambda: v["inferir_tipo_envio_casos"](df)),
+        ("display_label/option_value tab2", lambda: legacy_label_y_opciones(df, FUENTE_DEFAULT, True),
+         lambda: (
+             v["etiqueta_pedido_series"](df, marcar_casos_especiales=True),
+             v["opciones_pedido_series"](df, v["_columna_str"](df, "Fuente", FUENTE_DEFAULT),
+                                         v["_columna_texto"](df, "ID_Pedido")),
+         )),
+        ("display no entregados", lambda: legacy_no_entregado(df),
+         lambda: v["etiqueta_no_entregado_series"](df)),
+        ("_coincide_caso_especial", lambda: legacy_coincide_caso(df, "denisse F12"),
+         lambda: v["coincide_caso_especial_mask"](df, "denisse F12")),
+        ("nota venta & terceros (radar)",
+         lambda: df.apply(lambda row: a["is_nota_venta_pedido"](row) and a["is_venta_terceros_pedido"](row), axis=1),
+         lambda: a["nota_venta_mask"](df) & a["venta_terceros_mask"](df)),
+        ("_format_turno_display", lambda: legacy_turno_display(df), lambda: a["turno_local_display"](df)),
+        ("display_label pendientes", lambda: legacy_etiqueta_pendiente(df), lambda: a["etiqueta_pendiente_series"](df)),
+        ("Link_Dictamen_o_Nota", lambda: legacy_link_dictamen(df),
+         lambda: a["link_dictamen_o_nota"](df)),
+    ]
+
+    print(f"filas={rows}")
+    for nombre, legacy_fn, nuevo_fn in casos:
+        viejo, nuevo = legacy_fn(), nuevo_fn()
+        for esperado, obtenido in zip(viejo if isinstance(viejo, tuple) else (viejo,),
+                                      nuevo if isinstance(nuevo, tuple) else (nuevo,)):
+            pd.testing.assert_series_equal(
+                obtenido.astype(object), esperado.astype(object), check_names=False, obj=nombre
+            )
+        t_legacy = timeit(legacy_fn, repeat=1)
+        t_nuevo = timeit(nuevo_fn, repeat=3)
+        print(f"{nombre:<34} anterior={t_legacy:8.3f}s  vectorizado={t_nuevo:8.3f}s  x{t_legacy / t_nuevo:6.1f}")
+
+
+if __name__ == "__main__":
+    main()
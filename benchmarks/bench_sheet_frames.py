@@ -0,0 +1,184 @@
+"""Paridad y tiempos del convertidor compartido ``sheet_values_to_frame``.
+
+Compara el convertidor (``app_comun.py``) contra las conversiones hoja →
+DataFrame escritas a mano que reemplaza: lazo por fila con padding y filtro de
+filas vacías (admin), un dict por fila (``load_sheet_records_with_row_numbers``
+y los fallbacks por encabezados repetidos) y el DataFrame con ``apply`` para
+descartar vacías (casos especiales). Los datos incluyen filas irregulares, en
+blanco y con solo espacios, y un encabezado repetido. Uso:
+
+    python benchmarks/bench_sheet_frames.py [filas]
+"""
+
+import random
+import sys
+
+import pandas as pd
+
+from _app_loader import load_functions, timeit
+from generators import generar_casos_especiales, generar_pedidos
+
+sheet_values_to_frame = load_functions("app_comun.py", ["sheet_values_to_frame"])["sheet_values_to_frame"]
+
+
+def ensuciar(valores: list[list[str]], *, seed: int = 3) -> list[list[str]]:
+    """Recorta, alarga y vacía filas como llegan de una hoja editada a mano."""
+    rng = random.Random(seed)
+    ancho = len(valores[0])
+    salida = [list(valores[0])]
+    for fila in valores[1:]:
+        r = rng.random()
+        if r < 0.02:
+            fila = [""] * ancho
+        elif r < 0.03:
+            fila = ["  "] + [""] * (ancho - 1)
+        elif r < 0.08:
+            fila = fila[: rng.randint(1, ancho - 1)]
+        elif r < 0.10:
+            fila = fila + ["extra"]
+        salida.append(fila)
+    return salida
+
+
+def con_encabezado_repetido(valores: list[list[str]]) -> list[list[str]]:
+    encabezados = list(valores[0])
+    encabezados[-1] = encabezados[0]
+    encabezados[-2] = ""
+    return [encabezados] + valores[1:]
+
+
+# --- Conversiones anteriores (copiadas de las apps antes del cambio) ---
+
+def legacy_admin_pedidos(raw_values):
+    headers = ["" if h is None else str(h) for h in raw_values[0]]
+    num_cols = len(headers)
+    rows = []
+    sheet_rows = []
+    for sheet_row_number, raw_row in enumerate(raw_values[1:], start=2):
+        row = list(raw_row[:num_cols])
+        if len(row) < num_cols:
+            row.extend([""] * (num_cols - len(row)))
+        row = ["" if cell is None else cell for cell in row]
+        if all(str(cell).strip() == "" for cell in row):
+            continue
+        rows.append(row)
+        sheet_rows.append(sheet_row_number)
+    df = pd.DataFrame(rows, columns=headers) if rows else pd.DataFrame(columns=headers)
+    if not df.empty:
+        df["__sheet_row"] = sheet_rows
+    return df
+
+
+def nuevo_admin_pedidos(raw_values):
+    df, sheet_rows, _ = sheet_values_to_frame(
+        raw_values, sufijo_duplicados=None, descartar_vacias=True, limpiar_encabezados=False
+    )
+    if not df.empty:
+        df["__sheet_row"] = sheet_rows
+    return df
+
+
+def legacy_records_with_row_numbers(all_values):
+    headers = [str(h).strip() for h in all_values[0]]
+    max_columns = len(headers)
+    records = []
+    row_numbers = []
+    for row_index, row_values in enumerate(all_values[1:], start=2):
+        normalized_row = list(row_values[:max_columns])
+        if len(normalized_row) < max_columns:
+            normalized_row.extend([""] * (max_columns - len(normalized_row)))
+        if not any(str(cell).strip() for cell in normalized_row):
+            continue
+        records.append({
+            headers[col_idx]: normalized_row[col_idx] if col_idx < len(normalized_row) else ""
+            for col_idx in range(max_columns)
+        })
+        row_numbers.append(row_index)
+    df_records = pd.DataFrame(records)
+    if df_records.empty:
+        return df_records
+    df_records.insert(0, "Sheet_Row_Number", row_numbers)
+    return df_records
+
+
+def nuevo_records_with_row_numbers(all_values):
+    df_records, row_numbers, _ = sheet_values_to_frame(all_values, sufijo_duplicados=None, descartar_vacias=True)
+    if df_records.empty:
+        return pd.DataFrame()
+    if df_records.columns.duplicated().any():
+        orden = list(dict.fromkeys(df_records.columns))
+        df_records = df_records.loc[:, ~df_records.columns.duplicated(keep="last")][orden]
+    df_records.insert(0, "Sheet_Row_Number", row_numbers)
+    return df_records
+
+
+def legacy_registros_dedup(valores):
+    headers = []
+    conteo_headers = {}
+    for idx, raw_header in enumerate(valores[0], start=1):
+        base = str(raw_header).strip() or f"col_{idx}"
+        repeticiones = conteo_headers.get(base, 0)
+        conteo_headers[base] = repeticiones + 1
+        if repeticiones:
+            base = f"{base}_{repeticiones + 1}"
+        headers.append(base)
+    registros = []
+    for fila in valores[1:]:
+        fila_normalizada = list(fila) + [""] * max(0, len(headers) - len(fila))
+        registros.append(dict(zip(headers, fila_normalizada)))
+    return pd.DataFrame(registros)
+
+
+def legacy_casos_base(values):
+    headers = [str(h).strip() for h in values[0]]
+    columnas = []
+    conteo = {}
+    for idx, header in enumerate(headers, start=1):
+        base = header or f"col_{idx}"
+        repeticiones = conteo.get(base, 0)
+        conteo[base] = repeticiones + 1
+        columnas.append(base if repeticiones == 0 else f"{base}_{repeticiones + 1}")
+    ancho = len(columnas)
+    filas = [list(fila[:ancho]) + [""] * (ancho - len(fila)) for fila in values[1:]]
+    df = pd.DataFrame(filas, columns=columnas, dtype=object)
+    df.insert(0, "Sheet_Row_Number", range(2, len(filas) + 2))
+    no_vacias = df[columnas].apply(lambda col: col.astype(str).str.strip().ne("")).any(axis=1)
+    return df[no_vacias].reset_index(drop=True)
+
+
+def nuevo_casos_base(values):
+    df, filas, _ = sheet_values_to_frame(values, descartar_vacias=True)
+    df.insert(0, "Sheet_Row_Number", filas)
+    return df
+
+
+def main() -> None:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    pedidos = ensuciar(generar_pedidos(rows))
+    pedidos_dup = con_encabezado_repetido(pedidos)
+    casos = con_encabezado_repetido(ensuciar(generar_casos_especiales(max(rows // 5, 1))))
+
+    pruebas = [
+        ("admin cargar_pedidos", pedidos, legacy_admin_pedidos, nuevo_admin_pedidos),
+        ("admin cargar_pedidos (repetidos)", pedidos_dup, legacy_admin_pedidos, nuevo_admin_pedidos),
+        ("load_sheet_records_with_row_numbers", pedidos, legacy_records_with_row_numbers,
+         nuevo_records_with_row_numbers),
+        ("load_sheet_records (repetidos)", pedidos_dup, legacy_records_with_row_numbers,
+         nuevo_records_with_row_numbers),
+        ("fallback encabezados repetidos", pedidos_dup, legacy_registros_dedup, lambda x: sheet_values_to_frame(x)[0]),
+        ("get_casos_especiales_base", casos, legacy_casos_base, nuevo_casos_base),
+    ]
+
+    print(f"filas={rows}")
+    for nombre, datos, legacy_fn, nuevo_fn in pruebas:
+        esperado, obtenido = legacy_fn(datos), nuevo_fn(datos)
+        pd.testing.assert_frame_equal(
+            obtenido.astype(object), esperado.astype(object), check_index_type=False, obj=nombre
+        )
+        t_legacy = timeit(legacy_fn, datos, repeat=1)
+        t_nuevo = timeit(nuevo_fn, datos, repeat=3)
+        print(f"{nombre:<38} anterior={t_legacy:7.3f}s  nuevo={t_nuevo:7.3f}s  x{t_legacy / t_nuevo:5.1f}")
+
+
+if __name__ == "__main__":
+    main()
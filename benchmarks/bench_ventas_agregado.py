@@ -0,0 +1,176 @@
+"""Paridad y tiempos del agregado diario de "📊 Ventas y Reportes".
+
+Compara los totales del resumen del Excel (venta total, cursos, por vendedor y
+por forma de pago) y los "TOTAL VENDIDO" de cada hoja de sección calculados con
+``.apply(_norm_texto)`` y sumas booleanas sobre las filas (versión anterior)
+contra los leídos del agregado diario, para "Todos" y cada mes. También
+verifica que la actualización incremental (solo filas nuevas al final) da el
+mismo agregado que reconstruirlo completo. Uso:
+
+    python benchmarks/bench_ventas_agregado.py [filas]
+"""
+
+import hashlib
+import math
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+from _app_loader import load_functions, timeit
+from generators import generar_pedidos
+
+_state = {}
+
+
+def _get_state() -> dict:
+    if not _state:
+        _state.update(lock=threading.Lock(), huellas=np.empty(0, dtype=np.uint64), agregado=None, version="")
+    return _state
+
+
+fns = load_functions(
+    "app_v.py",
+    [
+        "normalizar",
+        "_aplicar_por_valor",
+        "_normalizar_por_valor",
+        "VENTAS_REPORTE_COLUMNAS",
+        "VENTAS_AGREGADO_DIMENSIONES",
+        "VENTAS_FECHA_COL",
+        "VENTAS_HUELLA_COL",
+        "_ventas_texto",
+        "ventas_montos",
+        "huellas_ventas",
+        "agregar_ventas_diarias",
+        "actualizar_agregado_ventas",
+        "filtrar_agregado_ventas",
+    ],
+    extra_globals={"hashlib": hashlib, "get_ventas_agregado_state": _get_state},
+)
+normalizar = fns["normalizar"]
+_normalizar_por_valor = fns["_normalizar_por_valor"]
+huellas_ventas = fns["huellas_ventas"]
+agregar_ventas_diarias = fns["agregar_ventas_diarias"]
+actualizar_agregado_ventas = fns["actualizar_agregado_ventas"]
+filtrar_agregado_ventas = fns["filtrar_agregado_ventas"]
+DIMENSIONES = fns["VENTAS_AGREGADO_DIMENSIONES"]
+FECHA_COL = fns["VENTAS_FECHA_COL"]
+HUELLA_COL = fns["VENTAS_HUELLA_COL"]
+
+FORMAS_PAGO = ["Transferencia", "Tarjeta de Crédito", "Tarjeta de Débito", "Depósito en Efectivo",
+               "Efectivo", "Link de Pago"]
+
+
+def _norm_texto(valor) -> str:
+    return normalizar(str(valor)).strip().lower()
+
+
+def preparar(valores: list[list[str]]) -> pd.DataFrame:
+    """Como ``cargar_pedidos_ventas_reportes``: columnas precalculadas por snapshot."""
+    frame = pd.DataFrame(valores[1:], columns=valores[0])
+    frame["Comprobante_Confirmado"] = ""
+    frame[FECHA_COL] = pd.to_datetime(frame["Hora_Registro"], errors="coerce")
+    frame[HUELLA_COL] = huellas_ventas(frame)
+    return frame
+
+
+def legacy_totales(df_ventas: pd.DataFrame) -> dict:
+    """Cálculo anterior dentro de ``_build_ventas_excel`` (por fila, con ``apply``)."""
+    montos = pd.to_numeric(
+        df_ventas["Monto_Comprobante"].astype(str).str.replace(",", "", regex=False), errors="coerce"
+    ).fillna(0.0)
+    tipo_envio_norm = df_ventas["Tipo_Envio"].astype(str).apply(_norm_texto)
+    forma_pago_norm = df_ventas["Forma_Pago_Comprobante"].astype(str).apply(_norm_texto)
+    vendedor_col = df_ventas["Vendedor_Registro"].astype(str)
+    vendedor_norm = vendedor_col.apply(_norm_texto)
+
+    totales = {
+        "total": float(montos.sum()),
+        "cursos": float(montos[tipo_envio_norm.eq(_norm_texto("🎓 Cursos y Eventos"))].sum()),
+        "juan": float(montos[vendedor_norm.str.startswith(_norm_texto("JUAN"))].sum()),
+        "cursos_seccion": float(montos[tipo_envio_norm.str.contains(_norm_texto("Cursos y Eventos"))].sum()),
+    }
+    vendedores = vendedor_col[vendedor_norm.ne("")].drop_duplicates().sort_values(key=lambda s: s.str.lower())
+    for vendedor in vendedores:
+        totales[f"v:{vendedor}"] = float(montos[vendedor_norm.eq(_norm_texto(vendedor))].sum())
+    for forma in FORMAS_PAGO:
+        totales[f"f:{forma}"] = float(montos[forma_pago_norm.eq(_norm_texto(forma))].sum())
+    return totales
+
+
+def nuevos_totales(agregado_mes: pd.DataFrame) -> dict:
+    """Los mismos totales leídos del agregado diario."""
+    montos = agregado_mes["monto"]
+    normas = {col: _normalizar_por_valor(agregado_mes[col]) for col in DIMENSIONES}
+    vendedor_norm = normas["Vendedor_Registro"]
+    totales = {
+        "total": float(montos.sum()),
+        "cursos": float(montos[normas["Tipo_Envio"].eq(_norm_texto("🎓 Cursos y Eventos"))].sum()),
+        "juan": float(montos[vendedor_norm.str.startswith(_norm_texto("JUAN"))].sum()),
+        "cursos_seccion": float(montos[normas["Tipo_Envio"].str.contains(_norm_texto("Cursos y Eventos"))].sum()),
+    }
+    por_vendedor = montos.groupby(vendedor_norm).sum()
+    vendedores = (
+        agregado_mes["Vendedor_Registro"][vendedor_norm.ne("")]
+        .drop_duplicates()
+        .sort_values(key=lambda s: s.str.lower())
+    )
+    for vendedor in vendedores:
+        totales[f"v:{vendedor}"] = float(por_vendedor.get(_norm_texto(vendedor), 0.0))
+    for forma in FORMAS_PAGO:
+        totales[f"f:{forma}"] = float(montos[normas["Forma_Pago_Comprobante"].eq(_norm_texto(forma))].sum())
+    return totales
+
+
+def comparar(esperado: dict, obtenido: dict, contexto: str) -> None:
+    assert list(esperado) == list(obtenido), f"{contexto}: etiquetas distintas"
+    for clave, valor in esperado.items():
+        assert math.isclose(valor, obtenido[clave], rel_tol=1e-9, abs_tol=1e-6), (contexto, clave, valor, obtenido[clave])
+
+
+def main() -> None:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    valores = generar_pedidos(rows)
+    # Algunos montos con separador de miles, como los captura el equipo.
+    for i, fila in enumerate(valores[1:], start=1):
+        monto = fila[17]
+        if monto and i % 13 == 0:
+            fila[17] = f"{float(monto):,.2f}"
+    df = preparar(valores)
+    meses = df[FECHA_COL].dt.to_period("M").astype("string")
+
+    agregado, _ = actualizar_agregado_ventas(df)
+    print(f"filas={rows} renglones_agregado={len(agregado)}")
+    for mes in ["Todos", *meses.dropna().unique().tolist()]:
+        filas_mes = df if mes == "Todos" else df[meses == mes]
+        comparar(legacy_totales(filas_mes), nuevos_totales(filtrar_agregado_ventas(agregado, mes)), mes)
+
+    # Pedidos nuevos al final: solo se suman las filas nuevas.
+    corte = int(len(df) * 0.98)
+    _state.clear()
+    actualizar_agregado_ventas(df.iloc[:corte])
+    incremental, _ = actualizar_agregado_ventas(df)
+    completo = agregar_ventas_diarias(df)
+    claves = ["fecha", *DIMENSIONES]
+    pd.testing.assert_frame_equal(
+        incremental.sort_values(claves).reset_index(drop=True),
+        completo.sort_values(claves).reset_index(drop=True),
+        check_exact=False,
+    )
+
+    t_legacy = timeit(legacy_totales, df, repeat=1)
+    t_nuevo = timeit(lambda: nuevos_totales(filtrar_agregado_ventas(actualizar_agregado_ventas(df)[0], "Todos")))
+    t_completo = timeit(agregar_ventas_diarias, df, repeat=1)
+
+    _state.clear()
+    actualizar_agregado_ventas(df.iloc[:corte])
+    t_incremental = timeit(actualizar_agregado_ventas, df, repeat=1)
+    print(f"resumen por rerun      anterior={t_legacy:7.3f}s  agregado={t_nuevo:7.3f}s  x{t_legacy / t_nuevo:5.1f}")
+    print(f"agregado completo      {t_completo:7.3f}s")
+    print(f"agregado incremental   {t_incremental:7.3f}s  ({len(df) - corte} filas nuevas)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""Regresión del parche en memoria de ``df_pedidos`` tras confirmar comprobantes.
+
+``cargar_pedidos_desde_google_sheet`` descarta filas en blanco y filas sin ID ni
+folio, así que el índice del DataFrame no es ``fila de hoja - 2``. Se carga la
+hoja real (con huecos) por el loader de la app, se confirma un pedido que queda
+después de los huecos y se verifica que la celda parcheada sea la de ese pedido
+y que ninguna otra fila cambie; igual para la confirmación masiva
+(``bulk_confirm_comprobantes``), que escribe en la hoja y parchea varias filas
+y deja fuera los pedidos a crédito o sin pago. Uso:
+
+    python benchmarks/check_write_through.py
+"""
+
+import hashlib
+import json
+import sys
+import threading
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from _app_loader import load_functions
+from fakes import FakeGspreadClient, gspread_stub, rowcol_to_a1
+from generators import PEDIDOS_HEADERS
+
+SHEET_ID = "check-sheet"
+
+
+class FakeStreamlit:
+    """``st`` mínimo: ``session_state`` real y llamadas de UI sin efecto."""
+
+    def __init__(self):
+        self.session_state = {}
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+def _fila(pedido_id: str, folio: str, cliente: str, estado_pago: str = "✅ Pagado") -> list[str]:
+    fila = [""] * len(PEDIDOS_HEADERS)
+    fila[PEDIDOS_HEADERS.index("ID_Pedido")] = pedido_id
+    fila[PEDIDOS_HEADERS.index("Folio_Factura")] = folio
+    fila[PEDIDOS_HEADERS.index("Cliente")] = cliente
+    fila[PEDIDOS_HEADERS.index("Estado_Pago")] = estado_pago
+    return fila
+
+
+def hoja_con_huecos() -> list[list[str]]:
+    """Fila 3 en blanco y fila 5 sin ID ni folio: el loader descarta ambas."""
+    sin_claves = [""] * len(PEDIDOS_HEADERS)
+    sin_claves[PEDIDOS_HEADERS.index("Cliente")] = "Sin claves"
+    return [
+        list(PEDIDOS_HEADERS),
+        _fila("P1", "F1", "Cliente 1", "💳 CREDITO"),  # fila 2
+        [""] * len(PEDIDOS_HEADERS),      # fila 3
+        _fila("P2", "F2", "Cliente 2"),   # fila 4
+        sin_claves,                       # fila 5
+        _fila("P3", "F3", "Cliente 3"),   # fila 6
+        _fila("P4", "F4", "Cliente 4"),   # fila 7
+    ]
+
+
+PENDIENTES_FUNCIONES = [
+    "PENDIENTES_INDEX_KEY", "pedido_cancelado_mask", "pendientes_mask", "_materializar_pendientes",
+    "refresh_pedidos_pagados_no_confirmados", "load_pedidos_pagados_no_confirmados",
+    "derived_frame_version", "_actualizar_pendientes",
+]
+
+
+def cargar_app(valores: list[list[str]], con_pendientes: bool = False) -> tuple[dict, FakeGspreadClient, list]:
+    """Funciones reales de la app; ``con_pendientes`` usa el conjunto de pendientes real en vez del registro."""
+    gsheets = FakeGspreadClient({"datos_pedidos": valores})
+    worksheet = gsheets.worksheet("datos_pedidos")
+    st_fake = FakeStreamlit()
+    registro = {"hojas": {}, "lock": threading.Lock()}
+    almacen = {"entries": OrderedDict(), "bytes": 0, "lock": threading.Lock()}
+    pendientes = []
+    fns: dict = {}
+
+    def resolve_pedido_source_context(pedido):
+        return fns["load_session_frame"]("df_pedidos"), worksheet, list(PEDIDOS_HEADERS), "datos_pedidos"
+
+    fns.update(load_functions(
+        "app_admin.py",
+        [
+            "RETRIABLE_CODES", "TRANSIENT_TEXT_MARKERS", "REFRESH_COOLDOWN", "QUOTA_ERROR_THRESHOLD",
+            "_err_signature", "_is_transient_quota_error", "_register_quota_hit", "safe_open_worksheet",
+            "MOTIVO_RECHAZO_CANCELACION_COL", "PEDIDO_KEY_ID_COL", "PEDIDO_KEY_FOLIO_COL",
+            "PEDIDO_CANCELADO_COL", "PEDIDOS_VERSION_COLUMNS",
+            "normalize_id_pedido", "_normalize_key_series", "normalize_id_pedido_series",
+            "normalize_folio_factura", "normalize_folio_factura_series", "with_pedido_keys",
+            "_motivo_cancelado_mask", "register_sheet_headers", "sheet_values_to_frame",
+            "FRAME_STORE_MAX_BYTES", "FRAME_LEASE_SECONDS", "SHARED_FRAME_PREFIX", "FRAME_VERSION_ATTR",
+            "dataframe_fingerprint", "_frame_session_id", "_shared_value_bytes",
+            "_shared_value_fingerprint", "_evict_shared_frames_locked", "put_shared_frame",
+            "get_shared_frame", "_release_frame_handles", "store_session_frame", "load_session_frame",
+            "cargar_pedidos_desde_google_sheet", "_trim_version_column",
+            "apply_pedidos_write_through", "apply_pedido_write_through",
+            "FECHA_CONFIRMADO_COL", "PEDIDO_KEY_INDEX_MAX", "pedido_id_keys", "pedido_folio_keys",
+            "_positions_by_key", "_pedido_key_token", "pedido_key_index",
+            "build_pedido_row_index", "lookup_pedido_row", "is_estado_pago_no_aplica",
+            "is_estado_pago_confirmable", "bulk_confirm_comprobantes",
+            *(PENDIENTES_FUNCIONES if con_pendientes else []),
+        ],
+        extra_globals={
+            "st": st_fake,
+            "gspread": gspread_stub,
+            "get_spreadsheet": lambda sheet_id: gsheets.spreadsheet,
+            "random": __import__("random"),
+            "time": __import__("time"),
+            "hashlib": hashlib,
+            "json": json,
+            "sys": sys,
+            "uuid": uuid,
+            "get_header_registry": lambda: registro,
+            "get_frame_store": lambda: almacen,
+            "_actualizar_pendientes": lambda hoja, pedidos, valores: pendientes.append((hoja, len(pedidos))),
+            "invalidar_hojas": lambda *hojas: None,
+            "_schedule_pedidos_version_check": lambda *args: None,
+            "rowcol_to_a1": rowcol_to_a1,
+            "obtener_fecha_confirmado_cdmx": lambda: "2025-01-31 10:00:00",
+            "safe_batch_update": lambda ws, data: ws.batch_update(data),
+            "resolve_pedido_source_context": resolve_pedido_source_context,
+            "ensure_sheet_column": lambda ws, headers, col: headers,
+        },
+    ))
+    fns["st"] = st_fake
+    return fns, gsheets, pendientes
+
+
+def snapshot(fns: dict) -> pd.DataFrame:
+    df, _ = fns["cargar_pedidos_desde_google_sheet"](SHEET_ID, "datos_pedidos", 0)
+    fns["store_session_frame"]("df_pedidos", df)
+    return fns["load_session_frame"]("df_pedidos")
+
+
+def verificar(antes: pd.DataFrame, despues: pd.DataFrame, filas_confirmadas: set[int]) -> None:
+    filas = pd.to_numeric(despues["__sheet_row"]).astype(int)
+    confirmado = despues["Comprobante_Confirmado"].eq("Sí").to_numpy()
+    esperado = filas.isin(filas_confirmadas).to_numpy()
+    assert np.array_equal(confirmado, esperado), (
+        f"filas confirmadas {sorted(filas[confirmado])}, esperadas {sorted(filas_confirmadas)}"
+    )
+    cancelado = despues["__cancelado"].to_numpy(dtype=bool)
+    assert not cancelado[~esperado].any(), "__cancelado cambió en una fila no confirmada"
+    otras = [c for c in antes.columns if c not in {"Comprobante_Confirmado", "Motivo_Rechazo/Cancelacion", "__cancelado"}]
+    pd.testing.assert_frame_equal(antes[otras], despues[otras])
+
+
+def main() -> None:
+    fns, gsheets, pendientes = cargar_app(hoja_con_huecos())
+    antes = snapshot(fns)
+    assert antes["__sheet_row"].tolist() == [2, 4, 6, 7], antes["__sheet_row"].tolist()
+    assert antes.index.tolist() == [0, 1, 3, 4]
+
+    # P3 vive en la fila 6; con ``índice + 2`` se parchearía P4 (índice 4) o nada.
+    pedido = antes[antes["ID_Pedido"] == "P3"].iloc[0]
+    fns["apply_pedido_write_through"](
+        pedido, "datos_pedidos", 6,
+        {"Comprobante_Confirmado": "Sí", "Motivo_Rechazo/Cancelacion": ""},
+        None, list(PEDIDOS_HEADERS),
+    )
+    verificar(antes, fns["load_session_frame"]("df_pedidos"), {6})
+    assert pendientes == [("datos_pedidos", 1)]
+    print("ok: confirmación individual después de filas descartadas")
+
+    # Confirmación masiva: P2 (fila 4) y P4 (fila 7) en un solo batch_update; P1 es
+    # crédito y se reporta sin escribirse.
+    seleccion = antes[antes["ID_Pedido"].isin(["P1", "P2", "P4"])]
+    resultados = fns["bulk_confirm_comprobantes"](seleccion)
+    assert [(r["Folio_Factura"], r["Fila"], r["OK"]) for r in resultados] == [
+        ("F1", None, False), ("F2", 4, True), ("F4", 7, True)
+    ], resultados
+    verificar(antes, fns["load_session_frame"]("df_pedidos"), {4, 6, 7})
+    col = PEDIDOS_HEADERS.index("Comprobante_Confirmado")
+    hoja = gsheets.worksheet("datos_pedidos").get_all_values()
+    assert [n for n, fila in enumerate(hoja, start=1) if fila[col:col + 1] == ["Sí"]] == [4, 7]
+    assert pendientes[-1] == ("datos_pedidos", 2)
+    print("ok: confirmación masiva después de filas descartadas")
+
+    # El índice de claves se memoriza por versión del snapshot, no por la vista derivada.
+    df = fns["load_session_frame"]("df_pedidos")
+    indice = fns["pedido_key_index"](df)
+    assert fns["pedido_key_index"](fns["load_session_frame"]("df_pedidos")) is indice
+    vista = df[df["ID_Pedido"] != "P1"]
+    assert fns["pedido_key_index"](vista)["id"]["P2"] == [0]
+    assert fns["pedido_key_index"](df)["id"]["P2"] == [1]
+    print("ok: índice de claves por versión de snapshot")
+
+    # Un rechazo deja el pedido pendiente con nuevo motivo; si el almacén desaloja los
+    # pendientes materializados, se rearman desde el snapshot base ya parchado.
+    fns, _, _ = cargar_app(hoja_con_huecos(), con_pendientes=True)
+    fns["refresh_pedidos_pagados_no_confirmados"](snapshot(fns))
+    pedido = fns["load_session_frame"]("df_pedidos").iloc[2]
+    assert pedido["ID_Pedido"] == "P3"
+    fns["apply_pedido_write_through"](
+        pedido, "datos_pedidos", 6,
+        {"Comprobante_Confirmado": "No", "Motivo_Rechazo/Cancelacion": "Monto incorrecto"},
+        None, list(PEDIDOS_HEADERS),
+    )
+    fns["st"].session_state["pedidos_pagados_no_confirmados"] = "shared-frame:desalojado"
+    pendientes = fns["load_pedidos_pagados_no_confirmados"]()
+    # La hoja sintética no trae la columna de motivo: basta con Comprobante_Confirmado.
+    estados = dict(zip(pendientes["ID_Pedido"], pendientes["Comprobante_Confirmado"]))
+    assert estados == {"P1": "", "P2": "", "P3": "No", "P4": ""}, estados
+    print("ok: pendientes rearmados tras desalojo conservan el parche")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Compara los perfiles de rerun (JSON lines) entre despliegues.
+
+Cada app escribe un registro por rerun perfilado (``?profile=1`` o el secret
+``profile_reruns``) en ``APP_PROFILE_LOG`` o en ``<tmp>/<app>_reruns.jsonl``.
+Este script junta uno o más de esos archivos y muestra p50/p95 por sección y
+despliegue. Uso:
+
+    python benchmarks/compare_profiles.py archivo.jsonl [otro.jsonl ...]
+"""
+
+import json
+import sys
+
+import pandas as pd
+
+
+def load_records(paths: list[str]) -> pd.DataFrame:
+    filas = []
+    for path in paths:
+        with open(path, encoding="utf-8") as fh:
+            for line in fh:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                base = {
+                    "app": record.get("app", ""),
+                    "deployment": record.get("deployment", "") or "(sin id)",
+                    "completed": record.get("completed", True),
+                }
+                filas.append({**base, "section": "TOTAL", "ms": record.get("total_ms", 0.0),
+                              "dataframe_copies": record.get("dataframe_copies", 0)})
+                for section in record.get("sections", []):
+                    filas.append({**base, "section": section["section"], "ms": section["ms"],
+                                  "dataframe_copies": section.get("dataframe_copies", 0)})
+                for detalle in record.get("detalle", []):
+                    filas.append({**base, "section": f"{detalle['section']} › {detalle['name']}",
+                                  "ms": detalle["ms"], "dataframe_copies": detalle.get("dataframe_copies", 0)})
+    return pd.DataFrame(filas)
+
+
+def main() -> None:
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    df = load_records(sys.argv[1:])
+    if df.empty:
+        print("Sin registros.")
+        return
+    resumen = (
+        df.groupby(["app", "section", "deployment"])
+        .agg(
+            reruns=("ms", "size"),
+            p50_ms=("ms", "median"),
+            p95_ms=("ms", lambda s: s.quantile(0.95)),
+            copias_p50=("dataframe_copies", "median"),
+        )
+        .round(1)
+        .reset_index()
+        .sort_values(["app", "p95_ms"], ascending=[True, False])
+    )
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(resumen.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+"""Dobles locales de Google Sheets (gspread) y S3 (boto3) para los benchmarks.
+
+Las hojas viven en memoria como listas de filas (igual que ``get_all_values``)
+y cada llamada puede simular latencia de red e inyectar errores 429. El
+cliente S3 guarda objetos en un dict. Ambos llevan conteo de llamadas y de
+latencia simulada para el reporte.
+"""
+
+import bisect
+import time
+from collections import Counter
+from io import BytesIO
+from types import SimpleNamespace
+
+try:  # Con gspread instalado se lanzan sus excepciones reales.
+    from gspread.exceptions import APIError as _GspreadAPIError
+    from gspread.utils import a1_to_rowcol, rowcol_to_a1
+except ImportError:  # pragma: no cover - entorno sin gspread
+    _GspreadAPIError = None
+    a1_to_rowcol = None
+    rowcol_to_a1 = None
+
+
+class FakeResponse:
+    """Respuesta HTTP mínima compatible con ``gspread.exceptions.APIError``."""
+
+    def __init__(self, status_code: int, message: str):
+        self.status_code = status_code
+        self.text = message
+        self.content = message.encode("utf-8")
+
+    def json(self):
+        return {"error": {"code": self.status_code, "message": self.text, "status": "RESOURCE_EXHAUSTED"}}
+
+
+if _GspreadAPIError is not None:
+    APIError = _GspreadAPIError
+else:
+    class APIError(Exception):
+        """Sustituto de ``gspread.exceptions.APIError`` cuando gspread no está instalado."""
+
+        def __init__(self, response):
+            super().__init__(response.text)
+            self.response = response
+
+
+class GSpreadException(Exception):
+    pass
+
+
+# Espacio de nombres con la forma ``gspread.exceptions.*`` que usan las apps.
+gspread_stub = SimpleNamespace(
+    exceptions=SimpleNamespace(APIError=APIError, GSpreadException=GSpreadException)
+)
+
+
+class CallStats:
+    """Conteo de llamadas, errores inyectados y latencia simulada (segundos)."""
+
+    def __init__(self):
+        self.calls = Counter()
+        self.injected_429 = 0
+        self.simulated_latency = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": dict(self.calls),
+            "injected_429": self.injected_429,
+            "simulated_latency_s": round(self.simulated_latency, 3),
+        }
+
+
+class _Latency:
+    """Latencia por llamada; ``sleep=False`` sólo la contabiliza (benchmarks rápidos)."""
+
+    def __init__(self, stats: CallStats, latency_s: float = 0.0, fail_429_every: int = 0, sleep: bool = False):
+        self.stats = stats
+        self.latency_s = latency_s
+        self.fail_429_every = fail_429_every
+        self.sleep = sleep
+
+    def hit(self, operation: str) -> None:
+        self.stats.calls[operation] += 1
+        if self.latency_s:
+            self.stats.simulated_latency += self.latency_s
+            if self.sleep:
+                time.sleep(self.latency_s)
+        total = sum(self.stats.calls.values())
+        if self.fail_429_every and total % self.fail_429_every == 0:
+            self.stats.injected_429 += 1
+            raise APIError(FakeResponse(429, "Quota exceeded (RESOURCE_EXHAUSTED) [simulado]"))
+
+
+def _rowcol_to_a1(row: int, col: int) -> str:
+    letters = ""
+    while col > 0:
+        col, rem = divmod(col - 1, 26)
+        letters = chr(65 + rem) + letters
+    return f"{letters}{row}"
+
+
+if rowcol_to_a1 is None:
+    rowcol_to_a1 = _rowcol_to_a1
+
+
+def _a1_to_rowcol(label: str) -> tuple[int, int]:
+    if a1_to_rowcol is not None:
+        return a1_to_rowcol(label)
+    letters = "".join(ch for ch in label if ch.isalpha()).upper()
+    digits = "".join(ch for ch in label if ch.isdigit())
+    col = 0
+    for ch in letters:
+        col = col * 26 + (ord(ch) - 64)
+    return int(digits or 1), col
+
+
+class FakeWorksheet:
+    """Hoja en memoria con la API de gspread que usan ``app_admin.py`` y ``app_v.py``."""
+
+    def __init__(self, title: str, values: list[list], latency: _Latency):
+        self.title = title
+        self._values = [list(row) for row in values]
+        self._latency = latency
+        self.row_count = max(len(self._values) + 100, 1000)
+        self.col_count = max((len(r) for r in self._values), default=26)
+
+    # --- lecturas ---
+    def get_all_values(self, *args, **kwargs):
+        self._latency.hit("get_all_values")
+        return [list(row) for row in self._values]
+
+    def get_values(self, range_name=None, *args, **kwargs):
+        self._latency.hit("get_values")
+        return [list(row) for row in self._values]
+
+    def get_all_records(self, *args, **kwargs):
+        self._latency.hit("get_all_records")
+        if not self._values:
+            return []
+        headers = self._values[0]
+        if len(set(headers)) != len(headers):
+            raise GSpreadException("the header row in the worksheet is not unique")
+        width = len(headers)
+        return [
+            dict(zip(headers, list(row[:width]) + [""] * (width - len(row))))
+            for row in self._values[1:]
+        ]
+
+    def batch_get(self, ranges, *args, **kwargs):
+        """Solo rangos de columna completa (``"C:C"``), como los usa la verificación de versión."""
+        self._latency.hit("batch_get")
+        resultado = []
+        for rango in ranges:
+            _, col = _a1_to_rowcol(str(rango).split("!")[-1].split(":")[0] + "1")
+            columna = [[row[col - 1]] if len(row) >= col and row[col - 1] != "" else [] for row in self._values]
+            while columna and not columna[-1]:
+                columna.pop()
+            resultado.append(columna)
+        return resultado
+
+    def row_values(self, row: int, *args, **kwargs):
+        self._latency.hit("row_values")
+        if 1 <= row <= len(self._values):
+            return list(self._values[row - 1])
+        return []
+
+    def col_values(self, col: int, *args, **kwargs):
+        self._latency.hit("col_values")
+        return [row[col - 1] if len(row) >= col else "" for row in self._values]
+
+    # --- escrituras ---
+    def _write(self, row: int, col: int, value) -> None:
+        while len(self._values) < row:
+            self._values.append([])
+        target = self._values[row - 1]
+        while len(target) < col:
+            target.append("")
+        target[col - 1] = "" if value is None else str(value)
+
+    def update(self, range_name, values=None, *args, **kwargs):
+        self._latency.hit("update")
+        if values is None:  # firma gspread 6: update(values, range_name)
+            range_name, values = values, range_name
+        start = str(range_name).split("!")[-1].split(":")[0]
+        row0, col0 = _a1_to_rowcol(start)
+        for r_offset, row_values in enumerate(values or []):
+            for c_offset, value in enumerate(row_values):
+                self._write(row0 + r_offset, col0 + c_offset, value)
+        return {"updatedRange": range_name}
+
+    def update_cell(self, row: int, col: int, value):
+        self._latency.hit("update_cell")
+        self._write(row, col, value)
+
+    def batch_update(self, data, *args, **kwargs):
+        self._latency.hit("batch_update")
+        for item in data:
+            start = str(item["range"]).split("!")[-1].split(":")[0]
+            row0, col0 = _a1_to_rowcol(start)
+            for r_offset, row_values in enumerate(item.get("values") or []):
+                for c_offset, value in enumerate(row_values):
+                    self._write(row0 + r_offset, col0 + c_offset, value)
+        return {"totalUpdatedCells": len(data)}
+
+    def append_row(self, values, *args, **kwargs):
+        self._latency.hit("append_row")
+        self._values.append(["" if v is None else str(v) for v in values])
+
+    def append_rows(self, rows, *args, **kwargs):
+        self._latency.hit("append_rows")
+        self._values.extend(["" if v is None else str(v) for v in row] for row in rows)
+
+    def add_rows(self, rows: int):
+        self._latency.hit("add_rows")
+        self.row_count += int(rows)
+
+    def add_cols(self, cols: int):
+        self._latency.hit("add_cols")
+        self.col_count += int(cols)
+
+    def delete_rows(self, start_index: int, end_index: int | None = None):
+        self._latency.hit("delete_rows")
+        end_index = end_index or start_index
+        del self._values[start_index - 1:end_index]
+
+
+class FakeSpreadsheet:
+    def __init__(self, worksheets: dict[str, FakeWorksheet], latency: _Latency):
+        self._worksheets = worksheets
+        self._latency = latency
+
+    def worksheet(self, name: str) -> FakeWorksheet:
+        self._latency.hit("worksheet")
+        if name not in self._worksheets:
+            raise KeyError(f"WorksheetNotFound: {name}")
+        return self._worksheets[name]
+
+    def worksheets(self):
+        return list(self._worksheets.values())
+
+
+class FakeGspreadClient:
+    """Cliente con ``open_by_key``/``open``; todas las hojas comparten estadísticas."""
+
+    def __init__(self, sheets: dict[str, list[list]], *, latency_s: float = 0.0,
+                 fail_429_every: int = 0, sleep: bool = False):
+        self.stats = CallStats()
+        self._latency = _Latency(self.stats, latency_s, fail_429_every, sleep)
+        worksheets = {name: FakeWorksheet(name, values, self._latency) for name, values in sheets.items()}
+        self.spreadsheet = FakeSpreadsheet(worksheets, self._latency)
+
+    def open_by_key(self, key: str) -> FakeSpreadsheet:
+        self._latency.hit("open_by_key")
+        return self.spreadsheet
+
+    open = open_by_key
+
+    def worksheet(self, name: str) -> FakeWorksheet:
+        return self.spreadsheet._worksheets[name]
+
+
+class FakeS3Client:
+    """Stand-in de S3 en memoria: put/get/list/upload_fileobj/presign."""
+
+    PAGE_SIZE = 1000
+
+    def __init__(self, *, latency_s: float = 0.0, sleep: bool = False):
+        self.stats = CallStats()
+        self._latency = _Latency(self.stats, latency_s, 0, sleep)
+        self.objects: dict[str, bytes] = {}
+        self._sorted_keys: list[str] | None = None
+
+    def _store(self, key: str, data) -> None:
+        self.objects[key] = data.encode("utf-8") if isinstance(data, str) else bytes(data)
+        self._sorted_keys = None
+
+    def put_object(self, Bucket, Key, Body=b"", **kwargs):
+        self._latency.hit("put_object")
+        self._store(Key, Body.read() if hasattr(Body, "read") else Body)
+        return {"ResponseMetadata": {"HTTPStatusCode": 200, "RetryAttempts": 0}}
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, **kwargs):
+        self._latency.hit("upload_fileobj")
+        self._store(Key, Fileobj.read())
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self._latency.hit("get_object")
+        data = self.objects[Key]
+        return {"Body": BytesIO(data), "ContentLength": len(data)}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self._latency.hit("head_object")
+        return {"ContentLength": len(self.objects[Key])}
+
+    def list_objects_v2(self, Bucket, Prefix="", ContinuationToken=None, MaxKeys=None, **kwargs):
+        self._latency.hit("list_objects_v2")
+        if self._sorted_keys is None:
+            self._sorted_keys = sorted(self.objects)
+        page_size = min(int(MaxKeys or self.PAGE_SIZE), self.PAGE_SIZE)
+        start = int(ContinuationToken) if ContinuationToken else bisect.bisect_left(self._sorted_keys, Prefix)
+        page = []
+        for key in self._sorted_keys[start:start + page_size + 1]:
+            if not key.startswith(Prefix):
+                break
+            page.append(key)
+        truncated = len(page) > page_size
+        page = page[:page_size]
+        response = {
+            "Contents": [{"Key": k, "Size": len(self.objects[k])} for k in page],
+            "KeyCount": len(page),
+            "IsTruncated": truncated,
+        }
+        if truncated:
+            response["NextContinuationToken"] = str(start + page_size)
+        if not page:
+            response.pop("Contents")
+        return response
+
+    def generate_presigned_url(self, ClientMethod, Params=None, ExpiresIn=3600, **kwargs):
+        self._latency.hit("generate_presigned_url")
+        params = Params or {}
+        return f"https://{params.get('Bucket', 'bucket')}.s3.local/{params.get('Key', '')}?X-Amz-Expires={ExpiresIn}"
+
+
+class FakeClock:
+    """Reemplazo de ``time`` que no duerme: acumula los ``sleep`` que la app pediría."""
+
+    def __init__(self):
+        self.slept = 0.0
+
+    def sleep(self, seconds: float) -> None:
+        self.slept += float(seconds or 0)
+
+    def __getattr__(self, name):
+        return getattr(time, name)
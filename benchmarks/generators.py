@@ -0,0 +1,242 @@
+"""Generadores sintéticos de las hojas y archivos que usan las apps.
+
+Cada generador regresa ``[headers, *filas]`` como lo devolvería
+``worksheet.get_all_values()`` (todo texto), con una semilla fija para que
+los reportes sean comparables entre corridas.
+"""
+
+import random
+from datetime import datetime, timedelta
+
+CLIENTES_BASE = [
+    "Abarrotes La Esperanza", "Farmacia San Rafael", "Distribuidora del Norte", "Papelería Central",
+    "Ferretería El Martillo", "Consultorio Dental Sonrisas", "Clínica Santa Fe", "Hospital Ángeles Roma",
+    "Laboratorio Médico Polanco", "Óptica Visión Clara", "Denisse Rubí Ramos", "José Luis Hernández",
+    "María Fernanda Gómez", "Comercializadora Tláhuac", "Grupo Médico Cuauhtémoc",
+]
+VENDEDORES = [("ALEJANDRO RODRIGUEZ", "AR01"), ("ANA KAREN ORTEGA", "AK02"), ("CECILIA SEPULVEDA", "CS03"),
+              ("DANIELA LOPEZ", "DL04"), ("GLORIA MICHELLE", "GM05"), ("HECTOR DEL ANGEL", "HA06")]
+TIPOS_ENVIO = ["📍 Pedido Local", "🚚 Pedido Foráneo", "🔁 Devolución", "🛠 Garantía", "🎓 Cursos y Eventos"]
+ESTADOS = ["🟡 Pendiente", "🔵 En Proceso", "🟢 Completado", "🔴 Cancelado"]
+ESTADOS_PAGO = ["🔴 No Pagado", "✅ Pagado", "💳 CREDITO"]
+TURNOS = ["☀️ Local Mañana", "🌙 Local Tarde", "🌆 Local CDMX", "🎓 Recoge en Aula", ""]
+
+PEDIDOS_HEADERS = [
+    "ID_Pedido", "Hora_Registro", "Cliente", "Folio_Factura", "Vendedor_Registro", "id_vendedor",
+    "Tipo_Envio", "Turno", "Fecha_Entrega", "Comentario", "Estado", "Estado_Pago", "Adjuntos",
+    "Adjuntos_Guia", "Hoja_Ruta_Mensajero", "Fecha_Pago_Comprobante", "Forma_Pago_Comprobante",
+    "Monto_Comprobante", "Banco_Destino_Pago", "Terminal", "Referencia_Comprobante",
+    "Comprobante_Confirmado", "Completados_Limpiado", "Modificacion_Surtido", "Adjuntos_Surtido",
+    "Estado_Surtido", "Fecha_Completado", "Numero_Cliente_RFC",
+]
+
+CASOS_HEADERS = [
+    "ID_Pedido", "Hora_Registro", "Vendedor_Registro", "id_vendedor", "Cliente", "Folio_Factura",
+    "Folio_Factura_Error", "Tipo_Envio", "Tipo_Caso", "Fecha_Entrega", "Comentario", "Adjuntos",
+    "Estado", "Estado_Caso", "Resultado_Esperado", "Material_Devuelto", "Monto_Devuelto",
+    "Motivo_Detallado", "Area_Responsable", "Nombre_Responsable", "Hoja_Ruta_Mensajero", "Adjuntos_Guia",
+    "Numero_Cliente_RFC", "Tipo_Envio_Original", "Fecha_Recepcion_Devolucion", "Estado_Recepcion",
+    "Nota_Credito_URL", "Documento_Adicional_URL", "Seguimiento", "Completados_Limpiado", "Turno",
+    "Numero_Serie", "Fecha_Compra",
+]
+
+CONFIRMADOS_HEADERS = [
+    "ID_Pedido", "Folio_Factura", "Cliente", "Vendedor_Registro", "Tipo_Envio", "Fecha_Entrega",
+    "Estado", "Estado_Pago", "Comprobante_Confirmado", "Fecha_Pago_Comprobante", "Monto_Comprobante",
+    "Forma_Pago_Comprobante", "Banco_Destino_Pago", "Referencia_Comprobante", "Link_Comprobante",
+    "Link_Factura", "Link_Refacturacion", "Link_Guia", "Estado_Surtido", "Fecha_Confirmado",
+]
+
+BASE_DATE = datetime(2025, 1, 1, 8, 0, 0)
+
+
+def _cliente(rng: random.Random, i: int) -> str:
+    base = rng.choice(CLIENTES_BASE)
+    return base if rng.random() < 0.7 else f"{base} Sucursal {i % 97}"
+
+
+def _fecha(rng: random.Random, i: int, n: int) -> datetime:
+    return BASE_DATE + timedelta(minutes=int(i * 525600 / max(n, 1)) + rng.randint(0, 59))
+
+
+def _fecha_texto(rng: random.Random, value: datetime) -> str:
+    """Mezcla formatos reales de la hoja: ISO, dd/mm/aaaa y serial de Sheets."""
+    r = rng.random()
+    if r < 0.7:
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if r < 0.9:
+        return value.strftime("%d/%m/%Y %H:%M")
+    return f"{(value - datetime(1899, 12, 30)).total_seconds() / 86400:.5f}"
+
+
+def _adjuntos(rng: random.Random, pedido_id: str, k: int) -> str:
+    return ", ".join(
+        f"https://bucket.s3.us-east-1.amazonaws.com/adjuntos_pedidos/{pedido_id}/archivo_{j}.pdf"
+        for j in range(k)
+    )
+
+
+def generar_pedidos(n: int, *, seed: int = 7, prefijo: str = "P") -> list[list[str]]:
+    """Hoja ``data_pedidos``/``datos_pedidos``."""
+    rng = random.Random(seed)
+    filas = [list(PEDIDOS_HEADERS)]
+    for i in range(n):
+        pedido_id = f"{prefijo}{i:07d}"
+        registro = _fecha(rng, i, n)
+        vendedor, vendedor_id = rng.choice(VENDEDORES)
+        estado_pago = rng.choice(ESTADOS_PAGO)
+        pagado = estado_pago == "✅ Pagado"
+        filas.append([
+            pedido_id,
+            _fecha_texto(rng, registro),
+            _cliente(rng, i),
+            f"F{100000 + i}" if rng.random() < 0.85 else "",
+            vendedor,
+            vendedor_id,
+            rng.choice(TIPOS_ENVIO[:2]) if rng.random() < 0.9 else rng.choice(TIPOS_ENVIO),
+            rng.choice(TURNOS),
+            (registro + timedelta(days=rng.randint(0, 5))).strftime("%Y-%m-%d"),
+            "Entregar en recepción" if rng.random() < 0.2 else "",
+            rng.choice(ESTADOS),
+            estado_pago,
+            _adjuntos(rng, pedido_id, rng.randint(0, 3)),
+            _adjuntos(rng, pedido_id, 1) if rng.random() < 0.3 else "",
+            "",
+            registro.strftime("%Y-%m-%d") if pagado else "",
+            rng.choice(["Transferencia", "Depósito en Efectivo", "Tarjeta de Crédito"]) if pagado else "",
+            f"{rng.uniform(100, 50000):.2f}" if pagado else "",
+            rng.choice(["BANORTE", "BANAMEX", "BBVA", "SANTANDER"]) if pagado else "",
+            "",
+            f"REF{rng.randint(100000, 999999)}" if pagado else "",
+            "Sí" if pagado and rng.random() < 0.6 else "",
+            "sí" if rng.random() < 0.1 else "",
+            "",
+            "",
+            "",
+            "",
+            f"C{rng.randint(1000, 9999)}",
+        ])
+    return filas
+
+
+def generar_casos_especiales(n: int, *, seed: int = 11) -> list[list[str]]:
+    rng = random.Random(seed)
+    filas = [list(CASOS_HEADERS)]
+    for i in range(n):
+        pedido_id = f"CE{i:07d}"
+        registro = _fecha(rng, i, n)
+        vendedor, vendedor_id = rng.choice(VENDEDORES)
+        tipo = rng.choice(["🔁 Devolución", "🛠 Garantía"])
+        filas.append([
+            pedido_id,
+            _fecha_texto(rng, registro),
+            vendedor,
+            vendedor_id,
+            _cliente(rng, i),
+            f"F{200000 + i}" if rng.random() < 0.7 else "",
+            f"F{100000 + i}",
+            tipo,
+            "Devolución" if tipo.startswith("🔁") else "Garantía",
+            registro.strftime("%Y-%m-%d"),
+            "",
+            _adjuntos(rng, pedido_id, rng.randint(0, 4)),
+            rng.choice(ESTADOS),
+            rng.choice(["Aprobado", "Rechazado", ""]),
+            rng.choice(["Nota de crédito", "Cambio de material"]),
+            "Código | Descripción | Cantidad | Monto IVA\nA1 | Guantes | 2 | 116.00",
+            f"{rng.uniform(50, 5000):.2f}",
+            "Producto dañado",
+            rng.choice(["Almacén", "Ventas", "Logística"]),
+            rng.choice(["Luis", "Karla", "Mario"]),
+            _adjuntos(rng, pedido_id, 1) if rng.random() < 0.3 else "",
+            "",
+            f"C{rng.randint(1000, 9999)}",
+            rng.choice(TIPOS_ENVIO[:2]),
+            registro.strftime("%d/%m/%Y") if rng.random() < 0.5 else "",
+            rng.choice(["Todo correcto", "Faltante", ""]),
+            "",
+            "",
+            rng.choice(["Autorización de devolución", "En revisión", "cerrado", ""]),
+            "",
+            rng.choice(TURNOS),
+            f"SN{rng.randint(10000, 99999)}" if tipo.startswith("🛠") else "",
+            registro.strftime("%Y-%m-%d") if tipo.startswith("🛠") else "",
+        ])
+    return filas
+
+
+def generar_pedidos_confirmados(n: int, *, seed: int = 13) -> list[list[str]]:
+    rng = random.Random(seed)
+    filas = [list(CONFIRMADOS_HEADERS)]
+    for i in range(n):
+        pedido_id = f"P{i:07d}"
+        registro = _fecha(rng, i, n)
+        vendedor, _vendedor_id = rng.choice(VENDEDORES)
+        filas.append([
+            pedido_id if rng.random() < 0.97 else f" {pedido_id.lower()} ",
+            f"F{100000 + i}" if rng.random() < 0.9 else "",
+            _cliente(rng, i),
+            vendedor,
+            rng.choice(TIPOS_ENVIO[:2]),
+            registro.strftime("%Y-%m-%d"),
+            rng.choice(ESTADOS),
+            "✅ Pagado",
+            "Sí",
+            registro.strftime("%Y-%m-%d"),
+            f"{rng.uniform(100, 50000):.2f}",
+            "Transferencia",
+            "BANORTE",
+            f"REF{rng.randint(100000, 999999)}",
+            f"https://bucket.s3.us-east-1.amazonaws.com/adjuntos_pedidos/{pedido_id}/comprobante.pdf",
+            f"https://bucket.s3.us-east-1.amazonaws.com/adjuntos_pedidos/{pedido_id}/factura.pdf",
+            "",
+            "",
+            rng.choice(["", "Surtido", "Parcial"]),
+            registro.strftime("%Y-%m-%d %H:%M:%S"),
+        ])
+    return filas
+
+
+def generar_nombres_credito(k: int = 300, *, seed: int = 17) -> list[str]:
+    rng = random.Random(seed)
+    nombres = {f"{rng.choice(CLIENTES_BASE)} Sucursal {i}" for i in range(k)}
+    nombres.update(CLIENTES_BASE[: len(CLIENTES_BASE) // 2])
+    return sorted(nombres)
+
+
+def generar_guia_pdf(pedido_id: str, cliente: str, guia: str) -> bytes:
+    """PDF mínimo (una página, texto plano) con los datos típicos de una guía."""
+    texto = f"Guia {guia} Pedido {pedido_id} Cliente {cliente}".replace("(", "[").replace(")", "]")
+    contenido = f"BT /F1 12 Tf 72 720 Td ({texto}) Tj ET".encode("latin-1", "replace")
+    objetos = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 5 0 R >> >> "
+        b"/Contents 4 0 R >>",
+        b"<< /Length " + str(len(contenido)).encode() + b" >>\nstream\n" + contenido + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    salida = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for idx, objeto in enumerate(objetos, start=1):
+        offsets.append(len(salida))
+        salida += f"{idx} 0 obj\n".encode() + objeto + b"\nendobj\n"
+    xref = len(salida)
+    salida += f"xref\n0 {len(objetos) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        salida += f"{offset:010d} 00000 n \n".encode()
+    salida += f"trailer\n<< /Size {len(objetos) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(salida)
+
+
+def poblar_guias_s3(s3_client, bucket: str, filas_pedidos: list[list[str]], k: int) -> list[str]:
+    """Sube ``k`` guías PDF al stand-in de S3 bajo ``adjuntos_pedidos/<ID>/``."""
+    headers = filas_pedidos[0]
+    idx_id = headers.index("ID_Pedido")
+    idx_cliente = headers.index("Cliente")
+    keys = []
+    for fila in filas_pedidos[1:k + 1]:
+        key = f"adjuntos_pedidos/{fila[idx_id]}/guia_{fila[idx_id]}.pdf"
+        s3_client.put_object(Bucket=bucket, Key=key, Body=generar_guia_pdf(fila[idx_id], fila[idx_cliente], key[-12:-4]))
+        keys.append(key)
+    return keys
@@ -0,0 +1,376 @@
+"""Suite offline de rendimiento contra Sheets/S3 simulados.
+
+Ejecuta las funciones reales de ``app_admin.py`` y ``app_v.py`` (extraídas con
+``_app_loader``) sobre hojas sintéticas en memoria (``fakes.py`` +
+``generators.py``) y escribe un reporte JSON comparable entre corridas. Uso:
+
+    python benchmarks/run_suite.py [--sizes 10000,100000,500000]
+        [--latency 0.05] [--fail-429-every 0]
+        [--scenarios cargar_pedidos,append_row,busqueda,confirmados_sync,credito,guias_pdf]
+        [--output benchmarks/results/suite.json] [--compare anterior.json]
+
+La latencia simulada no se duerme: se suma por llamada y se reporta aparte
+(``sim_latency_s``), igual que los ``time.sleep`` que pedirían las funciones
+de reintento (``app_sleep_s``). Así el tiempo medido es CPU de la app.
+"""
+
+import argparse
+import hashlib
+import json
+import platform
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import nullcontext
+from datetime import datetime
+from difflib import SequenceMatcher
+from pathlib import Path
+
+import pandas as pd
+
+from _app_loader import load_functions
+from fakes import (
+    APIError,
+    FakeClock,
+    FakeGspreadClient,
+    FakeS3Client,
+    GSpreadException,
+    gspread_stub,
+    rowcol_to_a1,
+)
+from generators import (
+    generar_casos_especiales,
+    generar_nombres_credito,
+    generar_pedidos,
+    generar_pedidos_confirmados,
+    poblar_guias_s3,
+)
+
+BUCKET = "bench-bucket"
+SHEET_ID = "bench-sheet"
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+class FakeStreamlit:
+    """``st`` mínimo: ``session_state`` real y llamadas de UI sin efecto."""
+
+    def __init__(self):
+        self.session_state = {}
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+def _frame(values: list[list[str]]) -> pd.DataFrame:
+    return pd.DataFrame(values[1:], columns=values[0])
+
+
+def _medir(nombre: str, filas: int, fn, *, clients=(), clock: FakeClock | None = None, notas: str = "") -> dict:
+    for client in clients:
+        client.stats.calls.clear()
+        client.stats.injected_429 = 0
+        client.stats.simulated_latency = 0.0
+    start = time.perf_counter()
+    error = ""
+    try:
+        detalle = fn()
+    except Exception as exc:  # el reporte registra el fallo y sigue con los demás escenarios
+        detalle = None
+        error = f"{type(exc).__name__}: {exc}"
+    elapsed = time.perf_counter() - start
+    llamadas: dict[str, int] = {}
+    for client in clients:
+        for op, count in client.stats.calls.items():
+            llamadas[op] = llamadas.get(op, 0) + count
+    return {
+        "scenario": nombre,
+        "rows": filas,
+        "seconds": round(elapsed, 4),
+        "calls": llamadas,
+        "sim_latency_s": round(sum(c.stats.simulated_latency for c in clients), 3),
+        "injected_429": sum(c.stats.injected_429 for c in clients),
+        "app_sleep_s": round(clock.slept, 3) if clock else 0.0,
+        "detail": detalle,
+        "error": error,
+        "notes": notas,
+    }
+
+
+# --- Escenarios -------------------------------------------------------------
+
+def escenario_cargar_pedidos(n: int, args) -> dict:
+    gsheets = FakeGspreadClient({"datos_pedidos": generar_pedidos(n)}, latency_s=args.latency,
+                                fail_429_every=args.fail_429_every)
+    clock = FakeClock()
+    st_fake = FakeStreamlit()
+    almacen = {"entries": OrderedDict(), "bytes": 0, "lock": threading.Lock()}
+    registro = {"hojas": {}, "lock": threading.Lock()}
+    fns = load_functions(
+        "app_admin.py",
+        [
+            "RETRIABLE_CODES", "TRANSIENT_TEXT_MARKERS", "REFRESH_COOLDOWN", "QUOTA_ERROR_THRESHOLD",
+            "_err_signature", "_is_transient_quota_error", "_register_quota_hit",
+            "safe_open_worksheet", "normalize_id_pedido", "normalize_folio_factura",
+            "PEDIDO_KEY_ID_COL", "PEDIDO_KEY_FOLIO_COL", "_normalize_key_series",
+            "normalize_id_pedido_series", "normalize_folio_factura_series", "with_pedido_keys",
+            "MOTIVO_RECHAZO_CANCELACION_COL", "PEDIDO_CANCELADO_COL", "_motivo_cancelado_mask",
+            "register_sheet_headers", "sheet_values_to_frame", "FRAME_STORE_MAX_BYTES", "FRAME_LEASE_SECONDS", "SHARED_FRAME_PREFIX", "FRAME_VERSION_ATTR",
+            "dataframe_fingerprint", "_frame_session_id", "_shared_value_bytes",
+            "_shared_value_fingerprint", "_evict_shared_frames_locked", "put_shared_frame",
+            "get_shared_frame", "_release_frame_handles", "store_session_frame",
+            "cargar_pedidos_desde_google_sheet",
+        ],
+        extra_globals={
+            "st": st_fake,
+            "gspread": gspread_stub,
+            "get_spreadsheet": lambda sheet_id: gsheets.spreadsheet,
+            "random": __import__("random"),
+            "time": clock,
+            "hashlib": hashlib,
+            "sys": sys,
+            "uuid": uuid,
+            # Almacén compartido en memoria del proceso (en la app es ``st.cache_resource``).
+            "get_frame_store": lambda: almacen,
+            "get_header_registry": lambda: registro,
+        },
+    )
+
+    def run():
+        df, headers = fns["cargar_pedidos_desde_google_sheet"](SHEET_ID, "datos_pedidos", 0)
+        return {"filas_df": int(len(df)), "columnas": len(headers)}
+
+    return _medir("cargar_pedidos_desde_google_sheet", n, run, clients=[gsheets], clock=clock)
+
+
+def escenario_append_row(n: int, args) -> dict:
+    valores = generar_pedidos(n)
+    gsheets = FakeGspreadClient({"datos_pedidos": valores}, latency_s=args.latency,
+                                fail_429_every=args.fail_429_every)
+    clock = FakeClock()
+    fns = load_functions(
+        "app_v.py",
+        ["append_row_with_confirmation"],
+        extra_globals={"rowcol_to_a1": rowcol_to_a1, "time": clock},
+    )
+    ws = gsheets.worksheet("datos_pedidos")
+    nuevos = generar_pedidos(args.appends, seed=99, prefijo="N")[1:]
+
+    def run():
+        for fila in nuevos:
+            fns["append_row_with_confirmation"](ws, fila, fila[0], 0, base_delay=1.0)
+        return {"appends": len(nuevos)}
+
+    return _medir("append_row_with_confirmation", n, run, clients=[gsheets], clock=clock,
+                  notas=f"{args.appends} altas; cada una relee la hoja completa")
+
+
+def escenario_busqueda(n: int, args) -> dict:
+    pedidos = generar_pedidos(n)
+    gsheets = FakeGspreadClient(
+        {
+            "datos_pedidos": pedidos,
+            "data_pedidos": generar_pedidos(max(n // 10, 1), seed=8, prefijo="D"),
+            "casos_especiales": generar_casos_especiales(max(n // 10, 1)),
+        },
+        latency_s=args.latency,
+        fail_429_every=args.fail_429_every,
+    )
+    s3 = FakeS3Client(latency_s=args.s3_latency)
+    poblar_guias_s3(s3, BUCKET, pedidos, min(args.pdfs, n))
+    st_fake = FakeStreamlit()
+    fns = load_functions(
+        "app_v.py",
+        [
+            "PEDIDOS_SHEETS", "PEDIDOS_COLUMNAS_MINIMAS", "_leer_registros_hoja_busqueda",
+            "cargar_hoja_pedidos_busqueda", "cargar_pedidos_busqueda", "normalizar",
+            "_tokenizar_nombre_busqueda", "coincide_nombre_cliente_busqueda", "normalizar_folio",
+            "obtener_prefijo_s3", "obtener_todos_los_archivos",
+        ],
+        extra_globals={
+            "st": st_fake,
+            "g_spread_client": gsheets,
+            "GOOGLE_SHEET_ID": SHEET_ID,
+            "APIError": APIError,
+            "GSpreadException": GSpreadException,
+            "s3_client": s3,
+            "S3_BUCKET_NAME": BUCKET,
+            # Sin réplica SQLite: se mide la lectura directa de las hojas simuladas.
+            "query_replica": lambda *args, **kwargs: None,
+        },
+    )
+    keyword = args.keyword
+
+    def run():
+        # Réplica del ciclo "🧑 Por cliente/factura" de la pestaña 8 (vive inline en la UI).
+        df_pedidos = fns["cargar_pedidos_busqueda"]()
+        keyword_cliente = fns["normalizar"](keyword.strip())
+        keyword_folio = fns["normalizar_folio"](keyword.strip())
+        coincidencias = 0
+        archivos = 0
+        for _, row in df_pedidos.iterrows():
+            nombre = str(row.get("Cliente", "")).strip()
+            folio_normalizado = fns["normalizar_folio"](str(row.get("Folio_Factura", "")).strip())
+            coincide_cliente = fns["coincide_nombre_cliente_busqueda"](nombre, keyword_cliente)
+            coincide_folio = bool(folio_normalizado) and keyword_folio == folio_normalizado
+            if not coincide_cliente and not coincide_folio:
+                continue
+            pedido_id = str(row.get("ID_Pedido", "")).strip()
+            if not pedido_id:
+                continue
+            coincidencias += 1
+            prefix = fns["obtener_prefijo_s3"](pedido_id)
+            archivos += len(fns["obtener_todos_los_archivos"](prefix) if prefix else [])
+        return {"filas_leidas": int(len(df_pedidos)), "coincidencias": coincidencias, "archivos": archivos}
+
+    return _medir("busqueda_tab8_cliente", n, run, clients=[gsheets, s3], notas=f"keyword={keyword!r}")
+
+
+def escenario_confirmados_sync(n: int, args) -> dict:
+    confirmados = _frame(generar_pedidos_confirmados(n))
+    pedidos = _frame(generar_pedidos(n))
+    pedidos["Estado_Surtido"] = "Surtido"
+    fns = load_functions(
+        "app_admin.py",
+        [
+            "FECHA_CONFIRMADO_COL", "ESTADO_ENTREGA_COL", "CONFIRMADOS_SYNC_COLUMN_MAP",
+            "normalize_id_pedido", "normalize_folio_factura", "PEDIDO_KEY_ID_COL",
+            "_normalize_key_series", "normalize_id_pedido_series", "normalize_folio_factura_series",
+            "pedido_id_keys", "dedupe_confirmados", "sync_estado_surtido_confirmados",
+        ],
+    )
+
+    def run():
+        deduplicado = fns["dedupe_confirmados"](confirmados)
+        sincronizado = fns["sync_estado_surtido_confirmados"](deduplicado, pedidos)
+        return {"confirmados": int(len(sincronizado))}
+
+    return _medir("confirmados_dedupe_sync", n, run)
+
+
+def escenario_credito(n: int, args) -> dict:
+    clientes = _frame(generar_pedidos_confirmados(n))["Cliente"]
+    fns = load_functions(
+        "app_admin.py",
+        ["normalize_client_name", "cliente_credito_match"],
+        extra_globals={"SequenceMatcher": SequenceMatcher},
+    )
+    nombres = [fns["normalize_client_name"](nombre) for nombre in generar_nombres_credito(args.credito)]
+    lookup = set(nombres)
+
+    def run():
+        mask = clientes.apply(lambda nombre: fns["cliente_credito_match"](nombre, nombres, lookup))
+        return {"credito": int(mask.sum()), "lista_credito": len(nombres)}
+
+    return _medir("cliente_credito_match", n, run)
+
+
+def escenario_guias_pdf(n: int, args) -> dict:
+    try:
+        import pdfplumber
+    except ImportError:
+        return {"scenario": "guias_pdf_extraer_texto", "rows": n, "seconds": None, "calls": {},
+                "sim_latency_s": 0.0, "injected_429": 0, "app_sleep_s": 0.0, "detail": None,
+                "error": "", "notes": "omitido: pdfplumber no está instalado"}
+    s3 = FakeS3Client(latency_s=args.s3_latency)
+    keys = poblar_guias_s3(s3, BUCKET, generar_pedidos(min(args.pdfs, n)), min(args.pdfs, n))
+    fns = load_functions(
+        "app_v.py",
+        ["extraer_texto_pdf"],
+        extra_globals={
+            "s3_client": s3,
+            "S3_BUCKET_NAME": BUCKET,
+            "pdfplumber": pdfplumber,
+            "BytesIO": __import__("io").BytesIO,
+            "trace_span": lambda *a, **k: nullcontext(),
+        },
+    )
+
+    def run():
+        textos = [fns["extraer_texto_pdf"](key) for key in keys]
+        return {"pdfs": len(textos), "errores": sum(t.startswith("[ERROR") for t in textos)}
+
+    return _medir("guias_pdf_extraer_texto", len(keys), run, clients=[s3])
+
+
+ESCENARIOS = {
+    "cargar_pedidos": escenario_cargar_pedidos,
+    "append_row": escenario_append_row,
+    "busqueda": escenario_busqueda,
+    "confirmados_sync": escenario_confirmados_sync,
+    "credito": escenario_credito,
+    "guias_pdf": escenario_guias_pdf,
+}
+
+
+# --- Reporte ----------------------------------------------------------------
+
+def _tabla(resultados: list[dict], anterior: dict | None) -> str:
+    previos = {}
+    if anterior:
+        previos = {(r["scenario"], r["rows"]): r for r in anterior.get("results", [])}
+    lineas = [
+        "| escenario | filas | s | llamadas | latencia sim. (s) | 429 | sleep app (s) | vs anterior |",
+        "|---|---:|---:|---:|---:|---:|---:|---:|",
+    ]
+    for r in resultados:
+        segundos = "—" if r["seconds"] is None else f"{r['seconds']:.3f}"
+        comparacion = ""
+        previo = previos.get((r["scenario"], r["rows"]))
+        if previo and previo.get("seconds") and r["seconds"]:
+            comparacion = f"x{previo['seconds'] / r['seconds']:.2f}"
+        estado = f" ⚠️ {r['error']}" if r["error"] else (f" ({r['notes']})" if r["notes"] else "")
+        lineas.append(
+            f"| {r['scenario']}{estado} | {r['rows']} | {segundos} | {sum(r['calls'].values())} "
+            f"| {r['sim_latency_s']:.2f} | {r['injected_429']} | {r['app_sleep_s']:.1f} | {comparacion} |"
+        )
+    return "\n".join(lineas)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000", help="filas por hoja, separadas por coma")
+    parser.add_argument("--scenarios", default=",".join(ESCENARIOS))
+    parser.add_argument("--latency", type=float, default=0.0, help="latencia simulada por llamada a Sheets (s)")
+    parser.add_argument("--s3-latency", type=float, default=0.0, help="latencia simulada por llamada a S3 (s)")
+    parser.add_argument("--fail-429-every", type=int, default=0, help="inyecta un 429 cada N llamadas a Sheets")
+    parser.add_argument("--appends", type=int, default=10, help="altas en el escenario append_row")
+    parser.add_argument("--pdfs", type=int, default=200, help="guías PDF en el S3 simulado")
+    parser.add_argument("--credito", type=int, default=300, help="clientes en la lista de crédito")
+    parser.add_argument("--keyword", default="denisse ramos", help="búsqueda de cliente de la pestaña 8")
+    parser.add_argument("--output", default=None, help="ruta del reporte JSON")
+    parser.add_argument("--compare", default=None, help="reporte JSON anterior para comparar")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    escenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    desconocidos = set(escenarios) - set(ESCENARIOS)
+    if desconocidos:
+        parser.error(f"escenarios desconocidos: {sorted(desconocidos)}")
+
+    resultados = []
+    for n in sizes:
+        for nombre in escenarios:
+            print(f"→ {nombre} ({n} filas)...", file=sys.stderr)
+            resultados.append(ESCENARIOS[nombre](n, args))
+
+    reporte = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "params": {k: v for k, v in vars(args).items() if k not in {"output", "compare"}},
+        "results": resultados,
+    }
+    salida = Path(args.output) if args.output else RESULTS_DIR / f"suite_{datetime.now():%Y%m%d_%H%M%S}.json"
+    salida.parent.mkdir(parents=True, exist_ok=True)
+    salida.write_text(json.dumps(reporte, ensure_ascii=False, indent=2, default=str), encoding="utf-8")
+
+    anterior = json.loads(Path(args.compare).read_text(encoding="utf-8")) if args.compare else None
+    print(_tabla(resultados, anterior))
+    print(f"\nReporte: {salida}")
+
+
+if __name__ == "__main__":
+    main()